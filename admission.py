@@ -0,0 +1,251 @@
+# CONTROLE DE ADMISSÃO DE PEDIDOS - HORÁRIO DE PICO
+#
+# Antes de gravar um pedido, reserva uma vaga da unidade para o dia e o tipo de
+# refeição (database.reservar_vaga: decremento atômico em Vaga_Refeicao). Sem
+# vaga, o pedido não chega ao banco: o banco nunca recebe escritas que a
+# capacidade da unidade deveria recusar (antes, VerificarCapacidadeUnidade só
+# apontava "EXCESSO" depois do fato).
+#
+# FLUXO:
+#   reservar() → reserva com validade → confirmar() grava o pedido e consome a reserva
+#                                      → cancelar() devolve a vaga
+#   admitir() faz as duas etapas de uma vez (TUI e API)
+#
+# FILA LOCAL: sem vaga, reservar(espera=s) aguarda em fila FIFO por
+# (unidade, data, tipo) neste processo. Só o primeiro da fila consulta o banco;
+# devoluções feitas aqui acordam a fila na hora. As demais vagas (reservas
+# vencidas, cancelamentos em outros processos) são conferidas a cada
+# 'intervalo' segundos, que também dispara a liberação das reservas vencidas.
+#
+# Ativado por ADMISSAO=1 no .env (main.py e api.py).
+#
+# USO (manutenção):
+#   python admission.py situacao [--data AAAA-MM-DD]
+#   python admission.py liberar                        # reservas vencidas (cron)
+#   python admission.py recalcular [--data AAAA-MM-DD] # após pedidos fora da admissão
+
+import argparse
+import itertools
+import threading
+import time
+from collections import deque, namedtuple
+from datetime import date
+import psycopg2
+import database
+
+VALIDADE_PADRAO = 120
+ESPERA_PADRAO = 0.0
+INTERVALO_PADRAO = 2.0
+FILA_MAXIMA_PADRAO = 200
+
+Reserva = namedtuple('Reserva', 'id_reserva id_unidade data tipo_refeicao expira_em')
+
+class SemVagas(Exception):
+    """Capacidade esgotada para (unidade, data, tipo), ou fila de espera cheia"""
+
+    def __init__(self, id_unidade, data, tipo_refeicao, fila_cheia=False):
+        motivo = "fila de espera cheia" if fila_cheia else "capacidade esgotada"
+        super().__init__(f"Unidade {id_unidade}: {motivo} para {tipo_refeicao} em {data}")
+        self.id_unidade = id_unidade
+        self.data = data
+        self.tipo_refeicao = tipo_refeicao
+        self.fila_cheia = fila_cheia
+
+class ReservaExpirada(Exception):
+    """A reserva venceu (ou já foi usada) antes da confirmação"""
+
+class ControleAdmissao:
+    """
+    RESERVAS DE VAGA COM FILA DE ESPERA POR (UNIDADE, DATA, TIPO)
+
+    Compartilhado entre threads (ex.: executor da API); cada chamada recebe a
+    conexão da thread que a faz.
+    """
+
+    def __init__(self, validade=VALIDADE_PADRAO, intervalo=INTERVALO_PADRAO, fila_maxima=FILA_MAXIMA_PADRAO):
+        self.validade = validade
+        self.intervalo = intervalo
+        self.fila_maxima = fila_maxima
+        self._cond = threading.Condition()
+        self._filas = {}
+        self._senhas = itertools.count()
+        self._ultima_limpeza = 0.0
+
+    # ---------- FILA ----------
+
+    def _entrar(self, chave):
+        with self._cond:
+            fila = self._filas.setdefault(chave, deque())
+            if len(fila) >= self.fila_maxima:
+                raise SemVagas(*chave, fila_cheia=True)
+            senha = next(self._senhas)
+            fila.append(senha)
+            return senha
+
+    def _sair(self, chave, senha):
+        with self._cond:
+            fila = self._filas[chave]
+            fila.remove(senha)
+            if not fila:
+                del self._filas[chave]
+            self._cond.notify_all()
+
+    def _aguardar_vez(self, chave, senha, limite):
+        """Espera a senha chegar à frente da fila; False se o prazo acabar antes"""
+        with self._cond:
+            while self._filas[chave][0] != senha:
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    return False
+                self._cond.wait(restante)
+        return True
+
+    def _aguardar_devolucao(self, limite):
+        with self._cond:
+            restante = limite - time.monotonic()
+            if restante > 0:
+                self._cond.wait(min(restante, self.intervalo))
+
+    def _limpar_vencidas(self, conn):
+        """Libera reservas vencidas no banco, no máximo uma vez por intervalo"""
+        agora = time.monotonic()
+        if agora - self._ultima_limpeza < self.intervalo:
+            return 0
+        self._ultima_limpeza = agora
+        return database.liberar_reservas_expiradas(conn)
+
+    # ---------- RESERVAS ----------
+
+    def reservar(self, conn, id_unidade, tipo_refeicao, data=None, espera=ESPERA_PADRAO):
+        """
+        Obtém uma reserva de vaga, aguardando na fila até 'espera' segundos
+
+        Raises:
+            SemVagas: Sem vaga no prazo, ou fila de espera cheia
+        """
+        chave = (id_unidade, data or date.today(), tipo_refeicao)
+        limite = time.monotonic() + espera
+        senha = self._entrar(chave)
+        try:
+            if not self._aguardar_vez(chave, senha, limite):
+                raise SemVagas(*chave)
+            while True:
+                linha = database.reservar_vaga(conn, *chave, self.validade)
+                if linha is None and self._limpar_vencidas(conn):
+                    linha = database.reservar_vaga(conn, *chave, self.validade)
+                if linha is not None:
+                    return Reserva(linha[0], *chave, linha[1])
+                if time.monotonic() >= limite:
+                    raise SemVagas(*chave)
+                self._aguardar_devolucao(limite)
+        finally:
+            self._sair(chave, senha)
+
+    def confirmar(self, conn, reserva, pedido_data):
+        """
+        Grava o pedido consumindo a reserva
+
+        Raises:
+            ReservaExpirada: A reserva venceu antes da confirmação (nada foi gravado)
+        """
+        pedido_id = database.confirmar_reserva(conn, reserva.id_reserva, pedido_data)
+        if pedido_id is None:
+            raise ReservaExpirada(f"Reserva {reserva.id_reserva} expirou antes da confirmação")
+        return pedido_id
+
+    def cancelar(self, conn, reserva):
+        """Devolve a vaga e acorda quem espera por ela neste processo"""
+        liberou = database.liberar_reserva(conn, reserva.id_reserva)
+        with self._cond:
+            self._cond.notify_all()
+        return liberou
+
+    def admitir(self, conn, pedido_data, id_unidade=None, data=None, espera=ESPERA_PADRAO):
+        """
+        Reserva e confirma o pedido em sequência
+
+        A unidade e o tipo vêm do cardápio do pedido (get_unidade_do_cardapio).
+        Cardápio próprio de uma unidade usa sempre a vaga dela; no cardápio
+        geral, 'id_unidade' (a unidade do caixa) tem precedência sobre a que o
+        aponta. Sem unidade, não há capacidade a verificar: o pedido é gravado direto.
+
+        Returns:
+            int: ID do pedido
+
+        Raises:
+            SemVagas: Capacidade esgotada (o pedido não é gravado)
+        """
+        cardapio = database.get_unidade_do_cardapio(conn, pedido_data['ped_cardapio'])
+        unidade_cardapio, tipo_refeicao, propria = cardapio or (None, None, False)
+        if propria or id_unidade is None:
+            id_unidade = unidade_cardapio
+        if id_unidade is None or tipo_refeicao is None:
+            return database.add_pedido(conn, pedido_data)
+        data = data or (pedido_data.get('data_hora') or date.today())
+        if hasattr(data, 'date'):
+            data = data.date()
+
+        reserva = self.reservar(conn, id_unidade, tipo_refeicao, data, espera)
+        try:
+            return self.confirmar(conn, reserva, pedido_data)
+        except psycopg2.Error:
+            # Pedido inválido (FK, CHECK...): a vaga volta para a fila
+            self.cancelar(conn, reserva)
+            raise
+
+
+def criar_controle(config=None):
+    """ControleAdmissao se ADMISSAO=1 no .env (None = pedidos gravados direto)"""
+    config = config if config is not None else database.get_db_config()
+    if config.get('ADMISSAO') != '1':
+        return None
+    try:
+        return ControleAdmissao(
+            validade=int(config.get('ADMISSAO_VALIDADE', VALIDADE_PADRAO)),
+            fila_maxima=int(config.get('ADMISSAO_FILA_MAXIMA', FILA_MAXIMA_PADRAO)),
+        )
+    except ValueError:
+        print("[AVISO] ADMISSAO_VALIDADE/ADMISSAO_FILA_MAXIMA inválidos: usando os padrões.")
+        return ControleAdmissao()
+
+# ==================== CLI ====================
+
+def main():
+    parser = argparse.ArgumentParser(description="Manutenção das reservas de vaga (admissão de pedidos)")
+    sub = parser.add_subparsers(dest='comando', required=True)
+    situacao = sub.add_parser('situacao', help="Saldos de vagas e reservas em aberto do dia")
+    situacao.add_argument('--data', type=date.fromisoformat, default=date.today())
+    sub.add_parser('liberar', help="Devolve as vagas das reservas vencidas")
+    recalcular = sub.add_parser('recalcular', help="Recalcula os saldos do dia a partir dos pedidos")
+    recalcular.add_argument('--data', type=date.fromisoformat, default=date.today())
+    args = parser.parse_args()
+
+    try:
+        conn = database.open_connection()
+    except psycopg2.Error as e:
+        print(f"[ERRO] Erro ao conectar ao PostgreSQL: {e}")
+        return 1
+
+    try:
+        if args.comando == 'situacao':
+            linhas = database.get_vagas(conn, args.data)
+            if not linhas:
+                print(f"[INFO] Nenhuma reserva registrada para {args.data}.")
+                return 0
+            print(f"\n{'Unidade':<22} {'Tipo':<8} {'Capacidade':>10} {'Disponíveis':>11} {'Reservas':>9}")
+            print('-' * 64)
+            for _, nome, tipo, capacidade, disponiveis, reservas in linhas:
+                print(f"{nome[:22]:<22} {tipo:<8} {capacidade:>10} {disponiveis:>11} {reservas:>9}")
+        elif args.comando == 'liberar':
+            print(f"[SUCESSO] {database.liberar_reservas_expiradas(conn)} reservas vencidas liberadas.")
+        else:
+            print(f"[SUCESSO] {database.recalcular_vagas(conn, args.data)} saldos recalculados para {args.data}.")
+        return 0
+    except psycopg2.Error as e:
+        print(f"[ERRO] {e}")
+        return 1
+    finally:
+        conn.close()
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,551 @@
+# SERVIÇO HTTP JSON - QUIOSQUES E CATRACAS
+#
+# Expõe o CRUD de usuários, pedidos e pagamentos (as mesmas operações de
+# database.py) em um servidor HTTP/1.1 assíncrono (asyncio, biblioteca padrão).
+#
+# ARQUITETURA:
+# - asyncio atende as conexões HTTP (keep-alive) sem uma thread por cliente
+# - As chamadas ao banco (psycopg2 é bloqueante) rodam em um ThreadPoolExecutor
+#   com uma conexão do pool por chamada
+# - Backpressure: no máximo API_MAX_CONCURRENT operações em andamento e
+#   API_MAX_QUEUE aguardando; acima disso a resposta é 503 com Retry-After
+# - Timeout por requisição: a consulta em andamento é cancelada no servidor
+#   (connection.cancel()) e a resposta é 504
+# - Listagens paginadas por cursor (?cursor=<id>&limite=N), sem OFFSET; pedidos e
+#   pagamentos aceitam ?desde=AAAA-MM-DD (lê só as partições a partir dessa data)
+# - Admissão (ADMISSAO=1 no .env): POST /pedidos só grava com vaga na unidade
+#   (admission.py); sem vaga após API_ADMISSAO_ESPERA segundos, 409
+# - Concorrência otimista: GET /{recurso}/{id} devolve 'versao'; PUT com essa
+#   'versao' no corpo só grava se o registro não mudou desde a leitura (409 se mudou)
+#
+# ROTAS:
+#   GET    /saude
+#   GET    /usuarios            GET /usuarios/{id}      POST /usuarios
+#   PUT    /usuarios/{id}       DELETE /usuarios/{id}
+#   GET    /pedidos[?desde=]    GET /pedidos/{id}       POST /pedidos
+#   PUT    /pedidos/{id}        DELETE /pedidos/{id}
+#   GET    /pagamentos[?desde=] GET /pagamentos/{id}    POST /pagamentos
+#   PUT    /pagamentos/{id}     DELETE /pagamentos/{id}
+#   GET    /cardapios/vigente?tipo=almoco[&unidade=1][&data=AAAA-MM-DD]
+#
+# USO:
+#   python api.py [--host 0.0.0.0] [--porta 8080]
+
+import argparse
+import asyncio
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime
+from decimal import Decimal
+from urllib.parse import parse_qs, urlsplit
+import psycopg2
+import psycopg2.errors
+import admission
+import database
+import menus
+import metrics
+
+COLUNAS_USUARIO = ('id_usuario', 'matricula_usuario', 'CPF_usuario', 'nome_usuario',
+                   'email_usuario', 'telefone_usuario', 'status_usuario')
+COLUNAS_PEDIDO_LISTA = ('id_pedido', 'pedido_usuario', 'nome_usuario', 'data_hora',
+                        'status_do_pedido', 'tipo_cardapio', 'observacao')
+COLUNAS_PEDIDO = ('id_pedido', 'pedido_usuario', 'nome_usuario', 'data_hora',
+                  'status_do_pedido', 'ped_cardapio', 'tipo_cardapio')
+COLUNAS_CARDAPIO = ('id_cardapio', 'tipo', 'id_unidade', 'data_inicio', 'data_fim', 'observacao')
+COLUNAS_PAGAMENTO = ('id_pagamento', 'pag_pedido', 'nome_usuario', 'valor_pago',
+                     'forma_de_pagamento', 'data_pagamento', 'pag_categoria_nome', 'status_do_pedido')
+
+LIMITE_PADRAO = 50
+LIMITE_MAXIMO = 500
+CORPO_MAXIMO = 64 * 1024
+
+MOTIVOS = {200: 'OK', 201: 'Created', 204: 'No Content', 400: 'Bad Request', 404: 'Not Found',
+           405: 'Method Not Allowed', 409: 'Conflict', 413: 'Payload Too Large',
+           500: 'Internal Server Error', 503: 'Service Unavailable', 504: 'Gateway Timeout'}
+
+class ErroHTTP(Exception):
+    def __init__(self, status, mensagem, cabecalhos=None):
+        super().__init__(mensagem)
+        self.status = status
+        self.mensagem = mensagem
+        self.cabecalhos = cabecalhos or {}
+
+def _json_padrao(valor):
+    if isinstance(valor, (datetime, date)):
+        return valor.isoformat()
+    if isinstance(valor, Decimal):
+        return float(valor)
+    if isinstance(valor, (bytes, memoryview)):
+        return None
+    raise TypeError(f"Tipo não serializável: {type(valor).__name__}")
+
+def _como_dict(colunas, linha):
+    return dict(zip(colunas, linha)) if linha else None
+
+def _erro_do_banco(e):
+    """Traduz erros do psycopg2 em status HTTP"""
+    if isinstance(e, (psycopg2.errors.UniqueViolation, psycopg2.errors.ForeignKeyViolation)):
+        return ErroHTTP(409, str(e).strip())
+    if isinstance(e, (psycopg2.errors.CheckViolation, psycopg2.errors.NotNullViolation,
+                      psycopg2.errors.InvalidTextRepresentation, psycopg2.errors.NumericValueOutOfRange,
+                      psycopg2.errors.StringDataRightTruncation)):
+        return ErroHTTP(400, str(e).strip())
+    if isinstance(e, psycopg2.extensions.QueryCanceledError):
+        # Inclui TempoEsgotado (orçamento/prazo da requisição)
+        return ErroHTTP(504, "Tempo limite da consulta excedido")
+    if e.pgcode is None:
+        # Validações da própria camada de dados (ex.: pagamento duplicado em add_pagamento)
+        return ErroHTTP(409, str(e).strip())
+    return ErroHTTP(500, "Erro interno no banco de dados")
+
+
+class ServicoRU:
+    """
+    SERVIÇO HTTP DO RU
+
+    Mantém o pool de conexões, o executor de chamadas bloqueantes e os limites
+    de concorrência. Cada rota é um método que recebe (conn, parâmetros, corpo)
+    e roda em uma thread do executor.
+    """
+
+    def __init__(self, pool_max=20, max_concorrentes=20, max_fila=200, timeout=5.0, admissao=None, espera_admissao=0.0):
+        self.pool = database.create_pool(1, pool_max)
+        self.admissao = admissao
+        self.cardapios = menus.CardapiosVigentes()
+        self.espera_admissao = min(espera_admissao, timeout / 2)
+        self.executor = ThreadPoolExecutor(max_workers=pool_max, thread_name_prefix='api-db')
+        self.timeout = timeout
+        self.max_fila = max_fila
+        self._vagas = asyncio.Semaphore(max_concorrentes)
+        self._na_fila = 0
+        self._em_uso = 0
+        self._pool_max = pool_max
+        self._lock_pool = threading.Lock()
+        self._rotas = [
+            ('GET', ('usuarios',), self.listar_usuarios),
+            ('GET', ('usuarios', int), self.obter_usuario),
+            ('POST', ('usuarios',), self.criar_usuario),
+            ('PUT', ('usuarios', int), self.atualizar_usuario),
+            ('DELETE', ('usuarios', int), self.remover_usuario),
+            ('GET', ('pedidos',), self.listar_pedidos),
+            ('GET', ('pedidos', int), self.obter_pedido),
+            ('POST', ('pedidos',), self.criar_pedido),
+            ('PUT', ('pedidos', int), self.atualizar_pedido),
+            ('DELETE', ('pedidos', int), self.remover_pedido),
+            ('GET', ('pagamentos',), self.listar_pagamentos),
+            ('GET', ('pagamentos', int), self.obter_pagamento),
+            ('POST', ('pagamentos',), self.criar_pagamento),
+            ('PUT', ('pagamentos', int), self.atualizar_pagamento),
+            ('DELETE', ('pagamentos', int), self.remover_pagamento),
+            ('GET', ('cardapios', 'vigente'), self.obter_cardapio_vigente),
+        ]
+
+    def fechar(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
+        self.pool.closeall()
+
+    # ---------- EXECUÇÃO COM POOL, TIMEOUT E BACKPRESSURE ----------
+
+    def _atualizar_metricas_pool(self):
+        metrics.POOL.definir(self._em_uso, estado='em_uso')
+        metrics.POOL.definir(self._pool_max - self._em_uso, estado='livres')
+        metrics.POOL.definir(self._na_fila, estado='fila')
+
+    def _executar(self, operacao, args, em_andamento):
+        conn = self.pool.getconn()
+        with self._lock_pool:
+            self._em_uso += 1
+            self._atualizar_metricas_pool()
+        em_andamento['conn'] = conn
+        try:
+            # O servidor também encerra a consulta no prazo (statement_timeout)
+            with database.prazo(self.timeout):
+                resultado = operacao(conn, *args)
+            # Leituras deixam a transação aberta; devolve a conexão limpa ao pool
+            conn.rollback()
+            return resultado
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            em_andamento['conn'] = None
+            self.pool.putconn(conn, close=conn.closed != 0)
+            with self._lock_pool:
+                self._em_uso -= 1
+                self._atualizar_metricas_pool()
+
+    async def executar(self, operacao, *args):
+        """Roda 'operacao(conn, *args)' no executor respeitando fila, vagas e timeout"""
+        if self._na_fila >= self.max_fila:
+            raise ErroHTTP(503, "Serviço sobrecarregado, tente novamente", {'Retry-After': '1'})
+
+        self._na_fila += 1
+        try:
+            await asyncio.wait_for(self._vagas.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            raise ErroHTTP(503, "Serviço sobrecarregado, tente novamente", {'Retry-After': '1'})
+        finally:
+            self._na_fila -= 1
+
+        em_andamento = {'conn': None}
+        futuro = asyncio.get_running_loop().run_in_executor(self.executor, self._executar, operacao, args, em_andamento)
+        try:
+            return await asyncio.wait_for(asyncio.shield(futuro), self.timeout)
+        except asyncio.TimeoutError:
+            # Cancela a consulta no servidor; a thread termina com QueryCanceled
+            conn = em_andamento['conn']
+            if conn is not None:
+                conn.cancel()
+            raise ErroHTTP(504, "Tempo limite da requisição excedido")
+        except psycopg2.Error as e:
+            raise _erro_do_banco(e)
+        finally:
+            # A vaga só é liberada quando a thread realmente termina
+            futuro.add_done_callback(self._liberar_vaga)
+
+    def _liberar_vaga(self, futuro):
+        if not futuro.cancelled():
+            futuro.exception()  # Consome o erro de chamadas que já responderam 504
+        self._vagas.release()
+
+    # ---------- ROTEAMENTO ----------
+
+    def _resolver(self, metodo, caminho):
+        partes = [p for p in caminho.split('/') if p]
+        encontrou_caminho = False
+        for metodo_rota, padrao, funcao in self._rotas:
+            if len(padrao) != len(partes):
+                continue
+            args = []
+            for esperado, parte in zip(padrao, partes):
+                if esperado is int:
+                    if not parte.isdigit():
+                        break
+                    args.append(int(parte))
+                elif esperado != parte:
+                    break
+            else:
+                encontrou_caminho = True
+                if metodo_rota == metodo:
+                    return funcao, args
+        if encontrou_caminho:
+            raise ErroHTTP(405, "Método não permitido")
+        raise ErroHTTP(404, "Rota não encontrada")
+
+    async def atender(self, metodo, alvo, corpo):
+        url = urlsplit(alvo)
+        if url.path.rstrip('/') == '/saude':
+            return 200, {'status': 'ok', 'em_uso': self._em_uso, 'fila': self._na_fila}
+        funcao, args = self._resolver(metodo, url.path)
+        parametros = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        dados = None
+        if metodo in ('POST', 'PUT'):
+            try:
+                dados = json.loads(corpo or b'{}')
+            except ValueError:
+                raise ErroHTTP(400, "Corpo JSON inválido")
+            if not isinstance(dados, dict):
+                raise ErroHTTP(400, "Corpo JSON deve ser um objeto")
+        return await funcao(parametros, dados, *args)
+
+    # ---------- PAGINAÇÃO ----------
+
+    @staticmethod
+    def _pagina(parametros):
+        try:
+            limite = min(int(parametros.get('limite', LIMITE_PADRAO)), LIMITE_MAXIMO)
+            cursor = int(parametros['cursor']) if parametros.get('cursor') else None
+        except ValueError:
+            raise ErroHTTP(400, "Parâmetros 'cursor' e 'limite' devem ser inteiros")
+        if limite <= 0:
+            raise ErroHTTP(400, "'limite' deve ser positivo")
+        return cursor, limite
+
+    @staticmethod
+    def _desde(parametros):
+        try:
+            return date.fromisoformat(parametros['desde']) if parametros.get('desde') else None
+        except ValueError:
+            raise ErroHTTP(400, "Parâmetro 'desde' deve estar no formato AAAA-MM-DD")
+
+    @staticmethod
+    def _resposta_pagina(colunas, linhas, limite):
+        itens = [_como_dict(colunas, linha) for linha in linhas]
+        proximo = str(linhas[-1][0]) if len(linhas) == limite else None
+        return 200, {'itens': itens, 'proximo_cursor': proximo}
+
+    @staticmethod
+    def _campos(dados, obrigatorios, opcionais=()):
+        faltando = [c for c in obrigatorios if c not in dados]
+        if faltando:
+            raise ErroHTTP(400, f"Campos obrigatórios ausentes: {', '.join(faltando)}")
+        campos = {c: dados[c] for c in obrigatorios}
+        campos.update({c: dados.get(c) for c in opcionais})
+        return campos
+
+    async def _gravar_edicao(self, atualizar, registro_id, campos, dados):
+        """
+        PUT: com 'versao' no corpo, grava só se o registro ainda estiver nessa versão
+
+        Returns:
+            int: Nova versão do registro
+        """
+        versao = dados.get('versao')
+        if versao is not None and (not isinstance(versao, int) or isinstance(versao, bool)):
+            raise ErroHTTP(400, "Campo 'versao' deve ser inteiro")
+        try:
+            nova = await self.executar(atualizar, registro_id, campos, versao)
+        except database.ConflitoVersao as e:
+            # A mensagem traz a versão atual: o cliente relê o registro e reaplica a edição
+            if e.atual is None:
+                raise ErroHTTP(404, str(e))
+            raise ErroHTTP(409, str(e))
+        if nova is None:
+            raise ErroHTTP(404, "Registro não encontrado")
+        return nova
+
+    # ---------- USUÁRIOS ----------
+
+    async def listar_usuarios(self, parametros, _):
+        cursor, limite = self._pagina(parametros)
+        linhas = await self.executar(database.get_users_page, cursor or 0, limite)
+        return self._resposta_pagina(COLUNAS_USUARIO, linhas, limite)
+
+    async def obter_usuario(self, _, __, user_id):
+        linha = await self.executar(database.get_user_by_id, user_id, True)
+        if not linha:
+            raise ErroHTTP(404, "Usuário não encontrado")
+        return 200, _como_dict(COLUNAS_USUARIO + ('versao',), linha)
+
+    def _dados_usuario(self, dados):
+        campos = self._campos(
+            dados, ('matricula_usuario', 'CPF_usuario', 'nome_usuario', 'email_usuario'),
+            ('telefone_usuario',)
+        )
+        campos['status_usuario'] = dados.get('status_usuario', 'ativo')
+        return campos
+
+    async def criar_usuario(self, _, dados):
+        user_id = await self.executar(database.add_user, self._dados_usuario(dados))
+        return 201, {'id_usuario': user_id}
+
+    async def atualizar_usuario(self, _, dados, user_id):
+        versao = await self._gravar_edicao(database.update_user, user_id, self._dados_usuario(dados), dados)
+        return 200, {'id_usuario': user_id, 'versao': versao}
+
+    async def remover_usuario(self, _, __, user_id):
+        if not await self.executar(database.delete_user, user_id):
+            raise ErroHTTP(404, "Usuário não encontrado")
+        return 204, None
+
+    # ---------- PEDIDOS ----------
+
+    async def listar_pedidos(self, parametros, _):
+        cursor, limite = self._pagina(parametros)
+        linhas = await self.executar(database.get_pedidos_page, cursor, limite, self._desde(parametros))
+        return self._resposta_pagina(COLUNAS_PEDIDO_LISTA, linhas, limite)
+
+    async def obter_pedido(self, _, __, pedido_id):
+        linha = await self.executar(database.get_pedido_by_id, pedido_id, True)
+        if not linha:
+            raise ErroHTTP(404, "Pedido não encontrado")
+        return 200, _como_dict(COLUNAS_PEDIDO + ('versao',), linha)
+
+    def _dados_pedido(self, dados):
+        campos = self._campos(dados, ('pedido_usuario', 'ped_cardapio'))
+        campos['status_do_pedido'] = dados.get('status_do_pedido', 'pendente')
+        return campos
+
+    async def criar_pedido(self, _, dados):
+        pedido_data = self._dados_pedido(dados)
+        if self.admissao is None:
+            pedido_id = await self.executar(database.add_pedido, pedido_data)
+            return 201, {'id_pedido': pedido_id}
+        # 'id_unidade' (opcional): unidade do caixa, usada nos cardápios gerais
+        id_unidade = dados.get('id_unidade')
+        if id_unidade is not None and not isinstance(id_unidade, int):
+            raise ErroHTTP(400, "Campo 'id_unidade' deve ser inteiro")
+        try:
+            pedido_id = await self.executar(self.admissao.admitir, pedido_data, id_unidade, None, self.espera_admissao)
+        except admission.SemVagas as e:
+            if e.fila_cheia:
+                raise ErroHTTP(503, str(e), {'Retry-After': '1'})
+            raise ErroHTTP(409, str(e))
+        except admission.ReservaExpirada as e:
+            raise ErroHTTP(409, str(e))
+        return 201, {'id_pedido': pedido_id}
+
+    async def atualizar_pedido(self, _, dados, pedido_id):
+        versao = await self._gravar_edicao(database.update_pedido, pedido_id, self._dados_pedido(dados), dados)
+        return 200, {'id_pedido': pedido_id, 'versao': versao}
+
+    async def remover_pedido(self, _, __, pedido_id):
+        if not await self.executar(database.delete_pedido, pedido_id):
+            raise ErroHTTP(404, "Pedido não encontrado")
+        return 204, None
+
+    # ---------- PAGAMENTOS ----------
+
+    async def listar_pagamentos(self, parametros, _):
+        cursor, limite = self._pagina(parametros)
+        linhas = await self.executar(database.get_pagamentos_page, cursor, limite, self._desde(parametros))
+        return self._resposta_pagina(COLUNAS_PAGAMENTO, linhas, limite)
+
+    async def obter_pagamento(self, _, __, pagamento_id):
+        linha = await self.executar(database.get_pagamento_by_id, pagamento_id, True)
+        if not linha:
+            raise ErroHTTP(404, "Pagamento não encontrado")
+        return 200, _como_dict(COLUNAS_PAGAMENTO + ('versao',), linha)
+
+    def _dados_pagamento(self, dados):
+        return self._campos(dados, ('pag_pedido', 'valor_pago', 'forma_de_pagamento',
+                                    'pag_categoria_usuario', 'pag_categoria_nome'))
+
+    async def criar_pagamento(self, _, dados):
+        pagamento_id = await self.executar(database.add_pagamento, self._dados_pagamento(dados))
+        return 201, {'id_pagamento': pagamento_id}
+
+    async def atualizar_pagamento(self, _, dados, pagamento_id):
+        versao = await self._gravar_edicao(database.update_pagamento, pagamento_id,
+                                           self._dados_pagamento(dados), dados)
+        return 200, {'id_pagamento': pagamento_id, 'versao': versao}
+
+    async def remover_pagamento(self, _, __, pagamento_id):
+        if not await self.executar(database.delete_pagamento, pagamento_id):
+            raise ErroHTTP(404, "Pagamento não encontrado")
+        return 204, None
+
+    # ---------- CARDÁPIOS ----------
+
+    async def obter_cardapio_vigente(self, parametros, _):
+        tipo = parametros.get('tipo')
+        if tipo not in ('cafe', 'almoco', 'jantar'):
+            raise ErroHTTP(400, "Parâmetro 'tipo' deve ser cafe, almoco ou jantar")
+        try:
+            unidade = int(parametros['unidade']) if 'unidade' in parametros else None
+            data = date.fromisoformat(parametros['data']) if 'data' in parametros else None
+        except ValueError:
+            raise ErroHTTP(400, "Parâmetros 'unidade' ou 'data' inválidos")
+        linha = await self.executar(self.cardapios.resolver, tipo, unidade, data)
+        if not linha:
+            raise ErroHTTP(404, "Nenhum cardápio em vigor")
+        return 200, _como_dict(COLUNAS_CARDAPIO, linha)
+
+
+# ==================== PROTOCOLO HTTP/1.1 ====================
+
+async def _ler_requisicao(reader, timeout_ocioso):
+    """Lê uma requisição; retorna (método, alvo, cabeçalhos, corpo) ou None se a conexão fechou"""
+    try:
+        linha = await asyncio.wait_for(reader.readline(), timeout_ocioso)
+    except asyncio.TimeoutError:
+        return None
+    if not linha:
+        return None
+    try:
+        metodo, alvo, versao = linha.decode('latin-1').split()
+    except ValueError:
+        raise ErroHTTP(400, "Linha de requisição inválida")
+
+    cabecalhos = {}
+    while True:
+        linha = await reader.readline()
+        if linha in (b'\r\n', b'\n', b''):
+            break
+        nome, _, valor = linha.decode('latin-1').partition(':')
+        cabecalhos[nome.strip().lower()] = valor.strip()
+
+    tamanho = int(cabecalhos.get('content-length', 0) or 0)
+    if tamanho > CORPO_MAXIMO:
+        raise ErroHTTP(413, "Corpo da requisição muito grande")
+    corpo = await reader.readexactly(tamanho) if tamanho else b''
+    cabecalhos[':versao'] = versao
+    return metodo.upper(), alvo, cabecalhos, corpo
+
+def _montar_resposta(status, conteudo, manter_aberta, cabecalhos_extra=None):
+    corpo = b'' if conteudo is None else json.dumps(conteudo, default=_json_padrao, ensure_ascii=False).encode('utf-8')
+    cabecalhos = [
+        f"HTTP/1.1 {status} {MOTIVOS.get(status, '')}",
+        f"Content-Length: {len(corpo)}",
+        f"Connection: {'keep-alive' if manter_aberta else 'close'}",
+    ]
+    if corpo:
+        cabecalhos.append("Content-Type: application/json; charset=utf-8")
+    for nome, valor in (cabecalhos_extra or {}).items():
+        cabecalhos.append(f"{nome}: {valor}")
+    return ('\r\n'.join(cabecalhos) + '\r\n\r\n').encode('latin-1') + corpo
+
+async def servir(servico, host, porta, timeout_ocioso=30.0):
+    async def conexao(reader, writer):
+        try:
+            while True:
+                extra = None
+                try:
+                    requisicao = await _ler_requisicao(reader, timeout_ocioso)
+                    if requisicao is None:
+                        break
+                    metodo, alvo, cabecalhos, corpo = requisicao
+                    manter_aberta = (cabecalhos.get('connection', '').lower() != 'close'
+                                     and cabecalhos[':versao'] == 'HTTP/1.1')
+                    status, conteudo = await servico.atender(metodo, alvo, corpo)
+                except ErroHTTP as e:
+                    status, conteudo, extra = e.status, {'erro': e.mensagem}, e.cabecalhos
+                    manter_aberta = e.status not in (400, 413)
+                except (KeyError, TypeError, ValueError) as e:
+                    status, conteudo, manter_aberta = 400, {'erro': f"Dados inválidos: {e}"}, True
+                writer.write(_montar_resposta(status, conteudo, manter_aberta, extra))
+                await writer.drain()
+                if not manter_aberta:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    servidor = await asyncio.start_server(conexao, host, porta, backlog=1024)
+    print(f"[INFO] API do RU em http://{host}:{porta}")
+    async with servidor:
+        await servidor.serve_forever()
+
+def main():
+    config = database.get_db_config()
+    parser = argparse.ArgumentParser(description="Serviço HTTP JSON do RU")
+    parser.add_argument('--host', default=config.get('API_HOST', '127.0.0.1'))
+    parser.add_argument('--porta', type=int, default=int(config.get('API_PORT', 8080)))
+    parser.add_argument('--pool', type=int, default=int(config.get('API_POOL_MAX', 20)),
+                        help="Conexões no pool (e threads de banco)")
+    parser.add_argument('--concorrentes', type=int, default=int(config.get('API_MAX_CONCURRENT', 20)),
+                        help="Operações simultâneas no banco")
+    parser.add_argument('--fila', type=int, default=int(config.get('API_MAX_QUEUE', 200)),
+                        help="Operações aguardando vaga antes de responder 503")
+    parser.add_argument('--timeout', type=float, default=float(config.get('API_TIMEOUT', 5)),
+                        help="Tempo máximo por requisição, em segundos")
+    parser.add_argument('--espera-admissao', type=float, default=float(config.get('API_ADMISSAO_ESPERA', 1)),
+                        help="Com ADMISSAO=1: espera máxima por uma vaga, em segundos")
+    args = parser.parse_args()
+
+    database.setup_metrics(config)
+    database.setup_gravacao(config)
+
+    async def executar():
+        try:
+            servico = ServicoRU(args.pool, args.concorrentes, args.fila, args.timeout,
+                                admission.criar_controle(config), args.espera_admissao)
+        except psycopg2.Error as e:
+            print(f"[ERRO] Erro ao conectar ao PostgreSQL: {e}")
+            return 1
+        try:
+            await servir(servico, args.host, args.porta)
+        finally:
+            servico.fechar()
+        return 0
+
+    try:
+        return asyncio.run(executar())
+    except KeyboardInterrupt:
+        print("\nEncerrando API...")
+        return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
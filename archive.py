@@ -0,0 +1,211 @@
+# ARQUIVAMENTO E RETENÇÃO - PEDIDOS E PAGAMENTOS ANTIGOS
+#
+# Move pedidos encerrados ('entregue' ou 'cancelado') anteriores a uma data de
+# corte, junto com seus pagamentos, para Pedido_Arquivo e Pagamento_Arquivo.
+#
+# CARACTERÍSTICAS:
+# - Lotes pequenos por chave (id_pedido > último processado), um commit por lote
+# - FOR UPDATE SKIP LOCKED: pedidos em uso por um caixa são pulados e, como o
+#   cursor (último id) avança além deles, ficam para a próxima execução
+# - lock_timeout curto por lote e pausa entre lotes (pode rodar em horário de serviço)
+# - Movimento atômico por lote: DELETE ... RETURNING alimenta o INSERT no arquivo
+#
+# USO:
+#   python archive.py arquivar --antes 2024-01-01 [--lote 500] [--pausa 0.2]
+#   python archive.py restaurar --antes 2024-01-01 [--depois 2023-08-01]
+#   python archive.py restaurar --pedido 15 --pedido 16
+
+import argparse
+import time
+from datetime import date
+import psycopg2
+import psycopg2.errors
+import database
+
+STATUS_ENCERRADOS = ('entregue', 'cancelado')
+
+COLUNAS_PEDIDO = 'id_pedido, data_hora, status_do_pedido, pedido_usuario, ped_cardapio, versao'
+COLUNAS_PAGAMENTO = ('id_pagamento, data_pagamento, valor_pago, comprovante, forma_de_pagamento, '
+                     'pag_pedido, pag_categoria_usuario, pag_categoria_nome, versao')
+
+def _mover_lote(conn, ids, lock_timeout):
+    """Move um lote de pedidos (e seus pagamentos) para o arquivo em uma transação"""
+    with conn.cursor() as cur:
+        cur.execute("SET LOCAL lock_timeout = %s;", (lock_timeout,))
+        cur.execute(f"""
+            WITH movidos AS (
+                DELETE FROM Pagamento WHERE pag_pedido = ANY(%s)
+                RETURNING {COLUNAS_PAGAMENTO}
+            )
+            INSERT INTO Pagamento_Arquivo ({COLUNAS_PAGAMENTO})
+            SELECT {COLUNAS_PAGAMENTO} FROM movidos;
+        """, (ids,))
+        pagamentos = cur.rowcount
+        cur.execute(f"""
+            WITH movidos AS (
+                DELETE FROM Pedido WHERE id_pedido = ANY(%s)
+                RETURNING {COLUNAS_PEDIDO}
+            )
+            INSERT INTO Pedido_Arquivo ({COLUNAS_PEDIDO})
+            SELECT {COLUNAS_PEDIDO} FROM movidos;
+        """, (ids,))
+        pedidos = cur.rowcount
+    return pedidos, pagamentos
+
+def arquivar(conn, antes, lote=500, pausa=0.2, lock_timeout='2s', max_tentativas=5):
+    """
+    ARQUIVAMENTO EM LOTES
+
+    Args:
+        antes: Data de corte; pedidos com data_hora anterior são arquivados
+        lote: Pedidos por transação
+        pausa: Espera entre lotes, em segundos (throttling)
+        lock_timeout: Espera máxima por locks em cada lote
+        max_tentativas: Tentativas de um lote que esbarra em locks
+
+    Returns:
+        dict: {'pedidos': n, 'pagamentos': n}
+    """
+    totais = {'pedidos': 0, 'pagamentos': 0}
+    ultimo = 0
+    tentativas = 0
+
+    while True:
+        try:
+            with conn.cursor() as cur:
+                cur.execute("""
+                    SELECT id_pedido FROM Pedido
+                    WHERE id_pedido > %s
+                      AND data_hora < %s
+                      AND status_do_pedido = ANY(%s)
+                    ORDER BY id_pedido
+                    LIMIT %s
+                    FOR UPDATE SKIP LOCKED;
+                """, (ultimo, antes, list(STATUS_ENCERRADOS), lote))
+                ids = [row[0] for row in cur.fetchall()]
+            if not ids:
+                conn.rollback()
+                break
+
+            pedidos, pagamentos = _mover_lote(conn, ids, lock_timeout)
+            conn.commit()
+        except psycopg2.errors.LockNotAvailable:
+            conn.rollback()
+            tentativas += 1
+            if tentativas > max_tentativas:
+                print(f"[ERRO] Lote após id {ultimo} bloqueado {max_tentativas} vezes; interrompendo.")
+                break
+            print("[AVISO] Lote aguardando locks; tentando novamente...")
+            time.sleep(pausa * 2 ** tentativas)
+            continue
+
+        tentativas = 0
+        ultimo = ids[-1]
+        totais['pedidos'] += pedidos
+        totais['pagamentos'] += pagamentos
+        print(f"[INFO] Arquivados {totais['pedidos']} pedidos e {totais['pagamentos']} pagamentos (até id {ultimo})")
+        time.sleep(pausa)
+
+    return totais
+
+def restaurar(conn, antes=None, depois=None, pedidos=None, lote=500, pausa=0.2):
+    """
+    RESTAURAÇÃO DO ARQUIVO PARA AS TABELAS ATIVAS
+
+    Restaura os pedidos informados por ID ou pelo intervalo [depois, antes) de
+    data_hora, com seus pagamentos, preservando os IDs originais.
+    """
+    totais = {'pedidos': 0, 'pagamentos': 0}
+    ultimo = 0
+
+    while True:
+        with conn.cursor() as cur:
+            cur.execute("""
+                SELECT id_pedido FROM Pedido_Arquivo
+                WHERE id_pedido > %(ultimo)s
+                  AND (%(ids)s::int[] IS NULL OR id_pedido = ANY(%(ids)s::int[]))
+                  AND (%(antes)s::timestamp IS NULL OR data_hora < %(antes)s::timestamp)
+                  AND (%(depois)s::timestamp IS NULL OR data_hora >= %(depois)s::timestamp)
+                ORDER BY id_pedido
+                LIMIT %(lote)s
+                FOR UPDATE SKIP LOCKED;
+            """, {'ultimo': ultimo, 'ids': pedidos, 'antes': antes, 'depois': depois, 'lote': lote})
+            ids = [row[0] for row in cur.fetchall()]
+            if not ids:
+                conn.rollback()
+                break
+
+            # Ordem inversa do arquivamento: pedidos antes dos pagamentos (FK)
+            cur.execute(f"""
+                WITH movidos AS (
+                    DELETE FROM Pedido_Arquivo WHERE id_pedido = ANY(%s)
+                    RETURNING {COLUNAS_PEDIDO}
+                )
+                INSERT INTO Pedido ({COLUNAS_PEDIDO})
+                SELECT {COLUNAS_PEDIDO} FROM movidos;
+            """, (ids,))
+            totais['pedidos'] += cur.rowcount
+            cur.execute(f"""
+                WITH movidos AS (
+                    DELETE FROM Pagamento_Arquivo WHERE pag_pedido = ANY(%s)
+                    RETURNING {COLUNAS_PAGAMENTO}
+                )
+                INSERT INTO Pagamento ({COLUNAS_PAGAMENTO})
+                SELECT {COLUNAS_PAGAMENTO} FROM movidos;
+            """, (ids,))
+            totais['pagamentos'] += cur.rowcount
+        conn.commit()
+        ultimo = ids[-1]
+        print(f"[INFO] Restaurados {totais['pedidos']} pedidos e {totais['pagamentos']} pagamentos")
+        time.sleep(pausa)
+
+    return totais
+
+def main():
+    parser = argparse.ArgumentParser(description="Arquivamento de pedidos e pagamentos antigos")
+    parser.add_argument('--prazo', type=float,
+                        help="Tempo máximo em segundos (a consulta em andamento é cancelada no servidor)")
+    sub = parser.add_subparsers(dest='comando', required=True)
+
+    p_arq = sub.add_parser('arquivar', help="Move pedidos encerrados anteriores à data de corte")
+    p_arq.add_argument('--antes', type=date.fromisoformat, required=True, help="Data de corte (AAAA-MM-DD)")
+    p_arq.add_argument('--lote', type=int, default=500)
+    p_arq.add_argument('--pausa', type=float, default=0.2, help="Pausa entre lotes, em segundos")
+    p_arq.add_argument('--lock-timeout', default='2s')
+
+    p_rest = sub.add_parser('restaurar', help="Devolve pedidos arquivados às tabelas ativas")
+    p_rest.add_argument('--antes', type=date.fromisoformat)
+    p_rest.add_argument('--depois', type=date.fromisoformat)
+    p_rest.add_argument('--pedido', type=int, action='append', dest='pedidos', help="ID do pedido (repetível)")
+    p_rest.add_argument('--lote', type=int, default=500)
+    p_rest.add_argument('--pausa', type=float, default=0.2)
+
+    args = parser.parse_args()
+
+    try:
+        conn = database.open_connection()
+    except psycopg2.Error as e:
+        print(f"[ERRO] Erro ao conectar ao PostgreSQL: {e}")
+        return 1
+
+    try:
+        database.aplicar_migracoes(conn)
+        with database.prazo(args.prazo):
+            if args.comando == 'arquivar':
+                totais = arquivar(conn, args.antes, args.lote, args.pausa, args.lock_timeout)
+            else:
+                if not (args.antes or args.depois or args.pedidos):
+                    print("[ERRO] Informe --pedido ou um intervalo (--antes/--depois).")
+                    return 1
+                totais = restaurar(conn, args.antes, args.depois, args.pedidos, args.lote, args.pausa)
+            print(f"[SUCESSO] Pedidos: {totais['pedidos']}, Pagamentos: {totais['pagamentos']}")
+    except psycopg2.Error as e:
+        print(f"[ERRO] {e}")
+        conn.rollback()
+        return 1
+    finally:
+        conn.close()
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -9,7 +9,16 @@
 # - Tratamento de constraints únicas
 
 import psycopg2
+import psycopg2.errors
+import psycopg2.extensions
+import contextlib
+import functools
 import os
+import re
+import select
+import threading
+import time
+import metrics
 from datetime import datetime
 
 def get_db_config(file_path='.env'):
@@ -25,6 +34,11 @@ def get_db_config(file_path='.env'):
     - DB_PASSWORD: Senha
     - DB_HOST: Endereço do servidor
     - DB_PORT: Porta de conexão
+
+    Variáveis opcionais (réplicas de leitura):
+    - DB_REPLICAS: Lista host:porta separada por vírgulas (ex: localhost:5433,localhost:5434)
+    - DB_REPLICA_MAX_LAG: Atraso máximo tolerado em segundos (padrão: 5)
+    - DB_REPLICA_CHECK_INTERVAL: Intervalo entre verificações de atraso em segundos (padrão: 2)
     """
     config = {}
     base_dir = os.path.dirname(os.path.abspath(__file__))
@@ -73,16 +87,573 @@ def connect():
         return None
 
     try:
-        dsn = f"dbname='{config.get('DB_NAME')}' user='{config.get('DB_USER')}' host='{config.get('DB_HOST')}' password='{config.get('DB_PASSWORD')}' port='{config.get('DB_PORT')}' client_encoding='utf8'"
-        conn = psycopg2.connect(dsn)
+        conn = psycopg2.connect(_montar_dsn(config), connection_factory=ConexaoComOrcamento)
         print("[SUCESSO] Conexão com PostgreSQL estabelecida!")
         return conn
     except psycopg2.OperationalError as e:
         print(f"[ERRO] Erro ao conectar ao PostgreSQL: {e}")
         return None
 
+def open_connection(autocommit=False):
+    """
+    Abre uma conexão adicional com o primário, sem mensagens no terminal.
+
+    Usada por threads e processos auxiliares que precisam de conexão própria.
+    Lança psycopg2.OperationalError se o .env estiver incompleto ou a conexão falhar.
+    """
+    config = get_db_config()
+    if not config or not all(k in config for k in ["DB_NAME", "DB_USER", "DB_PASSWORD", "DB_HOST", "DB_PORT"]):
+        raise psycopg2.OperationalError("Arquivo de configuração .env está incompleto ou ausente.")
+    conn = psycopg2.connect(_montar_dsn(config), connection_factory=ConexaoComOrcamento)
+    conn.autocommit = autocommit
+    return conn
+
+def setup_metrics(config=None):
+    """
+    ATIVAÇÃO OPCIONAL DE MÉTRICAS
+
+    Se METRICS_PORT estiver no .env, inicia o servidor /metrics (metrics.py).
+    METRICS_HOST define o endereço de escuta (padrão: 127.0.0.1).
+
+    Returns:
+        Servidor HTTP iniciado, ou None se as métricas estiverem desativadas
+    """
+    config = config if config is not None else get_db_config()
+    porta = config.get('METRICS_PORT')
+    if not porta:
+        return None
+    try:
+        servidor = metrics.iniciar_servidor(int(porta), config.get('METRICS_HOST', '127.0.0.1'))
+        print(f"[INFO] Métricas disponíveis em http://{config.get('METRICS_HOST', '127.0.0.1')}:{porta}/metrics")
+        return servidor
+    except (OSError, ValueError) as e:
+        print(f"[AVISO] Não foi possível iniciar o servidor de métricas: {e}")
+        return None
+
+def setup_gravacao(config=None):
+    """
+    GRAVAÇÃO OPCIONAL DE OPERAÇÕES (REPLAY)
+
+    Se DB_GRAVACAO estiver no .env, grava cada chamada das funções deste módulo
+    em JSONL (metrics.Gravador), com parâmetros pessoais pseudonimizados.
+    DB_GRAVACAO_CHAVE fixa a chave dos pseudônimos entre execuções.
+    Reprodução: python replay.py reproduzir <arquivo>
+
+    Returns:
+        Gravador ativo, ou None se a gravação estiver desativada
+    """
+    config = config if config is not None else get_db_config()
+    arquivo = config.get('DB_GRAVACAO')
+    if not arquivo:
+        return None
+    try:
+        gravador = metrics.iniciar_gravacao(arquivo, config.get('DB_GRAVACAO_CHAVE') or None)
+        print(f"[INFO] Gravando operações do banco em {arquivo}")
+        return gravador
+    except OSError as e:
+        print(f"[AVISO] Não foi possível iniciar a gravação de operações: {e}")
+        return None
+
+def create_pool(minconn=1, maxconn=10):
+    """
+    Cria um pool de conexões com o primário (psycopg2.pool.ThreadedConnectionPool).
+
+    Usado por serviços com várias requisições simultâneas (api.py).
+    """
+    from psycopg2 import pool
+    config = get_db_config()
+    if not config or not all(k in config for k in ["DB_NAME", "DB_USER", "DB_PASSWORD", "DB_HOST", "DB_PORT"]):
+        raise psycopg2.OperationalError("Arquivo de configuração .env está incompleto ou ausente.")
+    return pool.ThreadedConnectionPool(
+        minconn, maxconn, _montar_dsn(config), connection_factory=ConexaoComOrcamento
+    )
+
+def _montar_dsn(config, host=None, port=None):
+    """Monta a string de conexão a partir do .env (host/porta podem ser sobrescritos para réplicas)"""
+    host = host or config.get('DB_HOST')
+    port = port or config.get('DB_PORT')
+    return f"dbname='{config.get('DB_NAME')}' user='{config.get('DB_USER')}' host='{host}' password='{config.get('DB_PASSWORD')}' port='{port}' client_encoding='utf8'"
+
+# ==================== ORÇAMENTOS DE TEMPO (TIMEOUTS) ====================
+#
+# Cada função de acesso a dados tem um orçamento de latência (@orcamento), aplicado
+# no servidor com SET LOCAL statement_timeout/lock_timeout no mesmo envio do comando
+# (sem ida e volta extra). Scripts podem definir um prazo total com prazo(segundos):
+# cada comando recebe como limite o menor entre o orçamento e o tempo restante.
+# Com ativar_cancelamento(), Ctrl+C durante uma consulta envia o cancelamento ao
+# servidor em vez de esperar a consulta terminar.
+#
+# Nesses casos o erro é TempoEsgotado (subclasse de QueryCanceled), com o motivo; o de
+# lock_timeout é também LockNotAvailable, para quem já trata espera por bloqueio.
+# Cancelamentos que não vêm de um limite nosso nem do usuário passam sem tradução.
+# DB_TIMEOUT_ESCALA no .env multiplica os orçamentos (0 desativa).
+
+_estado_tempo = threading.local()
+_escala_orcamento = None
+
+class TempoEsgotado(psycopg2.extensions.QueryCanceledError):
+    """
+    Comando interrompido por orçamento, prazo ou pedido do usuário.
+
+    Atributos:
+        motivo: 'statement_timeout', 'lock_timeout', 'prazo' ou 'cancelado'
+        funcao: Função de database.py em execução (se houver)
+        limite_ms: Limite aplicado ao comando (None se cancelado pelo usuário)
+    """
+
+    MENSAGENS = {
+        'statement_timeout': "consulta excedeu o tempo limite",
+        'lock_timeout': "tempo de espera por bloqueio excedido (registro em uso por outra operação)",
+        'prazo': "prazo da operação esgotado",
+        'cancelado': "consulta cancelada pelo usuário",
+    }
+
+    def __new__(cls, motivo, funcao=None, limite_ms=None):
+        if cls is TempoEsgotado and motivo == 'lock_timeout':
+            cls = BloqueioEsgotado
+        return super().__new__(cls, motivo, funcao, limite_ms)
+
+    def __init__(self, motivo, funcao=None, limite_ms=None):
+        detalhe = f" ({limite_ms} ms)" if limite_ms is not None else ""
+        origem = f"{funcao}: " if funcao else ""
+        super().__init__(f"{origem}{self.MENSAGENS[motivo]}{detalhe}")
+        self.motivo = motivo
+        self.funcao = funcao
+        self.limite_ms = limite_ms
+
+    @property
+    def pgcode(self):
+        return '55P03' if self.motivo == 'lock_timeout' else '57014'
+
+class BloqueioEsgotado(TempoEsgotado, psycopg2.errors.LockNotAvailable):
+    """TempoEsgotado('lock_timeout'): também capturável como LockNotAvailable"""
+
+def _escala():
+    global _escala_orcamento
+    if _escala_orcamento is None:
+        try:
+            _escala_orcamento = float(get_db_config().get('DB_TIMEOUT_ESCALA', 1))
+        except ValueError:
+            _escala_orcamento = 1.0
+    return _escala_orcamento
+
+def orcamento(statement_ms, lock_ms=None):
+    """
+    Decorador: orçamento de tempo da função (statement_timeout e lock_timeout em ms).
+
+    Se a função estourar o orçamento, a transação é desfeita (exceto com commit=False,
+    quando ela pertence a quem chama) e TempoEsgotado é lançado.
+    """
+    def decorador(funcao):
+        @functools.wraps(funcao)
+        def wrapper(conn, *args, **kwargs):
+            anterior = getattr(_estado_tempo, 'orcamento', None)
+            _estado_tempo.orcamento = (funcao.__name__, statement_ms, lock_ms)
+            try:
+                return funcao(conn, *args, **kwargs)
+            except TempoEsgotado:
+                if kwargs.get('commit', True) and not conn.closed:
+                    conn.rollback()
+                raise
+            finally:
+                _estado_tempo.orcamento = anterior
+        return wrapper
+    return decorador
+
+@contextlib.contextmanager
+def prazo(segundos):
+    """
+    Prazo total para um bloco (scripts em lote, requisições da API).
+
+    Todo comando executado no bloco, nesta thread, tem statement_timeout limitado
+    ao tempo restante; com o prazo esgotado, nenhum comando novo é enviado.
+    prazo(None) não impõe limite.
+    """
+    if segundos is None:
+        yield
+        return
+    anterior = getattr(_estado_tempo, 'prazo', None)
+    limite = time.monotonic() + segundos
+    _estado_tempo.prazo = limite if anterior is None else min(anterior, limite)
+    try:
+        yield
+    finally:
+        _estado_tempo.prazo = anterior
+
+def _limites_em_vigor():
+    """(função, statement_ms, lock_ms, por_prazo) para o próximo comando, ou None sem limites"""
+    funcao, statement_ms, lock_ms = getattr(_estado_tempo, 'orcamento', None) or (None, None, None)
+    escala = _escala()
+    if statement_ms is not None:
+        if escala <= 0:
+            statement_ms = lock_ms = None
+        else:
+            statement_ms = max(int(statement_ms * escala), 1)
+            lock_ms = max(int(lock_ms * escala), 1) if lock_ms is not None else None
+
+    por_prazo = False
+    limite_prazo = getattr(_estado_tempo, 'prazo', None)
+    if limite_prazo is not None:
+        restante_ms = int((limite_prazo - time.monotonic()) * 1000)
+        if restante_ms <= 0:
+            raise TempoEsgotado('prazo', funcao, 0)
+        if statement_ms is None or restante_ms < statement_ms:
+            statement_ms, por_prazo = restante_ms, True
+
+    if statement_ms is None:
+        return None
+    return funcao, statement_ms, lock_ms, por_prazo
+
+_COMANDOS_COM_PREFIXO = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE')
+
+class CursorComOrcamento(metrics.CursorInstrumentado):
+    """Cursor que aplica o orçamento/prazo em vigor e traduz cancelamentos em TempoEsgotado"""
+
+    def execute(self, query, vars=None):
+        conn = self.connection
+        limites = _limites_em_vigor()
+        prefixo = ''
+        if self.name is not None:
+            # Cursor nomeado (DECLARE ... no servidor): o limite vale para o resto da transação
+            if limites is not None and not conn.autocommit:
+                with psycopg2.extensions.cursor(conn) as cur:
+                    cur.execute(f"SET LOCAL statement_timeout = {limites[1]};")
+                conn.limites_locais = True
+        elif isinstance(query, str):
+            # Em autocommit o prefixo cria um bloco de transação implícito, que comandos
+            # como DETACH ... CONCURRENTLY não aceitam: só os comandos comuns recebem limite
+            aceita_prefixo = not conn.autocommit or query.lstrip().upper().startswith(_COMANDOS_COM_PREFIXO)
+            if limites is not None and aceita_prefixo:
+                _, statement_ms, lock_ms, _ = limites
+                prefixo = f"SET LOCAL statement_timeout = {statement_ms}; "
+                if lock_ms is not None:
+                    prefixo += f"SET LOCAL lock_timeout = {lock_ms}; "
+                conn.limites_locais = not conn.autocommit
+            elif limites is None and conn.limites_locais:
+                # Transação ainda aberta com limites de uma função anterior
+                if conn.get_transaction_status() == psycopg2.extensions.TRANSACTION_STATUS_INTRANS:
+                    prefixo = "SET LOCAL statement_timeout TO DEFAULT; SET LOCAL lock_timeout TO DEFAULT; "
+                conn.limites_locais = False
+        try:
+            return super().execute(prefixo + query if prefixo else query, vars)
+        except (psycopg2.errors.QueryCanceled, psycopg2.errors.LockNotAvailable) as e:
+            if isinstance(e, TempoEsgotado):
+                raise
+            traduzido = _traduzir_cancelamento(conn, e, limites)
+            if traduzido is None:
+                raise
+            raise traduzido from e
+
+def _traduzir_cancelamento(conn, erro, limites):
+    """TempoEsgotado correspondente ao erro, ou None se o limite não foi nosso"""
+    funcao = limites[0] if limites else None
+    if conn.cancelado_pelo_usuario:
+        conn.cancelado_pelo_usuario = False
+        return TempoEsgotado('cancelado', funcao)
+    if limites is None:
+        # Cancelamento externo (ex.: connection.cancel() da API) ou lock_timeout do chamador
+        return None
+    _, statement_ms, lock_ms, por_prazo = limites
+    if isinstance(erro, psycopg2.errors.LockNotAvailable):
+        # Sem lock_ms no orçamento, o lock_timeout foi definido por quem chama
+        return TempoEsgotado('lock_timeout', funcao, lock_ms) if lock_ms is not None else None
+    return TempoEsgotado('prazo' if por_prazo else 'statement_timeout', funcao, statement_ms)
+
+class ConexaoComOrcamento(metrics.ConexaoInstrumentada):
+    """Conexão instrumentada que usa CursorComOrcamento"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.limites_locais = False
+        self.cancelado_pelo_usuario = False
+
+    def cursor(self, *args, **kwargs):
+        kwargs.setdefault('cursor_factory', CursorComOrcamento)
+        return super().cursor(*args, **kwargs)
+
+def _aguardar_cancelavel(conn):
+    """
+    Callback de espera (psycopg2.extensions.set_wait_callback), como
+    psycopg2.extras.wait_select: Ctrl+C durante a espera envia o cancelamento
+    ao servidor e continua aguardando a resposta (que chega como erro).
+    """
+    while True:
+        try:
+            estado = conn.poll()
+            if estado == psycopg2.extensions.POLL_OK:
+                break
+            elif estado == psycopg2.extensions.POLL_READ:
+                select.select([conn.fileno()], [], [])
+            elif estado == psycopg2.extensions.POLL_WRITE:
+                select.select([], [conn.fileno()], [])
+            else:
+                raise conn.OperationalError(f"Estado de poll inesperado: {estado}")
+        except KeyboardInterrupt:
+            conn.cancel()
+            if isinstance(conn, ConexaoComOrcamento):
+                conn.cancelado_pelo_usuario = True
+
+def ativar_cancelamento():
+    """Permite interromper consultas com Ctrl+C (vale para todas as conexões do processo)"""
+    psycopg2.extensions.set_wait_callback(_aguardar_cancelavel)
+
+# ==================== ROTEAMENTO DE LEITURA PARA RÉPLICAS ====================
+#
+# Listagens e relatórios podem ser atendidos por réplicas em streaming replication,
+# aliviando o primário que atende os caixas. Cada réplica tem o atraso (lag) verificado
+# periodicamente; se estiver acima de DB_REPLICA_MAX_LAG ou inacessível, a leitura
+# volta automaticamente para a conexão primária.
+
+_replicas = None
+_replicas_lock = threading.Lock()   # protege só o estado das réplicas, nunca E/S
+_replica_max_lag = 5.0
+_replica_intervalo = 2.0
+
+def _carregar_replicas():
+    """Lê DB_REPLICAS do .env e prepara o estado de cada réplica (conexões preguiçosas)"""
+    global _replicas, _replica_max_lag, _replica_intervalo
+    config = get_db_config()
+    _replica_max_lag = float(config.get('DB_REPLICA_MAX_LAG', 5))
+    _replica_intervalo = float(config.get('DB_REPLICA_CHECK_INTERVAL', 2))
+    _replicas = []
+    for item in config.get('DB_REPLICAS', '').split(','):
+        item = item.strip()
+        if not item:
+            continue
+        host, _, port = item.partition(':')
+        _replicas.append({
+            'nome': item,
+            'dsn': _montar_dsn(config, host, port or config.get('DB_PORT')),
+            'conexoes': set(),      # conexões abertas (uma por thread), para close_replicas
+            'lag_ok': False,
+            'verificado_em': 0.0,
+            'verificando': False,   # uma thread mede o atraso; as demais usam o último resultado
+            'falhou_em': 0.0,
+        })
+    return _replicas
+
+def _medir_atraso(conn):
+    """
+    Mede o atraso da réplica em segundos.
+
+    Se tudo que foi recebido já foi aplicado, o atraso é zero (mesmo com o primário
+    ocioso, quando pg_last_xact_replay_timestamp() fica antigo). Retorna None se o
+    servidor não estiver em recuperação (não é réplica).
+    """
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT pg_is_in_recovery(),
+                   CASE
+                       WHEN pg_last_wal_receive_lsn() = pg_last_wal_replay_lsn() THEN 0
+                       ELSE COALESCE(EXTRACT(EPOCH FROM now() - pg_last_xact_replay_timestamp()), 0)
+                   END;
+        """)
+        em_recuperacao, atraso = cur.fetchone()
+    if not em_recuperacao:
+        return None
+    return float(atraso)
+
+_leitura_local = threading.local()
+
+@contextlib.contextmanager
+def somente_primario():
+    """
+    Dentro do bloco, as leituras desta thread vão à conexão primária.
+
+    Para cargas que precisam enxergar tudo que já foi confirmado no primário
+    (ex.: cache reconstruído após o LISTEN, ver notifications.py).
+    """
+    anterior = getattr(_leitura_local, 'primario', False)
+    _leitura_local.primario = True
+    try:
+        yield
+    finally:
+        _leitura_local.primario = anterior
+
+def _conexoes_da_thread():
+    """Conexões desta thread com as réplicas: nome da réplica -> conexão"""
+    conexoes = getattr(_leitura_local, 'conexoes', None)
+    if conexoes is None:
+        conexoes = _leitura_local.conexoes = {}
+    return conexoes
+
+def _conexao_replica(replica):
+    """Conexão desta thread com a réplica, aberta sob demanda (fora do lock)"""
+    conexoes = _conexoes_da_thread()
+    read_conn = conexoes.get(replica['nome'])
+    if read_conn is None or read_conn.closed:
+        read_conn = psycopg2.connect(replica['dsn'], connection_factory=ConexaoComOrcamento)
+        read_conn.set_session(readonly=True, autocommit=True)
+        conexoes[replica['nome']] = read_conn
+        with _replicas_lock:
+            replica['conexoes'].add(read_conn)
+    return read_conn
+
+def _fechar_conexao_replica(replica):
+    """Fecha a conexão desta thread com a réplica (as de outras threads seguem abertas)"""
+    read_conn = _conexoes_da_thread().pop(replica['nome'], None)
+    if read_conn is None:
+        return
+    with _replicas_lock:
+        replica['conexoes'].discard(read_conn)
+    if not read_conn.closed:
+        read_conn.close()
+
+def get_read_connection(conn):
+    """
+    SELEÇÃO DA CONEXÃO DE LEITURA
+
+    Retorna uma réplica saudável e dentro do atraso máximo, ou a conexão primária
+    recebida quando não há réplicas configuradas/disponíveis (ou dentro de
+    somente_primario()).
+
+    Cada thread usa conexões próprias com as réplicas: uma consulta nunca divide
+    conexão com outra thread. O lock só protege o estado compartilhado (atraso,
+    falhas); conexão e medição de atraso acontecem fora dele.
+    """
+    if getattr(_leitura_local, 'primario', False):
+        return conn
+    with _replicas_lock:
+        replicas = _replicas if _replicas is not None else _carregar_replicas()
+    if not replicas:
+        return conn
+
+    max_lag, intervalo = _replica_max_lag, _replica_intervalo
+    agora = time.monotonic()
+
+    for replica in replicas:
+        with _replicas_lock:
+            # Réplica que falhou recentemente fica fora até o próximo intervalo
+            if agora - replica['falhou_em'] < intervalo:
+                continue
+            medir = not replica['verificando'] and agora - replica['verificado_em'] >= intervalo
+            if medir:
+                replica['verificando'] = True
+            elif not replica['lag_ok']:
+                continue
+        try:
+            read_conn = _conexao_replica(replica)
+            if medir:
+                atraso = _medir_atraso(read_conn)
+                lag_ok = atraso is not None and atraso <= max_lag
+                with _replicas_lock:
+                    replica['lag_ok'] = lag_ok
+                    replica['verificado_em'] = agora
+                if not lag_ok:
+                    print(f"[AVISO] Réplica {replica['nome']} ignorada (atraso: {atraso}s, máximo: {max_lag}s)")
+                    continue
+            return read_conn
+        except psycopg2.Error as e:
+            print(f"[AVISO] Réplica {replica['nome']} indisponível, usando primário: {e}")
+            with _replicas_lock:
+                replica['falhou_em'] = agora
+                replica['lag_ok'] = False
+            _fechar_conexao_replica(replica)
+        finally:
+            if medir:
+                with _replicas_lock:
+                    replica['verificando'] = False
+
+    return conn
+
+def _descartar_replica(read_conn):
+    """Marca a réplica como falha após erro de consulta (a próxima leitura volta ao primário)"""
+    for nome, conexao in list(_conexoes_da_thread().items()):
+        if conexao is not read_conn:
+            continue
+        for replica in _replicas or []:
+            if replica['nome'] == nome:
+                with _replicas_lock:
+                    replica['falhou_em'] = time.monotonic()
+                    replica['lag_ok'] = False
+                _fechar_conexao_replica(replica)
+
+def _executar_leitura(conn, sql, params=None):
+    """Executa uma consulta somente leitura na réplica, repetindo no primário se a réplica falhar"""
+    read_conn = get_read_connection(conn)
+    if read_conn is not conn:
+        try:
+            with read_conn.cursor() as cur:
+                cur.execute(sql, params)
+                metrics.registrar_leitura('replica')
+                return cur.fetchall()
+        except psycopg2.Error as e:
+            print(f"[AVISO] Falha na réplica, repetindo no primário: {e}")
+            _descartar_replica(read_conn)
+    metrics.registrar_leitura('primario')
+    with conn.cursor() as cur:
+        cur.execute(sql, params)
+        return cur.fetchall()
+
+def close_replicas():
+    """Fecha as conexões abertas com réplicas (de todas as threads)"""
+    with _replicas_lock:
+        conexoes = [c for replica in _replicas or [] for c in replica['conexoes']]
+        for replica in _replicas or []:
+            replica['conexoes'].clear()
+    for read_conn in conexoes:
+        if not read_conn.closed:
+            read_conn.close()
+
+def desativar_replicas():
+    """
+    Desliga o roteamento para réplicas neste processo: toda leitura vai ao primário.
+
+    Para ferramentas que trabalham com dados que só existem no primário (ex.: o
+    schema de teste do plancheck.py, nunca replicado a tempo).
+    """
+    global _replicas
+    close_replicas()
+    with _replicas_lock:
+        _replicas = []
+
+# ==================== MIGRAÇÕES DO SCHEMA ====================
+# schema.sql é a única fonte do DDL. As seções acrescentadas depois da criação
+# original são migrações numeradas ("-- MIGRAÇÃO NNN: ..." até "-- FIM DA
+# MIGRAÇÃO NNN"), idempotentes, que se registram em Migracao_Aplicada. Um banco
+# criado com uma versão anterior do script recebe só as que faltam.
+
+SCHEMA_SQL = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'schema.sql')
+
+_RE_MIGRACAO = re.compile(r'^-- MIGRAÇÃO (\d{3}): (.*?)\s*$(.*?)^-- FIM DA MIGRAÇÃO \1\s*$', re.M | re.S)
+
+def ler_migracoes(caminho=SCHEMA_SQL):
+    """Lista [(numero, titulo, sql)] das migrações do schema.sql, em ordem"""
+    with open(caminho, encoding='utf-8') as f:
+        texto = f.read()
+    return sorted((int(m.group(1)), m.group(2), m.group(3)) for m in _RE_MIGRACAO.finditer(texto))
+
+def aplicar_migracoes(conn, caminho=SCHEMA_SQL):
+    """
+    Aplica as migrações do schema.sql ainda não registradas em Migracao_Aplicada.
+
+    Tudo em uma transação, sob trava consultiva: duas instâncias iniciando juntas
+    não aplicam a mesma migração duas vezes, e uma falha não deixa o banco pela
+    metade. Lança psycopg2.Error (com a transação desfeita) se uma delas falhar.
+
+    Returns:
+        list: (numero, titulo) das migrações aplicadas
+    """
+    migracoes = ler_migracoes(caminho)
+    try:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_advisory_xact_lock(hashtext('ru_migracoes'));")
+            cur.execute("SELECT to_regclass('migracao_aplicada') IS NOT NULL;")
+            aplicadas = set()
+            if cur.fetchone()[0]:
+                cur.execute("SELECT numero FROM Migracao_Aplicada;")
+                aplicadas = {linha[0] for linha in cur.fetchall()}
+            pendentes = [m for m in migracoes if m[0] not in aplicadas]
+            for numero, titulo, sql in pendentes:
+                cur.execute(sql)
+        conn.commit()
+    except psycopg2.Error:
+        conn.rollback()
+        raise
+    return [(numero, titulo) for numero, titulo, _ in pendentes]
+
 def setup_database_schema(conn):
-    """Verifica se as tabelas existem - não cria pois já existem no Supabase"""
+    """Verifica se as tabelas existem e aplica as migrações pendentes do schema.sql"""
     try:
         with conn.cursor() as cur:
             # Verifica se as tabelas principais existem
@@ -101,6 +672,10 @@ def setup_database_schema(conn):
                 print("[SUCESSO] Base de dados Supabase detectada e pronta para uso!")
             else:
                 print("[AVISO] Algumas tabelas podem estar faltando. Verificar configuração.")
+                return
+
+        for numero, titulo in aplicar_migracoes(conn):
+            print(f"[INFO] Migração {numero:03d} aplicada: {titulo}")
                 
     except psycopg2.Error as e:
         print(f"[ERRO] Erro ao verificar schema: {e}")
@@ -133,8 +708,63 @@ def populate_sample_data(conn):
     except psycopg2.Error as e:
         print(f"[ERRO] Erro ao verificar dados existentes: {e}")
 
+# ==================== CONCORRÊNCIA OTIMISTA ====================
+# Usuario, Pedido e Pagamento têm 'versao', incrementada por trigger a cada
+# UPDATE (seção CONCORRÊNCIA OTIMISTA do schema.sql). update_user/update_pedido/
+# update_pagamento recebem a versão lida (get_*_by_id com com_versao=True) e só
+# gravam se ela ainda for a atual: nenhuma trava fica aberta durante a edição.
+
+class ConflitoVersao(Exception):
+    """
+    O registro foi alterado ou removido por outra operação desde a leitura.
+
+    Atributos:
+        tabela: 'usuario', 'pedido' ou 'pagamento'
+        registro_id: ID do registro
+        versao: Versão com que a gravação foi tentada
+        atual: Linha atual no formato de get_*_by_id(com_versao=True), ou None se removido
+    """
+
+    def __init__(self, tabela, registro_id, versao, atual):
+        if atual is None:
+            mensagem = f"{tabela.capitalize()} {registro_id} foi removido por outra operação"
+        else:
+            mensagem = (f"{tabela.capitalize()} {registro_id} foi alterado por outra operação "
+                        f"(versão lida {versao}, atual {atual[-1]})")
+        super().__init__(mensagem)
+        self.tabela = tabela
+        self.registro_id = registro_id
+        self.versao = versao
+        self.atual = atual
+
+def _gravar_versionado(conn, tabela, registro_id, sql, params, versao, buscar):
+    """
+    Executa o UPDATE ... WHERE <chave> = %s{condicao} RETURNING versao
+
+    Sem 'versao', grava incondicionalmente (scripts e chamadores antigos).
+
+    Returns:
+        int: Nova versão (None se o registro não existe e 'versao' não foi informada)
+
+    Raises:
+        ConflitoVersao: A versão mudou ou o registro foi removido (nada foi gravado)
+    """
+    with conn.cursor() as cur:
+        if versao is None:
+            cur.execute(sql.format(condicao=''), params)
+        else:
+            cur.execute(sql.format(condicao=' AND versao = %s'), params + (versao,))
+        linha = cur.fetchone()
+    if linha is None and versao is not None:
+        conn.rollback()
+        raise ConflitoVersao(tabela, registro_id, versao, buscar(conn, registro_id, com_versao=True))
+    conn.commit()
+    return linha[0] if linha else None
+
 # CRUD USUARIO (ESTRUTURA REAL DO SUPABASE)
 
+@metrics.medir
+@orcamento(3000, 1000)
 def add_user(conn, user_data):
     """Adiciona um novo usuário usando estrutura real do Supabase"""
     sql = """
@@ -155,6 +785,8 @@ def add_user(conn, user_data):
         conn.commit()
         return user_id
 
+@metrics.medir
+@orcamento(5000)
 def get_all_users(conn):
     """Busca todos os usuários usando estrutura real do Supabase"""
     try:
@@ -163,72 +795,253 @@ def get_all_users(conn):
         FROM Usuario 
         ORDER BY id_usuario;
         """
-        with conn.cursor() as cur:
-            cur.execute(sql)
-            return cur.fetchall()
+        return _executar_leitura(conn, sql)
+    except TempoEsgotado:
+        # Tempo esgotado/cancelamento chega a quem chamou (transação já desfeita)
+        raise
     except psycopg2.Error as e:
         print(f"[ERRO] Erro ao buscar usuários: {e}")
         conn.rollback()
         return []
 
-def get_user_by_id(conn, user_id):
-    """Busca um usuário por ID usando estrutura real do Supabase"""
+@metrics.medir
+@orcamento(2000)
+def get_users_page(conn, apos_id=0, limite=50):
+    """Página de usuários por cursor (id_usuario > apos_id), sem OFFSET"""
     sql = """
     SELECT id_usuario, matricula_usuario, CPF_usuario, nome_usuario, email_usuario, telefone_usuario, status_usuario 
     FROM Usuario 
+    WHERE id_usuario > %s
+    ORDER BY id_usuario
+    LIMIT %s;
+    """
+    return _executar_leitura(conn, sql, (apos_id or 0, limite))
+
+@metrics.medir
+@orcamento(2000)
+def get_users_delta(conn, desde=None):
+    """
+    USUÁRIOS ALTERADOS DESDE UM INSTANTE (SINCRONIZAÇÃO INCREMENTAL)
+
+    Usa Usuario.atualizado_em e as lápides de Usuario_Removido (seção
+    SINCRONIZAÇÃO INCREMENTAL DE USUÁRIOS do schema.sql). Tudo vem de uma só
+    consulta, então linhas, lápides e marca refletem o mesmo instante.
+
+    Args:
+        desde: timestamptz da sincronização anterior (None = carga completa)
+
+    Returns:
+        tuple: (linhas no formato de get_all_users, IDs removidos, marca do servidor)
+    """
+    sql = """
+    SELECT 'U', id_usuario, matricula_usuario, CPF_usuario, nome_usuario, email_usuario, telefone_usuario, status_usuario, NULL::timestamptz
+    FROM Usuario
+    WHERE %(desde)s::timestamptz IS NULL OR atualizado_em > %(desde)s::timestamptz
+    UNION ALL
+    SELECT 'D', id_usuario, NULL, NULL, NULL, NULL, NULL, NULL, NULL
+    FROM Usuario_Removido
+    WHERE %(desde)s::timestamptz IS NOT NULL AND removido_em > %(desde)s::timestamptz
+    UNION ALL
+    SELECT 'M', NULL, NULL, NULL, NULL, NULL, NULL, NULL, now();
+    """
+    linhas, removidos, marca = [], [], None
+    for tipo, *dados in _executar_leitura(conn, sql, {'desde': desde}):
+        if tipo == 'U':
+            linhas.append(tuple(dados[:7]))
+        elif tipo == 'D':
+            removidos.append(dados[0])
+        else:
+            marca = dados[7]
+    return linhas, removidos, marca
+
+@metrics.medir
+@orcamento(1000)
+def get_user_by_id(conn, user_id, com_versao=False):
+    """
+    Busca um usuário por ID usando estrutura real do Supabase
+
+    com_versao: acrescenta 'versao' como última coluna (para update_user)
+    """
+    sql = """
+    SELECT id_usuario, matricula_usuario, CPF_usuario, nome_usuario, email_usuario, telefone_usuario, status_usuario,
+           versao
+    FROM Usuario 
     WHERE id_usuario = %s;
     """
     with conn.cursor() as cur:
         cur.execute(sql, (user_id,))
-        return cur.fetchone()
+        linha = cur.fetchone()
+    return linha if com_versao or linha is None else linha[:-1]
+
+@metrics.medir
+@orcamento(3000, 1000)
+def update_user(conn, user_id, user_data, versao=None):
+    """
+    Atualiza um usuário usando estrutura real do Supabase
+
+    versao: versão lida (get_user_by_id com com_versao=True); None grava sem conferir
 
-def update_user(conn, user_id, user_data):
-    """Atualiza um usuário usando estrutura real do Supabase"""
+    Returns:
+        int: Nova versão do usuário
+
+    Raises:
+        ConflitoVersao: O usuário mudou desde a leitura
+    """
     sql = """
     UPDATE Usuario 
     SET matricula_usuario = %s, CPF_usuario = %s, nome_usuario = %s, email_usuario = %s, telefone_usuario = %s, status_usuario = %s 
-    WHERE id_usuario = %s;
+    WHERE id_usuario = %s{condicao}
+    RETURNING versao;
     """
-    with conn.cursor() as cur:
-        cur.execute(sql, (
-            user_data['matricula_usuario'], 
-            user_data['CPF_usuario'], 
-            user_data['nome_usuario'], 
-            user_data['email_usuario'], 
-            user_data['telefone_usuario'], 
-            user_data['status_usuario'], 
-            user_id
-        ))
-        conn.commit()
+    return _gravar_versionado(conn, 'usuario', user_id, sql, (
+        user_data['matricula_usuario'], 
+        user_data['CPF_usuario'], 
+        user_data['nome_usuario'], 
+        user_data['email_usuario'], 
+        user_data['telefone_usuario'], 
+        user_data['status_usuario'], 
+        user_id
+    ), versao, get_user_by_id)
 
+@metrics.medir
+@orcamento(3000, 1000)
 def delete_user(conn, user_id):
-    """Deleta um usuário usando estrutura real do Supabase"""
+    """Deleta um usuário usando estrutura real do Supabase; False se o ID não existia"""
     sql = "DELETE FROM Usuario WHERE id_usuario = %s;"
     with conn.cursor() as cur:
         cur.execute(sql, (user_id,))
+        removido = cur.rowcount > 0
         conn.commit()
+    return removido
+
+@metrics.medir
+@orcamento(60000, 5000)
+def purge_users(conn, user_ids, lote=5000):
+    """
+    EXCLUSÃO EM CASCATA DE USUÁRIOS (SET-BASED)
+
+    Remove os usuários e tudo que depende deles, na ordem exigida pelas FKs:
+    PAGAMENTO → PEDIDO → FEEDBACK → CATEGORIA_USUARIO → USUARIO
+    (e também os registros em Pedido_Arquivo/Pagamento_Arquivo, se existirem).
+
+    Cada etapa é um DELETE por conjunto, repetido em lotes de 'lote' linhas para
+    usuários com histórico longo. Tudo ocorre em uma única transação.
+
+    Args:
+        conn: Conexão ativa com PostgreSQL
+        user_ids: IDs dos usuários a remover
+        lote: Linhas por DELETE nas tabelas grandes
+
+    Returns:
+        dict: Quantidade removida por tabela
+
+    Raises:
+        psycopg2.Error: Em caso de erro (a transação é desfeita)
+    """
+    ids = list({int(u) for u in user_ids})
+    contagens = {'pagamentos': 0, 'pedidos': 0, 'feedbacks': 0, 'categorias': 0, 'usuarios': 0}
+
+    def _em_lotes(cur, sql, chave):
+        while True:
+            cur.execute(sql, {'ids': ids, 'lote': lote})
+            contagens[chave] += cur.rowcount
+            if cur.rowcount < lote:
+                break
+
+    try:
+        with conn.cursor() as cur:
+            # Bloqueia os usuários: nenhum pedido novo pode surgir durante a exclusão
+            cur.execute("SELECT id_usuario FROM Usuario WHERE id_usuario = ANY(%s) FOR UPDATE;", (ids,))
+
+            # Pagamentos dos pedidos do usuário ou feitos com a categoria do usuário
+            _em_lotes(cur, """
+                DELETE FROM Pagamento WHERE id_pagamento IN (
+                    SELECT pg.id_pagamento FROM Pagamento pg
+                    WHERE pg.pag_categoria_usuario = ANY(%(ids)s)
+                       OR pg.pag_pedido IN (SELECT id_pedido FROM Pedido WHERE pedido_usuario = ANY(%(ids)s))
+                    LIMIT %(lote)s
+                );
+            """, 'pagamentos')
+
+            _em_lotes(cur, """
+                DELETE FROM Pedido WHERE id_pedido IN (
+                    SELECT id_pedido FROM Pedido WHERE pedido_usuario = ANY(%(ids)s) LIMIT %(lote)s
+                );
+            """, 'pedidos')
+
+            _em_lotes(cur, """
+                DELETE FROM Feedback WHERE id_feedback IN (
+                    SELECT id_feedback FROM Feedback WHERE feed_usuario = ANY(%(ids)s) LIMIT %(lote)s
+                );
+            """, 'feedbacks')
+
+            cur.execute("DELETE FROM Categoria_Usuario WHERE id_usuario = ANY(%s);", (ids,))
+            contagens['categorias'] = cur.rowcount
+
+            # Histórico arquivado (archive.py) também pertence ao usuário
+            cur.execute("SELECT to_regclass('pagamento_arquivo') IS NOT NULL;")
+            if cur.fetchone()[0]:
+                cur.execute("""
+                    DELETE FROM Pagamento_Arquivo
+                    WHERE pag_categoria_usuario = ANY(%(ids)s)
+                       OR pag_pedido IN (SELECT id_pedido FROM Pedido_Arquivo WHERE pedido_usuario = ANY(%(ids)s));
+                """, {'ids': ids})
+                contagens['pagamentos_arquivados'] = cur.rowcount
+                cur.execute("DELETE FROM Pedido_Arquivo WHERE pedido_usuario = ANY(%s);", (ids,))
+                contagens['pedidos_arquivados'] = cur.rowcount
+
+            cur.execute("DELETE FROM Usuario WHERE id_usuario = ANY(%s);", (ids,))
+            contagens['usuarios'] = cur.rowcount
+        conn.commit()
+    except psycopg2.Error as e:
+        print(f"[ERRO] Erro ao remover usuários: {e}")
+        conn.rollback()
+        raise
+
+    return contagens
+
+@metrics.medir
+def purge_user(conn, user_id, lote=5000):
+    """Remove um usuário com pedidos, pagamentos, feedbacks e categorias (ver purge_users)"""
+    return purge_users(conn, [user_id], lote)
 
 # CRUD PEDIDO (ESTRUTURA REAL SUPABASE)
 
-def add_pedido(conn, pedido_data):
-    """Adiciona um novo pedido usando estrutura real do Supabase"""
+@metrics.medir
+@orcamento(3000, 1000)
+def add_pedido(conn, pedido_data, commit=True):
+    """
+    Adiciona um novo pedido usando estrutura real do Supabase
+
+    'data_hora' é opcional em pedido_data (pedidos registrados offline mantêm o
+    horário do registro). Com commit=False, a transação fica a cargo de quem chama.
+    """
     sql = """
-    INSERT INTO Pedido (pedido_usuario, ped_cardapio, status_do_pedido) 
-    VALUES (%s, %s, %s)
+    INSERT INTO Pedido (pedido_usuario, ped_cardapio, status_do_pedido, data_hora) 
+    VALUES (%s, %s, %s, COALESCE(%s::timestamp, CURRENT_TIMESTAMP))
     RETURNING id_pedido;
     """
     with conn.cursor() as cur:
         cur.execute(sql, (
             pedido_data['pedido_usuario'], 
             pedido_data['ped_cardapio'], 
-            pedido_data['status_do_pedido']
+            pedido_data['status_do_pedido'],
+            pedido_data.get('data_hora')
         ))
         pedido_id = cur.fetchone()[0]
-        conn.commit()
+        if commit:
+            conn.commit()
         return pedido_id
 
-def get_all_pedidos(conn):
-    """Busca todos os pedidos com dados do usuário usando estrutura real do Supabase"""
+@metrics.medir
+@orcamento(10000)
+def get_all_pedidos(conn, desde=None):
+    """
+    Busca todos os pedidos com dados do usuário usando estrutura real do Supabase
+
+    Com 'desde' (date/datetime), filtra por data_hora com predicado de intervalo
+    direto na coluna, permitindo que o PostgreSQL descarte partições antigas.
+    """
     try:
         sql = """
         SELECT p.id_pedido, p.pedido_usuario, u.nome_usuario, p.data_hora, p.status_do_pedido, 
@@ -236,18 +1049,47 @@ def get_all_pedidos(conn):
         FROM Pedido p
         JOIN Usuario u ON p.pedido_usuario = u.id_usuario
         LEFT JOIN Cardapio c ON p.ped_cardapio = c.id_cardapio
+        WHERE %(desde)s::timestamp IS NULL OR p.data_hora >= %(desde)s::timestamp
         ORDER BY p.data_hora DESC;
         """
-        with conn.cursor() as cur:
-            cur.execute(sql)
-            return cur.fetchall()
+        return _executar_leitura(conn, sql, {'desde': desde})
+    except TempoEsgotado:
+        raise
     except psycopg2.Error as e:
         print(f"[ERRO] Erro ao buscar pedidos: {e}")
         conn.rollback()
         return []
 
-def get_pedidos_pendentes(conn):
-    """Busca pedidos pendentes de pagamento usando estrutura real do Supabase"""
+@metrics.medir
+@orcamento(2000)
+def get_pedidos_page(conn, antes_id=None, limite=50, desde=None):
+    """
+    Página de pedidos por cursor, do mais recente para o mais antigo (id_pedido < antes_id)
+
+    Com 'desde', só pedidos a partir dessa data (poda de partições, como em get_all_pedidos).
+    """
+    sql = """
+    SELECT p.id_pedido, p.pedido_usuario, u.nome_usuario, p.data_hora, p.status_do_pedido, 
+           c.tipo as tipo_cardapio, c.observacao
+    FROM Pedido p
+    JOIN Usuario u ON p.pedido_usuario = u.id_usuario
+    LEFT JOIN Cardapio c ON p.ped_cardapio = c.id_cardapio
+    WHERE (%(antes)s::int IS NULL OR p.id_pedido < %(antes)s::int)
+      AND (%(desde)s::timestamp IS NULL OR p.data_hora >= %(desde)s::timestamp)
+    ORDER BY p.id_pedido DESC
+    LIMIT %(limite)s;
+    """
+    return _executar_leitura(conn, sql, {'antes': antes_id, 'limite': limite, 'desde': desde})
+
+@metrics.medir
+@orcamento(5000)
+def get_pedidos_pendentes(conn, desde=None):
+    """
+    Busca pedidos pendentes de pagamento usando estrutura real do Supabase
+
+    NOT EXISTS (anti-join) permite busca pelo índice de pag_pedido em cada partição,
+    ao contrário de NOT IN, que materializa todos os pagamentos.
+    """
     try:
         sql = """
         SELECT p.id_pedido, p.pedido_usuario, u.nome_usuario, p.data_hora, p.status_do_pedido,
@@ -256,59 +1098,292 @@ def get_pedidos_pendentes(conn):
         JOIN Usuario u ON p.pedido_usuario = u.id_usuario
         LEFT JOIN Cardapio c ON p.ped_cardapio = c.id_cardapio
         WHERE p.status_do_pedido IN ('pendente', 'pago')
-          AND p.id_pedido NOT IN (
-              SELECT pg.pag_pedido FROM Pagamento pg WHERE pg.pag_pedido IS NOT NULL
+          AND (%(desde)s::timestamp IS NULL OR p.data_hora >= %(desde)s::timestamp)
+          AND NOT EXISTS (
+              SELECT 1 FROM Pagamento pg WHERE pg.pag_pedido = p.id_pedido
           )
         ORDER BY p.data_hora;
         """
-        with conn.cursor() as cur:
-            cur.execute(sql)
-            return cur.fetchall()
+        return _executar_leitura(conn, sql, {'desde': desde})
+    except TempoEsgotado:
+        raise
     except psycopg2.Error as e:
         print(f"[ERRO] Erro ao buscar pedidos pendentes: {e}")
         conn.rollback()
         return []
 
-def get_pedido_by_id(conn, pedido_id):
-    """Busca um pedido por ID usando estrutura real do Supabase"""
+@metrics.medir
+@orcamento(1000)
+def get_pedido_pendente_by_id(conn, pedido_id):
+    """Busca um pedido no formato de get_pedidos_pendentes (None se não estiver mais pendente)"""
     sql = """
     SELECT p.id_pedido, p.pedido_usuario, u.nome_usuario, p.data_hora, p.status_do_pedido,
-           p.ped_cardapio, c.tipo as tipo_cardapio
+           c.tipo as tipo_cardapio
     FROM Pedido p
     JOIN Usuario u ON p.pedido_usuario = u.id_usuario
     LEFT JOIN Cardapio c ON p.ped_cardapio = c.id_cardapio
-    WHERE p.id_pedido = %s;
+    WHERE p.id_pedido = %s
+      AND p.status_do_pedido IN ('pendente', 'pago')
+      AND NOT EXISTS (SELECT 1 FROM Pagamento pg WHERE pg.pag_pedido = p.id_pedido);
     """
     with conn.cursor() as cur:
         cur.execute(sql, (pedido_id,))
         return cur.fetchone()
 
-def update_pedido(conn, pedido_id, pedido_data):
-    """Atualiza um pedido usando estrutura real do Supabase"""
+@metrics.medir
+@orcamento(1000)
+def get_pedido_by_id(conn, pedido_id, com_versao=False):
+    """
+    Busca um pedido por ID usando estrutura real do Supabase
+
+    com_versao: acrescenta 'versao' como última coluna (para update_pedido)
+    """
+    sql = """
+    SELECT p.id_pedido, p.pedido_usuario, u.nome_usuario, p.data_hora, p.status_do_pedido,
+           p.ped_cardapio, c.tipo as tipo_cardapio, p.versao
+    FROM Pedido p
+    JOIN Usuario u ON p.pedido_usuario = u.id_usuario
+    LEFT JOIN Cardapio c ON p.ped_cardapio = c.id_cardapio
+    WHERE p.id_pedido = %s;
+    """
+    with conn.cursor() as cur:
+        cur.execute(sql, (pedido_id,))
+        linha = cur.fetchone()
+    return linha if com_versao or linha is None else linha[:-1]
+
+@metrics.medir
+@orcamento(3000, 1000)
+def update_pedido(conn, pedido_id, pedido_data, versao=None):
+    """
+    Atualiza um pedido usando estrutura real do Supabase
+
+    versao: versão lida (get_pedido_by_id com com_versao=True); None grava sem conferir
+
+    Returns:
+        int: Nova versão do pedido
+
+    Raises:
+        ConflitoVersao: O pedido mudou desde a leitura (ex.: entregue na catraca)
+    """
     sql = """
     UPDATE Pedido 
     SET pedido_usuario = %s, ped_cardapio = %s, status_do_pedido = %s 
-    WHERE id_pedido = %s;
+    WHERE id_pedido = %s{condicao}
+    RETURNING versao;
     """
-    with conn.cursor() as cur:
-        cur.execute(sql, (
-            pedido_data['pedido_usuario'], 
-            pedido_data['ped_cardapio'], 
-            pedido_data['status_do_pedido'], 
-            pedido_id
-        ))
-        conn.commit()
+    return _gravar_versionado(conn, 'pedido', pedido_id, sql, (
+        pedido_data['pedido_usuario'], 
+        pedido_data['ped_cardapio'], 
+        pedido_data['status_do_pedido'], 
+        pedido_id
+    ), versao, get_pedido_by_id)
 
+@metrics.medir
+@orcamento(3000, 1000)
 def delete_pedido(conn, pedido_id):
-    """Deleta um pedido usando estrutura real do Supabase"""
+    """Deleta um pedido usando estrutura real do Supabase; False se o ID não existia"""
     sql = "DELETE FROM Pedido WHERE id_pedido = %s;"
     with conn.cursor() as cur:
         cur.execute(sql, (pedido_id,))
+        removido = cur.rowcount > 0
         conn.commit()
+    return removido
+
+# ADMISSÃO DE PEDIDOS (RESERVAS DE VAGA - admission.py)
+
+# Pedidos não cancelados da unidade/dia/tipo (unidade pela vw_cardapio_unidade).
+# Mesma regra de VerificarCapacidadeUnidade e capacidade_unidades (migração 015):
+# pendente conta, pois é o estado em que confirmar_reserva grava o pedido
+_SQL_OCUPADAS = """
+    SELECT COUNT(*) FROM Pedido ped
+    JOIN vw_cardapio_unidade cu ON ped.ped_cardapio = cu.id_cardapio
+    WHERE cu.id_unidade = u.id_unidade
+      AND cu.tipo = {tipo}
+      AND ped.data_hora >= {data} AND ped.data_hora < {data} + 1
+      AND ped.status_do_pedido <> 'cancelado'
+"""
+
+@metrics.medir
+@orcamento(2000, 1000)
+def reservar_vaga(conn, id_unidade, data, tipo_refeicao, validade=120):
+    """
+    RESERVA UMA VAGA (unidade, data, tipo) COM VALIDADE
+
+    Decremento atômico do saldo em Vaga_Refeicao e registro da reserva em um
+    único comando, em transação própria (o bloqueio da linha de saldo dura só
+    esse comando). O saldo do dia é criado na primeira reserva.
+
+    Args:
+        validade: Segundos até a reserva vencer se não virar pedido
+
+    Returns:
+        tuple: (id_reserva, expira_em), ou None se não houver vaga
+    """
+    parametros = {'unidade': id_unidade, 'data': data, 'tipo': tipo_refeicao, 'validade': validade}
+    sql_reservar = """
+    WITH vaga AS (
+        UPDATE Vaga_Refeicao
+        SET disponiveis = disponiveis - 1
+        WHERE id_unidade = %(unidade)s AND data = %(data)s AND tipo_refeicao = %(tipo)s
+          AND disponiveis > 0
+        RETURNING id_unidade, data, tipo_refeicao
+    )
+    INSERT INTO Reserva_Vaga (id_unidade, data, tipo_refeicao, expira_em)
+    SELECT id_unidade, data, tipo_refeicao, clock_timestamp() + make_interval(secs => %(validade)s)
+    FROM vaga
+    RETURNING id_reserva, expira_em;
+    """
+    sql_iniciar = f"""
+    INSERT INTO Vaga_Refeicao (id_unidade, data, tipo_refeicao, capacidade, disponiveis)
+    SELECT u.id_unidade, %(data)s::date, %(tipo)s, u.capacidade,
+           GREATEST(u.capacidade - ({_SQL_OCUPADAS.format(tipo='%(tipo)s', data='%(data)s::date')}), 0)
+    FROM Unidade u
+    WHERE u.id_unidade = %(unidade)s
+    ON CONFLICT DO NOTHING;
+    """
+    try:
+        with conn.cursor() as cur:
+            cur.execute(sql_reservar, parametros)
+            reserva = cur.fetchone()
+            if reserva is None:
+                # Sem linha de saldo para o dia (primeira reserva) ou saldo zerado
+                cur.execute(sql_iniciar, parametros)
+                if cur.rowcount:
+                    cur.execute(sql_reservar, parametros)
+                    reserva = cur.fetchone()
+        conn.commit()
+        return reserva
+    except psycopg2.Error:
+        conn.rollback()
+        raise
+
+@metrics.medir
+@orcamento(3000, 1000)
+def confirmar_reserva(conn, id_reserva, pedido_data):
+    """
+    Cria o pedido consumindo a reserva, na mesma transação
+
+    Returns:
+        int: ID do pedido, ou None se a reserva venceu/já foi usada (nada é gravado)
+    """
+    try:
+        pedido_id = add_pedido(conn, pedido_data, commit=False)
+        with conn.cursor() as cur:
+            cur.execute("""
+                UPDATE Reserva_Vaga SET id_pedido = %s
+                WHERE id_reserva = %s AND id_pedido IS NULL AND expira_em > clock_timestamp();
+            """, (pedido_id, id_reserva))
+            if cur.rowcount == 0:
+                conn.rollback()
+                return None
+        conn.commit()
+        return pedido_id
+    except psycopg2.Error:
+        conn.rollback()
+        raise
+
+@metrics.medir
+@orcamento(2000, 1000)
+def liberar_reserva(conn, id_reserva):
+    """Desiste de uma reserva não usada e devolve a vaga; False se ela já não existia"""
+    sql = """
+    WITH liberada AS (
+        DELETE FROM Reserva_Vaga WHERE id_reserva = %s AND id_pedido IS NULL
+        RETURNING id_unidade, data, tipo_refeicao
+    )
+    UPDATE Vaga_Refeicao v
+    SET disponiveis = v.disponiveis + 1
+    FROM liberada l
+    WHERE v.id_unidade = l.id_unidade AND v.data = l.data AND v.tipo_refeicao = l.tipo_refeicao;
+    """
+    with conn.cursor() as cur:
+        cur.execute(sql, (id_reserva,))
+        liberou = cur.rowcount > 0
+    conn.commit()
+    return liberou
+
+@metrics.medir
+@orcamento(10000, 2000)
+def liberar_reservas_expiradas(conn):
+    """Devolve as vagas das reservas vencidas (função liberar_reservas_expiradas do schema.sql)"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT liberar_reservas_expiradas();")
+        liberadas = cur.fetchone()[0]
+    conn.commit()
+    return liberadas
+
+@metrics.medir
+@orcamento(10000, 2000)
+def recalcular_vagas(conn, data):
+    """
+    Recalcula os saldos do dia a partir dos pedidos e reservas em aberto
+
+    Necessário quando pedidos entram sem passar pela admissão (fila offline,
+    admissão desligada) ou quando a capacidade da unidade muda.
+    """
+    sql = f"""
+    UPDATE Vaga_Refeicao v
+    SET capacidade = u.capacidade,
+        disponiveis = GREATEST(
+            u.capacidade
+            - ({_SQL_OCUPADAS.format(tipo='v.tipo_refeicao', data='v.data')})
+            - (SELECT COUNT(*) FROM Reserva_Vaga r
+               WHERE r.id_unidade = v.id_unidade AND r.data = v.data AND r.tipo_refeicao = v.tipo_refeicao
+                 AND r.id_pedido IS NULL AND r.expira_em > clock_timestamp()),
+            0)
+    FROM Unidade u
+    WHERE u.id_unidade = v.id_unidade AND v.data = %s;
+    """
+    with conn.cursor() as cur:
+        cur.execute(sql, (data,))
+        atualizados = cur.rowcount
+    conn.commit()
+    return atualizados
+
+@metrics.medir
+@orcamento(2000)
+def get_vagas(conn, data):
+    """Saldos do dia: (unidade, nome, tipo, capacidade, disponíveis, reservas em aberto)"""
+    sql = """
+    SELECT v.id_unidade, u.nome_unidade, v.tipo_refeicao, v.capacidade, v.disponiveis,
+           (SELECT COUNT(*) FROM Reserva_Vaga r
+            WHERE r.id_unidade = v.id_unidade AND r.data = v.data AND r.tipo_refeicao = v.tipo_refeicao
+              AND r.id_pedido IS NULL)
+    FROM Vaga_Refeicao v
+    JOIN Unidade u ON u.id_unidade = v.id_unidade
+    WHERE v.data = %s
+    ORDER BY v.id_unidade, array_position(ARRAY['cafe', 'almoco', 'jantar']::VARCHAR(20)[], v.tipo_refeicao);
+    """
+    return _executar_leitura(conn, sql, (data,))
+
+@metrics.medir
+@orcamento(1000)
+def get_unidade_do_cardapio(conn, id_cardapio):
+    """
+    Unidade e tipo de refeição de um cardápio (vw_cardapio_unidade)
+
+    Cardapio.id_unidade (cardápio próprio) tem precedência; para cardápio geral,
+    vale a unidade que o aponta em Unidade.id_cardapio.
+
+    Returns:
+        tuple: (id_unidade, tipo, propria); id_unidade é None se nenhuma unidade
+        serve o cardápio, propria indica cardápio da própria unidade. None se o
+        cardápio não existe.
+    """
+    sql = """
+    SELECT id_unidade, tipo, propria
+    FROM vw_cardapio_unidade
+    WHERE id_cardapio = %s;
+    """
+    with conn.cursor() as cur:
+        cur.execute(sql, (id_cardapio,))
+        return cur.fetchone()
 
 #  CRUD PAGAMENTO (ESTRUTURA REAL SUPABASE)
 
-def add_pagamento(conn, pagamento_data):
+@metrics.medir
+@orcamento(3000, 1000)
+def add_pagamento(conn, pagamento_data, commit=True):
     """
     FUNÇÃO PRINCIPAL: CADASTRO DE PAGAMENTO
     
@@ -328,6 +1403,8 @@ def add_pagamento(conn, pagamento_data):
     Args:
         conn: Conexão ativa com PostgreSQL
         pagamento_data: Dict com dados do pagamento
+        commit: False para inserir dentro de uma transação controlada por quem chama
+                (sem commit, sem rollback e sem mensagem de erro)
         
     Returns:
         int: ID do pagamento criado
@@ -355,27 +1432,18 @@ def add_pagamento(conn, pagamento_data):
         # A FK composta exige que (id_usuario, nome_categoria) exista em CATEGORIA_USUARIO
         
         
-        # Verificar se a categoria já existe para este usuário
-        categoria_existente = get_categoria_usuario(conn, user_id, categoria_nome)
+        # Garante a categoria em uma única instrução (upsert), na mesma transação do pagamento
+        categoria_existente = create_categoria_usuario_if_not_exists(conn, user_id, categoria_nome, commit=False)
         
         if not categoria_existente:
-            # Tentativa de criação automática da categoria
-            categoria_criada = create_categoria_usuario_if_not_exists(conn, user_id, categoria_nome)
-            
-            if not categoria_criada:
-                raise psycopg2.Error(f"Não foi possível criar categoria ({user_id}, {categoria_nome})")
-            
-            # Verificação dupla: confirmar que a categoria foi realmente criada
-            categoria_existente = get_categoria_usuario(conn, user_id, categoria_nome)
-            if not categoria_existente:
-                raise psycopg2.Error(f"Categoria ({user_id}, {categoria_nome}) não foi criada corretamente")
+            raise psycopg2.Error(f"Não foi possível criar categoria ({user_id}, {categoria_nome}): usuário inexistente")
         
         # FASE 3: INSERÇÃO DO PAGAMENTO COM CHAVE ESTRANGEIRA COMPOSTA
         # Agora que garantimos a existência da categoria, podemos inserir o pagamento
         # A FK composta (pag_categoria_usuario, pag_categoria_nome) será válida
         sql = """
-        INSERT INTO Pagamento (pag_pedido, valor_pago, forma_de_pagamento, pag_categoria_usuario, pag_categoria_nome) 
-        VALUES (%s, %s, %s, %s, %s)
+        INSERT INTO Pagamento (pag_pedido, valor_pago, forma_de_pagamento, pag_categoria_usuario, pag_categoria_nome, data_pagamento) 
+        VALUES (%s, %s, %s, %s, %s, COALESCE(%s::timestamp, CURRENT_TIMESTAMP))
         RETURNING id_pagamento;
         """
         
@@ -385,20 +1453,29 @@ def add_pagamento(conn, pagamento_data):
                 pagamento_data['valor_pago'], 
                 pagamento_data['forma_de_pagamento'], 
                 user_id,  # FK composta - parte 1: id_usuario
-                categoria_nome  # FK composta - parte 2: nome_categoria  
+                categoria_nome,  # FK composta - parte 2: nome_categoria  
+                pagamento_data.get('data_pagamento')  # Opcional: horário do registro offline
             ))
             pagamento_id = cur.fetchone()[0]
-            conn.commit()
+            if commit:
+                conn.commit()
             # SUCESSO: Pagamento inserido com integridade referencial preservada
             return pagamento_id
         
     except psycopg2.Error as e:
-        print(f"[ERRO] Erro ao adicionar pagamento: {e}")
-        conn.rollback()
+        if commit:
+            print(f"[ERRO] Erro ao adicionar pagamento: {e}")
+            conn.rollback()
         raise e  # Relança o erro original sem fallback que pode violar NOT NULL
 
-def get_all_pagamentos(conn):
-    """Busca todos os pagamentos com dados do pedido e usuário usando estrutura real do Supabase"""
+@metrics.medir
+@orcamento(10000)
+def get_all_pagamentos(conn, desde=None):
+    """
+    Busca todos os pagamentos com dados do pedido e usuário usando estrutura real do Supabase
+
+    Com 'desde', filtra por data_pagamento (poda de partições de Pagamento).
+    """
     try:
         sql = """
         SELECT pg.id_pagamento, pg.pag_pedido, u.nome_usuario, pg.valor_pago, 
@@ -407,18 +1484,25 @@ def get_all_pagamentos(conn):
         FROM Pagamento pg
         JOIN Pedido p ON pg.pag_pedido = p.id_pedido
         JOIN Usuario u ON p.pedido_usuario = u.id_usuario
+        WHERE %(desde)s::timestamp IS NULL OR pg.data_pagamento >= %(desde)s::timestamp
         ORDER BY pg.data_pagamento DESC;
         """
-        with conn.cursor() as cur:
-            cur.execute(sql)
-            return cur.fetchall()
+        return _executar_leitura(conn, sql, {'desde': desde})
+    except TempoEsgotado:
+        raise
     except psycopg2.Error as e:
         print(f"[ERRO] Erro ao buscar pagamentos: {e}")
         conn.rollback()
         return []
 
-def get_pagamento_by_id(conn, pagamento_id):
-    """Busca um pagamento por ID usando estrutura real do Supabase"""
+@metrics.medir
+@orcamento(2000)
+def get_pagamentos_page(conn, antes_id=None, limite=50, desde=None):
+    """
+    Página de pagamentos por cursor, do mais recente para o mais antigo (id_pagamento < antes_id)
+
+    Com 'desde', só pagamentos a partir dessa data (poda de partições, como em get_all_pagamentos).
+    """
     sql = """
     SELECT pg.id_pagamento, pg.pag_pedido, u.nome_usuario, pg.valor_pago, 
            pg.forma_de_pagamento, pg.data_pagamento, pg.pag_categoria_nome,
@@ -426,40 +1510,80 @@ def get_pagamento_by_id(conn, pagamento_id):
     FROM Pagamento pg
     JOIN Pedido p ON pg.pag_pedido = p.id_pedido
     JOIN Usuario u ON p.pedido_usuario = u.id_usuario
+    WHERE (%(antes)s::int IS NULL OR pg.id_pagamento < %(antes)s::int)
+      AND (%(desde)s::timestamp IS NULL OR pg.data_pagamento >= %(desde)s::timestamp)
+    ORDER BY pg.id_pagamento DESC
+    LIMIT %(limite)s;
+    """
+    return _executar_leitura(conn, sql, {'antes': antes_id, 'limite': limite, 'desde': desde})
+
+@metrics.medir
+@orcamento(1000)
+def get_pagamento_by_id(conn, pagamento_id, com_versao=False):
+    """
+    Busca um pagamento por ID usando estrutura real do Supabase
+
+    com_versao: acrescenta 'versao' como última coluna (para update_pagamento)
+    """
+    sql = """
+    SELECT pg.id_pagamento, pg.pag_pedido, u.nome_usuario, pg.valor_pago, 
+           pg.forma_de_pagamento, pg.data_pagamento, pg.pag_categoria_nome,
+           p.status_do_pedido, pg.versao
+    FROM Pagamento pg
+    JOIN Pedido p ON pg.pag_pedido = p.id_pedido
+    JOIN Usuario u ON p.pedido_usuario = u.id_usuario
     WHERE pg.id_pagamento = %s;
     """
     with conn.cursor() as cur:
         cur.execute(sql, (pagamento_id,))
-        return cur.fetchone()
+        linha = cur.fetchone()
+    return linha if com_versao or linha is None else linha[:-1]
+
+@metrics.medir
+@orcamento(3000, 1000)
+def update_pagamento(conn, pagamento_id, pagamento_data, versao=None):
+    """
+    Atualiza um pagamento usando estrutura real do Supabase
+
+    versao: versão lida (get_pagamento_by_id com com_versao=True); None grava sem conferir
 
-def update_pagamento(conn, pagamento_id, pagamento_data):
-    """Atualiza um pagamento usando estrutura real do Supabase"""
+    Returns:
+        int: Nova versão do pagamento
+
+    Raises:
+        ConflitoVersao: O pagamento mudou desde a leitura
+    """
     sql = """
     UPDATE Pagamento 
     SET pag_pedido = %s, valor_pago = %s, forma_de_pagamento = %s, 
         pag_categoria_usuario = %s, pag_categoria_nome = %s 
-    WHERE id_pagamento = %s;
+    WHERE id_pagamento = %s{condicao}
+    RETURNING versao;
     """
-    with conn.cursor() as cur:
-        cur.execute(sql, (
-            pagamento_data['pag_pedido'], 
-            pagamento_data['valor_pago'], 
-            pagamento_data['forma_de_pagamento'], 
-            pagamento_data['pag_categoria_usuario'], 
-            pagamento_data['pag_categoria_nome'], 
-            pagamento_id
-        ))
-        conn.commit()
+    return _gravar_versionado(conn, 'pagamento', pagamento_id, sql, (
+        pagamento_data['pag_pedido'], 
+        pagamento_data['valor_pago'], 
+        pagamento_data['forma_de_pagamento'], 
+        pagamento_data['pag_categoria_usuario'], 
+        pagamento_data['pag_categoria_nome'], 
+        pagamento_id
+    ), versao, get_pagamento_by_id)
 
+@metrics.medir
+@orcamento(3000, 1000)
 def delete_pagamento(conn, pagamento_id):
-    """Deleta um pagamento usando estrutura real do Supabase"""
+    """Deleta um pagamento usando estrutura real do Supabase; False se o ID não existia"""
     sql = "DELETE FROM Pagamento WHERE id_pagamento = %s;"
     with conn.cursor() as cur:
         cur.execute(sql, (pagamento_id,))
+        removido = cur.rowcount > 0
         conn.commit()
+    return removido
 
 # ==================== FUNÇÕES AUXILIARES ====================
 
+@metrics.medir
+@orcamento(2000)
 def get_cardapios_disponiveis(conn):
     """Busca cardápios disponíveis para vincular pedidos"""
     sql = """
@@ -467,10 +1591,334 @@ def get_cardapios_disponiveis(conn):
     FROM Cardapio 
     ORDER BY data_inicio DESC;
     """
+    return _executar_leitura(conn, sql)
+
+@metrics.medir
+@orcamento(1000)
+def get_cardapios_vigentes(conn, data):
+    """
+    Cardápios em vigor em uma data (todos os tipos e unidades)
+
+    Busca pelo índice GiST da restrição cardapio_sem_sobreposicao (vigencia @> data).
+
+    Returns:
+        list: (id_cardapio, tipo, id_unidade, data_inicio, data_fim, observacao);
+        id_unidade None = cardápio geral
+    """
+    sql = """
+    SELECT id_cardapio, tipo, id_unidade, data_inicio, data_fim, observacao
+    FROM Cardapio
+    WHERE vigencia @> %s::date
+    ORDER BY tipo, id_unidade NULLS LAST;
+    """
+    return _executar_leitura(conn, sql, (data,))
+
+# Regras das categorias (Resolução 27/2018 CAD/UnB para preços do RU).
+# Os valores cobrados por categoria e refeição ficam em Tabela_Preco (ver pricing.py).
+CATEGORIAS_CONFIG = {
+    'estudante_assistencia': {
+        'grupo': 1,                    # Grupo prioritário
+        'subsidio': 'total',           # 100% subsidiado (R$ 0,00)
+        'beneficio': 'Desconto total - Assistência estudantil'
+    },
+    'estudante_regular': {
+        'grupo': 2,                    # Grupo intermediário  
+        'subsidio': 'parcial',         # Fração subsidiada: ver subsidy.subsidio_atual
+        'beneficio': 'Desconto parcial - Estudante regular'
+    },
+    'servidor': {
+        'grupo': 3,                    # Sem prioridade
+        'subsidio': 'sem_subsidio',    # Preço integral
+        'beneficio': 'Preço integral - Servidor'
+    }
+}
+
+@metrics.medir
+@orcamento(2000)
+def get_tabela_precos(conn):
+    """Busca todas as faixas de preço (categoria, tipo de refeição, vigência, valor)"""
+    sql = """
+    SELECT nome_categoria, tipo_refeicao, data_inicio, data_fim, valor
+    FROM Tabela_Preco
+    ORDER BY nome_categoria, tipo_refeicao, data_inicio;
+    """
     with conn.cursor() as cur:
         cur.execute(sql)
         return cur.fetchall()
 
+@metrics.medir
+@orcamento(5000)
+def get_previsao_demanda(conn, inicio, fim, id_unidade=None):
+    """
+    Previsões de refeições por unidade, data e tipo (gravadas por forecast.py)
+
+    Returns:
+        list: (id_unidade, nome_unidade, data, tipo_refeicao, quantidade_prevista, limite_superior)
+    """
+    sql = """
+    SELECT pd.id_unidade, un.nome_unidade, pd.data, pd.tipo_refeicao, pd.quantidade_prevista, pd.limite_superior
+    FROM Previsao_Demanda pd
+    JOIN Unidade un ON pd.id_unidade = un.id_unidade
+    WHERE pd.data BETWEEN %(inicio)s AND %(fim)s
+      AND (%(unidade)s::int IS NULL OR pd.id_unidade = %(unidade)s::int)
+    ORDER BY pd.id_unidade, pd.data, array_position(ARRAY['cafe', 'almoco', 'jantar']::varchar[], pd.tipo_refeicao);
+    """
+    return _executar_leitura(conn, sql, {'inicio': inicio, 'fim': fim, 'unidade': id_unidade})
+
+@metrics.medir
+@orcamento(10000)
+def get_capacidade_grade(conn, inicio, fim, unidades=None, tipos=None):
+    """
+    OCUPAÇÃO DE UNIDADES × DATAS × TIPOS EM UMA CONSULTA
+
+    Usa a função capacidade_unidades do schema (uma linha por combinação).
+
+    Args:
+        inicio, fim: Intervalo de datas (inclusivo)
+        unidades: IDs das unidades (None = todas)
+        tipos: Tipos de refeição (None = cafe, almoco e jantar)
+
+    Returns:
+        list: (id_unidade, nome_unidade, data, tipo_refeicao, capacidade, pedidos,
+               vagas_restantes, pode_atender, previsao)
+    """
+    sql = "SELECT * FROM capacidade_unidades(%s::int[], %s::date, %s::date, %s::varchar[]);"
+    return _executar_leitura(conn, sql, (
+        list(unidades) if unidades else None, inicio, fim, list(tipos) if tipos else None
+    ))
+
+@metrics.medir
+@orcamento(5000)
+def get_avaliacoes_resumo(conn, semanas=8):
+    """
+    Média e distribuição das notas por unidade/cardápio nas últimas 'semanas'
+    (lidas do agregado Feedback_Semanal mantido por feedback.py)
+
+    Returns:
+        list: (id_unidade, nome_unidade, id_cardapio, tipo, total, media, nota_1..nota_5)
+    """
+    sql = """
+    SELECT fs.id_unidade, COALESCE(un.nome_unidade, 'Não atribuída'), fs.id_cardapio, c.tipo,
+           SUM(fs.total)::int, ROUND(SUM(fs.soma_notas)::numeric / NULLIF(SUM(fs.total), 0), 2),
+           SUM(fs.nota_1)::int, SUM(fs.nota_2)::int, SUM(fs.nota_3)::int, SUM(fs.nota_4)::int, SUM(fs.nota_5)::int
+    FROM Feedback_Semanal fs
+    LEFT JOIN Unidade un ON un.id_unidade = fs.id_unidade
+    LEFT JOIN Cardapio c ON c.id_cardapio = fs.id_cardapio
+    WHERE fs.semana >= date_trunc('week', CURRENT_DATE)::date - 7 * (%s - 1)
+    GROUP BY fs.id_unidade, un.nome_unidade, fs.id_cardapio, c.tipo
+    ORDER BY fs.id_unidade = 0, fs.id_unidade, fs.id_cardapio;
+    """
+    return _executar_leitura(conn, sql, (semanas,))
+
+@metrics.medir
+@orcamento(5000)
+def get_avaliacoes_semanais(conn, id_unidade=None, semanas=12, janela=4):
+    """
+    Média semanal e média móvel ('janela' semanas, ponderada pelo número de
+    avaliações) por unidade, a partir de Feedback_Semanal
+
+    Returns:
+        list: (id_unidade, semana, total, media_semana, media_movel)
+    """
+    sql = """
+    WITH por_semana AS (
+        SELECT id_unidade, semana, SUM(total) AS total, SUM(soma_notas) AS soma
+        FROM Feedback_Semanal
+        WHERE (%(unidade)s::int IS NULL OR id_unidade = %(unidade)s::int)
+          AND semana >= date_trunc('week', CURRENT_DATE)::date - 7 * (%(semanas)s + %(janela)s - 2)
+        GROUP BY id_unidade, semana
+    ),
+    movel AS (
+        SELECT id_unidade, semana, total,
+               ROUND(soma::numeric / NULLIF(total, 0), 2) AS media_semana,
+               ROUND(SUM(soma) OVER w::numeric / NULLIF(SUM(total) OVER w, 0), 2) AS media_movel
+        FROM por_semana
+        WINDOW w AS (PARTITION BY id_unidade ORDER BY semana
+                     RANGE BETWEEN (INTERVAL '1 week' * (%(janela)s - 1)) PRECEDING AND CURRENT ROW)
+    )
+    SELECT id_unidade, semana, total::int, media_semana, media_movel
+    FROM movel
+    WHERE semana >= date_trunc('week', CURRENT_DATE)::date - 7 * (%(semanas)s - 1)
+    ORDER BY id_unidade, semana;
+    """
+    return _executar_leitura(conn, sql, {'unidade': id_unidade, 'semanas': semanas, 'janela': janela})
+
+# ==================== FECHAMENTO MENSAL POR UNIDADE (reports.py) ====================
+
+@metrics.medir
+@orcamento(1000)
+def get_unidades(conn):
+    """Lista as unidades: (id_unidade, nome_unidade, capacidade)"""
+    sql = "SELECT id_unidade, nome_unidade, capacidade FROM Unidade ORDER BY id_unidade;"
+    return _executar_leitura(conn, sql)
+
+@metrics.medir
+@orcamento(30000)
+def get_fechamento_unidade(conn, id_unidade, inicio, fim):
+    """
+    FECHAMENTO DE UMA UNIDADE NO PERÍODO, POR CATEGORIA DE PAGAMENTO
+
+    Inclui pedidos ativos e arquivados (Pedido_Arquivo). A unidade do pedido
+    vem do cardápio (vw_cardapio_unidade).
+
+    Subsídio = preço integral vigente (categoria 'sem_subsidio' de
+    CATEGORIAS_CONFIG em Tabela_Preco) menos o valor pago.
+
+    Args:
+        inicio, fim: Intervalo de data_hora [inicio, fim)
+
+    Returns:
+        list: (categoria, pedidos, servidas, canceladas, receita, subsidio);
+              categoria None = pedidos sem pagamento
+    """
+    integral = [nome for nome, regra in CATEGORIAS_CONFIG.items() if regra['subsidio'] == 'sem_subsidio']
+    sql = """
+    WITH da_unidade AS (
+        SELECT ped.id_pedido, ped.data_hora, ped.status_do_pedido, cu.tipo
+        FROM (
+            SELECT id_pedido, data_hora, status_do_pedido, ped_cardapio FROM Pedido
+            WHERE data_hora >= %(inicio)s AND data_hora < %(fim)s
+            UNION ALL
+            SELECT id_pedido, data_hora, status_do_pedido, ped_cardapio FROM Pedido_Arquivo
+            WHERE data_hora >= %(inicio)s AND data_hora < %(fim)s
+        ) ped
+        JOIN vw_cardapio_unidade cu ON cu.id_cardapio = ped.ped_cardapio
+        WHERE cu.id_unidade = %(unidade)s
+    ),
+    pagamentos AS (
+        SELECT pag_pedido, valor_pago, pag_categoria_nome FROM Pagamento
+        WHERE pag_pedido IN (SELECT id_pedido FROM da_unidade)
+        UNION ALL
+        SELECT pag_pedido, valor_pago, pag_categoria_nome FROM Pagamento_Arquivo
+        WHERE pag_pedido IN (SELECT id_pedido FROM da_unidade)
+    )
+    SELECT pg.pag_categoria_nome,
+           COUNT(DISTINCT d.id_pedido)::int,
+           COUNT(DISTINCT d.id_pedido) FILTER (WHERE d.status_do_pedido = 'entregue')::int,
+           COUNT(DISTINCT d.id_pedido) FILTER (WHERE d.status_do_pedido = 'cancelado')::int,
+           COALESCE(SUM(pg.valor_pago), 0),
+           COALESCE(SUM(GREATEST(cheio.valor - pg.valor_pago, 0)), 0)
+    FROM da_unidade d
+    LEFT JOIN pagamentos pg ON pg.pag_pedido = d.id_pedido
+    LEFT JOIN LATERAL (
+        SELECT tp.valor FROM Tabela_Preco tp
+        WHERE tp.nome_categoria = ANY(%(integral)s) AND tp.tipo_refeicao = d.tipo
+          AND tp.data_inicio <= d.data_hora::date
+          AND (tp.data_fim IS NULL OR tp.data_fim >= d.data_hora::date)
+        ORDER BY tp.data_inicio DESC
+        LIMIT 1
+    ) cheio ON pg.pag_pedido IS NOT NULL
+    GROUP BY pg.pag_categoria_nome
+    ORDER BY pg.pag_categoria_nome NULLS LAST;
+    """
+    return _executar_leitura(conn, sql, {
+        'unidade': id_unidade, 'inicio': inicio, 'fim': fim, 'integral': integral
+    })
+
+@metrics.medir
+@orcamento(5000)
+def get_avaliacoes_periodo(conn, id_unidade, inicio, fim):
+    """
+    Avaliações da unidade nas semanas iniciadas em [inicio, fim) (Feedback_Semanal)
+
+    Returns:
+        tuple: (total, media, nota_1..nota_5); media None sem avaliações
+    """
+    sql = """
+    SELECT COALESCE(SUM(total), 0)::int, ROUND(SUM(soma_notas)::numeric / NULLIF(SUM(total), 0), 2),
+           COALESCE(SUM(nota_1), 0)::int, COALESCE(SUM(nota_2), 0)::int, COALESCE(SUM(nota_3), 0)::int,
+           COALESCE(SUM(nota_4), 0)::int, COALESCE(SUM(nota_5), 0)::int
+    FROM Feedback_Semanal
+    WHERE id_unidade = %s AND semana >= %s AND semana < %s;
+    """
+    return _executar_leitura(conn, sql, (id_unidade, inicio, fim))[0]
+
+# ==================== BUSCA TEXTUAL ====================
+
+ENTIDADES_BUSCA = ('usuario', 'refeicao', 'feedback')
+
+def _consulta_textual(termo):
+    """Converte o texto digitado em tsquery com prefixo em cada palavra ("joa sil" → joa:* & sil:*)"""
+    palavras = re.findall(r'[^\W_]+', termo or '')
+    return ' & '.join(f"{p}:*" for p in palavras)
+
+@metrics.medir
+@orcamento(2000)
+def search(conn, termo, entidades=None, limite=20, apos=None):
+    """
+    BUSCA TEXTUAL EM USUÁRIOS, REFEIÇÕES E COMENTÁRIOS DE AVALIAÇÕES
+
+    Usa as colunas 'busca' (tsvector em português, sem acentos) e seus índices GIN
+    (seção BUSCA TEXTUAL do schema.sql). Cada palavra casa por prefixo, então
+    nomes e e-mails parciais funcionam ("mar sil" encontra "Maria Silva").
+    Resultados vêm do mais relevante para o menos relevante (ts_rank; nome pesa
+    mais que e-mail/descrição).
+
+    Args:
+        termo: Texto digitado
+        entidades: Subconjunto de ENTIDADES_BUSCA (padrão: todas)
+        limite: Resultados por página
+        apos: (rank, entidade, id) da última linha da página anterior
+
+    Returns:
+        list: (entidade, id, titulo, trecho, rank); trecho com os termos entre [ ]
+    """
+    consulta = _consulta_textual(termo)
+    if not consulta:
+        return []
+    entidades = list(entidades or ENTIDADES_BUSCA)
+    rank, entidade, ultimo_id = apos if apos else (None, None, None)
+
+    sql = """
+    WITH q AS (SELECT to_tsquery('busca_pt', %(consulta)s) AS q),
+    achados AS (
+        SELECT 'usuario'::text AS entidade, u.id_usuario AS id, ts_rank(u.busca, q.q) AS rank
+        FROM Usuario u, q
+        WHERE 'usuario' = ANY(%(entidades)s) AND u.busca @@ q.q
+        UNION ALL
+        SELECT 'refeicao', r.id_refeicao, ts_rank(r.busca, q.q)
+        FROM Refeicao r, q
+        WHERE 'refeicao' = ANY(%(entidades)s) AND r.busca @@ q.q
+        UNION ALL
+        SELECT 'feedback', f.id_feedback, ts_rank(f.busca, q.q)
+        FROM Feedback f, q
+        WHERE 'feedback' = ANY(%(entidades)s) AND f.busca @@ q.q
+    ),
+    pagina AS (
+        SELECT entidade, id, rank
+        FROM achados
+        WHERE %(rank)s::real IS NULL
+           OR (-rank, entidade, id) > (-%(rank)s::real, %(entidade)s::text, %(id)s::int)
+        ORDER BY rank DESC, entidade, id
+        LIMIT %(limite)s
+    )
+    -- Títulos e trechos (ts_headline) só para as linhas da página
+    SELECT p.entidade, p.id,
+           CASE p.entidade
+               WHEN 'usuario' THEN u.nome_usuario
+               WHEN 'refeicao' THEN r.nome_refeicao
+               ELSE 'Nota ' || f.nota || ' - ' || to_char(f.data_feedback, 'DD/MM/YYYY')
+           END AS titulo,
+           CASE p.entidade
+               WHEN 'usuario' THEN u.email_usuario
+               ELSE ts_headline('busca_pt', coalesce(r.descricao_refeicao, f.comentarios, ''), q.q,
+                                'StartSel=[, StopSel=], MaxWords=18, MinWords=6')
+           END AS trecho,
+           p.rank
+    FROM pagina p
+    CROSS JOIN q
+    LEFT JOIN Usuario u ON p.entidade = 'usuario' AND u.id_usuario = p.id
+    LEFT JOIN Refeicao r ON p.entidade = 'refeicao' AND r.id_refeicao = p.id
+    LEFT JOIN Feedback f ON p.entidade = 'feedback' AND f.id_feedback = p.id
+    ORDER BY p.rank DESC, p.entidade, p.id;
+    """
+    return _executar_leitura(conn, sql, {
+        'consulta': consulta, 'entidades': entidades, 'limite': limite,
+        'rank': rank, 'entidade': entidade, 'id': ultimo_id,
+    })
+
+@metrics.medir
+@orcamento(2000, 1000)
 def get_categoria_usuario(conn, user_id, categoria_nome=None):
     """Busca categoria do usuário para vincular pagamentos"""
     try:
@@ -495,21 +1943,127 @@ def get_categoria_usuario(conn, user_id, categoria_nome=None):
             with conn.cursor() as cur:
                 cur.execute(sql, (user_id,))
                 return cur.fetchone()
+    except TempoEsgotado:
+        raise
     except psycopg2.Error as e:
         print(f"[ERRO] Erro ao buscar categoria do usuário: {e}")
         conn.rollback()
         return None
 
-def create_categoria_usuario_if_not_exists(conn, user_id, categoria_nome):
+@metrics.medir
+@orcamento(1000)
+def get_categorias_do_usuario(conn, user_id):
+    """Busca todas as categorias de um usuário"""
+    sql = """
+    SELECT id_usuario, nome_categoria, grupo, subsidio, beneficio 
+    FROM Categoria_Usuario 
+    WHERE id_usuario = %s
+    ORDER BY nome_categoria;
+    """
+    with conn.cursor() as cur:
+        cur.execute(sql, (user_id,))
+        return cur.fetchall()
+
+@metrics.medir
+@orcamento(30000, 5000)
+def atribuir_categorias(conn, pares, atualizar_existentes=False, commit=True):
+    """
+    ATRIBUIÇÃO DE CATEGORIAS EM MASSA (UPSERT SET-BASED)
+
+    Aplica milhares de pares (id_usuario, nome_categoria) com um único
+    INSERT ... SELECT ... ON CONFLICT, unindo a entrada com Usuario para ignorar
+    usuários inexistentes e com CATEGORIAS_CONFIG para grupo/subsídio/benefício.
+    Tudo ocorre em uma transação: ou todos os pares válidos são aplicados, ou nenhum.
+
+    Args:
+        conn: Conexão ativa com PostgreSQL
+        pares: Iterável de (id_usuario, nome_categoria)
+        atualizar_existentes: Se True, categorias já existentes recebem grupo,
+            subsídio e benefício atuais de CATEGORIAS_CONFIG
+        commit: Se False, a transação fica aberta para o chamador
+
+    Returns:
+        dict: {'inseridas': n, 'atualizadas': n, 'inalteradas': n,
+               'usuarios_inexistentes': [ids]}
+
+    Raises:
+        psycopg2.Error: Em caso de erro (a transação é desfeita)
+    """
+    pares = list(pares)
+    ids = [int(p[0]) for p in pares]
+    nomes = [p[1] for p in pares]
+    regras = list(CATEGORIAS_CONFIG.items())
+
+    conflito = """
+        DO UPDATE SET grupo = EXCLUDED.grupo, subsidio = EXCLUDED.subsidio, beneficio = EXCLUDED.beneficio
+        WHERE (Categoria_Usuario.grupo, Categoria_Usuario.subsidio, Categoria_Usuario.beneficio)
+              IS DISTINCT FROM (EXCLUDED.grupo, EXCLUDED.subsidio, EXCLUDED.beneficio)
+    """ if atualizar_existentes else "DO NOTHING"
+
+    sql = f"""
+    WITH entrada AS (
+        SELECT DISTINCT id_usuario, nome_categoria
+        FROM unnest(%(ids)s::int[], %(nomes)s::varchar[]) AS e(id_usuario, nome_categoria)
+    ),
+    regras AS (
+        SELECT *
+        FROM unnest(%(r_nomes)s::varchar[], %(r_grupos)s::int[], %(r_subsidios)s::varchar[], %(r_beneficios)s::varchar[])
+             AS r(nome_categoria, grupo, subsidio, beneficio)
+    ),
+    aplicadas AS (
+        INSERT INTO Categoria_Usuario (id_usuario, nome_categoria, grupo, subsidio, beneficio)
+        SELECT e.id_usuario, e.nome_categoria,
+               COALESCE(r.grupo, 2),
+               COALESCE(r.subsidio, 'parcial'),
+               COALESCE(r.beneficio, left('Categoria ' || e.nome_categoria, 50))
+        FROM entrada e
+        JOIN Usuario u ON u.id_usuario = e.id_usuario
+        LEFT JOIN regras r ON r.nome_categoria = e.nome_categoria
+        ON CONFLICT (id_usuario, nome_categoria) {conflito}
+        RETURNING (xmax = 0) AS inserida
+    )
+    SELECT
+        (SELECT count(*) FROM aplicadas WHERE inserida),
+        (SELECT count(*) FROM aplicadas WHERE NOT inserida),
+        (SELECT count(*) FROM entrada e JOIN Usuario u ON u.id_usuario = e.id_usuario),
+        (SELECT COALESCE(array_agg(DISTINCT e.id_usuario ORDER BY e.id_usuario), '{{}}')
+         FROM entrada e
+         WHERE NOT EXISTS (SELECT 1 FROM Usuario u WHERE u.id_usuario = e.id_usuario));
+    """
+    try:
+        with conn.cursor() as cur:
+            cur.execute(sql, {
+                'ids': ids,
+                'nomes': nomes,
+                'r_nomes': [nome for nome, _ in regras],
+                'r_grupos': [cfg['grupo'] for _, cfg in regras],
+                'r_subsidios': [cfg['subsidio'] for _, cfg in regras],
+                'r_beneficios': [cfg['beneficio'] for _, cfg in regras],
+            })
+            inseridas, atualizadas, validas, inexistentes = cur.fetchone()
+        if commit:
+            conn.commit()
+    except psycopg2.Error as e:
+        # Com commit=False a transação pertence ao chamador, que decide o rollback
+        if commit:
+            print(f"[ERRO] Erro ao atribuir categorias: {e}")
+            conn.rollback()
+        raise
+
+    return {
+        'inseridas': inseridas,
+        'atualizadas': atualizadas,
+        'inalteradas': validas - inseridas - atualizadas,
+        'usuarios_inexistentes': list(inexistentes),
+    }
+
+@metrics.medir
+def create_categoria_usuario_if_not_exists(conn, user_id, categoria_nome, commit=True):
     """
     FUNÇÃO AUXILIAR: CRIAÇÃO AUTOMÁTICA DE CATEGORIA DE USUÁRIO
     
-    Esta função implementa criação inteligente de categorias com:
-    
-    1. VALIDAÇÃO DE USUÁRIO: Verifica se o usuário existe antes de criar categoria
-    2. CHAVE PRIMÁRIA COMPOSTA: (id_usuario, nome_categoria)
-    3. CONFIGURAÇÃO AUTOMÁTICA: Define valores padrão baseados no tipo de categoria
-    4. TENTATIVAS MÚLTIPLAS: Estratégia de fallback para diferentes cenários
+    Caso particular de atribuir_categorias com um único par: uma ida ao banco,
+    sem consulta prévia. Grupo, subsídio e benefício vêm de CATEGORIAS_CONFIG.
     
     Tipos de categoria suportados:
     - estudante_assistencia: Grupo 1, subsídio total
@@ -520,95 +2074,13 @@ def create_categoria_usuario_if_not_exists(conn, user_id, categoria_nome):
         conn: Conexão ativa com PostgreSQL
         user_id: ID do usuário (FK para USUARIO)
         categoria_nome: Nome da categoria a ser inserida
+        commit: Se False, a transação fica aberta para o chamador
         
     Returns:
-        bool: True se categoria foi inserida/existe, False caso contrário
-    """
-    try:
-        # ETAPA 1: VALIDAÇÃO DE INTEGRIDADE REFERENCIAL
-        # Não podemos inserir categoria para usuário inexistente (violaria FK)
-        
-        sql_check_user = "SELECT id_usuario FROM Usuario WHERE id_usuario = %s;"
-        with conn.cursor() as cur:
-            cur.execute(sql_check_user, (user_id,))
-            user_exists = cur.fetchone()
-            
-        if not user_exists:
-            return False  # Usuário não existe, não podemos inserir categoria
-        
-        # ETAPA 2: VERIFICAÇÃO DE EXISTÊNCIA
-        # Se a categoria já existe, não precisamos inserir
-        
-        existing = get_categoria_usuario(conn, user_id, categoria_nome)
-        if existing:
-            return True  # Categoria já existe, missão cumprida
-        
-        # ETAPA 3: CONFIGURAÇÃO AUTOMÁTICA POR TIPO DE CATEGORIA
-        # Baseado na Resolução 27/2018 CAD/UnB para preços do RU
-        
-        categoria_config = {
-            'estudante_assistencia': {
-                'grupo': 1,                    # Grupo prioritário
-                'subsidio': 'total',           # 100% subsidiado (R$ 0,00)
-                'beneficio': 'Desconto total - Assistência estudantil'
-            },
-            'estudante_regular': {
-                'grupo': 2,                    # Grupo intermediário  
-                'subsidio': 'parcial',         # 60% subsidiado
-                'beneficio': 'Desconto parcial - Estudante regular'
-            },
-            'servidor': {
-                'grupo': 3,                    # Sem prioridade
-                'subsidio': 'sem_subsidio',    # Preço integral
-                'beneficio': 'Preço integral - Servidor'
-            }
-        }
-        
-        # Configuração padrão para categorias não mapeadas
-        config = categoria_config.get(categoria_nome, {
-            'grupo': 2,                        # Padrão: grupo intermediário
-            'subsidio': 'parcial',             # Padrão: subsídio parcial
-            'beneficio': f'Categoria {categoria_nome}'
-        })
-        
-        # ETAPA 4: ESTRATÉGIA DE INSERÇÃO COM FALLBACK
-        # Tentamos diferentes abordagens caso o schema tenha restrições
-        
-        sqls_to_try = [
-            # TENTATIVA 1: Inserção completa com todos os campos de negócio
-            {
-                'sql': """
-                INSERT INTO Categoria_Usuario (id_usuario, nome_categoria, grupo, subsidio, beneficio)
-                VALUES (%s, %s, %s, %s, %s);
-                """,
-                'params': (user_id, categoria_nome, config['grupo'], config['subsidio'], config['beneficio'])
-            },
-            # TENTATIVA 2: Inserção mínima (apenas chave primária composta)
-            {
-                'sql': """
-                INSERT INTO Categoria_Usuario (id_usuario, nome_categoria)
-                VALUES (%s, %s);
-                """,
-                'params': (user_id, categoria_nome)
-            }
-        ]
-        
-        # Execução das tentativas em ordem de prioridade
-        for i, attempt in enumerate(sqls_to_try):
-            try:
-                with conn.cursor() as cur:
-                    cur.execute(attempt['sql'], attempt['params'])
-                    conn.commit()
-                    # SUCESSO: Categoria criada com sucesso
-                    return True
-            except psycopg2.Error as e:
-                conn.rollback()
-                continue  # Tenta próxima abordagem
-        
-        # FALHA: Todas as tentativas falharam
-        return False
-            
-    except psycopg2.Error as e:
-        conn.rollback()
-        return False
+        bool: True se categoria foi inserida/existe, False se o usuário não existe
 
+    Raises:
+        psycopg2.Error: Erros de banco não são mais silenciados
+    """
+    resultado = atribuir_categorias(conn, [(user_id, categoria_nome)], commit=commit)
+    return not resultado['usuarios_inexistentes']
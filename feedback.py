@@ -0,0 +1,168 @@
+# AVALIAÇÕES (FEEDBACK) - AGREGADOS INCREMENTAIS
+#
+# Mantém em Feedback_Semanal contagens por (unidade, cardápio, semana):
+# total, soma das notas e distribuição das notas 1 a 5. Médias, médias móveis e
+# distribuições são lidas desse agregado, cujo tamanho depende do número de
+# semanas e unidades - não do número de avaliações.
+#
+# ATRIBUIÇÃO:
+# Feedback não referencia unidade nem cardápio. Cada avaliação é atribuída ao
+# último pedido do usuário feito até a data da avaliação (cardápio do pedido e
+# a unidade que serve esse cardápio). Sem pedido anterior, vai para a linha
+# "não atribuída" (id_unidade = 0, id_cardapio = 0).
+#
+# ATUALIZAÇÃO POR MARCA D'ÁGUA:
+# - IDs vêm de sequência, mas as transações não confirmam em ordem: uma avaliação
+#   com id menor pode aparecer depois de outra com id maior já agregada
+# - Feedback_Processado guarda os IDs agregados na janela recente (JANELA);
+#   cada lote lê id_feedback > marca que ainda não estejam ali, soma ao agregado
+#   e registra os IDs, tudo na mesma transação (nada é contado pela metade nem duas vezes)
+# - Feedback_Marca só avança até o maior ID processado há mais de JANELA (as
+#   transações abertas antes dele já terminaram); os IDs até a marca saem de
+#   Feedback_Processado. Uma transação aberta por mais de JANELA pode ser perdida
+# - Alterações/remoções de avaliações antigas não são vistas pela marca:
+#   use 'reconstruir' após correções manuais na tabela Feedback
+#
+# USO:
+#   python feedback.py atualizar [--lote 5000]
+#   python feedback.py reconstruir
+
+import argparse
+import psycopg2
+import database
+
+MARCA = 'feedback_semanal'
+JANELA = '1 hour'
+
+SQL_LOTE = """
+WITH novos AS (
+    SELECT f.id_feedback, f.nota, f.feed_usuario, COALESCE(f.data_feedback, CURRENT_TIMESTAMP) AS data_feedback
+    FROM Feedback f
+    WHERE f.id_feedback > %(marca)s
+      AND NOT EXISTS (SELECT 1 FROM Feedback_Processado fp WHERE fp.id_feedback = f.id_feedback)
+    ORDER BY f.id_feedback
+    LIMIT %(lote)s
+),
+processados AS (
+    INSERT INTO Feedback_Processado (id_feedback)
+    SELECT id_feedback FROM novos
+),
+atribuidos AS (
+    SELECT n.nota,
+           date_trunc('week', n.data_feedback)::date AS semana,
+           COALESCE(ultimo.id_unidade, 0) AS id_unidade,
+           COALESCE(ultimo.ped_cardapio, 0) AS id_cardapio
+    FROM novos n
+    LEFT JOIN LATERAL (
+        SELECT p.ped_cardapio,
+               (SELECT cu.id_unidade FROM vw_cardapio_unidade cu WHERE cu.id_cardapio = p.ped_cardapio) AS id_unidade
+        FROM Pedido p
+        WHERE p.pedido_usuario = n.feed_usuario
+          AND p.data_hora <= n.data_feedback
+        ORDER BY p.data_hora DESC
+        LIMIT 1
+    ) ultimo ON TRUE
+),
+somados AS (
+    INSERT INTO Feedback_Semanal AS fs
+        (id_unidade, id_cardapio, semana, total, soma_notas, nota_1, nota_2, nota_3, nota_4, nota_5)
+    SELECT id_unidade, id_cardapio, semana, COUNT(*), SUM(nota),
+           COUNT(*) FILTER (WHERE nota = 1), COUNT(*) FILTER (WHERE nota = 2),
+           COUNT(*) FILTER (WHERE nota = 3), COUNT(*) FILTER (WHERE nota = 4),
+           COUNT(*) FILTER (WHERE nota = 5)
+    FROM atribuidos
+    GROUP BY id_unidade, id_cardapio, semana
+    ON CONFLICT (id_unidade, id_cardapio, semana) DO UPDATE
+    SET total = fs.total + EXCLUDED.total,
+        soma_notas = fs.soma_notas + EXCLUDED.soma_notas,
+        nota_1 = fs.nota_1 + EXCLUDED.nota_1,
+        nota_2 = fs.nota_2 + EXCLUDED.nota_2,
+        nota_3 = fs.nota_3 + EXCLUDED.nota_3,
+        nota_4 = fs.nota_4 + EXCLUDED.nota_4,
+        nota_5 = fs.nota_5 + EXCLUDED.nota_5
+)
+SELECT COUNT(*) FROM novos;
+"""
+
+def _avancar_marca(cur, janela):
+    """Avança a marca até o maior ID processado há mais de 'janela' e descarta os IDs cobertos"""
+    cur.execute("""
+        SELECT MAX(id_feedback) FROM Feedback_Processado
+        WHERE processado_em < CURRENT_TIMESTAMP - %s::interval;
+    """, (janela,))
+    nova = cur.fetchone()[0]
+    if nova is not None:
+        cur.execute("""
+            INSERT INTO Feedback_Marca (nome, ultimo_id) VALUES (%s, %s)
+            ON CONFLICT (nome) DO UPDATE SET ultimo_id = GREATEST(Feedback_Marca.ultimo_id, EXCLUDED.ultimo_id);
+        """, (MARCA, nova))
+        cur.execute("DELETE FROM Feedback_Processado WHERE id_feedback <= %s;", (nova,))
+
+def atualizar(conn, lote=5000, janela=JANELA):
+    """
+    AGREGA AS AVALIAÇÕES NOVAS (acima da marca d'água e ainda não processadas)
+
+    Returns:
+        int: Avaliações agregadas nesta chamada
+    """
+    total = 0
+    while True:
+        with conn.cursor() as cur:
+            # Uma atualização por vez (marca e IDs processados mudam na mesma transação)
+            cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s));", (MARCA,))
+            _avancar_marca(cur, janela)
+            cur.execute("SELECT ultimo_id FROM Feedback_Marca WHERE nome = %s;", (MARCA,))
+            linha = cur.fetchone()
+            marca = linha[0] if linha else 0
+
+            cur.execute(SQL_LOTE, {'marca': marca, 'lote': lote})
+            quantidade = cur.fetchone()[0]
+        conn.commit()
+        total += quantidade
+        if quantidade < lote:
+            return total
+
+def reconstruir(conn, lote=5000):
+    """Apaga o agregado, a marca e os IDs processados e reagrega todas as avaliações"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext(%s));", (MARCA,))
+        cur.execute("TRUNCATE Feedback_Semanal, Feedback_Processado;")
+        cur.execute("DELETE FROM Feedback_Marca WHERE nome = %s;", (MARCA,))
+    conn.commit()
+    return atualizar(conn, lote)
+
+def main():
+    parser = argparse.ArgumentParser(description="Agregados incrementais de avaliações (Feedback)")
+    sub = parser.add_subparsers(dest='comando', required=True)
+
+    p_atu = sub.add_parser('atualizar', help="Agrega as avaliações novas desde a última execução")
+    p_atu.add_argument('--lote', type=int, default=5000)
+
+    p_rec = sub.add_parser('reconstruir', help="Refaz o agregado a partir de todas as avaliações")
+    p_rec.add_argument('--lote', type=int, default=5000)
+
+    args = parser.parse_args()
+
+    try:
+        conn = database.open_connection()
+    except psycopg2.Error as e:
+        print(f"[ERRO] Erro ao conectar ao PostgreSQL: {e}")
+        return 1
+
+    try:
+        database.aplicar_migracoes(conn)
+        if args.comando == 'atualizar':
+            quantidade = atualizar(conn, args.lote)
+        else:
+            quantidade = reconstruir(conn, args.lote)
+        print(f"[SUCESSO] {quantidade} avaliações agregadas.")
+    except psycopg2.Error as e:
+        print(f"[ERRO] {e}")
+        conn.rollback()
+        return 1
+    finally:
+        conn.close()
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,303 @@
+# PREVISÃO DE DEMANDA - REFEIÇÕES POR UNIDADE, DATA E TIPO
+#
+# Estima quantas refeições cada unidade servirá por dia e tipo (café, almoço,
+# jantar) a partir do histórico de pedidos, ativos e arquivados (Pedido e
+# Pedido_Arquivo ⨝ vw_cardapio_unidade), e grava o resultado em Previsao_Demanda
+# para consulta instantânea.
+#
+# MODELO (linha de base sazonal multiplicativa, por unidade e tipo):
+#   previsto = nível × fator_dia_da_semana × fator_calendário × fator_período_especial
+# - nível: média dos dias letivos comuns nas últimas semanas
+# - dia da semana: razão entre a média de cada dia e o nível
+# - calendário: semestre letivo ou férias (PERIODOS_LETIVOS)
+# - períodos especiais: os mesmos de Refeicao.periodo_de_oferta (natal, festa_junina,
+#   pascoa, carnaval) e feriados nacionais
+# Fatores com poucas observações são puxados para 1 (encolhimento), para que
+# uma única data atípica não distorça a previsão.
+#
+# O histórico é agregado no servidor (um COUNT por unidade/tipo/dia) e lido em
+# blocos por um cursor nomeado direto para arrays NumPy.
+#
+# USO:
+#   python forecast.py gerar [--historico-dias 365] [--horizonte 28]
+#   python forecast.py mostrar [--unidade 1] [--dias 7]
+
+import argparse
+from datetime import date, timedelta
+import numpy as np
+import psycopg2
+import database
+
+TIPOS = ('cafe', 'almoco', 'jantar')
+
+# Semestres letivos aproximados (mês, dia) - fora deles, férias
+PERIODOS_LETIVOS = (((3, 1), (7, 15)), ((8, 10), (12, 20)))
+
+# Feriados nacionais de data fixa (mês, dia)
+FERIADOS_FIXOS = ((1, 1), (4, 21), (5, 1), (9, 7), (10, 12), (11, 2), (11, 15), (12, 25))
+
+# Códigos dos períodos especiais (0 = dia comum)
+PERIODOS_ESPECIAIS = ('comum', 'natal', 'festa_junina', 'pascoa', 'carnaval', 'feriado')
+
+# Pseudo-observações que puxam fatores pouco observados para 1
+ENCOLHIMENTO = 3.0
+JANELA_NIVEL_SEMANAS = 8
+Z_LIMITE_SUPERIOR = 1.2816  # quantil 90% da normal
+
+# ==================== CALENDÁRIO ====================
+
+def _pascoa(ano):
+    """Domingo de Páscoa (algoritmo de Meeus/Jones/Butcher)"""
+    a, b, c = ano % 19, ano // 100, ano % 100
+    d, e = b // 4, b % 4
+    f = (b + 8) // 25
+    g = (b - f + 1) // 3
+    h = (19 * a + b - d - g + 15) % 30
+    i, k = c // 4, c % 4
+    l = (32 + 2 * e + 2 * i - h - k) % 7
+    m = (a + 11 * h + 22 * l) // 451
+    mes = (h + l - 7 * m + 114) // 31
+    dia = (h + l - 7 * m + 114) % 31 + 1
+    return date(ano, mes, dia)
+
+def _janelas_especiais(ano):
+    """(código, início, fim) dos períodos especiais de um ano"""
+    pascoa = _pascoa(ano)
+    carnaval = pascoa - timedelta(days=47)
+    return [
+        (PERIODOS_ESPECIAIS.index('natal'), date(ano, 12, 20), date(ano, 12, 31)),
+        (PERIODOS_ESPECIAIS.index('festa_junina'), date(ano, 6, 1), date(ano, 6, 30)),
+        (PERIODOS_ESPECIAIS.index('pascoa'), pascoa - timedelta(days=3), pascoa),
+        (PERIODOS_ESPECIAIS.index('carnaval'), carnaval - timedelta(days=3), carnaval + timedelta(days=1)),
+    ]
+
+def calendario(inicio, dias):
+    """
+    Atributos de calendário de 'dias' datas consecutivas a partir de 'inicio'.
+
+    Returns:
+        tuple: (dia_semana, letivo, especial) - arrays de tamanho 'dias'
+    """
+    datas = np.arange(np.datetime64(inicio, 'D'), np.datetime64(inicio, 'D') + dias)
+    dia_semana = (datas.astype(np.int64) + 3) % 7  # 1970-01-01 foi quinta-feira; 0 = segunda
+    meses = datas.astype('datetime64[M]').astype(np.int64) % 12 + 1
+    dias_mes = (datas - datas.astype('datetime64[M]')).astype(np.int64) + 1
+    mes_dia = meses * 100 + dias_mes
+
+    letivo = np.zeros(dias, dtype=bool)
+    for (mi, di), (mf, df) in PERIODOS_LETIVOS:
+        letivo |= (mes_dia >= mi * 100 + di) & (mes_dia <= mf * 100 + df)
+
+    especial = np.zeros(dias, dtype=np.int64)
+    anos = datas.astype('datetime64[Y]').astype(np.int64) + 1970
+    for ano in np.unique(anos):
+        for codigo, ini, fim in _janelas_especiais(int(ano)):
+            especial[(datas >= np.datetime64(ini)) & (datas <= np.datetime64(fim))] = codigo
+    feriado = np.isin(mes_dia, [m * 100 + d for m, d in FERIADOS_FIXOS])
+    especial[feriado] = PERIODOS_ESPECIAIS.index('feriado')
+    return dia_semana, letivo, especial
+
+# ==================== HISTÓRICO ====================
+
+def carregar_historico(conn, inicio, fim, bloco=10000):
+    """
+    HISTÓRICO AGREGADO EM ARRAYS
+
+    Lê COUNT(*) por (unidade, tipo, dia) de Pedido e Pedido_Arquivo com cursor
+    nomeado, em blocos de 'bloco' linhas, e monta a matriz séries × dias.
+
+    Returns:
+        tuple: (series, matriz) - series = [(id_unidade, tipo)], matriz float64 (séries, dias)
+    """
+    dias = (fim - inicio).days
+    unidades, tipos, offsets, quantidades = [], [], [], []
+    with conn.cursor(name='historico_demanda') as cur:
+        cur.itersize = bloco
+        cur.execute("""
+            SELECT cu.id_unidade, cu.tipo, ped.data_hora::date - %(inicio)s::date AS dia, COUNT(*)
+            FROM (
+                -- Pedidos encerrados antigos estão no arquivo (archive.py)
+                SELECT data_hora, ped_cardapio FROM Pedido
+                WHERE data_hora >= %(inicio)s AND data_hora < %(fim)s
+                  AND status_do_pedido <> 'cancelado'
+                UNION ALL
+                SELECT data_hora, ped_cardapio FROM Pedido_Arquivo
+                WHERE data_hora >= %(inicio)s AND data_hora < %(fim)s
+                  AND status_do_pedido <> 'cancelado'
+            ) ped
+            JOIN vw_cardapio_unidade cu ON ped.ped_cardapio = cu.id_cardapio
+            WHERE cu.id_unidade IS NOT NULL
+            GROUP BY 1, 2, 3;
+        """, {'inicio': inicio, 'fim': fim})
+        while True:
+            linhas = cur.fetchmany(bloco)
+            if not linhas:
+                break
+            u, t, d, q = zip(*linhas)
+            unidades.append(np.array(u, dtype=np.int64))
+            tipos.append(np.array([TIPOS.index(x) for x in t], dtype=np.int64))
+            offsets.append(np.array(d, dtype=np.int64))
+            quantidades.append(np.array(q, dtype=np.float64))
+    conn.rollback()
+
+    if not unidades:
+        return [], np.zeros((0, dias))
+    unidades, tipos = np.concatenate(unidades), np.concatenate(tipos)
+    offsets, quantidades = np.concatenate(offsets), np.concatenate(quantidades)
+
+    chaves, serie = np.unique(unidades * len(TIPOS) + tipos, return_inverse=True)
+    matriz = np.zeros((len(chaves), dias))
+    np.add.at(matriz, (serie, offsets), quantidades)
+    series = [(int(c // len(TIPOS)), TIPOS[c % len(TIPOS)]) for c in chaves]
+    return series, matriz
+
+# ==================== MODELO ====================
+
+def _fator(somas, contagens, esperado):
+    """Razão observado/esperado por grupo, encolhida para 1 quando há poucos dias"""
+    return (somas + ENCOLHIMENTO * esperado) / np.maximum(esperado * (contagens + ENCOLHIMENTO), 1e-9)
+
+def ajustar(matriz, dia_semana, letivo, especial):
+    """
+    AJUSTE DOS FATORES SAZONAIS (todas as séries de uma vez)
+
+    Returns:
+        dict: nivel (S,), semana (S, 7), ferias (S,), especial (S, P), desvio (S,)
+    """
+    S, D = matriz.shape
+    comum = letivo & (especial == 0)
+
+    # Nível: dias letivos comuns das últimas semanas (ou de todo o histórico)
+    recente = comum & (np.arange(D) >= D - 7 * JANELA_NIVEL_SEMANAS)
+    base = recente if recente.sum() >= 7 else comum
+    if not base.any():
+        base = np.ones(D, dtype=bool)
+    nivel = matriz[:, base].mean(axis=1)
+
+    # Dia da semana (dias letivos comuns)
+    contagem_semana = np.bincount(dia_semana[comum], minlength=7).astype(np.float64)
+    soma_semana = np.stack([np.bincount(dia_semana[comum], weights=linha[comum], minlength=7) for linha in matriz])
+    semana = _fator(soma_semana, contagem_semana, nivel[:, None])
+
+    esperado = nivel[:, None] * semana[:, dia_semana]
+
+    # Férias (dias comuns fora do semestre)
+    dias_ferias = ~letivo & (especial == 0)
+    if dias_ferias.any():
+        ferias = _fator(matriz[:, dias_ferias].sum(axis=1), dias_ferias.sum(), esperado[:, dias_ferias].mean(axis=1))
+    else:
+        ferias = np.ones(S)
+
+    esperado = esperado * np.where(letivo, 1.0, ferias[:, None])
+
+    # Períodos especiais: observado / esperado pelo calendário comum
+    fator_especial = np.ones((S, len(PERIODOS_ESPECIAIS)))
+    for codigo in range(1, len(PERIODOS_ESPECIAIS)):
+        dias_periodo = especial == codigo
+        if dias_periodo.any():
+            media_esperada = esperado[:, dias_periodo].mean(axis=1)
+            fator_especial[:, codigo] = _fator(
+                matriz[:, dias_periodo].sum(axis=1), dias_periodo.sum(), media_esperada
+            )
+
+    ajustado = esperado * fator_especial[:, especial]
+    desvio = np.sqrt(((matriz - ajustado) ** 2).mean(axis=1)) if D else np.zeros(S)
+    return {'nivel': nivel, 'semana': semana, 'ferias': ferias, 'especial': fator_especial, 'desvio': desvio}
+
+def prever(modelo, dia_semana, letivo, especial):
+    """Previsão (S, dias) e limite superior de 90% para as datas informadas"""
+    previsto = (modelo['nivel'][:, None]
+                * modelo['semana'][:, dia_semana]
+                * np.where(letivo, 1.0, modelo['ferias'][:, None])
+                * modelo['especial'][:, especial])
+    limite = np.ceil(previsto + Z_LIMITE_SUPERIOR * modelo['desvio'][:, None])
+    return previsto, limite
+
+# ==================== GRAVAÇÃO ====================
+
+def gerar(conn, historico_dias=365, horizonte=28, hoje=None):
+    """
+    GERA E GRAVA AS PREVISÕES
+
+    Args:
+        historico_dias: Dias de histórico usados no ajuste
+        horizonte: Dias futuros previstos (a partir de hoje)
+
+    Returns:
+        int: Linhas gravadas em Previsao_Demanda
+    """
+    hoje = hoje or date.today()
+    inicio = hoje - timedelta(days=historico_dias)
+    series, matriz = carregar_historico(conn, inicio, hoje)
+    if not series:
+        return 0
+
+    modelo = ajustar(matriz, *calendario(inicio, historico_dias))
+    previsto, limite = prever(modelo, *calendario(hoje, horizonte))
+
+    datas = [hoje + timedelta(days=i) for i in range(horizonte)]
+    unidades = [u for u, _ in series for _ in datas]
+    tipos = [t for _, t in series for _ in datas]
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO Previsao_Demanda (id_unidade, data, tipo_refeicao, quantidade_prevista, limite_superior)
+            SELECT * FROM unnest(%s::int[], %s::date[], %s::varchar[], %s::numeric[], %s::int[])
+            ON CONFLICT (id_unidade, data, tipo_refeicao) DO UPDATE
+            SET quantidade_prevista = EXCLUDED.quantidade_prevista,
+                limite_superior = EXCLUDED.limite_superior,
+                gerada_em = CURRENT_TIMESTAMP;
+        """, (
+            unidades, datas * len(series), tipos,
+            np.round(previsto, 1).ravel().tolist(), limite.astype(np.int64).ravel().tolist()
+        ))
+        gravadas = cur.rowcount
+        # Previsões de datas passadas já não servem para planejamento
+        cur.execute("DELETE FROM Previsao_Demanda WHERE data < %s;", (hoje,))
+    conn.commit()
+    return gravadas
+
+def main():
+    parser = argparse.ArgumentParser(description="Previsão de demanda por unidade, data e tipo de refeição")
+    parser.add_argument('--prazo', type=float,
+                        help="Tempo máximo em segundos (a consulta em andamento é cancelada no servidor)")
+    sub = parser.add_subparsers(dest='comando', required=True)
+
+    p_gerar = sub.add_parser('gerar', help="Ajusta o modelo no histórico e grava Previsao_Demanda")
+    p_gerar.add_argument('--historico-dias', type=int, default=365)
+    p_gerar.add_argument('--horizonte', type=int, default=28, help="Dias futuros a prever")
+
+    p_mostrar = sub.add_parser('mostrar', help="Lista as previsões gravadas")
+    p_mostrar.add_argument('--unidade', type=int)
+    p_mostrar.add_argument('--dias', type=int, default=7)
+
+    args = parser.parse_args()
+
+    try:
+        conn = database.open_connection()
+    except psycopg2.Error as e:
+        print(f"[ERRO] Erro ao conectar ao PostgreSQL: {e}")
+        return 1
+
+    try:
+        database.aplicar_migracoes(conn)
+        with database.prazo(args.prazo):
+            if args.comando == 'gerar':
+                gravadas = gerar(conn, args.historico_dias, args.horizonte)
+                print(f"[SUCESSO] {gravadas} previsões gravadas em Previsao_Demanda.")
+            else:
+                hoje = date.today()
+                linhas = database.get_previsao_demanda(conn, hoje, hoje + timedelta(days=args.dias - 1), args.unidade)
+                print(f"\n{'Unidade':<25} {'Data':<12} {'Tipo':<8} {'Prevista':>9} {'Até (90%)':>10}")
+                print('-' * 68)
+                for _, nome, data, tipo, prevista, limite in linhas:
+                    print(f"{nome:<25} {data:%d/%m/%Y}   {tipo:<8} {prevista:>9} {limite:>10}")
+    except psycopg2.Error as e:
+        print(f"[ERRO] {e}")
+        conn.rollback()
+        return 1
+    finally:
+        conn.close()
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
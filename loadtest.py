@@ -0,0 +1,155 @@
+# TESTE DE CARGA - SERVIÇO HTTP DO RU (api.py)
+#
+# Simula quiosques fazendo requisições simultâneas contra a API local:
+# listagens paginadas, consultas por ID e criação de pedidos.
+# Cada cliente mantém uma conexão HTTP/1.1 keep-alive (como um quiosque real).
+#
+# Os pedidos criados durante o teste são reais: rode contra um banco de
+# desenvolvimento (ex.: populado com populate_sample_data).
+#
+# USO:
+#   python api.py &
+#   python loadtest.py [--url http://127.0.0.1:8080] [--clientes 200] [--duracao 30]
+
+import argparse
+import asyncio
+import json
+import random
+import time
+from collections import Counter
+from urllib.parse import urlsplit
+
+class ClienteHTTP:
+    """Cliente HTTP/1.1 mínimo com conexão persistente (reconecta se o servidor fechar)"""
+
+    def __init__(self, host, porta):
+        self.host = host
+        self.porta = porta
+        self._reader = None
+        self._writer = None
+
+    async def requisitar(self, metodo, caminho, corpo=None):
+        if self._writer is None:
+            self._reader, self._writer = await asyncio.open_connection(self.host, self.porta)
+        dados = json.dumps(corpo).encode('utf-8') if corpo is not None else b''
+        cabecalho = (f"{metodo} {caminho} HTTP/1.1\r\nHost: {self.host}\r\n"
+                     f"Content-Type: application/json\r\nContent-Length: {len(dados)}\r\n\r\n")
+        try:
+            self._writer.write(cabecalho.encode('latin-1') + dados)
+            await self._writer.drain()
+
+            status = int((await self._reader.readline()).split()[1])
+            tamanho = 0
+            fechar = False
+            while True:
+                linha = await self._reader.readline()
+                if linha in (b'\r\n', b''):
+                    break
+                nome, _, valor = linha.decode('latin-1').partition(':')
+                nome = nome.strip().lower()
+                if nome == 'content-length':
+                    tamanho = int(valor)
+                elif nome == 'connection' and valor.strip().lower() == 'close':
+                    fechar = True
+            resposta = await self._reader.readexactly(tamanho) if tamanho else b''
+        except (ConnectionError, IndexError, ValueError, asyncio.IncompleteReadError):
+            self.fechar()
+            raise ConnectionError("Conexão encerrada pelo servidor")
+        if fechar:
+            self.fechar()
+        return status, json.loads(resposta) if resposta else None
+
+    def fechar(self):
+        if self._writer is not None:
+            self._writer.close()
+        self._reader = self._writer = None
+
+
+async def _descobrir_ids(cliente, recurso, chave):
+    """IDs existentes para sortear nas consultas e nos pedidos"""
+    status, corpo = await cliente.requisitar('GET', f"/{recurso}?limite=500")
+    if status != 200:
+        return []
+    return [item[chave] for item in corpo['itens']]
+
+async def _cliente(url, fim, usuarios, pedidos, cardapios, resultados, mix):
+    cliente = ClienteHTTP(url.hostname, url.port or 80)
+    try:
+        while time.monotonic() < fim:
+            operacao = random.choices(list(mix), weights=list(mix.values()))[0]
+            if operacao == 'listar':
+                metodo, caminho, corpo = 'GET', "/pedidos?limite=20", None
+            elif operacao == 'obter':
+                metodo, caminho, corpo = 'GET', f"/pedidos/{random.choice(pedidos)}", None
+            else:
+                metodo, caminho, corpo = 'POST', '/pedidos', {
+                    'pedido_usuario': random.choice(usuarios),
+                    'ped_cardapio': random.choice(cardapios),
+                }
+            inicio = time.perf_counter()
+            try:
+                status, _ = await cliente.requisitar(metodo, caminho, corpo)
+            except (ConnectionError, OSError):
+                status = 'conexao'
+                await asyncio.sleep(0.1)
+            resultados.append((operacao, status, time.perf_counter() - inicio))
+    finally:
+        cliente.fechar()
+
+def _percentil(valores, p):
+    if not valores:
+        return 0.0
+    i = min(len(valores) - 1, int(round(p / 100 * (len(valores) - 1))))
+    return valores[i]
+
+def _relatorio(resultados, duracao):
+    print(f"\n{'Operação':<10} {'Reqs':>8} {'Req/s':>9} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    print('-' * 58)
+    for operacao in ('listar', 'obter', 'criar', 'total'):
+        tempos = sorted(t for op, _, t in resultados if operacao == 'total' or op == operacao)
+        if not tempos:
+            continue
+        print(f"{operacao:<10} {len(tempos):>8} {len(tempos) / duracao:>9.1f} "
+              f"{_percentil(tempos, 50) * 1000:>9.1f} {_percentil(tempos, 95) * 1000:>9.1f} "
+              f"{_percentil(tempos, 99) * 1000:>9.1f}")
+    print("\nStatus:", ', '.join(f"{s}={n}" for s, n in sorted(Counter(s for _, s, _ in resultados).items(), key=str)))
+
+async def executar(args):
+    url = urlsplit(args.url)
+    preparo = ClienteHTTP(url.hostname, url.port or 80)
+    try:
+        usuarios = await _descobrir_ids(preparo, 'usuarios', 'id_usuario')
+        pedidos = await _descobrir_ids(preparo, 'pedidos', 'id_pedido')
+    finally:
+        preparo.fechar()
+    if not usuarios or not pedidos:
+        print("[ERRO] A API precisa de usuários e pedidos cadastrados (use populate_sample_data).")
+        return 1
+
+    mix = {'listar': args.peso_listar, 'obter': args.peso_obter, 'criar': args.peso_criar}
+    resultados = []
+    print(f"[INFO] {args.clientes} clientes por {args.duracao}s contra {args.url}...")
+    fim = time.monotonic() + args.duracao
+    await asyncio.gather(*(
+        _cliente(url, fim, usuarios, pedidos, args.cardapios, resultados, mix)
+        for _ in range(args.clientes)
+    ))
+    _relatorio(resultados, args.duracao)
+    return 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Teste de carga da API do RU")
+    parser.add_argument('--url', default='http://127.0.0.1:8080')
+    parser.add_argument('--clientes', type=int, default=200, help="Quiosques simultâneos")
+    parser.add_argument('--duracao', type=float, default=30.0, help="Duração em segundos")
+    parser.add_argument('--cardapio', type=int, action='append', dest='cardapios',
+                        help="ID de cardápio para os pedidos criados (repetível; padrão: 1)")
+    parser.add_argument('--peso-listar', type=float, default=3)
+    parser.add_argument('--peso-obter', type=float, default=5)
+    parser.add_argument('--peso-criar', type=float, default=2)
+    args = parser.parse_args()
+    args.cardapios = args.cardapios or [1]
+    return asyncio.run(executar(args))
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -18,9 +18,18 @@
 
 import tui
 import database
+import notifications
+import pricing
+import writebehind
+import admission
+import menus
+import turnstile
+import feedback
 import time
+from datetime import date, timedelta
 import questionary
 import psycopg2
+import psycopg2.errors
 
 def main():
     """
@@ -37,8 +46,29 @@ def main():
     
     # Estabelece conexão segura com banco de dados
     conn = database.connect()
+
+    # Fila local de pedidos/pagamentos (SQLite): envia em segundo plano o que
+    # foi registrado sem conexão, inclusive em execuções anteriores
+    fila = writebehind.iniciar_despachante()
+
     if not conn:
-        return  # Falha crítica: sem BD, sistema não pode operar
+        # Sem BD: pedidos e pagamentos ainda podem ser registrados na fila local
+        offline = questionary.confirm(
+            "[AVISO] Sem conexão com o banco. Continuar no modo offline (pedidos e pagamentos ficam na fila local)?"
+        ).ask()
+        if offline:
+            handle_modo_offline(fila)
+        encerrar_fila(fila)
+        return
+
+    # Métricas opcionais (METRICS_PORT no .env)
+    database.setup_metrics()
+
+    # Gravação opcional das operações para replay.py (DB_GRAVACAO no .env)
+    database.setup_gravacao()
+
+    # Ctrl+C durante uma consulta cancela a consulta no servidor (e volta ao menu)
+    database.ativar_cancelamento()
 
     # FASE 2: VERIFICAÇÃO DE INTEGRIDADE DO BANCO DE DADOS
     
@@ -59,36 +89,283 @@ def main():
         input()
     else:
         print("Base de dados Supabase detectada. Carregando dados existentes...")
-        database.setup_database_schema(conn)  # Apenas verifica estrutura
+        database.setup_database_schema(conn)  # Verifica estrutura e aplica migrações pendentes
         database.populate_sample_data(conn)   # Apenas verifica dados  
         time.sleep(1)
 
+    # Ouvinte de alterações (LISTEN/NOTIFY): mantém caches locais atualizados
+    # para que formulários e listagens não reconsultem tabelas inteiras
+    cache, ouvinte = notifications.iniciar_ouvinte()
+
+    # Tabela de preços em memória, recarregada pelo ouvinte quando Tabela_Preco muda
+    precos = pricing.TabelaPrecos()
+    try:
+        precos.carregar(conn)
+        ouvinte.assinar(precos.ao_notificar)
+    except psycopg2.Error as e:
+        print(f"[AVISO] Tabela de preços indisponível, valores serão digitados: {e}")
+        conn.rollback()
+        precos = None
+
+    # Cardápios vigentes por dia em memória (sugestão do cardápio no cadastro de pedidos)
+    cardapios = menus.CardapiosVigentes()
+    ouvinte.assinar(cardapios.ao_notificar)
+
+    # Admissão de pedidos por vagas (ADMISSAO=1 no .env): sem vaga, o pedido não é gravado
+    admissao = admission.criar_controle()
+
     # FASE 3: LOOP PRINCIPAL DO SISTEMA
     # Coordena navegação entre os módulos CRUD respeitando hierarquia de dados
     
     while True:
-        main_choice = tui.main_menu()
+        main_choice = tui.main_menu(fila[0].resumo())
 
         if main_choice == "Sair":
             print("Saindo do sistema...")
             break
-            
-        elif main_choice == "Gerenciar Usuários":
-            # NÍVEL 1: Gerenciamento de usuários (entidade base)
-            handle_usuario_crud(conn)
-            
-        elif main_choice == "Gerenciar Pedidos":  
-            # NÍVEL 2: Gerenciamento de pedidos (depende de usuários)
-            handle_pedido_crud(conn)
-            
-        elif main_choice == "Gerenciar Pagamentos":
-            # NÍVEL 3: Gerenciamento de pagamentos (depende de pedidos)
-            handle_pagamento_crud(conn)
 
-    # Fechamento seguro da conexão
+        try:
+            if main_choice.startswith("Fila Offline"):
+                handle_fila_local(fila)
+
+            elif main_choice == "Gerenciar Usuários":
+                # NÍVEL 1: Gerenciamento de usuários (entidade base)
+                handle_usuario_crud(conn, cache)
+
+            elif main_choice == "Gerenciar Pedidos":
+                # NÍVEL 2: Gerenciamento de pedidos (depende de usuários)
+                handle_pedido_crud(conn, cache, fila, admissao, cardapios)
+
+            elif main_choice == "Gerenciar Pagamentos":
+                # NÍVEL 3: Gerenciamento de pagamentos (depende de pedidos)
+                handle_pagamento_crud(conn, cache, precos, fila)
+
+            elif main_choice == "Relatórios":
+                handle_relatorios(conn)
+
+            elif main_choice == "Buscar":
+                handle_busca(conn)
+        except database.TempoEsgotado as e:
+            # Ctrl+C ou orçamento de tempo estourado em uma operação sem tratamento próprio
+            conn.rollback()
+            print(f"\n[AVISO] Operação interrompida: {e}\n")
+            input("Pressione Enter para continuar...")
+
+    # Fechamento seguro das conexões (ouvinte, fila local, réplicas de leitura e primário)
+    ouvinte.parar()
+    cache.salvar()
+    encerrar_fila(fila)
+    database.close_replicas()
     conn.close()
 
-def handle_usuario_crud(conn):
+# ==================== FILA LOCAL (MODO OFFLINE) ====================
+
+def encerrar_fila(fila):
+    """Para o despachante e fecha o diário local (o que não foi enviado fica para a próxima execução)"""
+    diario, despachante = fila
+    despachante.parar()
+    despachante.join(timeout=5)
+    pendentes = diario.resumo()['pendente']
+    if pendentes:
+        print(f"[AVISO] {pendentes} operações continuam na fila local e serão enviadas na próxima execução.")
+    diario.fechar()
+
+def usar_fila(conn):
+    """Escritas vão direto para a fila local sem conexão ou com WRITE_BEHIND=1 no .env"""
+    return conn is None or database.get_db_config().get('WRITE_BEHIND') == '1'
+
+def registrar_pedido(conn, fila, pedido_data, admissao=None, unidade=None):
+    """
+    Grava o pedido no banco ou, se o banco estiver inacessível, na fila local.
+
+    Erros de validação (FK, CHECK...), cancelamentos e tempo esgotado continuam
+    sendo mostrados na hora quando há conexão; só falhas de conexão desviam o
+    registro para a fila.
+    Com admissão ativa, o pedido só é gravado se houver vaga na unidade
+    (a do caixa, 'unidade', quando o cardápio não define uma só).
+    """
+    diario, despachante = fila
+    if not usar_fila(conn):
+        try:
+            if admissao is not None:
+                admissao.admitir(conn, pedido_data, unidade)
+            else:
+                database.add_pedido(conn, pedido_data)
+            print("\n[SUCESSO] Pedido cadastrado com sucesso!\n")
+            return
+        except (admission.SemVagas, admission.ReservaExpirada) as e:
+            print(f"\n[AVISO] Pedido não cadastrado: {e}.\n")
+            return
+        except database.TempoEsgotado as e:
+            # Cancelado (Ctrl+C) ou tempo esgotado: o operador desistiu, não vai para a fila
+            conn.rollback()
+            print(f"\n[ERRO] Pedido não cadastrado: {e}.\n")
+            return
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+            print(f"\n[AVISO] Banco inacessível ({e}).")
+    id_local = diario.registrar_pedido(pedido_data)
+    despachante.notificar()
+    print(f"\n[SUCESSO] Pedido registrado na fila local (ID provisório {id_local}); será enviado ao banco.\n")
+
+def gravar_edicao(conn, tabela, atualizar, lido, dados, editar):
+    """
+    Grava uma edição se o registro ainda estiver na versão lida (concorrência otimista).
+
+    Em conflito, mostra o que mudou e deixa o operador gravar só os campos que
+    alterou, editar de novo a partir da versão atual ou desistir.
+
+    Args:
+        lido: Linha de get_*_by_id(com_versao=True) usada para abrir a edição
+        editar: Formulário (linha atual → dados) para a nova edição
+
+    Returns:
+        bool: True se a edição foi gravada
+    """
+    while True:
+        try:
+            atualizar(conn, lido[0], dados, versao=lido[-1])
+            return True
+        except database.ConflitoVersao as e:
+            if e.atual is None:
+                print(f"\n[ERRO] {e}. Nada foi gravado.\n")
+                return False
+            tui.show_conflito_versao(tabela, lido, e.atual, dados)
+            escolha = tui.escolher_resolucao_conflito()
+            if escolha == 'mesclar':
+                dados = tui.mesclar_edicao(tabela, lido, e.atual, dados)
+            elif escolha == 'editar':
+                dados = editar(e.atual)
+            else:
+                dados = None
+            if not dados:
+                print("\n[CANCELADO] Edição descartada; o registro ficou como a outra operação gravou.\n")
+                return False
+            lido = e.atual
+
+def registrar_pagamento(conn, fila, pagamento_data):
+    """Grava o pagamento no banco ou na fila local (mesma regra de registrar_pedido)"""
+    diario, despachante = fila
+    # Pagamento de pedido que ainda está na fila precisa esperar por ele
+    if not usar_fila(conn) and pagamento_data['pag_pedido'] > 0:
+        try:
+            database.add_pagamento(conn, pagamento_data)
+            print("\n[SUCESSO] Pagamento cadastrado com sucesso!\n")
+            return
+        except database.TempoEsgotado as e:
+            conn.rollback()
+            print(f"\n[ERRO] Pagamento não cadastrado: {e}.\n")
+            return
+        except (psycopg2.OperationalError, psycopg2.InterfaceError) as e:
+            print(f"\n[AVISO] Banco inacessível ({e}).")
+    id_local = diario.registrar_pagamento(pagamento_data)
+    despachante.notificar()
+    print(f"\n[SUCESSO] Pagamento registrado na fila local (ID provisório {id_local}); será enviado ao banco.\n")
+
+def handle_fila_local(fila):
+    """Mostra a situação da fila local e permite descartar conflitos já revisados"""
+    diario, despachante = fila
+    conflitos = diario.conflitos()
+    tui.display_fila_local(diario.resumo(), conflitos, despachante.conectado)
+    if conflitos and questionary.confirm("\nDescartar os conflitos listados (já revisados)?", default=False).ask():
+        print(f"\n[INFO] {diario.descartar_conflitos()} conflitos descartados.\n")
+    input("\nPressione Enter para continuar...")
+
+def handle_modo_offline(fila):
+    """
+    MODO OFFLINE
+
+    Sem conexão não há listas de usuários nem tabela de preços: IDs e valores
+    são digitados. Pagamentos podem referenciar pedidos ainda na fila (ID negativo).
+    """
+    diario, _ = fila
+    while True:
+        escolha = tui.offline_menu(diario.resumo())
+
+        if escolha == "Sair":
+            print("Saindo do sistema...")
+            break
+
+        elif escolha == "Cadastrar Pedido":
+            pedido_data = tui.get_pedido_data()
+            if pedido_data:
+                registrar_pedido(None, fila, pedido_data)
+            else:
+                print("\n[CANCELADO] Cadastro cancelado.\n")
+            input("Pressione Enter para continuar...")
+
+        elif escolha == "Cadastrar Pagamento":
+            pedidos_locais = diario.pedidos_locais()
+            if pedidos_locais:
+                print("\n[INFO] Pedidos na fila local:")
+                tui.display_pedidos(pedidos_locais)
+            pagamento_data = tui.get_pagamento_data(pedidos_disponiveis=pedidos_locais)
+            if pagamento_data:
+                registrar_pagamento(None, fila, pagamento_data)
+            else:
+                print("\n[CANCELADO] Cadastro cancelado.\n")
+            input("Pressione Enter para continuar...")
+
+        elif escolha == "Ver Fila Offline":
+            handle_fila_local(fila)
+
+def handle_relatorios(conn):
+    """Relatórios de leitura (não alteram dados)"""
+    while True:
+        escolha = tui.relatorios_menu()
+
+        if escolha == "Voltar ao Menu Principal":
+            break
+
+        elif escolha == "Capacidade da Semana":
+            hoje = date.today()
+            try:
+                linhas = database.get_capacidade_grade(conn, hoje, hoje + timedelta(days=6))
+                tui.display_capacidade_grade(linhas)
+            except psycopg2.Error as e:
+                conn.rollback()
+                print(f"\n[ERRO] Erro ao calcular capacidade: {e}\n")
+            input("Pressione Enter para continuar...")
+
+        elif escolha == "Avaliações (Feedback)":
+            semanas = 8
+            try:
+                # Agrega só as avaliações novas desde a última vez (marca d'água)
+                feedback.atualizar(conn)
+            except psycopg2.Error as e:
+                conn.rollback()
+                print(f"\n[AVISO] Agregado de avaliações não atualizado: {e}")
+            try:
+                tui.display_avaliacoes(database.get_avaliacoes_resumo(conn, semanas), semanas)
+            except psycopg2.Error as e:
+                conn.rollback()
+                print(f"\n[ERRO] Erro ao buscar avaliações: {e}\n")
+            input("Pressione Enter para continuar...")
+
+def handle_busca(conn, por_pagina=15):
+    """Busca textual em usuários, refeições e avaliações, com paginação"""
+    consulta = tui.get_busca()
+    if not consulta:
+        return
+    termo, entidades = consulta
+
+    apos = None
+    pagina = 1
+    while True:
+        try:
+            resultados = database.search(conn, termo, entidades, por_pagina, apos)
+        except psycopg2.Error as e:
+            conn.rollback()
+            print(f"\n[ERRO] Erro na busca: {e}\n")
+            break
+        tui.display_busca(termo, resultados, pagina)
+        if len(resultados) < por_pagina or not questionary.confirm("Ver próxima página?").ask():
+            break
+        entidade, id_registro, _, _, rank = resultados[-1]
+        apos = (rank, entidade, id_registro)
+        pagina += 1
+    input("\nPressione Enter para continuar...")
+
+def handle_usuario_crud(conn, cache):
     """
     CONTROLADOR CRUD - MÓDULO USUÁRIOS  
     
@@ -120,21 +397,22 @@ def handle_usuario_crud(conn):
             input("Pressione Enter para continuar...")
             
         elif user_choice == "Listar Usuários":
-            users = database.get_all_users(conn)
+            users = cache.get_usuarios(conn)
             tui.display_users(users)
             input("Pressione Enter para continuar...")
             
         elif user_choice == "Atualizar Usuário":
             user_id = tui.get_user_id("atualizar")
             if user_id:
-                existing_user = database.get_user_by_id(conn, user_id)
+                existing_user = database.get_user_by_id(conn, user_id, com_versao=True)
                 if existing_user:
                     tui.show_current_user_data(existing_user)
                     updated_data = tui.get_user_data(existing_user)
                     if updated_data:
                         try:
-                            database.update_user(conn, user_id, updated_data)
-                            print("\n[SUCESSO] Usuário atualizado com sucesso!\n")
+                            if gravar_edicao(conn, 'usuario', database.update_user, existing_user,
+                                             updated_data, tui.get_user_data):
+                                print("\n[SUCESSO] Usuário atualizado com sucesso!\n")
                         except psycopg2.Error as e:
                             print(f"\n[ERRO] Erro ao atualizar usuário: {e}\n")
                     else:
@@ -151,16 +429,45 @@ def handle_usuario_crud(conn):
                 ).ask()
                 if confirm:
                     try:
-                        database.delete_user(conn, user_id)
-                        print("\n[SUCESSO] Usuário deletado com sucesso!\n")
+                        if database.delete_user(conn, user_id):
+                            print("\n[SUCESSO] Usuário deletado com sucesso!\n")
+                        else:
+                            print("\n[ERRO] Usuário não encontrado.\n")
+                    except psycopg2.errors.ForeignKeyViolation:
+                        conn.rollback()
+                        # Usuário possui histórico: oferece a exclusão em cascata
+                        purge = questionary.confirm(
+                            "[AVISO] O usuário possui pedidos/pagamentos. Remover também todo o histórico dele?"
+                        ).ask()
+                        if purge:
+                            try:
+                                contagens = database.purge_user(conn, user_id)
+                                tui.display_purge_result(contagens)
+                            except psycopg2.Error as e:
+                                print(f"\n[ERRO] Erro ao deletar usuário: {e}\n")
+                        else:
+                            print("\n[CANCELADO] Exclusão cancelada.\n")
                     except psycopg2.Error as e:
+                        conn.rollback()
                         print(f"\n[ERRO] Erro ao deletar usuário: {e}\n")
                 else:
                     print("\n[CANCELADO] Exclusão cancelada.\n")
             input("Pressione Enter para continuar...")
 
-def handle_pedido_crud(conn):
+def handle_pedido_crud(conn, cache, fila, admissao=None, cardapios=None):
     """Gerencia o CRUD de pedidos"""
+    # Unidade do caixa (UNIDADE_PADRAO no .env): escolhe o cardápio próprio da unidade, se houver,
+    # e é a unidade cuja vaga a admissão reserva
+    unidade = database.get_db_config().get('UNIDADE_PADRAO')
+    unidade = int(unidade) if unidade and unidade.isdigit() else None
+
+    def cardapio_vigente(tipo):
+        try:
+            return cardapios.resolver(conn, tipo, unidade)
+        except psycopg2.Error as e:
+            print(f"[AVISO] Cardápio vigente indisponível: {e}")
+            conn.rollback()
+            return None
     while True:
         pedido_choice = tui.pedido_management_menu()
 
@@ -170,7 +477,7 @@ def handle_pedido_crud(conn):
         elif pedido_choice == "Cadastrar Pedido":
             # Mostra usuários disponíveis
             print("\n[INFO] Usuários cadastrados:")
-            users = database.get_all_users(conn)
+            users = cache.get_usuarios(conn)
             if users:
                 tui.display_users(users)
                 print("\n[INFO] Selecione um usuário da lista acima para criar o pedido.")
@@ -180,11 +487,14 @@ def handle_pedido_crud(conn):
                 input("Pressione Enter para continuar...")
                 continue
             
-            pedido_data = tui.get_pedido_data(usuarios_disponiveis=users)
+            pedido_data = tui.get_pedido_data(
+                usuarios_disponiveis=users,
+                cardapio_vigente=cardapio_vigente if cardapios else None,
+                tipo_padrao=turnstile.refeicao_atual() or 'almoco'
+            )
             if pedido_data:
                 try:
-                    database.add_pedido(conn, pedido_data)
-                    print("\n[SUCESSO] Pedido cadastrado com sucesso!\n")
+                    registrar_pedido(conn, fila, pedido_data, admissao, unidade)
                 except psycopg2.Error as e:
                     print(f"\n[ERRO] Erro ao cadastrar pedido: {e}\n")
             else:
@@ -192,23 +502,24 @@ def handle_pedido_crud(conn):
             input("Pressione Enter para continuar...")
             
         elif pedido_choice == "Listar Pedidos":
-            pedidos = database.get_all_pedidos(conn)
+            pedidos = database.get_all_pedidos(conn, tui.get_listagem_desde())
             tui.display_pedidos(pedidos)
             input("Pressione Enter para continuar...")
             
         elif pedido_choice == "Atualizar Pedido":
             pedido_id = tui.get_pedido_id("atualizar")
             if pedido_id:
-                existing_pedido = database.get_pedido_by_id(conn, pedido_id)
+                existing_pedido = database.get_pedido_by_id(conn, pedido_id, com_versao=True)
                 if existing_pedido:
                     tui.show_current_pedido_data(existing_pedido)
                     # Buscar usuários para o update
-                    users = database.get_all_users(conn)
+                    users = cache.get_usuarios(conn)
                     updated_data = tui.get_pedido_data(existing_pedido, usuarios_disponiveis=users)
                     if updated_data:
                         try:
-                            database.update_pedido(conn, pedido_id, updated_data)
-                            print("\n[SUCESSO] Pedido atualizado com sucesso!\n")
+                            if gravar_edicao(conn, 'pedido', database.update_pedido, existing_pedido, updated_data,
+                                             lambda atual: tui.get_pedido_data(atual, usuarios_disponiveis=users)):
+                                print("\n[SUCESSO] Pedido atualizado com sucesso!\n")
                         except psycopg2.Error as e:
                             print(f"\n[ERRO] Erro ao atualizar pedido: {e}\n")
                     else:
@@ -225,15 +536,17 @@ def handle_pedido_crud(conn):
                 ).ask()
                 if confirm:
                     try:
-                        database.delete_pedido(conn, pedido_id)
-                        print("\n[SUCESSO] Pedido deletado com sucesso!\n")
+                        if database.delete_pedido(conn, pedido_id):
+                            print("\n[SUCESSO] Pedido deletado com sucesso!\n")
+                        else:
+                            print("\n[ERRO] Pedido não encontrado.\n")
                     except psycopg2.Error as e:
                         print(f"\n[ERRO] Erro ao deletar pedido: {e}\n")
                 else:
                     print("\n[CANCELADO] Exclusão cancelada.\n")
             input("Pressione Enter para continuar...")
 
-def handle_pagamento_crud(conn):
+def handle_pagamento_crud(conn, cache, precos, fila):
     """
     CONTROLADOR CRUD - MÓDULO PAGAMENTOS (FUNÇÃO MAIS COMPLEXA)
     
@@ -251,6 +564,21 @@ def handle_pagamento_crud(conn):
     - estudante_regular: Valor com desconto (subsidiado 60%)  
     - servidor: Valor integral (sem subsídio)
     """
+    def calcular_valor(pedido_id, categoria):
+        """Preço pela tabela para o tipo de refeição e a data do pedido"""
+        if precos is None or pedido_id < 0:
+            return None
+        try:
+            if not cache.ativo:
+                precos.carregar_se_expirada(conn)
+            pedido = database.get_pedido_by_id(conn, pedido_id)
+        except psycopg2.Error:
+            conn.rollback()
+            return None
+        if not pedido:
+            return None
+        return precos.preco(categoria, pedido[6], pedido[3])
+
     while True:
         pagamento_choice = tui.pagamento_management_menu()
 
@@ -264,7 +592,8 @@ def handle_pagamento_crud(conn):
             print("\n[INFO] Pedidos pendentes de pagamento:")
             try:
                 # ETAPA 1: Buscar pedidos elegíveis para pagamento
-                pedidos_pendentes = database.get_pedidos_pendentes(conn)
+                # Inclui pedidos que ainda aguardam envio na fila local (ID negativo)
+                pedidos_pendentes = cache.get_pedidos_pendentes(conn) + fila[0].pedidos_locais()
                 if pedidos_pendentes:
                     tui.display_pedidos(pedidos_pendentes)
                     print("\n[INFO] Selecione um pedido da lista acima para processar o pagamento.")
@@ -280,13 +609,12 @@ def handle_pagamento_crud(conn):
                 continue
             
             # ETAPA 2: Coletar dados do pagamento via interface
-            pagamento_data = tui.get_pagamento_data(pedidos_disponiveis=pedidos_pendentes)
+            pagamento_data = tui.get_pagamento_data(pedidos_disponiveis=pedidos_pendentes, calcular_valor=calcular_valor)
             if pagamento_data:
                 try:
                     # ETAPA 3: Executar lógica complexa de cadastro
                     # (validação unicidade + FK composta + criação categoria)
-                    database.add_pagamento(conn, pagamento_data)
-                    print("\n[SUCESSO] Pagamento cadastrado com sucesso!\n")
+                    registrar_pagamento(conn, fila, pagamento_data)
                 except psycopg2.Error as e:
                     print(f"\n[ERRO] Erro ao cadastrar pagamento: {e}\n")
             else:
@@ -294,23 +622,26 @@ def handle_pagamento_crud(conn):
             input("Pressione Enter para continuar...")
             
         elif pagamento_choice == "Listar Pagamentos":
-            pagamentos = database.get_all_pagamentos(conn)
+            pagamentos = database.get_all_pagamentos(conn, tui.get_listagem_desde())
             tui.display_pagamentos(pagamentos)
             input("Pressione Enter para continuar...")
             
         elif pagamento_choice == "Atualizar Pagamento":
             pagamento_id = tui.get_pagamento_id("atualizar")
             if pagamento_id:
-                existing_pagamento = database.get_pagamento_by_id(conn, pagamento_id)
+                existing_pagamento = database.get_pagamento_by_id(conn, pagamento_id, com_versao=True)
                 if existing_pagamento:
                     tui.show_current_pagamento_data(existing_pagamento)
                     # Buscar pedidos pendentes para o update
-                    pedidos_pendentes = database.get_pedidos_pendentes(conn)
-                    updated_data = tui.get_pagamento_data(existing_pagamento, pedidos_disponiveis=pedidos_pendentes)
+                    pedidos_pendentes = cache.get_pedidos_pendentes(conn)
+                    updated_data = tui.get_pagamento_data(existing_pagamento, pedidos_disponiveis=pedidos_pendentes, calcular_valor=calcular_valor)
                     if updated_data:
                         try:
-                            database.update_pagamento(conn, pagamento_id, updated_data)
-                            print("\n[SUCESSO] Pagamento atualizado com sucesso!\n")
+                            editar = lambda atual: tui.get_pagamento_data(
+                                atual, pedidos_disponiveis=pedidos_pendentes, calcular_valor=calcular_valor)
+                            if gravar_edicao(conn, 'pagamento', database.update_pagamento, existing_pagamento,
+                                             updated_data, editar):
+                                print("\n[SUCESSO] Pagamento atualizado com sucesso!\n")
                         except psycopg2.Error as e:
                             print(f"\n[ERRO] Erro ao atualizar pagamento: {e}\n")
                     else:
@@ -327,8 +658,10 @@ def handle_pagamento_crud(conn):
                 ).ask()
                 if confirm:
                     try:
-                        database.delete_pagamento(conn, pagamento_id)
-                        print("\n[SUCESSO] Pagamento deletado com sucesso!\n")
+                        if database.delete_pagamento(conn, pagamento_id):
+                            print("\n[SUCESSO] Pagamento deletado com sucesso!\n")
+                        else:
+                            print("\n[ERRO] Pagamento não encontrado.\n")
                     except psycopg2.Error as e:
                         print(f"\n[ERRO] Erro ao deletar pagamento: {e}\n")
                 else:
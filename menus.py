@@ -0,0 +1,76 @@
+# CARDÁPIO VIGENTE - RESOLUÇÃO POR (DATA, TIPO, UNIDADE)
+#
+# Descobre a qual cardápio um pedido pertence sem listar a tabela inteira.
+# Cada dia consultado é carregado uma vez (database.get_cardapios_vigentes,
+# pelo índice GiST de vigência) e fica em memória como um dicionário
+# (tipo, unidade) → cardápio. As consultas seguintes do dia não vão ao banco.
+#
+# PRECEDÊNCIA: cardápio próprio da unidade (Cardapio.id_unidade) e, na falta
+# dele, o cardápio geral do tipo (id_unidade NULL). A restrição de exclusão do
+# schema.sql garante no máximo um de cada para a mesma data.
+#
+# RECARGA:
+# - Com o ouvinte de alterações ativo (notifications.py), qualquer comando em
+#   Cardapio descarta os dias em memória
+# - Um dia carregado há mais de 'ttl' segundos é relido (uso sem ouvinte)
+
+import threading
+import time
+from datetime import date, datetime
+import database
+
+DIAS_EM_MEMORIA = 7
+
+class CardapiosVigentes:
+    """
+    CARDÁPIOS VIGENTES POR DIA EM MEMÓRIA
+
+    data → ({(tipo, id_unidade ou None): linha}, instante da carga)
+    """
+
+    def __init__(self, ttl=300.0):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._dias = {}
+
+    def _carregar_dia(self, conn, dia):
+        indice = {}
+        for linha in database.get_cardapios_vigentes(conn, dia):
+            indice.setdefault((linha[1], linha[2]), linha)
+        with self._lock:
+            self._dias[dia] = (indice, time.monotonic())
+            # Descarta os dias mais antigos (a TUI consulta sobretudo hoje)
+            for antigo in sorted(self._dias)[:-DIAS_EM_MEMORIA]:
+                del self._dias[antigo]
+        return indice
+
+    def _indice(self, conn, dia):
+        with self._lock:
+            entrada = self._dias.get(dia)
+        if entrada is not None and time.monotonic() - entrada[1] <= self.ttl:
+            return entrada[0]
+        return self._carregar_dia(conn, dia)
+
+    def resolver(self, conn, tipo, id_unidade=None, data=None):
+        """
+        Cardápio vigente para o tipo de refeição na data (padrão: hoje)
+
+        Returns:
+            tuple: Linha de database.get_cardapios_vigentes, ou None se não houver
+        """
+        dia = data or date.today()
+        if isinstance(dia, datetime):
+            dia = dia.date()
+        indice = self._indice(conn, dia)
+        if id_unidade is not None and (tipo, id_unidade) in indice:
+            return indice[(tipo, id_unidade)]
+        return indice.get((tipo, None))
+
+    def invalidar(self):
+        with self._lock:
+            self._dias.clear()
+
+    def ao_notificar(self, evento, conn):
+        """Callback para OuvinteAlteracoes.assinar: descarta os dias ao mudar Cardapio"""
+        if evento.get('tabela') in ('cardapio', '*'):
+            self.invalidar()
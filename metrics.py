@@ -0,0 +1,396 @@
+# MÉTRICAS DA CAMADA DE DADOS - FORMATO PROMETHEUS
+#
+# Registro de métricas em memória (contadores, medidores e histogramas com
+# rótulos) exposto em texto no formato Prometheus por um servidor HTTP da
+# biblioteca padrão (GET /metrics).
+#
+# DESATIVADO POR PADRÃO: enquanto 'ativo' for False, as funções de registro
+# retornam imediatamente. O programa principal ativa via METRICS_PORT no .env
+# (database.setup_metrics); scripts em lote podem chamar ativar()/iniciar_servidor().
+#
+# MÉTRICAS COLETADAS:
+# - ru_db_operacao_segundos{funcao}          latência por função de database.py
+# - ru_db_erros_total{funcao,classe}         erros por classe do psycopg2
+# - ru_db_transacoes_total{resultado}        commits e rollbacks
+# - ru_db_leituras_total{destino}            leituras em réplica ou primário
+# - ru_cache_consultas_total{cache,resultado} acertos e faltas dos caches locais
+# - ru_db_pool_conexoes{estado}              ocupação do pool (quando houver pool)
+#
+# GRAVAÇÃO DE OPERAÇÕES (opcional, DB_GRAVACAO no .env): o mesmo decorador medir
+# grava cada chamada de nível mais alto em JSONL, com duração e parâmetros
+# pessoais pseudonimizados, para reprodução com replay.py.
+
+import atexit
+import base64
+import functools
+import hashlib
+import hmac
+import inspect
+import json
+import os
+import threading
+import time
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import psycopg2
+import psycopg2.extensions
+
+ativo = False
+gravador = None  # Gravador ativo (iniciar_gravacao); None = sem gravação
+
+BUCKETS_PADRAO = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+_lock = threading.Lock()
+_registro = {}
+_funcao_atual = threading.local()
+
+def ativar():
+    """Liga a coleta de métricas"""
+    global ativo
+    ativo = True
+
+def _escapar(valor):
+    return str(valor).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def _formatar_rotulos(nomes, valores, extra=None):
+    pares = [f'{n}="{_escapar(v)}"' for n, v in zip(nomes, valores)]
+    if extra:
+        pares.append(extra)
+    return '{' + ','.join(pares) + '}' if pares else ''
+
+class _Metrica:
+    tipo = None
+
+    def __init__(self, nome, ajuda, rotulos):
+        self.nome = nome
+        self.ajuda = ajuda
+        self.rotulos = tuple(rotulos)
+        self._valores = {}
+
+    def _chave(self, rotulos):
+        return tuple(rotulos.get(n, '') for n in self.rotulos)
+
+    def exportar(self):
+        linhas = [f"# HELP {self.nome} {self.ajuda}", f"# TYPE {self.nome} {self.tipo}"]
+        with _lock:
+            itens = list(self._valores.items())
+        for chave, valor in sorted(itens):
+            linhas.extend(self._linhas(chave, valor))
+        return linhas
+
+class Contador(_Metrica):
+    tipo = 'counter'
+
+    def incrementar(self, valor=1, **rotulos):
+        chave = self._chave(rotulos)
+        with _lock:
+            self._valores[chave] = self._valores.get(chave, 0) + valor
+
+    def _linhas(self, chave, valor):
+        return [f"{self.nome}{_formatar_rotulos(self.rotulos, chave)} {valor}"]
+
+class Medidor(_Metrica):
+    tipo = 'gauge'
+
+    def definir(self, valor, **rotulos):
+        chave = self._chave(rotulos)
+        with _lock:
+            self._valores[chave] = valor
+
+    def _linhas(self, chave, valor):
+        return [f"{self.nome}{_formatar_rotulos(self.rotulos, chave)} {valor}"]
+
+class Histograma(_Metrica):
+    tipo = 'histogram'
+
+    def __init__(self, nome, ajuda, rotulos, buckets=BUCKETS_PADRAO):
+        super().__init__(nome, ajuda, rotulos)
+        self.buckets = tuple(buckets)
+
+    def observar(self, valor, **rotulos):
+        chave = self._chave(rotulos)
+        with _lock:
+            estado = self._valores.get(chave)
+            if estado is None:
+                estado = self._valores[chave] = [[0] * len(self.buckets), 0.0, 0]
+            for i, limite in enumerate(self.buckets):
+                if valor <= limite:
+                    estado[0][i] += 1
+                    break
+            estado[1] += valor
+            estado[2] += 1
+
+    def _linhas(self, chave, estado):
+        contagens, soma, total = estado
+        linhas = []
+        acumulado = 0
+        for limite, n in zip(self.buckets, contagens):
+            acumulado += n
+            rotulos = _formatar_rotulos(self.rotulos, chave, 'le="%s"' % limite)
+            linhas.append(f"{self.nome}_bucket{rotulos} {acumulado}")
+        rotulos = _formatar_rotulos(self.rotulos, chave, 'le="+Inf"')
+        linhas.append(f"{self.nome}_bucket{rotulos} {total}")
+        linhas.append(f"{self.nome}_sum{_formatar_rotulos(self.rotulos, chave)} {soma}")
+        linhas.append(f"{self.nome}_count{_formatar_rotulos(self.rotulos, chave)} {total}")
+        return linhas
+
+def _obter(classe, nome, ajuda, rotulos, **kwargs):
+    with _lock:
+        metrica = _registro.get(nome)
+        if metrica is None:
+            metrica = _registro[nome] = classe(nome, ajuda, rotulos, **kwargs)
+    return metrica
+
+def contador(nome, ajuda, rotulos=()):
+    return _obter(Contador, nome, ajuda, rotulos)
+
+def medidor(nome, ajuda, rotulos=()):
+    return _obter(Medidor, nome, ajuda, rotulos)
+
+def histograma(nome, ajuda, rotulos=(), buckets=BUCKETS_PADRAO):
+    return _obter(Histograma, nome, ajuda, rotulos, buckets=buckets)
+
+def exportar():
+    """Texto de todas as métricas no formato de exposição do Prometheus"""
+    with _lock:
+        metricas = list(_registro.values())
+    linhas = []
+    for metrica in sorted(metricas, key=lambda m: m.nome):
+        linhas.extend(metrica.exportar())
+    return '\n'.join(linhas) + '\n'
+
+# ==================== MÉTRICAS DA CAMADA DE DADOS ====================
+
+LATENCIA = histograma('ru_db_operacao_segundos', 'Latência das funções de database.py', ('funcao',))
+ERROS = contador('ru_db_erros_total', 'Erros de banco por função e classe do psycopg2', ('funcao', 'classe'))
+TRANSACOES = contador('ru_db_transacoes_total', 'Transações encerradas por resultado', ('resultado',))
+LEITURAS = contador('ru_db_leituras_total', 'Leituras por destino (replica ou primario)', ('destino',))
+CACHE = contador('ru_cache_consultas_total', 'Consultas aos caches locais', ('cache', 'resultado'))
+POOL = medidor('ru_db_pool_conexoes', 'Conexões do pool por estado', ('estado',))
+
+def medir(funcao):
+    """
+    Decorador para funções de database.py: registra latência e, via cursor
+    instrumentado, os erros ocorridos dentro da função (mesmo os tratados nela).
+    """
+    nome = funcao.__name__
+
+    @functools.wraps(funcao)
+    def wrapper(*args, **kwargs):
+        if not ativo and gravador is None:
+            return funcao(*args, **kwargs)
+        anterior = getattr(_funcao_atual, 'nome', None)
+        _funcao_atual.nome = nome
+        inicio = time.perf_counter()
+        erro = None
+        try:
+            return funcao(*args, **kwargs)
+        except BaseException as e:
+            erro = type(e).__name__
+            raise
+        finally:
+            duracao = time.perf_counter() - inicio
+            if ativo:
+                LATENCIA.observar(duracao, funcao=nome)
+            _funcao_atual.nome = anterior
+            # Só a chamada externa: add_pagamento já reproduz a criação de categoria
+            if gravador is not None and anterior is None:
+                gravador.registrar(funcao, args, kwargs, duracao, erro)
+    return wrapper
+
+def registrar_cache(cache, acerto):
+    if ativo:
+        CACHE.incrementar(cache=cache, resultado='acerto' if acerto else 'falta')
+
+def registrar_leitura(destino):
+    if ativo:
+        LEITURAS.incrementar(destino=destino)
+
+class CursorInstrumentado(psycopg2.extensions.cursor):
+    """Cursor que contabiliza erros por classe do psycopg2 (ex.: UniqueViolation)"""
+
+    def execute(self, query, vars=None):
+        try:
+            return super().execute(query, vars)
+        except psycopg2.Error as e:
+            if ativo:
+                ERROS.incrementar(
+                    funcao=getattr(_funcao_atual, 'nome', None) or 'desconhecida',
+                    classe=type(e).__name__
+                )
+            raise
+
+class ConexaoInstrumentada(psycopg2.extensions.connection):
+    """Conexão que contabiliza commits/rollbacks e usa o cursor instrumentado"""
+
+    def cursor(self, *args, **kwargs):
+        kwargs.setdefault('cursor_factory', CursorInstrumentado)
+        return super().cursor(*args, **kwargs)
+
+    def commit(self):
+        super().commit()
+        if ativo:
+            TRANSACOES.incrementar(resultado='commit')
+
+    def rollback(self):
+        super().rollback()
+        if ativo:
+            TRANSACOES.incrementar(resultado='rollback')
+
+# ==================== GRAVAÇÃO DE OPERAÇÕES (replay.py) ====================
+
+# Parâmetros (ou campos de dicionários) que identificam pessoas: gravados como
+# pseudônimos de mesmo formato (dígito→dígito, letra→letra), estáveis na gravação
+CAMPOS_PESSOAIS = frozenset({
+    'matricula_usuario', 'CPF_usuario', 'nome_usuario', 'email_usuario',
+    'telefone_usuario', 'termo', 'comentarios',
+})
+
+_DIGITOS = '0123456789'
+_LETRAS = 'abcdefghijklmnopqrstuvwxyz'
+
+def codificar_valor(valor):
+    """Valor de parâmetro → JSON (datas e decimais marcados para decodificar_valor)"""
+    if isinstance(valor, datetime):
+        return {'$dt': valor.isoformat()}
+    if isinstance(valor, date):
+        return {'$d': valor.isoformat()}
+    if isinstance(valor, timedelta):
+        return {'$td': valor.total_seconds()}
+    if isinstance(valor, Decimal):
+        return {'$dec': str(valor)}
+    if isinstance(valor, dict):
+        return {str(k): codificar_valor(v) for k, v in valor.items()}
+    if isinstance(valor, (list, tuple, set, frozenset)):
+        return [codificar_valor(v) for v in valor]
+    if valor is None or isinstance(valor, (bool, int, float, str)):
+        return valor
+    return str(valor)
+
+def decodificar_valor(valor):
+    """Inverso de codificar_valor (listas voltam como listas)"""
+    if isinstance(valor, dict):
+        if len(valor) == 1:
+            marca, conteudo = next(iter(valor.items()))
+            if marca == '$dt':
+                return datetime.fromisoformat(conteudo)
+            if marca == '$d':
+                return date.fromisoformat(conteudo)
+            if marca == '$td':
+                return timedelta(seconds=conteudo)
+            if marca == '$dec':
+                return Decimal(conteudo)
+        return {k: decodificar_valor(v) for k, v in valor.items()}
+    if isinstance(valor, list):
+        return [decodificar_valor(v) for v in valor]
+    return valor
+
+class Gravador:
+    """
+    Grava as chamadas das funções de database.py em JSONL (uma linha por chamada):
+    {"ts": epoch de início, "sessao": n, "funcao": nome, "args": {...}, "dur": s, "erro": classe|null}
+
+    'sessao' numera as conexões usadas. A chave dos pseudônimos vem de
+    DB_GRAVACAO_CHAVE (estável entre execuções) ou é aleatória por processo.
+    """
+
+    def __init__(self, arquivo, chave=None):
+        self.arquivo = arquivo
+        self._chave = chave.encode('utf-8') if chave else os.urandom(32)
+        self._saida = open(arquivo, 'a', encoding='utf-8', buffering=1)
+        self._lock = threading.Lock()
+        self._assinaturas = {}
+        self._sessoes = {}
+
+    def _pseudonimo(self, valor):
+        if valor is None or isinstance(valor, bool):
+            return valor
+        texto = str(valor)
+        resumo = hmac.new(self._chave, texto.encode('utf-8'), hashlib.sha256).digest()
+        fluxo = base64.b32encode(resumo * (len(texto) // len(resumo) + 1))
+        saida = []
+        for i, c in enumerate(texto):
+            b = fluxo[i]
+            if c.isdigit():
+                saida.append(_DIGITOS[b % 10] if i or len(texto) == 1 else _DIGITOS[1 + b % 9])
+            elif c.isalpha():
+                letra = _LETRAS[b % 26]
+                saida.append(letra.upper() if c.isupper() else letra)
+            else:
+                saida.append(c)
+        resultado = ''.join(saida)
+        return int(resultado) if isinstance(valor, int) else resultado
+
+    def _anonimizar(self, nome, valor):
+        if nome in CAMPOS_PESSOAIS:
+            return self._pseudonimo(valor)
+        if isinstance(valor, dict):
+            return {k: self._anonimizar(k, v) for k, v in valor.items()}
+        return valor
+
+    def registrar(self, funcao, args, kwargs, duracao, erro):
+        assinatura = self._assinaturas.get(funcao)
+        if assinatura is None:
+            assinatura = self._assinaturas[funcao] = inspect.signature(funcao)
+        try:
+            parametros = assinatura.bind(*args, **kwargs).arguments
+        except TypeError:
+            return
+        # O primeiro parâmetro é sempre a conexão: vira o número da sessão
+        nomes = list(parametros)
+        conn = parametros[nomes[0]] if nomes else None
+        linha = {
+            'ts': round(time.time() - duracao, 6),
+            'funcao': funcao.__name__,
+            'args': {n: codificar_valor(self._anonimizar(n, parametros[n])) for n in nomes[1:]},
+            'dur': round(duracao, 6),
+            'erro': erro,
+        }
+        with self._lock:
+            linha['sessao'] = self._sessoes.setdefault(id(conn), len(self._sessoes) + 1)
+            if not self._saida.closed:
+                self._saida.write(json.dumps(linha, ensure_ascii=False) + '\n')
+
+    def fechar(self):
+        with self._lock:
+            self._saida.close()
+
+def iniciar_gravacao(arquivo, chave=None):
+    """Liga a gravação de operações no arquivo JSONL (acrescenta ao final)"""
+    global gravador
+    parar_gravacao()
+    gravador = Gravador(arquivo, chave)
+    atexit.register(parar_gravacao)
+    return gravador
+
+def parar_gravacao():
+    global gravador
+    atual, gravador = gravador, None
+    if atual is not None:
+        atual.fechar()
+
+# ==================== SERVIDOR HTTP ====================
+
+class _Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        if self.path.split('?', 1)[0] != '/metrics':
+            self.send_error(404)
+            return
+        corpo = exportar().encode('utf-8')
+        self.send_response(200)
+        self.send_header('Content-Type', 'text/plain; version=0.0.4; charset=utf-8')
+        self.send_header('Content-Length', str(len(corpo)))
+        self.end_headers()
+        self.wfile.write(corpo)
+
+    def log_message(self, format, *args):
+        pass  # Não polui o terminal da TUI
+
+def iniciar_servidor(porta, endereco='127.0.0.1'):
+    """Ativa a coleta e serve /metrics em uma thread daemon; retorna o servidor"""
+    ativar()
+    servidor = ThreadingHTTPServer((endereco, int(porta)), _Handler)
+    thread = threading.Thread(target=servidor.serve_forever, name='servidor-metricas', daemon=True)
+    thread.start()
+    return servidor
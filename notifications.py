@@ -0,0 +1,239 @@
+# CANAL DE ALTERAÇÕES - LISTEN/NOTIFY
+#
+# Este módulo mantém caches locais atualizados a partir dos eventos publicados
+# pelos triggers de schema.sql no canal 'ru_alteracoes'.
+#
+# FUNCIONAMENTO:
+# - Uma thread ouvinte mantém uma conexão própria (autocommit) com LISTEN
+# - Logo após o LISTEN, o cache é recarregado do primário: eventos de
+#   alterações confirmadas depois disso chegam pelo canal, e uma réplica
+#   atrasada poderia não ter as anteriores
+# - Cada evento identifica tabela, operação e chave; apenas a linha afetada
+#   é relida do primário e aplicada ao cache
+# - Se a conexão do ouvinte cair, os caches são invalidados (eventos podem ter
+#   sido perdidos) e o cliente volta a consultar as tabelas até reconectar
+
+import json
+import select
+import threading
+import time
+import psycopg2
+import database
+import metrics
+import snapshot
+
+CANAL = 'ru_alteracoes'
+
+class CacheLocal:
+    """
+    CACHE INCREMENTAL DE USUÁRIOS, PEDIDOS PENDENTES E CATEGORIAS
+
+    As listas são carregadas por completo apenas na primeira consulta (ou após
+    invalidação). Depois disso, só mudam pelos eventos aplicados pelo ouvinte.
+    Enquanto o ouvinte não estiver conectado, o cache não é confiável e cada
+    consulta vai direto ao banco, como antes.
+
+    Usuários ficam em uma cópia local sincronizada por delta (snapshot.py): a
+    "carga" após invalidação, ou cada consulta sem ouvinte, traz só o que mudou.
+    """
+
+    def __init__(self, usuarios=None):
+        self._lock = threading.RLock()
+        self.ativo = False              # True enquanto o ouvinte está conectado
+        self._usuarios = usuarios or snapshot.SnapshotUsuarios()
+        self._usuarios_em_dia = False   # cópia sincronizada desde a última invalidação
+        self._pendentes = None          # id_pedido -> linha de get_pedidos_pendentes
+        self._categorias = {}           # id_usuario -> linhas de get_categorias_do_usuario
+
+    def invalidar(self):
+        """Descarta todo o conteúdo (próxima consulta recarrega do banco)"""
+        with self._lock:
+            self._usuarios_em_dia = False
+            self._pendentes = None
+            self._categorias = {}
+
+    def carregar(self, conn):
+        """Carga completa a partir do primário (o ouvinte chama logo após o LISTEN)"""
+        with self._lock, database.somente_primario():
+            self._usuarios.sincronizar(conn)
+            self._usuarios_em_dia = True
+            self._pendentes = {p[0]: p for p in database.get_pedidos_pendentes(conn)}
+            self._categorias = {}
+
+    # ---------- CONSULTAS ----------
+
+    def get_usuarios(self, conn):
+        """Lista de usuários ordenada por ID (mesmo formato de database.get_all_users)"""
+        with self._lock:
+            if not self.ativo:
+                # Sem eventos: cada consulta busca só o que mudou desde a anterior
+                self._usuarios.sincronizar(conn)
+                return self._usuarios.listar()
+            metrics.registrar_cache('usuarios', self._usuarios_em_dia)
+            if not self._usuarios_em_dia:
+                with database.somente_primario():
+                    self._usuarios.sincronizar(conn)
+                self._usuarios_em_dia = True
+            return self._usuarios.listar()
+
+    def salvar(self):
+        """Grava a cópia local de usuários em disco (se configurado)"""
+        self._usuarios.salvar()
+
+    def get_pedidos_pendentes(self, conn):
+        """Pedidos pendentes ordenados por data (mesmo formato de database.get_pedidos_pendentes)"""
+        with self._lock:
+            if not self.ativo:
+                return database.get_pedidos_pendentes(conn)
+            metrics.registrar_cache('pedidos_pendentes', self._pendentes is not None)
+            if self._pendentes is None:
+                with database.somente_primario():
+                    self._pendentes = {p[0]: p for p in database.get_pedidos_pendentes(conn)}
+            return sorted(self._pendentes.values(), key=lambda p: (p[3] is None, p[3], p[0]))
+
+    def get_categorias(self, conn, user_id):
+        """Categorias de um usuário (carregadas sob demanda, por usuário)"""
+        with self._lock:
+            if not self.ativo:
+                return database.get_categorias_do_usuario(conn, user_id)
+            metrics.registrar_cache('categorias', user_id in self._categorias)
+            if user_id not in self._categorias:
+                with database.somente_primario():
+                    self._categorias[user_id] = database.get_categorias_do_usuario(conn, user_id)
+            return self._categorias[user_id]
+
+    # ---------- APLICAÇÃO DE EVENTOS ----------
+
+    def aplicar(self, evento, conn):
+        """
+        Aplica um evento do canal relendo apenas as linhas afetadas.
+
+        Reler a linha (em vez de confiar no payload) torna a aplicação idempotente
+        e independente da ordem em que eventos da mesma linha chegam. A releitura
+        é feita no primário: a réplica pode ainda não ter a alteração notificada.
+        """
+        tabela = evento.get('tabela')
+        chave = evento.get('id')
+
+        with self._lock, database.somente_primario():
+            if tabela == 'usuario':
+                if self._usuarios_em_dia:
+                    self._usuarios.aplicar(chave, database.get_user_by_id(conn, chave))
+                # O nome do usuário aparece na lista de pendentes
+                if self._pendentes is not None:
+                    for pedido_id in [p[0] for p in self._pendentes.values() if p[1] == chave]:
+                        self._atualizar_pendente(conn, pedido_id)
+                if evento.get('op') == 'D':
+                    self._categorias.pop(chave, None)
+
+            elif tabela == 'pedido':
+                if self._pendentes is not None:
+                    self._atualizar_pendente(conn, chave)
+
+            elif tabela == 'pagamento':
+                if self._pendentes is not None:
+                    for pedido_id in evento.get('pedidos', []):
+                        self._atualizar_pendente(conn, pedido_id)
+
+            elif tabela == 'categoria_usuario':
+                self._categorias.pop(chave, None)
+
+    def _atualizar_pendente(self, conn, pedido_id):
+        linha = database.get_pedido_pendente_by_id(conn, pedido_id)
+        if linha:
+            self._pendentes[pedido_id] = linha
+        else:
+            self._pendentes.pop(pedido_id, None)
+
+
+class OuvinteAlteracoes(threading.Thread):
+    """
+    THREAD OUVINTE DO CANAL 'ru_alteracoes'
+
+    Mantém conexão própria com o primário, escuta o canal e repassa cada evento
+    para os assinantes (o CacheLocal e quaisquer callbacks registrados).
+    Reconecta com espera crescente se a conexão cair.
+    """
+
+    def __init__(self, cache, timeout=5.0):
+        super().__init__(name='ouvinte-alteracoes', daemon=True)
+        self.cache = cache
+        self.timeout = timeout
+        self._parar = threading.Event()
+        self._callbacks = []
+        self._conn = None
+
+    def assinar(self, callback):
+        """
+        Registra callback(evento, conn) chamado para cada evento recebido.
+
+        A cada (re)conexão o callback recebe {'tabela': '*'}: eventos podem ter
+        sido perdidos e todo estado derivado deve ser recarregado.
+        """
+        self._callbacks.append(callback)
+
+    def parar(self):
+        self._parar.set()
+
+    def run(self):
+        espera = 1.0
+        while not self._parar.is_set():
+            try:
+                self._conn = database.open_connection(autocommit=True)
+                with self._conn.cursor() as cur:
+                    cur.execute(f"LISTEN {CANAL};")
+                # Eventos anteriores ao LISTEN não foram vistos: recarrega do primário.
+                # O que for confirmado a partir daqui fica na fila da conexão e é
+                # aplicado por _escutar sobre a carga.
+                self.cache.carregar(self._conn)
+                self.cache.ativo = True
+                self._repassar({'tabela': '*'})
+                espera = 1.0
+                self._escutar()
+            except psycopg2.Error as e:
+                print(f"\n[AVISO] Ouvinte de alterações desconectado: {e}")
+            finally:
+                self.cache.ativo = False
+                self.cache.invalidar()
+                if self._conn is not None and not self._conn.closed:
+                    self._conn.close()
+                self._conn = None
+            self._parar.wait(espera)
+            espera = min(espera * 2, 60.0)
+
+    def _escutar(self):
+        while not self._parar.is_set():
+            prontos, _, _ = select.select([self._conn], [], [], self.timeout)
+            if not prontos:
+                continue
+            self._conn.poll()
+            while self._conn.notifies:
+                notificacao = self._conn.notifies.pop(0)
+                try:
+                    evento = json.loads(notificacao.payload)
+                except ValueError:
+                    continue
+                self.cache.aplicar(evento, self._conn)
+                self._repassar(evento)
+
+    def _repassar(self, evento):
+        """Chama cada callback; a falha de um não derruba o ouvinte nem os demais"""
+        for callback in self._callbacks:
+            try:
+                callback(evento, self._conn)
+            except Exception as e:
+                nome = getattr(callback, '__qualname__', repr(callback))
+                print(f"\n[AVISO] Falha ao processar evento {evento.get('tabela')} em {nome}: {e}")
+
+
+def iniciar_ouvinte(cache=None):
+    """Cria o cache (se necessário) e inicia a thread ouvinte; retorna (cache, ouvinte)"""
+    cache = cache or CacheLocal(snapshot.criar_snapshot())
+    ouvinte = OuvinteAlteracoes(cache)
+    ouvinte.start()
+    # Pequena espera para o primeiro LISTEN, evitando uma carga completa desnecessária
+    for _ in range(20):
+        if cache.ativo:
+            break
+        time.sleep(0.05)
+    return cache, ouvinte
@@ -0,0 +1,515 @@
+# PARTICIONAMENTO MENSAL - PEDIDO E PAGAMENTO
+#
+# Este módulo converte Pedido e Pagamento em tabelas particionadas por mês
+# (declarative partitioning, PostgreSQL 14+) e faz a manutenção das partições.
+#
+# MIGRAÇÃO ONLINE (python partitions.py migrar):
+# 1. Cria pedido_part/pagamento_part particionadas, com os mesmos índices das
+#    tabelas atuais (pg_get_indexdef), e um log de alterações
+# 2. Copia os dados em lotes por chave (id > último copiado), com pausas
+# 3. Reaplica as linhas alteradas durante a cópia (registradas no log)
+# 4. Em uma transação curta com lock exclusivo: reaplica o restante do log e
+#    troca os nomes. As tabelas antigas ficam como pedido_legado/pagamento_legado
+#
+# LIMITAÇÕES DO PARTICIONAMENTO:
+# - A chave primária passa a incluir a data (id_pedido, data_hora)
+# - UNIQUE(pag_pedido) e a FK Pagamento → Pedido não podem ser declaradas
+#   (nem índices únicos sem a data)
+#   sobre tabelas particionadas por data; são garantidas por triggers com
+#   advisory lock (mesmos códigos de erro: 23505 e 23503)
+#
+# MANUTENÇÃO (python partitions.py manter):
+# - Pré-cria as partições dos próximos meses
+# - Desanexa (DETACH CONCURRENTLY) partições mais antigas que a retenção
+
+import argparse
+import time
+from datetime import date
+import psycopg2
+import database
+
+TABELAS = {
+    'pedido': {
+        'chave': 'id_pedido',
+        'data': 'data_hora',
+        'colunas': ['id_pedido', 'data_hora', 'status_do_pedido', 'pedido_usuario', 'ped_cardapio', 'versao'],
+    },
+    'pagamento': {
+        'chave': 'id_pagamento',
+        'data': 'data_pagamento',
+        'colunas': ['id_pagamento', 'data_pagamento', 'valor_pago', 'comprovante', 'forma_de_pagamento',
+                    'pag_pedido', 'pag_categoria_usuario', 'pag_categoria_nome', 'versao'],
+    },
+}
+
+SQL_CRIAR_PARTICIONADAS = """
+CREATE TABLE IF NOT EXISTS pedido_part (
+    id_pedido INTEGER NOT NULL DEFAULT nextval('pedido_id_pedido_seq'),
+    data_hora TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    status_do_pedido VARCHAR(20) DEFAULT 'pendente' CHECK (status_do_pedido IN ('pendente', 'pago', 'entregue', 'cancelado')),
+    pedido_usuario INTEGER NOT NULL REFERENCES Usuario(id_usuario),
+    ped_cardapio INTEGER NOT NULL REFERENCES Cardapio(id_cardapio),
+    versao INTEGER NOT NULL DEFAULT 1,
+    PRIMARY KEY (id_pedido, data_hora)
+) PARTITION BY RANGE (data_hora);
+
+CREATE TABLE IF NOT EXISTS pagamento_part (
+    id_pagamento INTEGER NOT NULL DEFAULT nextval('pagamento_id_pagamento_seq'),
+    data_pagamento TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    valor_pago DECIMAL(8,2) NOT NULL CHECK (valor_pago >= 0),
+    comprovante BYTEA,
+    forma_de_pagamento VARCHAR(30) NOT NULL CHECK (forma_de_pagamento IN ('dinheiro', 'pix', 'cartao', 'vale')),
+    pag_pedido INTEGER NOT NULL,
+    pag_categoria_usuario INTEGER NOT NULL,
+    pag_categoria_nome VARCHAR(50) NOT NULL,
+    versao INTEGER NOT NULL DEFAULT 1,
+    PRIMARY KEY (id_pagamento, data_pagamento),
+    FOREIGN KEY (pag_categoria_usuario, pag_categoria_nome) REFERENCES Categoria_Usuario(id_usuario, nome_categoria)
+) PARTITION BY RANGE (data_pagamento);
+
+CREATE TABLE IF NOT EXISTS pedido_part_default PARTITION OF pedido_part DEFAULT;
+CREATE TABLE IF NOT EXISTS pagamento_part_default PARTITION OF pagamento_part DEFAULT;
+
+CREATE INDEX IF NOT EXISTS idx_pedido_part_id ON pedido_part (id_pedido);
+CREATE INDEX IF NOT EXISTS idx_pagamento_part_id ON pagamento_part (id_pagamento);
+CREATE INDEX IF NOT EXISTS idx_pagamento_part_pedido ON pagamento_part (pag_pedido);
+
+-- Log de linhas alteradas durante a cópia
+CREATE TABLE IF NOT EXISTS _migracao_particoes (
+    tabela TEXT NOT NULL,
+    id INTEGER NOT NULL
+);
+
+CREATE OR REPLACE FUNCTION _registrar_alteracao_migracao()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF lower(TG_TABLE_NAME) = 'pedido' THEN
+        INSERT INTO _migracao_particoes VALUES ('pedido', COALESCE(NEW.id_pedido, OLD.id_pedido));
+        IF TG_OP = 'UPDATE' AND NEW.id_pedido <> OLD.id_pedido THEN
+            INSERT INTO _migracao_particoes VALUES ('pedido', OLD.id_pedido);
+        END IF;
+    ELSE
+        INSERT INTO _migracao_particoes VALUES ('pagamento', COALESCE(NEW.id_pagamento, OLD.id_pagamento));
+        IF TG_OP = 'UPDATE' AND NEW.id_pagamento <> OLD.id_pagamento THEN
+            INSERT INTO _migracao_particoes VALUES ('pagamento', OLD.id_pagamento);
+        END IF;
+    END IF;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_pedido_migracao ON Pedido;
+CREATE TRIGGER trg_pedido_migracao
+    AFTER INSERT OR UPDATE OR DELETE ON Pedido
+    FOR EACH ROW EXECUTE FUNCTION _registrar_alteracao_migracao();
+
+DROP TRIGGER IF EXISTS trg_pagamento_migracao ON Pagamento;
+CREATE TRIGGER trg_pagamento_migracao
+    AFTER INSERT OR UPDATE OR DELETE ON Pagamento
+    FOR EACH ROW EXECUTE FUNCTION _registrar_alteracao_migracao();
+"""
+
+# Integridade que as tabelas particionadas não conseguem declarar.
+# O advisory lock por pedido serializa "criar pagamento" e "excluir pedido",
+# e cada consulta dentro da função enxerga os commits concorrentes (READ COMMITTED).
+SQL_INTEGRIDADE = """
+CREATE OR REPLACE FUNCTION validar_pagamento_particionado()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('pedido'), NEW.pag_pedido);
+
+    IF NOT EXISTS (SELECT 1 FROM Pedido WHERE id_pedido = NEW.pag_pedido) THEN
+        RAISE EXCEPTION 'Pedido % não existe', NEW.pag_pedido
+            USING ERRCODE = 'foreign_key_violation';
+    END IF;
+
+    IF EXISTS (SELECT 1 FROM Pagamento
+               WHERE pag_pedido = NEW.pag_pedido AND id_pagamento <> NEW.id_pagamento) THEN
+        RAISE EXCEPTION 'Pagamento duplicado: já existe pagamento para o pedido %', NEW.pag_pedido
+            USING ERRCODE = 'unique_violation';
+    END IF;
+
+    RETURN NEW;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION proteger_pedido_com_pagamento()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    PERFORM pg_advisory_xact_lock(hashtext('pedido'), OLD.id_pedido);
+
+    IF EXISTS (SELECT 1 FROM Pagamento WHERE pag_pedido = OLD.id_pedido) THEN
+        RAISE EXCEPTION 'Pedido % possui pagamento e não pode ser removido', OLD.id_pedido
+            USING ERRCODE = 'foreign_key_violation';
+    END IF;
+
+    RETURN OLD;
+END;
+$$;
+
+CREATE TRIGGER trg_pagamento_integridade
+    BEFORE INSERT OR UPDATE OF pag_pedido ON Pagamento
+    FOR EACH ROW EXECUTE FUNCTION validar_pagamento_particionado();
+
+CREATE TRIGGER trg_pedido_integridade
+    BEFORE DELETE ON Pedido
+    FOR EACH ROW EXECUTE FUNCTION proteger_pedido_com_pagamento();
+"""
+
+# Triggers do canal de alterações (schema.sql), recriados se a função existir
+SQL_NOTIFICACAO = """
+CREATE TRIGGER trg_pedido_notificar
+    AFTER INSERT OR UPDATE OR DELETE ON Pedido
+    FOR EACH ROW EXECUTE FUNCTION notificar_alteracao();
+
+CREATE TRIGGER trg_pagamento_notificar
+    AFTER INSERT OR UPDATE OR DELETE ON Pagamento
+    FOR EACH ROW EXECUTE FUNCTION notificar_alteracao();
+"""
+
+# Devolução de vagas da admissão de pedidos (schema.sql), recriada se a função existir
+SQL_ADMISSAO = """
+CREATE TRIGGER trg_pedido_devolve_vaga
+    AFTER UPDATE OF status_do_pedido OR DELETE ON Pedido
+    FOR EACH ROW EXECUTE FUNCTION devolver_vaga_pedido();
+"""
+
+# Versões da concorrência otimista (schema.sql)
+SQL_VERSAO = """
+CREATE TRIGGER trg_pedido_versao
+    BEFORE UPDATE ON Pedido
+    FOR EACH ROW EXECUTE FUNCTION incrementar_versao();
+
+CREATE TRIGGER trg_pagamento_versao
+    BEFORE UPDATE ON Pagamento
+    FOR EACH ROW EXECUTE FUNCTION incrementar_versao();
+"""
+
+# ==================== PARTIÇÕES ====================
+
+def _inicio_mes(d):
+    return date(d.year, d.month, 1)
+
+def _somar_meses(d, meses):
+    indice = d.year * 12 + (d.month - 1) + meses
+    return date(indice // 12, indice % 12 + 1, 1)
+
+def _nome_particao(tabela, mes):
+    return f"{tabela}_p{mes.year:04d}_{mes.month:02d}"
+
+def criar_particoes(conn, tabela, inicio, fim):
+    """
+    Cria as partições mensais de 'tabela' cobrindo [inicio, fim] (idempotente).
+
+    Retorna a lista de partições criadas.
+    """
+    criadas = []
+    mes = _inicio_mes(inicio)
+    with conn.cursor() as cur:
+        while mes <= fim:
+            nome = _nome_particao(tabela.replace('_part', ''), mes)
+            cur.execute("SELECT to_regclass(%s);", (nome,))
+            if cur.fetchone()[0] is None:
+                cur.execute(
+                    f"CREATE TABLE {nome} PARTITION OF {tabela} FOR VALUES FROM (%s) TO (%s);",
+                    (mes, _somar_meses(mes, 1))
+                )
+                criadas.append(nome)
+            mes = _somar_meses(mes, 1)
+    conn.commit()
+    return criadas
+
+def listar_particoes(conn, tabela):
+    """Retorna [(nome, mês)] das partições mensais de 'tabela', em ordem cronológica"""
+    sql = """
+    SELECT c.relname
+    FROM pg_inherits i
+    JOIN pg_class c ON c.oid = i.inhrelid
+    JOIN pg_class p ON p.oid = i.inhparent
+    WHERE p.relname = %s
+    ORDER BY c.relname;
+    """
+    particoes = []
+    with conn.cursor() as cur:
+        cur.execute(sql, (tabela,))
+        for (nome,) in cur.fetchall():
+            sufixo = nome.rsplit('_p', 1)[-1]
+            try:
+                ano, mes = sufixo.split('_')
+                particoes.append((nome, date(int(ano), int(mes), 1)))
+            except ValueError:
+                continue  # partição default
+    return particoes
+
+# ==================== MIGRAÇÃO ONLINE ====================
+
+def _indices_da_tabela(cur, tabela):
+    """[(nome, definição a partir de USING)] dos índices não únicos de 'tabela'"""
+    cur.execute("""
+        SELECT c.relname, substring(pg_get_indexdef(i.indexrelid) FROM ' USING .*$')
+        FROM pg_index i
+        JOIN pg_class c ON c.oid = i.indexrelid
+        WHERE i.indrelid = %s::regclass AND NOT i.indisunique
+        ORDER BY c.relname;
+    """, (tabela,))
+    return cur.fetchall()
+
+def _copiar_indices(cur, tabela):
+    """Cria em {tabela}_part, como {nome}_part, os índices de 'tabela' que ainda faltam"""
+    for nome, definicao in _indices_da_tabela(cur, tabela):
+        cur.execute(f"CREATE INDEX IF NOT EXISTS {nome}_part ON {tabela}_part{definicao};")
+
+def _renomear_indices(cur, tabela):
+    """Após a troca: índices antigos viram {nome}_legado e as cópias assumem o nome original"""
+    for nome, _ in _indices_da_tabela(cur, f"{tabela}_legado"):
+        cur.execute("SELECT to_regclass(%s);", (f"{nome}_part",))
+        if cur.fetchone()[0] is not None:
+            cur.execute(f"ALTER INDEX {nome} RENAME TO {nome}_legado;")
+            cur.execute(f"ALTER INDEX {nome}_part RENAME TO {nome};")
+
+def _copiar_em_lotes(conn, tabela, lote, pausa):
+    """Copia a tabela antiga para a particionada em lotes por chave"""
+    info = TABELAS[tabela]
+    chave, data = info['chave'], info['data']
+    colunas = ', '.join(info['colunas'])
+    selecao = ', '.join(
+        f"COALESCE({c}, CURRENT_TIMESTAMP)" if c == data else c for c in info['colunas']
+    )
+    ultimo = 0
+    total = 0
+    while True:
+        with conn.cursor() as cur:
+            cur.execute(
+                f"SELECT max({chave}) FROM (SELECT {chave} FROM {tabela} WHERE {chave} > %s "
+                f"ORDER BY {chave} LIMIT %s) t;",
+                (ultimo, lote)
+            )
+            limite = cur.fetchone()[0]
+            if limite is None:
+                break
+            cur.execute(
+                f"INSERT INTO {tabela}_part ({colunas}) SELECT {selecao} FROM {tabela} "
+                f"WHERE {chave} > %s AND {chave} <= %s ON CONFLICT DO NOTHING;",
+                (ultimo, limite)
+            )
+            total += cur.rowcount
+        conn.commit()
+        ultimo = limite
+        print(f"[INFO] {tabela}: {total} linhas copiadas (até id {ultimo})")
+        time.sleep(pausa)
+    return total
+
+def _reaplicar_log(conn, lote, ate_esvaziar=True):
+    """
+    Reaplica as linhas registradas no log: remove a versão copiada e copia a atual.
+
+    Remover-e-recopiar é idempotente e corrige também cópias feitas com
+    snapshot anterior a uma alteração concorrente.
+    """
+    reaplicadas = 0
+    while True:
+        with conn.cursor() as cur:
+            cur.execute("""
+                DELETE FROM _migracao_particoes
+                WHERE ctid IN (SELECT ctid FROM _migracao_particoes LIMIT %s)
+                RETURNING tabela, id;
+            """, (lote,))
+            linhas = cur.fetchall()
+            if not linhas:
+                break
+            for tabela in TABELAS:
+                ids = list({i for t, i in linhas if t == tabela})
+                if not ids:
+                    continue
+                info = TABELAS[tabela]
+                chave, data = info['chave'], info['data']
+                colunas = ', '.join(info['colunas'])
+                selecao = ', '.join(
+                    f"COALESCE({c}, CURRENT_TIMESTAMP)" if c == data else c for c in info['colunas']
+                )
+                cur.execute(f"DELETE FROM {tabela}_part WHERE {chave} = ANY(%s);", (ids,))
+                cur.execute(
+                    f"INSERT INTO {tabela}_part ({colunas}) SELECT {selecao} FROM {tabela} "
+                    f"WHERE {chave} = ANY(%s);",
+                    (ids,)
+                )
+            reaplicadas += len(linhas)
+        if not ate_esvaziar:
+            break
+        conn.commit()
+    return reaplicadas
+
+def _trocar_tabelas(conn, lote):
+    """Transação curta: lock exclusivo, reaplica o log restante e troca os nomes"""
+    with conn.cursor() as cur:
+        cur.execute("SET LOCAL lock_timeout = '5s';")
+        cur.execute("LOCK TABLE Pedido, Pagamento IN ACCESS EXCLUSIVE MODE;")
+    # Dentro do lock: reaplica tudo sem commits intermediários
+    while _reaplicar_log(conn, lote, ate_esvaziar=False):
+        pass
+    with conn.cursor() as cur:
+        # Índices criados nas tabelas antigas durante a cópia
+        for tabela in TABELAS:
+            _copiar_indices(cur, tabela)
+        cur.execute("DROP TRIGGER trg_pedido_migracao ON Pedido;")
+        cur.execute("DROP TRIGGER trg_pagamento_migracao ON Pagamento;")
+        cur.execute("ALTER TABLE Pagamento RENAME TO pagamento_legado;")
+        cur.execute("ALTER TABLE Pedido RENAME TO pedido_legado;")
+        cur.execute("ALTER TABLE pedido_part RENAME TO pedido;")
+        cur.execute("ALTER TABLE pagamento_part RENAME TO pagamento;")
+        cur.execute("ALTER TABLE pedido_part_default RENAME TO pedido_default;")
+        cur.execute("ALTER TABLE pagamento_part_default RENAME TO pagamento_default;")
+        for tabela in TABELAS:
+            _renomear_indices(cur, tabela)
+        # As sequências passam a pertencer às novas tabelas (sobrevivem a DROP do legado)
+        cur.execute("ALTER SEQUENCE pedido_id_pedido_seq OWNED BY pedido.id_pedido;")
+        cur.execute("ALTER SEQUENCE pagamento_id_pagamento_seq OWNED BY pagamento.id_pagamento;")
+        cur.execute("DROP TABLE _migracao_particoes;")
+        # Triggers legados de notificação continuariam disparando nas tabelas antigas
+        cur.execute("DROP TRIGGER IF EXISTS trg_pedido_notificar ON pedido_legado;")
+        cur.execute("DROP TRIGGER IF EXISTS trg_pagamento_notificar ON pagamento_legado;")
+        cur.execute("DROP TRIGGER IF EXISTS trg_pedido_devolve_vaga ON pedido_legado;")
+        cur.execute("DROP TRIGGER IF EXISTS trg_pedido_versao ON pedido_legado;")
+        cur.execute("DROP TRIGGER IF EXISTS trg_pagamento_versao ON pagamento_legado;")
+        cur.execute(SQL_INTEGRIDADE)
+        cur.execute("SELECT to_regproc('notificar_alteracao');")
+        if cur.fetchone()[0] is not None:
+            cur.execute(SQL_NOTIFICACAO)
+        cur.execute("SELECT to_regproc('devolver_vaga_pedido');")
+        if cur.fetchone()[0] is not None:
+            cur.execute(SQL_ADMISSAO)
+        cur.execute(SQL_VERSAO)
+        # Views guardam a referência à tabela (OID), não o nome: recriar
+        cur.execute("SELECT pg_get_viewdef('vw_relatorio_pagamentos'::regclass);")
+        definicao = cur.fetchone()[0]
+        definicao = definicao.replace('pedido_legado', 'pedido').replace('pagamento_legado', 'pagamento')
+        cur.execute("DROP VIEW vw_relatorio_pagamentos;")
+        cur.execute(f"CREATE VIEW vw_relatorio_pagamentos AS {definicao}")
+    conn.commit()
+
+def migrar(conn, lote=5000, pausa=0.1, meses_futuros=3):
+    """
+    MIGRAÇÃO ONLINE PARA TABELAS PARTICIONADAS
+
+    Pode ser interrompida e executada novamente: a criação é idempotente e a
+    cópia ignora linhas já copiadas.
+    """
+    with conn.cursor() as cur:
+        cur.execute("SELECT to_regclass('pedido_legado');")
+        if cur.fetchone()[0] is not None:
+            print("[INFO] Pedido e Pagamento já estão particionadas.")
+            return
+        cur.execute(SQL_CRIAR_PARTICIONADAS)
+        # Com as tabelas ainda vazias; a cópia já preenche os índices
+        for tabela in TABELAS:
+            _copiar_indices(cur, tabela)
+        cur.execute("SELECT COALESCE(min(data_hora), CURRENT_TIMESTAMP)::date FROM Pedido;")
+        inicio_pedido = cur.fetchone()[0]
+        cur.execute("SELECT COALESCE(min(data_pagamento), CURRENT_TIMESTAMP)::date FROM Pagamento;")
+        inicio_pagamento = cur.fetchone()[0]
+    conn.commit()
+
+    fim = _somar_meses(_inicio_mes(date.today()), meses_futuros)
+    criar_particoes(conn, 'pedido_part', inicio_pedido, fim)
+    criar_particoes(conn, 'pagamento_part', inicio_pagamento, fim)
+
+    for tabela in TABELAS:
+        _copiar_em_lotes(conn, tabela, lote, pausa)
+
+    reaplicadas = _reaplicar_log(conn, lote)
+    print(f"[INFO] {reaplicadas} alterações concorrentes reaplicadas.")
+
+    _trocar_tabelas(conn, lote)
+    print("[SUCESSO] Pedido e Pagamento agora são particionadas por mês.")
+    print("[INFO] Tabelas antigas mantidas como pedido_legado e pagamento_legado.")
+
+# ==================== MANUTENÇÃO ====================
+
+def manter(conn, meses_futuros=3, reter_meses=None):
+    """
+    MANUTENÇÃO PERIÓDICA DAS PARTIÇÕES
+
+    - Cria partições até 'meses_futuros' meses à frente
+    - Se 'reter_meses' for informado, desanexa partições cujo mês terminou
+      antes desse limite. As partições desanexadas viram tabelas comuns
+      (podem ser arquivadas ou removidas manualmente)
+    """
+    hoje = _inicio_mes(date.today())
+    fim = _somar_meses(hoje, meses_futuros)
+
+    for tabela in TABELAS:
+        try:
+            criadas = criar_particoes(conn, tabela, hoje, fim)
+        except psycopg2.Error as e:
+            # Ex.: a partição default já contém linhas do intervalo
+            print(f"[ERRO] Erro ao criar partições de {tabela}: {e}")
+            conn.rollback()
+            continue
+        for nome in criadas:
+            print(f"[SUCESSO] Partição criada: {nome}")
+
+    if reter_meses is None:
+        return
+
+    limite = _somar_meses(hoje, -reter_meses)
+    # DETACH ... CONCURRENTLY não pode rodar dentro de transação
+    conn.autocommit = True
+    try:
+        for tabela in TABELAS:
+            for nome, mes in listar_particoes(conn, tabela):
+                if _somar_meses(mes, 1) > limite:
+                    continue
+                try:
+                    with conn.cursor() as cur:
+                        cur.execute(f"ALTER TABLE {tabela} DETACH PARTITION {nome} CONCURRENTLY;")
+                    print(f"[SUCESSO] Partição desanexada: {nome}")
+                except psycopg2.Error as e:
+                    print(f"[ERRO] Erro ao desanexar {nome}: {e}")
+    finally:
+        conn.autocommit = False
+
+def main():
+    parser = argparse.ArgumentParser(description="Particionamento mensal de Pedido e Pagamento")
+    parser.add_argument('--prazo', type=float,
+                        help="Tempo máximo em segundos (a consulta em andamento é cancelada no servidor)")
+    sub = parser.add_subparsers(dest='comando', required=True)
+
+    p_migrar = sub.add_parser('migrar', help="Converte as tabelas existentes (online, em lotes)")
+    p_migrar.add_argument('--lote', type=int, default=5000)
+    p_migrar.add_argument('--pausa', type=float, default=0.1, help="Pausa entre lotes, em segundos")
+    p_migrar.add_argument('--meses-futuros', type=int, default=3)
+
+    p_manter = sub.add_parser('manter', help="Cria partições futuras e desanexa as antigas")
+    p_manter.add_argument('--meses-futuros', type=int, default=3)
+    p_manter.add_argument('--reter-meses', type=int, default=None)
+
+    args = parser.parse_args()
+
+    try:
+        conn = database.open_connection()
+    except psycopg2.Error as e:
+        print(f"[ERRO] Erro ao conectar ao PostgreSQL: {e}")
+        return 1
+
+    try:
+        with database.prazo(args.prazo):
+            if args.comando == 'migrar':
+                migrar(conn, args.lote, args.pausa, args.meses_futuros)
+            else:
+                manter(conn, args.meses_futuros, args.reter_meses)
+    except psycopg2.Error as e:
+        print(f"[ERRO] {e}")
+        conn.rollback()
+        return 1
+    finally:
+        conn.close()
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
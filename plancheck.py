@@ -0,0 +1,412 @@
+# REGRESSÃO DE PLANOS DE CONSULTA - database.py
+#
+# Carrega uma massa sintética de tamanho configurável em um schema separado de
+# um PostgreSQL local, executa as funções de database.py capturando cada
+# comando SQL enviado, e mede cada um com EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON).
+# O resultado é comparado com uma linha de base gravada em JSON.
+#
+# FALHA (código de saída 1) quando:
+# - aparece um Seq Scan em uma tabela que a linha de base acessava por índice
+# - o tempo de execução passa da linha de base além da tolerância
+# - os buffers lidos passam da linha de base além da tolerância
+#
+# Tudo roda em uma transação desfeita ao final: a massa sintética não muda.
+# O schema de teste (padrão 'plancheck') é criado a partir do schema.sql e nunca
+# toca as tabelas do schema public.
+#
+# USO:
+#   python plancheck.py carregar --usuarios 20000 --pedidos 300000
+#   python plancheck.py verificar --atualizar-linha-base     # primeira execução
+#   python plancheck.py verificar [--tolerancia 0.5]
+
+import argparse
+import json
+import os
+from datetime import date, timedelta
+import psycopg2
+import psycopg2.extensions
+import database
+import metrics
+
+ARQUIVO_LINHA_BASE = 'plan_baselines.json'
+SCHEMA_PADRAO = 'plancheck'
+TABELAS_COM_TRIGGERS = ('Usuario', 'Categoria_Usuario', 'Pedido', 'Pagamento', 'Feedback')
+COMANDOS_PLANEJAVEIS = ('SELECT', 'WITH', 'INSERT', 'UPDATE', 'DELETE')
+
+# ==================== CAPTURA DOS COMANDOS ====================
+
+class _CursorCaptura(metrics.CursorInstrumentado):
+    def execute(self, query, vars=None):
+        if self.connection.capturando:
+            self.connection.capturadas.append(self.mogrify(query, vars).decode('utf-8'))
+        return super().execute(query, vars)
+
+class _ConexaoCaptura(metrics.ConexaoInstrumentada):
+    """
+    Conexão que registra todo SQL executado pelas funções de database.py.
+
+    commit()/rollback() das funções viram no-ops: cada cenário roda dentro de um
+    SAVEPOINT controlado aqui e a transação inteira é desfeita ao final.
+    """
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.capturando = False
+        self.capturadas = []
+
+    def cursor(self, *args, **kwargs):
+        kwargs.setdefault('cursor_factory', _CursorCaptura)
+        return super().cursor(*args, **kwargs)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+    def desfazer_tudo(self):
+        psycopg2.extensions.connection.rollback(self)
+
+def conectar(schema):
+    config = database.get_db_config()
+    if not config or not all(k in config for k in ["DB_NAME", "DB_USER", "DB_PASSWORD", "DB_HOST", "DB_PORT"]):
+        raise psycopg2.OperationalError("Arquivo de configuração .env está incompleto ou ausente.")
+    conn = psycopg2.connect(database._montar_dsn(config), connection_factory=_ConexaoCaptura)
+    with conn.cursor() as cur:
+        # public continua no caminho: extensões (unaccent, btree_gist) ficam lá
+        cur.execute("SET search_path TO %s, public;" % psycopg2.extensions.quote_ident(schema, conn))
+    # Leituras sempre no primário (a massa sintética não existe nas réplicas)
+    database.desativar_replicas()
+    return conn
+
+# ==================== MASSA SINTÉTICA ====================
+
+def carregar(schema, usuarios, pedidos, semanas, arquivo_schema='schema.sql'):
+    """Recria o schema de teste a partir do schema.sql e gera a massa sintética"""
+    config = database.get_db_config()
+    conn = psycopg2.connect(database._montar_dsn(config))
+    schema_id = psycopg2.extensions.quote_ident(schema, conn)
+    with open(arquivo_schema, encoding='utf-8') as arquivo:
+        ddl = arquivo.read()
+
+    inicio = date.today() - timedelta(weeks=semanas)
+    with conn.cursor() as cur:
+        cur.execute(f"DROP SCHEMA IF EXISTS {schema_id} CASCADE;")
+        cur.execute(f"CREATE SCHEMA {schema_id};")
+        cur.execute(f"SET search_path TO {schema_id}, public;")
+        cur.execute(ddl)
+        for tabela in TABELAS_COM_TRIGGERS:
+            cur.execute(f"ALTER TABLE {tabela} DISABLE TRIGGER USER;")
+
+        cur.execute("SELECT setseed(0.42);")
+        cur.execute("""
+            INSERT INTO Usuario (matricula_usuario, CPF_usuario, nome_usuario, email_usuario, telefone_usuario, status_usuario)
+            SELECT 900000000 + g, 'S' || lpad(g::text, 13, '0'), 'Usuario Sintetico ' || g,
+                   'usuario' || g || '@sintetico.unb.br', '(61) 9' || lpad(g::text, 8, '0'),
+                   (ARRAY['ativo', 'ativo', 'ativo', 'trancado', 'formado'])[1 + floor(random() * 5)::int]
+            FROM generate_series(1, %(usuarios)s) g
+            RETURNING id_usuario;
+        """, {'usuarios': usuarios})
+        u0 = min(row[0] for row in cur.fetchall())
+        cur.execute("""
+            INSERT INTO Categoria_Usuario (id_usuario, nome_categoria, grupo, subsidio, beneficio)
+            SELECT id_usuario,
+                   (ARRAY['estudante_assistencia', 'estudante_regular', 'servidor'])[1 + id_usuario %% 3],
+                   1 + id_usuario %% 3,
+                   (ARRAY['total', 'parcial', 'sem_subsidio'])[1 + id_usuario %% 3],
+                   'Massa sintética'
+            FROM Usuario WHERE id_usuario >= %s;
+        """, (u0,))
+        cur.execute("""
+            INSERT INTO Cardapio (data_inicio, data_fim, tipo, observacao)
+            SELECT %(inicio)s::date + 7 * s, %(inicio)s::date + 7 * s + 6, t, 'Sintético semana ' || s
+            FROM generate_series(0, %(semanas)s) s
+            CROSS JOIN unnest(ARRAY['cafe', 'almoco', 'jantar']) t
+            RETURNING id_cardapio;
+        """, {'inicio': inicio, 'semanas': semanas})
+        ids_cardapio = [row[0] for row in cur.fetchall()]
+        c0, nc = min(ids_cardapio), len(ids_cardapio)
+        cur.execute("""
+            WITH escolha AS (
+                SELECT %(u0)s + floor(random() * %(nu)s)::int AS id_usuario,
+                       %(c0)s + floor(random() * %(nc)s)::int AS id_cardapio
+                FROM generate_series(1, %(pedidos)s)
+            )
+            INSERT INTO Pedido (data_hora, status_do_pedido, pedido_usuario, ped_cardapio)
+            SELECT c.data_inicio + floor(random() * 7)::int + make_interval(hours => 7 + floor(random() * 14)::int),
+                   (ARRAY['pendente', 'pago', 'entregue', 'entregue', 'entregue', 'cancelado'])[1 + floor(random() * 6)::int],
+                   e.id_usuario, e.id_cardapio
+            FROM escolha e
+            JOIN Cardapio c ON c.id_cardapio = e.id_cardapio;
+        """, {'u0': u0, 'nu': usuarios, 'c0': c0, 'nc': nc, 'pedidos': pedidos})
+        cur.execute("""
+            INSERT INTO Pagamento (data_pagamento, valor_pago, forma_de_pagamento, pag_pedido, pag_categoria_usuario, pag_categoria_nome)
+            SELECT p.data_hora + INTERVAL '5 minutes',
+                   CASE cu.nome_categoria WHEN 'estudante_assistencia' THEN 0 WHEN 'estudante_regular' THEN 6.10 ELSE 15.20 END,
+                   (ARRAY['dinheiro', 'pix', 'cartao', 'vale'])[1 + floor(random() * 4)::int],
+                   p.id_pedido, cu.id_usuario, cu.nome_categoria
+            FROM Pedido p
+            JOIN Categoria_Usuario cu ON cu.id_usuario = p.pedido_usuario
+            WHERE p.pedido_usuario >= %s AND p.status_do_pedido IN ('pago', 'entregue');
+        """, (u0,))
+        cur.execute("""
+            INSERT INTO Feedback (nota, comentarios, data_feedback, feed_usuario)
+            SELECT 1 + floor(random() * 5)::int,
+                   (ARRAY['Comida boa', 'Fila grande', 'Faltou opção vegetariana', 'Ótimo atendimento'])[1 + floor(random() * 4)::int],
+                   %(inicio)s::date + random() * (CURRENT_DATE - %(inicio)s::date) * INTERVAL '1 day',
+                   %(u0)s + floor(random() * %(nu)s)::int
+            FROM generate_series(1, %(feedbacks)s);
+        """, {'inicio': inicio, 'u0': u0, 'nu': usuarios, 'feedbacks': max(pedidos // 20, 1)})
+
+        for tabela in TABELAS_COM_TRIGGERS:
+            cur.execute(f"ALTER TABLE {tabela} ENABLE TRIGGER USER;")
+    conn.commit()
+
+    conn.autocommit = True
+    with conn.cursor() as cur:
+        cur.execute(f"SET search_path TO {schema_id}, public;")
+        cur.execute("VACUUM ANALYZE;")
+    conn.close()
+
+# ==================== CENÁRIOS ====================
+
+def _ids_de_exemplo(conn):
+    """IDs da massa sintética usados como parâmetros dos cenários"""
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT
+                (SELECT MAX(id_usuario) FROM Usuario),
+                (SELECT MAX(id_pedido) FROM Pedido),
+                (SELECT MAX(p.id_pedido) FROM Pedido p
+                  WHERE p.status_do_pedido = 'pendente'
+                    AND NOT EXISTS (SELECT 1 FROM Pagamento pg WHERE pg.pag_pedido = p.id_pedido)),
+                (SELECT MAX(id_pagamento) FROM Pagamento),
+                (SELECT MAX(id_cardapio) FROM Cardapio),
+                (SELECT MIN(id_unidade) FROM Unidade);
+        """)
+        usuario, pedido, pendente, pagamento, cardapio, unidade = cur.fetchone()
+        cur.execute("SELECT nome_categoria FROM Categoria_Usuario WHERE id_usuario = %s;", (usuario,))
+        categoria = cur.fetchone()[0]
+    return {'usuario': usuario, 'pedido': pedido, 'pendente': pendente, 'pagamento': pagamento,
+            'cardapio': cardapio, 'unidade': unidade, 'categoria': categoria}
+
+def cenarios(ids):
+    """(nome, função(conn)) para cada operação de database.py e a view de relatório"""
+    hoje = date.today()
+    semana_passada = hoje - timedelta(days=7)
+    usuario = {
+        'matricula_usuario': 999999999, 'CPF_usuario': 'PLANCHECK-0001', 'nome_usuario': 'Plano',
+        'email_usuario': 'plano@sintetico.unb.br', 'telefone_usuario': None, 'status_usuario': 'ativo',
+    }
+    pedido = {'pedido_usuario': ids['usuario'], 'ped_cardapio': ids['cardapio'], 'status_do_pedido': 'pendente'}
+    pagamento = {
+        'pag_pedido': ids['pendente'], 'valor_pago': 6.10, 'forma_de_pagamento': 'pix',
+        'pag_categoria_usuario': ids['usuario'], 'pag_categoria_nome': ids['categoria'],
+    }
+    # Dia sem pedidos na massa sintética: a reserva sempre encontra vaga
+    dia_reserva = hoje + timedelta(days=30)
+
+    def reservar(conn):
+        """Reserva fora da captura (preparação dos cenários que consomem uma reserva)"""
+        conn.capturando = False
+        try:
+            return database.reservar_vaga(conn, ids['unidade'], dia_reserva, 'almoco')[0]
+        finally:
+            conn.capturando = True
+
+    return [
+        ('add_user', lambda c: database.add_user(c, usuario)),
+        ('get_users_delta', lambda c: database.get_users_delta(c, semana_passada)),
+        ('get_all_users', database.get_all_users),
+        ('get_users_page', lambda c: database.get_users_page(c, ids['usuario'] // 2, 50)),
+        ('get_user_by_id', lambda c: database.get_user_by_id(c, ids['usuario'])),
+        ('update_user', lambda c: database.update_user(c, ids['usuario'], usuario)),
+        ('add_pedido', lambda c: database.add_pedido(c, pedido)),
+        ('get_all_pedidos', lambda c: database.get_all_pedidos(c, semana_passada)),
+        ('get_pedidos_page', lambda c: database.get_pedidos_page(c, ids['pedido'] // 2, 50)),
+        ('get_pedidos_pendentes', lambda c: database.get_pedidos_pendentes(c, semana_passada)),
+        ('get_pedido_pendente_by_id', lambda c: database.get_pedido_pendente_by_id(c, ids['pendente'])),
+        ('get_pedido_by_id', lambda c: database.get_pedido_by_id(c, ids['pedido'])),
+        ('update_pedido', lambda c: database.update_pedido(c, ids['pedido'], pedido)),
+        ('add_pagamento', lambda c: database.add_pagamento(c, pagamento)),
+        ('get_all_pagamentos', lambda c: database.get_all_pagamentos(c, semana_passada)),
+        ('get_pagamentos_page', lambda c: database.get_pagamentos_page(c, ids['pagamento'] // 2, 50)),
+        ('get_pagamento_by_id', lambda c: database.get_pagamento_by_id(c, ids['pagamento'])),
+        ('update_pagamento', lambda c: database.update_pagamento(c, ids['pagamento'], dict(pagamento, pag_pedido=ids['pedido']))),
+        ('delete_pagamento', lambda c: database.delete_pagamento(c, ids['pagamento'])),
+        ('delete_pedido', lambda c: database.delete_pedido(c, ids['pendente'])),
+        ('reservar_vaga', lambda c: database.reservar_vaga(c, ids['unidade'], dia_reserva, 'almoco')),
+        ('confirmar_reserva', lambda c: database.confirmar_reserva(c, reservar(c), pedido)),
+        ('liberar_reserva', lambda c: database.liberar_reserva(c, reservar(c))),
+        ('recalcular_vagas', lambda c: database.recalcular_vagas(c, dia_reserva)),
+        ('get_cardapios_disponiveis', database.get_cardapios_disponiveis),
+        ('get_cardapios_vigentes', lambda c: database.get_cardapios_vigentes(c, semana_passada)),
+        ('get_tabela_precos', database.get_tabela_precos),
+        ('get_categoria_usuario', lambda c: database.get_categoria_usuario(c, ids['usuario'])),
+        ('get_categorias_do_usuario', lambda c: database.get_categorias_do_usuario(c, ids['usuario'])),
+        ('atribuir_categorias', lambda c: database.atribuir_categorias(c, [(ids['usuario'], 'servidor')], True)),
+        ('get_previsao_demanda', lambda c: database.get_previsao_demanda(c, hoje, hoje + timedelta(days=6))),
+        ('get_capacidade_grade', lambda c: database.get_capacidade_grade(c, hoje, hoje + timedelta(days=6))),
+        ('get_avaliacoes_resumo', lambda c: database.get_avaliacoes_resumo(c, 8)),
+        ('get_avaliacoes_semanais', lambda c: database.get_avaliacoes_semanais(c, None, 12)),
+        ('get_fechamento_unidade', lambda c: database.get_fechamento_unidade(c, 1, hoje.replace(day=1), hoje + timedelta(days=1))),
+        ('get_avaliacoes_periodo', lambda c: database.get_avaliacoes_periodo(c, 1, hoje.replace(day=1), hoje + timedelta(days=1))),
+        ('search', lambda c: database.search(c, 'sintetico')),
+        ('purge_users', lambda c: database.purge_users(c, [ids['usuario']])),
+        ('vw_relatorio_pagamentos', lambda c: _consultar(
+            c, "SELECT * FROM vw_relatorio_pagamentos WHERE id_usuario = %s;", (ids['usuario'],))),
+    ]
+
+def _consultar(conn, sql, params):
+    with conn.cursor() as cur:
+        cur.execute(sql, params)
+        return cur.fetchall()
+
+def capturar(conn, lista):
+    """Executa cada cenário em um SAVEPOINT e retorna [(nome, sql)] dos comandos planejáveis"""
+    comandos = []
+    with psycopg2.extensions.cursor(conn) as controle:
+        for nome, funcao in lista:
+            controle.execute("SAVEPOINT cenario;")
+            conn.capturadas = []
+            conn.capturando = True
+            try:
+                funcao(conn)
+            except psycopg2.Error as e:
+                print(f"[AVISO] Cenário {nome} terminou com erro (comandos até o erro serão medidos): {e}")
+            finally:
+                conn.capturando = False
+                controle.execute("ROLLBACK TO SAVEPOINT cenario;")
+            planejaveis = [sql for sql in conn.capturadas if sql.lstrip().upper().startswith(COMANDOS_PLANEJAVEIS)]
+            for i, sql in enumerate(planejaveis):
+                comandos.append((nome if len(planejaveis) == 1 else f"{nome}#{i + 1}", sql))
+    return comandos
+
+# ==================== MEDIÇÃO E COMPARAÇÃO ====================
+
+def _resumir(plano):
+    """Tipos de nó (com a tabela), buffers e tempo de um plano EXPLAIN em JSON"""
+    nos = set()
+
+    def visitar(no):
+        relacao = no.get('Relation Name')
+        nos.add(f"{no['Node Type']} on {relacao}" if relacao else no['Node Type'])
+        for filho in no.get('Plans', []):
+            visitar(filho)
+
+    visitar(plano['Plan'])
+    topo = plano['Plan']
+    return {
+        'nos': sorted(nos),
+        'buffers': topo.get('Shared Hit Blocks', 0) + topo.get('Shared Read Blocks', 0),
+        'tempo_ms': plano['Execution Time'],
+    }
+
+def medir(conn, comandos, repeticoes=3):
+    """EXPLAIN ANALYZE de cada comando (menor tempo de 'repeticoes'); efeitos sempre desfeitos"""
+    resultados = {}
+    with psycopg2.extensions.cursor(conn) as cur:
+        for nome, sql in comandos:
+            medidas = []
+            for _ in range(repeticoes):
+                cur.execute("SAVEPOINT medicao;")
+                try:
+                    cur.execute("EXPLAIN (ANALYZE, BUFFERS, FORMAT JSON) " + sql)
+                    medidas.append(_resumir(cur.fetchone()[0][0]))
+                except psycopg2.Error as e:
+                    print(f"[AVISO] {nome}: {e}".strip())
+                    break
+                finally:
+                    cur.execute("ROLLBACK TO SAVEPOINT medicao;")
+            if medidas:
+                melhor = min(medidas, key=lambda m: m['tempo_ms'])
+                resultados[nome] = dict(melhor, sql=sql.strip())
+    return resultados
+
+def comparar(atual, base, tolerancia=0.5, folga_ms=1.0, tolerancia_buffers=0.5):
+    """
+    Returns:
+        list: (nome, situacao, detalhe) com situacao em 'ok', 'falha' ou 'novo'
+    """
+    relatorio = []
+    for nome, medida in sorted(atual.items()):
+        anterior = base.get(nome)
+        if anterior is None:
+            relatorio.append((nome, 'novo', f"{medida['tempo_ms']:.2f} ms, {medida['buffers']} buffers"))
+            continue
+
+        problemas = []
+        seq_novos = [n for n in medida['nos'] if n.startswith('Seq Scan') and n not in anterior['nos']]
+        if seq_novos:
+            problemas.append("plano mudou para " + ', '.join(seq_novos))
+        limite_tempo = anterior['tempo_ms'] * (1 + tolerancia) + folga_ms
+        if medida['tempo_ms'] > limite_tempo:
+            problemas.append(f"tempo {anterior['tempo_ms']:.2f} → {medida['tempo_ms']:.2f} ms")
+        limite_buffers = anterior['buffers'] * (1 + tolerancia_buffers) + 10
+        if medida['buffers'] > limite_buffers:
+            problemas.append(f"buffers {anterior['buffers']} → {medida['buffers']}")
+
+        if problemas:
+            relatorio.append((nome, 'falha', '; '.join(problemas)))
+        else:
+            relatorio.append((nome, 'ok', f"{medida['tempo_ms']:.2f} ms (base {anterior['tempo_ms']:.2f}), "
+                                           f"{medida['buffers']} buffers"))
+    return relatorio
+
+def verificar(schema, arquivo, atualizar_linha_base, tolerancia, repeticoes):
+    conn = conectar(schema)
+    try:
+        comandos = capturar(conn, cenarios(_ids_de_exemplo(conn)))
+        atual = medir(conn, comandos, repeticoes)
+    finally:
+        conn.desfazer_tudo()
+        conn.close()
+
+    if atualizar_linha_base or not os.path.exists(arquivo):
+        with open(arquivo, 'w', encoding='utf-8') as saida:
+            json.dump(atual, saida, indent=2, ensure_ascii=False, sort_keys=True)
+        print(f"[SUCESSO] Linha de base com {len(atual)} comandos gravada em {arquivo}.")
+        return 0
+
+    with open(arquivo, encoding='utf-8') as entrada:
+        base = json.load(entrada)
+    relatorio = comparar(atual, base, tolerancia)
+    for nome, situacao, detalhe in relatorio:
+        print(f"[{situacao.upper():<5}] {nome:<32} {detalhe}")
+    for nome in sorted(set(base) - set(atual)):
+        print(f"[AVISO] {nome}: presente na linha de base, não executado agora")
+
+    falhas = sum(1 for _, situacao, _ in relatorio if situacao == 'falha')
+    print(f"\n{len(relatorio)} comandos medidos, {falhas} regressões.")
+    return 1 if falhas else 0
+
+def main():
+    parser = argparse.ArgumentParser(description="Regressão de planos de consulta de database.py")
+    parser.add_argument('--schema', default=SCHEMA_PADRAO, help="Schema da massa sintética")
+    sub = parser.add_subparsers(dest='comando', required=True)
+
+    p_carga = sub.add_parser('carregar', help="Recria o schema de teste com massa sintética")
+    p_carga.add_argument('--usuarios', type=int, default=20000)
+    p_carga.add_argument('--pedidos', type=int, default=300000)
+    p_carga.add_argument('--semanas', type=int, default=52, help="Semanas de cardápios/histórico")
+
+    p_ver = sub.add_parser('verificar', help="Mede os planos e compara com a linha de base")
+    p_ver.add_argument('--linha-base', default=ARQUIVO_LINHA_BASE)
+    p_ver.add_argument('--atualizar-linha-base', action='store_true')
+    p_ver.add_argument('--tolerancia', type=float, default=0.5, help="Aumento de tempo aceito (0.5 = 50%%)")
+    p_ver.add_argument('--repeticoes', type=int, default=3)
+
+    args = parser.parse_args()
+
+    try:
+        if args.comando == 'carregar':
+            carregar(args.schema, args.usuarios, args.pedidos, args.semanas)
+            print(f"[SUCESSO] Massa sintética carregada no schema '{args.schema}'.")
+            return 0
+        return verificar(args.schema, args.linha_base, args.atualizar_linha_base, args.tolerancia, args.repeticoes)
+    except psycopg2.Error as e:
+        print(f"[ERRO] {e}")
+        return 1
+
+if __name__ == "__main__":
+    raise SystemExit(main())
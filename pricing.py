@@ -0,0 +1,155 @@
+# MOTOR DE PREÇOS - TABELA_PRECO
+#
+# Calcula o valor_pago de um pedido a partir da categoria do usuário, do tipo de
+# refeição e da data, usando as faixas de vigência de Tabela_Preco.
+#
+# ESTRUTURAS EM MEMÓRIA:
+# - Consulta unitária: dict (categoria, tipo) → inícios de vigência ordenados,
+#   com busca binária (bisect) - alguns microssegundos por pedido. As faixas de
+#   uma chave não se sobrepõem (restrição tabela_preco_sem_sobreposicao), então
+#   a faixa de início mais próximo é a única que pode conter a data
+# - Consulta em lote: a tabela "achatada" em arrays NumPy ordenados por
+#   (chave, início); milhares de pedidos são precificados com um único
+#   np.searchsorted, sem laço Python por pedido
+#
+# RECARGA:
+# - Com o ouvinte de alterações ativo (notifications.py), qualquer comando em
+#   Tabela_Preco dispara a recarga imediata
+# - Sem ouvinte, a tabela é recarregada quando fica mais velha que 'ttl' segundos
+
+import threading
+import time
+from bisect import bisect_right
+from datetime import date, datetime
+import numpy as np
+import database
+
+# Deslocamento para compor (chave, dia) em um único inteiro ordenável
+_DIAS_POR_CHAVE = 1_000_000
+_SEM_FIM = np.iinfo(np.int64).max
+
+def _dia(valor):
+    """Converte date/datetime em dias desde 1970-01-01"""
+    if isinstance(valor, datetime):
+        valor = valor.date()
+    return (valor - date(1970, 1, 1)).days
+
+class TabelaPrecos:
+    """
+    TABELA DE PREÇOS EM MEMÓRIA
+
+    Carregada uma vez do banco e substituída por inteiro a cada recarga
+    (as consultas nunca veem uma tabela pela metade).
+    """
+
+    def __init__(self, ttl=300.0):
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._carregada_em = 0.0
+        self._faixas = {}               # (categoria, tipo) -> ([inícios], [(fim, valor)])
+        self._chaves = {}               # (categoria, tipo) -> código inteiro
+        self._inicio = np.empty(0, dtype=np.int64)   # chave * _DIAS_POR_CHAVE + dia
+        self._chave = np.empty(0, dtype=np.int64)
+        self._fim = np.empty(0, dtype=np.int64)
+        self._valor = np.empty(0, dtype=np.float64)
+
+    # ---------- CARGA ----------
+
+    def carregar(self, conn):
+        """Lê Tabela_Preco e reconstrói as estruturas de consulta"""
+        linhas = database.get_tabela_precos(conn)
+
+        faixas = {}
+        chaves = {}
+        for categoria, tipo, inicio, fim, valor in linhas:
+            chave = (categoria, tipo)
+            chaves.setdefault(chave, len(chaves))
+            inicios, dados = faixas.setdefault(chave, ([], []))
+            inicios.append(_dia(inicio))
+            dados.append((_dia(fim) if fim else _SEM_FIM, float(valor)))
+
+        # Arrays ordenados por (chave, início) - linhas já vêm ordenadas do banco
+        ordem = sorted(
+            (chaves[chave], ini, fim_valor)
+            for chave, (inicios, dados) in faixas.items()
+            for ini, fim_valor in zip(inicios, dados)
+        )
+        inicio = np.array([c * _DIAS_POR_CHAVE + ini for c, ini, _ in ordem], dtype=np.int64)
+        chave = np.array([c for c, _, _ in ordem], dtype=np.int64)
+        fim = np.array([fv[0] for _, _, fv in ordem], dtype=np.int64)
+        valor = np.array([fv[1] for _, _, fv in ordem], dtype=np.float64)
+
+        with self._lock:
+            self._faixas = faixas
+            self._chaves = chaves
+            self._inicio, self._chave, self._fim, self._valor = inicio, chave, fim, valor
+            self._carregada_em = time.monotonic()
+
+    def carregar_se_expirada(self, conn):
+        """Recarrega quando a cópia local passou do TTL (uso sem ouvinte de alterações)"""
+        if time.monotonic() - self._carregada_em > self.ttl:
+            self.carregar(conn)
+
+    def ao_notificar(self, evento, conn):
+        """Callback para OuvinteAlteracoes.assinar: recarrega ao mudar Tabela_Preco"""
+        if evento.get('tabela') in ('tabela_preco', '*'):
+            self.carregar(conn)
+
+    # ---------- CONSULTAS ----------
+
+    def preco(self, categoria, tipo, data=None):
+        """
+        PREÇO DE UM PEDIDO
+
+        Returns:
+            float: Valor vigente na data, ou None se não houver faixa cadastrada
+        """
+        faixas = self._faixas.get((categoria, tipo))
+        if not faixas:
+            return None
+        inicios, dados = faixas
+        dia = _dia(data or date.today())
+        i = bisect_right(inicios, dia) - 1
+        if i < 0:
+            return None
+        fim, valor = dados[i]
+        return valor if dia <= fim else None
+
+    def precos_em_lote(self, categorias, tipos, datas):
+        """
+        PRECIFICAÇÃO EM LOTE (FATURAMENTO)
+
+        Args:
+            categorias, tipos: Sequências de nomes (mesmo tamanho)
+            datas: Sequência de date/datetime ou array datetime64
+
+        Returns:
+            np.ndarray: Valores (float64); NaN onde não há faixa vigente
+        """
+        with self._lock:
+            chaves, inicio, chave_tab, fim, valor = (
+                self._chaves, self._inicio, self._chave, self._fim, self._valor
+            )
+
+        # Códigos das chaves: só os valores distintos passam pelo dicionário
+        pares, inverso = np.unique(
+            np.char.add(np.char.add(np.asarray(categorias, dtype=str), '|'), np.asarray(tipos, dtype=str)),
+            return_inverse=True
+        )
+        codigos_distintos = np.array(
+            [chaves.get(tuple(p.split('|', 1)), -1) for p in pares], dtype=np.int64
+        )
+        codigos = codigos_distintos[inverso]
+
+        dias = np.asarray(datas, dtype='datetime64[D]').astype(np.int64)
+        consulta = codigos * _DIAS_POR_CHAVE + dias
+
+        resultado = np.full(len(consulta), np.nan)
+        if len(inicio) == 0:
+            return resultado
+
+        i = np.searchsorted(inicio, consulta, side='right') - 1
+        i_seguro = np.clip(i, 0, None)
+        valido = (i >= 0) & (codigos >= 0) & (chave_tab[i_seguro] == codigos) & (dias <= fim[i_seguro])
+        resultado[valido] = valor[i_seguro[valido]]
+        return resultado
@@ -0,0 +1,188 @@
+# NECESSIDADE DE INGREDIENTES - COMPRAS
+#
+# Calcula quanto de cada ingrediente os cardápios de um período exigem:
+#   Cardapio → Cardapio_Refeicao → Refeicao → Refeicao_Ingrediente → Ingrediente
+# multiplicado pelo número de refeições (pedidos realizados, inclusive os
+# arquivados em Pedido_Arquivo, ou previsão de demanda).
+#
+# CACHE POR CARDÁPIO:
+# - Necessidade_Cardapio guarda os ingredientes de UM pedido de cada cardápio
+#   (a "explosão" da composição já somada por ingrediente)
+# - Necessidade_Assinatura guarda o md5 da composição usada no cálculo; a cada
+#   atualização, só os cardápios cuja assinatura mudou são recalculados
+# - A consulta de um período é então um único JOIN agregado:
+#   demanda por cardápio × Necessidade_Cardapio
+#
+# USO:
+#   python purchasing.py atualizar
+#   python purchasing.py calcular --inicio 2024-01-15 --fim 2024-01-21 [--base previsao]
+
+import argparse
+from datetime import date
+import psycopg2
+import database
+
+# Assinatura da composição de cada cardápio (refeições, ingredientes e quantidades)
+SQL_ASSINATURAS = """
+SELECT c.id_cardapio,
+       md5(COALESCE(string_agg(
+           cr.id_refeicao || ':' || ri.id_ingrediente || ':' || ri.quantidade_por_porcao, ','
+           ORDER BY cr.id_refeicao, ri.id_ingrediente
+       ), '')) AS assinatura
+FROM Cardapio c
+LEFT JOIN Cardapio_Refeicao cr ON cr.id_cardapio = c.id_cardapio
+LEFT JOIN Refeicao_Ingrediente ri ON ri.id_refeicao = cr.id_refeicao
+GROUP BY c.id_cardapio
+"""
+
+# Refeições por cardápio no período: pedidos realizados ou previsão de demanda
+SQL_DEMANDA = {
+    'pedidos': """
+        SELECT ped.ped_cardapio AS id_cardapio, COUNT(*)::numeric AS refeicoes
+        FROM (
+            -- Pedidos encerrados antigos estão no arquivo (archive.py)
+            SELECT ped_cardapio FROM Pedido
+            WHERE data_hora >= %(inicio)s AND data_hora < %(fim)s::date + 1
+              AND status_do_pedido <> 'cancelado'
+            UNION ALL
+            SELECT ped_cardapio FROM Pedido_Arquivo
+            WHERE data_hora >= %(inicio)s AND data_hora < %(fim)s::date + 1
+              AND status_do_pedido <> 'cancelado'
+        ) ped
+        GROUP BY ped.ped_cardapio
+    """,
+    'previsao': """
+        SELECT servido.id_cardapio, SUM(pd.quantidade_prevista) AS refeicoes
+        FROM Previsao_Demanda pd
+        CROSS JOIN LATERAL (
+            -- Cardápio da unidade no dia: o próprio antes do geral (vw_cardapio_unidade)
+            SELECT card.id_cardapio
+            FROM vw_cardapio_unidade cu
+            JOIN Cardapio card ON card.id_cardapio = cu.id_cardapio
+            WHERE cu.id_unidade = pd.id_unidade
+              AND cu.tipo = pd.tipo_refeicao
+              AND card.vigencia @> pd.data
+            ORDER BY cu.propria DESC
+            LIMIT 1
+        ) servido
+        WHERE pd.data BETWEEN %(inicio)s AND %(fim)s
+        GROUP BY servido.id_cardapio
+    """,
+}
+
+def atualizar_cache(conn):
+    """
+    RECÁLCULO INCREMENTAL DO CACHE
+
+    Compara a assinatura atual da composição de cada cardápio com a usada no
+    último cálculo e recalcula, em um único INSERT ... SELECT, apenas os que mudaram.
+
+    Returns:
+        list: IDs dos cardápios recalculados
+    """
+    with conn.cursor() as cur:
+        # Serializa atualizações concorrentes (ex.: agendador e execução manual)
+        cur.execute("SELECT pg_advisory_xact_lock(hashtext('necessidade_cardapio'));")
+        cur.execute(f"""
+            CREATE TEMP TABLE _assinatura_atual ON COMMIT DROP AS
+            SELECT atual.id_cardapio, atual.assinatura
+            FROM ({SQL_ASSINATURAS}) atual
+            LEFT JOIN Necessidade_Assinatura anterior ON anterior.id_cardapio = atual.id_cardapio
+            WHERE anterior.assinatura IS DISTINCT FROM atual.assinatura;
+        """)
+        cur.execute("SELECT id_cardapio FROM _assinatura_atual ORDER BY id_cardapio;")
+        alterados = [row[0] for row in cur.fetchall()]
+        if not alterados:
+            conn.commit()
+            return []
+
+        cur.execute("DELETE FROM Necessidade_Cardapio WHERE id_cardapio = ANY(%s);", (alterados,))
+        cur.execute("""
+            INSERT INTO Necessidade_Cardapio (id_cardapio, id_ingrediente, quantidade_por_pedido)
+            SELECT cr.id_cardapio, ri.id_ingrediente, SUM(ri.quantidade_por_porcao)
+            FROM Cardapio_Refeicao cr
+            JOIN Refeicao_Ingrediente ri ON ri.id_refeicao = cr.id_refeicao
+            WHERE cr.id_cardapio = ANY(%s)
+            GROUP BY cr.id_cardapio, ri.id_ingrediente;
+        """, (alterados,))
+        cur.execute("""
+            INSERT INTO Necessidade_Assinatura (id_cardapio, assinatura)
+            SELECT id_cardapio, assinatura FROM _assinatura_atual
+            ON CONFLICT (id_cardapio) DO UPDATE
+            SET assinatura = EXCLUDED.assinatura, calculada_em = CURRENT_TIMESTAMP;
+        """)
+    conn.commit()
+    return alterados
+
+def calcular(conn, inicio, fim, base='pedidos', atualizar=True):
+    """
+    NECESSIDADE DE INGREDIENTES NO PERÍODO
+
+    Args:
+        inicio, fim: Intervalo de datas (inclusivo)
+        base: 'pedidos' (realizados) ou 'previsao' (Previsao_Demanda)
+        atualizar: Recalcula antes os cardápios cuja composição mudou
+
+    Returns:
+        list: (id_ingrediente, nome_ingrediente, unidade_de_medida, quantidade)
+    """
+    if base not in SQL_DEMANDA:
+        raise ValueError(f"Base inválida: {base} (use 'pedidos' ou 'previsao')")
+    if atualizar:
+        atualizar_cache(conn)
+    with conn.cursor() as cur:
+        cur.execute(f"""
+            WITH demanda AS ({SQL_DEMANDA[base]})
+            SELECT i.id_ingrediente, i.nome_ingrediente, i.unidade_de_medida,
+                   ROUND(SUM(n.quantidade_por_pedido * d.refeicoes), 3) AS quantidade
+            FROM demanda d
+            JOIN Necessidade_Cardapio n ON n.id_cardapio = d.id_cardapio
+            JOIN Ingrediente i ON i.id_ingrediente = n.id_ingrediente
+            GROUP BY i.id_ingrediente, i.nome_ingrediente, i.unidade_de_medida
+            ORDER BY i.nome_ingrediente;
+        """, {'inicio': inicio, 'fim': fim})
+        linhas = cur.fetchall()
+    conn.rollback()
+    return linhas
+
+def main():
+    parser = argparse.ArgumentParser(description="Necessidade de ingredientes dos cardápios")
+    sub = parser.add_subparsers(dest='comando', required=True)
+
+    sub.add_parser('atualizar', help="Recalcula o cache dos cardápios cuja composição mudou")
+
+    p_calc = sub.add_parser('calcular', help="Total de ingredientes para um período")
+    p_calc.add_argument('--inicio', type=date.fromisoformat, required=True, help="AAAA-MM-DD")
+    p_calc.add_argument('--fim', type=date.fromisoformat, required=True, help="AAAA-MM-DD")
+    p_calc.add_argument('--base', choices=sorted(SQL_DEMANDA), default='pedidos',
+                        help="Multiplicar por pedidos realizados ou pela previsão de demanda")
+
+    args = parser.parse_args()
+
+    try:
+        conn = database.open_connection()
+    except psycopg2.Error as e:
+        print(f"[ERRO] Erro ao conectar ao PostgreSQL: {e}")
+        return 1
+
+    try:
+        database.aplicar_migracoes(conn)
+        if args.comando == 'atualizar':
+            alterados = atualizar_cache(conn)
+            print(f"[SUCESSO] {len(alterados)} cardápios recalculados.")
+        else:
+            linhas = calcular(conn, args.inicio, args.fim, args.base)
+            print(f"\n{'Ingrediente':<25} {'Quantidade':>14} {'Unidade':<10}")
+            print('-' * 52)
+            for _, nome, unidade, quantidade in linhas:
+                print(f"{nome:<25} {quantidade:>14} {unidade:<10}")
+    except psycopg2.Error as e:
+        print(f"[ERRO] {e}")
+        conn.rollback()
+        return 1
+    finally:
+        conn.close()
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,281 @@
+# REPRODUÇÃO DE CARGA GRAVADA - database.py
+#
+# Reexecuta contra um PostgreSQL local a sequência de chamadas gravada em
+# produção (DB_GRAVACAO no .env, ver metrics.Gravador) e compara a distribuição
+# de latência por função com a gravação original ou com outra reprodução.
+#
+# REPRODUÇÃO:
+# - Os eventos saem no ritmo gravado (ts), dividido por --velocidade
+#   (2 = duas vezes mais rápido; 0 = sem espera, vazão máxima)
+# - Pausas maiores que --pausa-maxima (ex.: entre duas execuções) são encurtadas
+# - --concorrencia conexões executam os eventos liberados; o "atraso" do
+#   relatório mostra quanto os eventos esperaram por uma conexão livre
+#
+# As escritas gravadas (add_pedido, add_pagamento...) são executadas de verdade:
+# rode contra uma cópia restaurada/anonimizada do banco, nunca contra produção,
+# ou use --somente-leitura. Erros (ex.: ID inexistente na cópia) são contados
+# por função, sem interromper a reprodução.
+#
+# USO:
+#   python replay.py resumo gravacao.jsonl
+#   python replay.py reproduzir gravacao.jsonl [--velocidade 2] [--concorrencia 8] [--saida nova.jsonl]
+#   python replay.py comparar base.jsonl nova.jsonl
+
+import argparse
+import contextlib
+import json
+import os
+import queue
+import threading
+import time
+from collections import defaultdict
+import psycopg2
+import database
+import metrics
+
+PREFIXOS_LEITURA = ('get_', 'search')
+
+# ==================== ARQUIVOS ====================
+
+def carregar_eventos(arquivo, funcoes=None):
+    """Eventos do JSONL ordenados por início (linhas inválidas são ignoradas com aviso)"""
+    eventos = []
+    invalidas = 0
+    with open(arquivo, encoding='utf-8') as entrada:
+        for linha in entrada:
+            if not linha.strip():
+                continue
+            try:
+                evento = json.loads(linha)
+                evento['ts'], evento['funcao']
+            except (ValueError, KeyError, TypeError):
+                invalidas += 1
+                continue
+            if funcoes is None or evento['funcao'] in funcoes:
+                eventos.append(evento)
+    if invalidas:
+        print(f"[AVISO] {invalidas} linhas inválidas ignoradas em {arquivo}")
+    eventos.sort(key=lambda e: e['ts'])
+    return eventos
+
+def _agendar(eventos, velocidade, pausa_maxima):
+    """Instante relativo (s) de cada evento na reprodução"""
+    agenda = []
+    relogio = 0.0
+    anterior = eventos[0]['ts'] if eventos else 0.0
+    for evento in eventos:
+        relogio += min(max(evento['ts'] - anterior, 0.0), pausa_maxima)
+        anterior = evento['ts']
+        agenda.append(relogio / velocidade if velocidade > 0 else 0.0)
+    return agenda
+
+# ==================== REPRODUÇÃO ====================
+
+def _trabalhador(fila, resultados, lock):
+    try:
+        conn = database.open_connection()
+    except psycopg2.Error as e:
+        print(f"[ERRO] Erro ao conectar ao PostgreSQL: {e}")
+        # Consome a fila mesmo sem conexão para o despachante não travar
+        while fila.get() is not None:
+            pass
+        return
+    try:
+        while True:
+            item = fila.get()
+            if item is None:
+                break
+            evento, previsto = item
+            inicio = time.perf_counter()
+            erro = None
+            try:
+                funcao = getattr(database, evento['funcao'])
+                funcao(conn, **metrics.decodificar_valor(evento.get('args') or {}))
+            except (psycopg2.Error, database.ConflitoVersao, KeyError, TypeError, ValueError, AttributeError) as e:
+                erro = type(e).__name__
+                if not conn.closed:
+                    conn.rollback()
+            fim = time.perf_counter()
+            with lock:
+                resultados.append({
+                    'ts': evento['ts'],
+                    'funcao': evento['funcao'],
+                    'dur': round(fim - inicio, 6),
+                    'erro': erro,
+                    'atraso': round(max(inicio - previsto, 0.0), 6),
+                })
+    finally:
+        conn.close()
+
+def reproduzir(eventos, velocidade=1.0, concorrencia=4, pausa_maxima=5.0):
+    """
+    Reexecuta os eventos com 'concorrencia' conexões próprias
+
+    Returns:
+        list: Um resultado por evento executado (funcao, dur, erro, atraso)
+    """
+    fila = queue.Queue(maxsize=concorrencia * 4)
+    resultados = []
+    lock = threading.Lock()
+    trabalhadores = [
+        threading.Thread(target=_trabalhador, args=(fila, resultados, lock), name=f'replay-{i}', daemon=True)
+        for i in range(concorrencia)
+    ]
+    for t in trabalhadores:
+        t.start()
+
+    inicio = time.perf_counter()
+    try:
+        for evento, instante in zip(eventos, _agendar(eventos, velocidade, pausa_maxima)):
+            previsto = inicio + instante
+            espera = previsto - time.perf_counter()
+            if espera > 0:
+                time.sleep(espera)
+            fila.put((evento, previsto))
+    except KeyboardInterrupt:
+        print("\n[AVISO] Reprodução interrompida: aguardando os eventos já liberados...", flush=True)
+    finally:
+        for _ in trabalhadores:
+            fila.put(None)
+        for t in trabalhadores:
+            t.join()
+    return resultados
+
+# ==================== RELATÓRIO ====================
+
+def _percentil(valores, p):
+    if not valores:
+        return 0.0
+    i = min(len(valores) - 1, int(round(p / 100 * (len(valores) - 1))))
+    return valores[i]
+
+def _por_funcao(eventos):
+    grupos = defaultdict(lambda: {'dur': [], 'erros': 0})
+    for evento in eventos:
+        grupo = grupos[evento['funcao']]
+        grupo['dur'].append(float(evento.get('dur') or 0.0))
+        grupo['erros'] += 1 if evento.get('erro') else 0
+    for grupo in grupos.values():
+        grupo['dur'].sort()
+    return grupos
+
+def _variacao(antes, depois):
+    if antes <= 0:
+        return '      -'
+    return f"{(depois - antes) / antes * 100:>+6.0f}%"
+
+def relatorio_resumo(eventos):
+    grupos = _por_funcao(eventos)
+    duracao = (eventos[-1]['ts'] - eventos[0]['ts']) if len(eventos) > 1 else 0.0
+    print(f"\n{len(eventos)} chamadas em {duracao:.0f}s de gravação "
+          f"({len({e.get('sessao') for e in eventos})} sessões)\n")
+    print(f"{'Função':<30} {'Chamadas':>9} {'Erros':>6} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    print('-' * 77)
+    for nome, grupo in sorted(grupos.items(), key=lambda item: -len(item[1]['dur'])):
+        d = grupo['dur']
+        print(f"{nome:<30} {len(d):>9} {grupo['erros']:>6} {_percentil(d, 50) * 1000:>9.1f} "
+              f"{_percentil(d, 95) * 1000:>9.1f} {_percentil(d, 99) * 1000:>9.1f}")
+
+def relatorio_comparacao(base, nova, rotulos=('base', 'nova')):
+    """Percentis por função nas duas execuções e a variação relativa"""
+    grupos_base, grupos_nova = _por_funcao(base), _por_funcao(nova)
+    print(f"\nColunas: {rotulos[0]} → {rotulos[1]}")
+    print(f"{'Função':<30} {'Chamadas':>9} {'Erros':>11} "
+          f"{'p50 ms':>17} {'p95 ms':>17} {'p99 ms':>17} {'Δp95':>7}")
+    print('-' * 115)
+    nomes = sorted(set(grupos_base) | set(grupos_nova),
+                   key=lambda n: -len(grupos_nova.get(n, grupos_base.get(n))['dur']))
+    vazio = {'dur': [], 'erros': 0}
+    for nome in nomes:
+        b, n = grupos_base.get(nome, vazio), grupos_nova.get(nome, vazio)
+        colunas = []
+        for p in (50, 95, 99):
+            colunas.append(f"{_percentil(b['dur'], p) * 1000:>8.1f}→{_percentil(n['dur'], p) * 1000:<8.1f}")
+        print(f"{nome:<30} {len(n['dur']):>9} {b['erros']:>5}→{n['erros']:<5} {' '.join(colunas)} "
+              f"{_variacao(_percentil(b['dur'], 95), _percentil(n['dur'], 95))}")
+
+def _salvar(resultados, arquivo):
+    with open(arquivo, 'w', encoding='utf-8') as saida:
+        for resultado in sorted(resultados, key=lambda r: r['ts']):
+            saida.write(json.dumps(resultado) + '\n')
+
+# ==================== CLI ====================
+
+def main():
+    parser = argparse.ArgumentParser(description="Reprodução de carga gravada de database.py")
+    sub = parser.add_subparsers(dest='comando', required=True)
+
+    resumo = sub.add_parser('resumo', help="Distribuição de chamadas e latências de uma gravação")
+    resumo.add_argument('arquivo')
+
+    repro = sub.add_parser('reproduzir', help="Reexecuta a gravação e compara as latências")
+    repro.add_argument('arquivo')
+    repro.add_argument('--velocidade', type=float, default=1.0,
+                       help="Multiplicador do ritmo gravado (0 = sem espera)")
+    repro.add_argument('--concorrencia', type=int, default=4, help="Conexões simultâneas")
+    repro.add_argument('--pausa-maxima', type=float, default=5.0,
+                       help="Pausa máxima entre eventos, em segundos de gravação")
+    repro.add_argument('--funcao', action='append', dest='funcoes',
+                       help="Reproduz só esta função (repetível)")
+    repro.add_argument('--somente-leitura', action='store_true',
+                       help="Ignora as funções que escrevem no banco")
+    repro.add_argument('--saida', help="Grava as latências reproduzidas em JSONL (para 'comparar')")
+
+    comparar = sub.add_parser('comparar', help="Compara as latências de duas gravações/reproduções")
+    comparar.add_argument('base')
+    comparar.add_argument('nova')
+
+    args = parser.parse_args()
+
+    try:
+        if args.comando == 'resumo':
+            eventos = carregar_eventos(args.arquivo)
+            if not eventos:
+                print("[AVISO] Nenhuma chamada gravada.")
+                return 1
+            relatorio_resumo(eventos)
+            return 0
+
+        if args.comando == 'comparar':
+            base, nova = carregar_eventos(args.base), carregar_eventos(args.nova)
+            relatorio_comparacao(base, nova, (os.path.basename(args.base), os.path.basename(args.nova)))
+            return 0
+
+        eventos = carregar_eventos(args.arquivo, set(args.funcoes) if args.funcoes else None)
+    except OSError as e:
+        print(f"[ERRO] Não foi possível ler a gravação: {e}")
+        return 1
+
+    desconhecidas = {e['funcao'] for e in eventos if not callable(getattr(database, e['funcao'], None))}
+    if desconhecidas:
+        print(f"[AVISO] Funções ausentes em database.py ignoradas: {', '.join(sorted(desconhecidas))}")
+    eventos = [e for e in eventos if e['funcao'] not in desconhecidas
+               and (not args.somente_leitura or e['funcao'].startswith(PREFIXOS_LEITURA))]
+    if not eventos:
+        print("[AVISO] Nenhuma chamada para reproduzir.")
+        return 1
+
+    print(f"[INFO] Reproduzindo {len(eventos)} chamadas a {args.velocidade:g}x "
+          f"com {args.concorrencia} conexões...", flush=True)
+    inicio = time.perf_counter()
+    # As funções de database.py imprimem seus próprios erros: silenciados durante a reprodução
+    with open(os.devnull, 'w') as nulo, contextlib.redirect_stdout(nulo):
+        resultados = reproduzir(eventos, args.velocidade, max(1, args.concorrencia), args.pausa_maxima)
+    duracao = time.perf_counter() - inicio
+    if not resultados:
+        print("[ERRO] Nenhuma chamada foi executada (verifique a conexão no .env).")
+        return 1
+
+    atrasos = sorted(r['atraso'] for r in resultados)
+    print(f"[INFO] {len(resultados)} chamadas em {duracao:.1f}s "
+          f"({len(resultados) / duracao:.1f}/s); atraso p95 {_percentil(atrasos, 95) * 1000:.1f} ms")
+    if _percentil(atrasos, 95) > 0.05:
+        print("[AVISO] Eventos esperaram por conexão livre: aumente --concorrencia para preservar o ritmo gravado.")
+    relatorio_comparacao(eventos, resultados, ('gravada', 'reproduzida'))
+    if args.saida:
+        _salvar(resultados, args.saida)
+        print(f"\n[SUCESSO] Latências reproduzidas gravadas em {args.saida}")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,314 @@
+# FECHAMENTO MENSAL POR UNIDADE - RELATÓRIOS EM PARALELO
+#
+# Gera, para cada unidade e cada mês do período, receita, refeições servidas,
+# custo de subsídio (por categoria de pagamento) e avaliações. Cada partição
+# (unidade, mês) é uma tarefa independente executada em um pool de processos;
+# cada processo abre a sua própria conexão (database.open_connection) e a
+# reutiliza nas tarefas seguintes.
+#
+# RETOMADA: cada partição concluída é gravada em <saida>/parciais/ assim que
+# termina. Ao rodar de novo com a mesma --saida, as partições já gravadas são
+# reaproveitadas e só as que faltam (ou falharam) vão ao banco. --refazer
+# descarta as parciais do período.
+#
+# SAÍDA (consolidada ao final, mesmo com partições reaproveitadas):
+#   <saida>/fechamento.json   partições + totais por unidade
+#   <saida>/fechamento.csv    uma linha por unidade × mês × categoria
+#
+# USO:
+#   python reports.py gerar --inicio 2024-01 --fim 2024-06 [--processos 4] [--unidade 1 ...]
+#   python reports.py gerar --inicio 2024-01 --fim 2024-06 --refazer
+#   python reports.py mostrar --saida fechamento_2024-01_2024-06
+
+import argparse
+import csv
+import json
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import date, datetime
+from decimal import Decimal
+import psycopg2
+import database
+import feedback
+
+PROCESSOS_PADRAO = 4
+CAMPOS_VALOR = ('receita', 'subsidio')
+CAMPOS_CONTAGEM = ('pedidos', 'servidas', 'canceladas')
+
+# ==================== PERÍODO ====================
+
+def _mes(texto):
+    """'AAAA-MM' → date do primeiro dia (tipo do argparse)"""
+    try:
+        return datetime.strptime(texto, '%Y-%m').date()
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"mês inválido: {texto!r} (use AAAA-MM)")
+
+def _proximo_mes(mes):
+    return date(mes.year + mes.month // 12, mes.month % 12 + 1, 1)
+
+def meses(inicio, fim):
+    """Primeiros dias dos meses de 'inicio' a 'fim' (inclusivo)"""
+    lista = []
+    mes = inicio.replace(day=1)
+    while mes <= fim:
+        lista.append(mes)
+        mes = _proximo_mes(mes)
+    return lista
+
+# ==================== TRABALHADORES (PROCESSOS) ====================
+
+_conn = None
+
+def _iniciar_processo():
+    """Initializer do pool: uma conexão por processo, reutilizada entre tarefas"""
+    global _conn
+    _conn = database.open_connection()
+
+def gerar_particao(id_unidade, nome_unidade, mes):
+    """
+    RELATÓRIO DE UMA UNIDADE EM UM MÊS
+
+    Executado nos processos do pool (usa a conexão do processo). Valores
+    monetários saem como texto para a gravação em JSON não perder centavos.
+
+    Returns:
+        dict: Partição pronta para gravar (unidade, mes, categorias, totais, avaliacoes)
+    """
+    fim = _proximo_mes(mes)
+    try:
+        linhas = database.get_fechamento_unidade(_conn, id_unidade, mes, fim)
+        avaliacoes = database.get_avaliacoes_periodo(_conn, id_unidade, mes, fim)
+        _conn.rollback()
+    except psycopg2.Error as e:
+        if not _conn.closed:
+            _conn.rollback()
+        # Exceções do psycopg2 nem sempre voltam intactas ao processo principal
+        raise RuntimeError(str(e).strip()) from None
+
+    categorias = []
+    for categoria, pedidos, servidas, canceladas, receita, subsidio in linhas:
+        categorias.append({
+            'categoria': categoria or 'sem_pagamento',
+            'pedidos': pedidos, 'servidas': servidas, 'canceladas': canceladas,
+            'receita': str(receita), 'subsidio': str(subsidio),
+        })
+    total, media, *notas = avaliacoes
+    return {
+        'id_unidade': id_unidade,
+        'unidade': nome_unidade,
+        'mes': f"{mes:%Y-%m}",
+        'categorias': categorias,
+        'totais': _somar(categorias),
+        'avaliacoes': {'total': total, 'media': str(media) if media is not None else None, 'notas': notas},
+        'gerado_em': datetime.now().isoformat(timespec='seconds'),
+    }
+
+# ==================== CONSOLIDAÇÃO ====================
+
+def _somar(linhas):
+    totais = {campo: 0 for campo in CAMPOS_CONTAGEM}
+    totais.update({campo: Decimal('0') for campo in CAMPOS_VALOR})
+    for linha in linhas:
+        for campo in CAMPOS_CONTAGEM:
+            totais[campo] += linha[campo]
+        for campo in CAMPOS_VALOR:
+            totais[campo] += Decimal(linha[campo])
+    return {campo: str(valor) if campo in CAMPOS_VALOR else valor for campo, valor in totais.items()}
+
+def _somar_avaliacoes(lista):
+    total = sum(a['total'] for a in lista)
+    notas = [sum(a['notas'][i] for a in lista) for i in range(5)]
+    soma = sum((i + 1) * n for i, n in enumerate(notas))
+    media = str((Decimal(soma) / total).quantize(Decimal('0.01'))) if total else None
+    return {'total': total, 'media': media, 'notas': notas}
+
+def consolidar(particoes):
+    """Partições ordenadas e totais por unidade no período"""
+    particoes = sorted(particoes, key=lambda p: (p['id_unidade'], p['mes']))
+    unidades = {}
+    for p in particoes:
+        unidades.setdefault(p['id_unidade'], {'unidade': p['unidade'], 'particoes': []})['particoes'].append(p)
+    totais = []
+    for id_unidade, grupo in unidades.items():
+        totais.append({
+            'id_unidade': id_unidade,
+            'unidade': grupo['unidade'],
+            'meses': len(grupo['particoes']),
+            **_somar([p['totais'] for p in grupo['particoes']]),
+            'avaliacoes': _somar_avaliacoes([p['avaliacoes'] for p in grupo['particoes']]),
+        })
+    return {'particoes': particoes, 'totais_por_unidade': totais}
+
+def _gravar_json(caminho, dados):
+    """Grava atomicamente (arquivo temporário + os.replace): parcial nunca fica pela metade"""
+    temporario = caminho + '.tmp'
+    with open(temporario, 'w', encoding='utf-8') as saida:
+        json.dump(dados, saida, ensure_ascii=False, indent=2)
+    os.replace(temporario, caminho)
+
+def gravar_consolidado(saida, consolidado):
+    _gravar_json(os.path.join(saida, 'fechamento.json'), consolidado)
+    with open(os.path.join(saida, 'fechamento.csv'), 'w', encoding='utf-8', newline='') as arquivo:
+        escritor = csv.writer(arquivo)
+        escritor.writerow(['id_unidade', 'unidade', 'mes', 'categoria', *CAMPOS_CONTAGEM, *CAMPOS_VALOR,
+                           'avaliacoes', 'media_avaliacoes'])
+        for p in consolidado['particoes']:
+            aval = p['avaliacoes']
+            for c in p['categorias']:
+                escritor.writerow([p['id_unidade'], p['unidade'], p['mes'], c['categoria'],
+                                   *(c[k] for k in CAMPOS_CONTAGEM), *(c[k] for k in CAMPOS_VALOR),
+                                   aval['total'], aval['media'] or ''])
+
+# ==================== EXECUÇÃO ====================
+
+def _caminho_parcial(pasta, id_unidade, mes):
+    return os.path.join(pasta, f"{mes:%Y-%m}_unidade{id_unidade}.json")
+
+def _ler_parcial(caminho):
+    try:
+        with open(caminho, encoding='utf-8') as entrada:
+            return json.load(entrada)
+    except (OSError, ValueError):
+        return None
+
+def gerar(unidades, lista_meses, saida, processos=PROCESSOS_PADRAO, refazer=False):
+    """
+    GERA AS PARTIÇÕES QUE FALTAM E CONSOLIDA
+
+    Args:
+        unidades: [(id_unidade, nome_unidade)]
+        lista_meses: Primeiros dias dos meses
+        saida: Pasta da execução (parciais e consolidado)
+
+    Returns:
+        tuple: (consolidado, reaproveitadas, geradas, falhas)
+    """
+    pasta = os.path.join(saida, 'parciais')
+    os.makedirs(pasta, exist_ok=True)
+
+    particoes, pendentes = [], []
+    for id_unidade, nome in unidades:
+        for mes in lista_meses:
+            caminho = _caminho_parcial(pasta, id_unidade, mes)
+            if refazer and os.path.exists(caminho):
+                os.remove(caminho)
+            parcial = _ler_parcial(caminho)
+            if parcial is not None:
+                particoes.append(parcial)
+            else:
+                pendentes.append((id_unidade, nome, mes))
+    reaproveitadas = len(particoes)
+
+    falhas = []
+    if pendentes:
+        print(f"[INFO] {len(pendentes)} partições a gerar com {processos} processos "
+              f"({reaproveitadas} já concluídas)...", flush=True)
+        with ProcessPoolExecutor(max_workers=processos, initializer=_iniciar_processo) as pool:
+            tarefas = {pool.submit(gerar_particao, *tarefa): tarefa for tarefa in pendentes}
+            try:
+                for feita in as_completed(tarefas):
+                    id_unidade, nome, mes = tarefas[feita]
+                    try:
+                        parcial = feita.result()
+                    except Exception as e:
+                        falhas.append((id_unidade, mes))
+                        print(f"[ERRO] {nome} {mes:%Y-%m}: {e}")
+                        continue
+                    _gravar_json(_caminho_parcial(pasta, id_unidade, mes), parcial)
+                    particoes.append(parcial)
+                    print(f"[INFO] {nome} {mes:%Y-%m} concluída "
+                          f"({len(particoes) - reaproveitadas}/{len(pendentes)})", flush=True)
+            except KeyboardInterrupt:
+                for tarefa in tarefas:
+                    tarefa.cancel()
+                print("\n[AVISO] Interrompido: as partições concluídas ficam para a próxima execução.")
+                raise
+
+    consolidado = consolidar(particoes)
+    gravar_consolidado(saida, consolidado)
+    return consolidado, reaproveitadas, len(particoes) - reaproveitadas, falhas
+
+def mostrar(consolidado):
+    print(f"\n{'Unidade':<22} {'Meses':>5} {'Pedidos':>8} {'Servidas':>9} {'Receita (R$)':>13} "
+          f"{'Subsídio (R$)':>14} {'Avaliações':>10} {'Média':>6}")
+    print('-' * 94)
+    for t in consolidado['totais_por_unidade']:
+        aval = t['avaliacoes']
+        print(f"{t['unidade'][:22]:<22} {t['meses']:>5} {t['pedidos']:>8} {t['servidas']:>9} "
+              f"{Decimal(t['receita']):>13,.2f} {Decimal(t['subsidio']):>14,.2f} "
+              f"{aval['total']:>10} {aval['media'] or '-':>6}")
+
+# ==================== CLI ====================
+
+def main():
+    parser = argparse.ArgumentParser(description="Fechamento mensal por unidade (relatórios em paralelo)")
+    sub = parser.add_subparsers(dest='comando', required=True)
+
+    p_gerar = sub.add_parser('gerar', help="Gera as partições (unidade × mês) e consolida")
+    p_gerar.add_argument('--inicio', type=_mes, required=True, help="Primeiro mês (AAAA-MM)")
+    p_gerar.add_argument('--fim', type=_mes, help="Último mês (AAAA-MM; padrão: --inicio)")
+    p_gerar.add_argument('--unidade', type=int, action='append', dest='unidades',
+                         help="Só esta unidade (repetível)")
+    p_gerar.add_argument('--processos', type=int, default=PROCESSOS_PADRAO)
+    p_gerar.add_argument('--saida', help="Pasta da execução (padrão: fechamento_<inicio>_<fim>)")
+    p_gerar.add_argument('--refazer', action='store_true', help="Descarta as partições já gravadas")
+
+    p_mostrar = sub.add_parser('mostrar', help="Totais por unidade de um fechamento consolidado")
+    p_mostrar.add_argument('--saida', required=True)
+
+    args = parser.parse_args()
+
+    if args.comando == 'mostrar':
+        consolidado = _ler_parcial(os.path.join(args.saida, 'fechamento.json'))
+        if consolidado is None:
+            print(f"[ERRO] Nenhum fechamento consolidado em {args.saida}")
+            return 1
+        mostrar(consolidado)
+        return 0
+
+    fim = args.fim or args.inicio
+    if fim < args.inicio:
+        print("[ERRO] --fim anterior a --inicio.")
+        return 1
+    saida = args.saida or f"fechamento_{args.inicio:%Y-%m}_{fim:%Y-%m}"
+
+    try:
+        conn = database.open_connection()
+    except psycopg2.Error as e:
+        print(f"[ERRO] Erro ao conectar ao PostgreSQL: {e}")
+        return 1
+    try:
+        unidades = [(u[0], u[1]) for u in database.get_unidades(conn)
+                    if not args.unidades or u[0] in args.unidades]
+        # Avaliações novas entram em Feedback_Semanal antes da leitura pelos processos
+        feedback.atualizar(conn)
+    except psycopg2.Error as e:
+        print(f"[ERRO] {e}")
+        return 1
+    finally:
+        conn.close()
+    if not unidades:
+        print("[AVISO] Nenhuma unidade encontrada.")
+        return 1
+
+    try:
+        consolidado, reaproveitadas, geradas, falhas = gerar(
+            unidades, meses(args.inicio, fim), saida, max(1, args.processos), args.refazer)
+    except KeyboardInterrupt:
+        return 130
+    except OSError as e:
+        print(f"[ERRO] Não foi possível gravar em {saida}: {e}")
+        return 1
+
+    mostrar(consolidado)
+    print(f"\n[INFO] {geradas} partições geradas, {reaproveitadas} reaproveitadas.")
+    if falhas:
+        print(f"[AVISO] {len(falhas)} partições falharam e ficaram fora do consolidado: "
+              f"rode o mesmo comando de novo para completá-las.")
+        return 1
+    print(f"[SUCESSO] Fechamento consolidado em {saida}")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
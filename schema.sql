@@ -141,6 +141,541 @@ CREATE TABLE Refeicao_Ingrediente (
     FOREIGN KEY (id_ingrediente) REFERENCES Ingrediente(id_ingrediente) ON DELETE CASCADE
 );
 
+-- ============================================
+-- MIGRAÇÃO 001: CONTROLE DE MIGRAÇÕES
+-- ============================================
+-- As seções numeradas deste script (de "MIGRAÇÃO NNN" até "FIM DA MIGRAÇÃO
+-- NNN") vieram depois da criação original. Cada uma pode ser executada de novo
+-- sem erro e se registra em Migracao_Aplicada. Em bancos criados com uma versão
+-- anterior deste script, database.aplicar_migracoes (chamada ao iniciar o
+-- sistema) executa as que faltam, em ordem.
+
+CREATE TABLE IF NOT EXISTS Migracao_Aplicada (
+    numero INTEGER PRIMARY KEY,
+    descricao VARCHAR(100) NOT NULL,
+    aplicada_em TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO Migracao_Aplicada (numero, descricao) VALUES (1, 'Controle de migrações')
+ON CONFLICT (numero) DO NOTHING;
+-- FIM DA MIGRAÇÃO 001
+
+-- ============================================
+-- MIGRAÇÃO 002: TABELA DE PREÇOS (pricing.py)
+-- ============================================
+-- Preço por categoria, tipo de refeição e vigência. A carga inicial traz os
+-- valores da Resolução 27/2018 CAD/UnB se a tabela estiver vazia. Vigências de
+-- uma mesma categoria e refeição não podem se sobrepor (restrição de exclusão):
+-- para reajustar, feche a faixa atual (data_fim) antes de inserir a nova.
+
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
+CREATE TABLE IF NOT EXISTS Tabela_Preco (
+    id_preco SERIAL PRIMARY KEY,
+    nome_categoria VARCHAR(50) NOT NULL,
+    tipo_refeicao VARCHAR(20) NOT NULL CHECK (tipo_refeicao IN ('cafe', 'almoco', 'jantar')),
+    data_inicio DATE NOT NULL,
+    data_fim DATE, -- NULL = vigente por tempo indeterminado
+    valor DECIMAL(8,2) NOT NULL CHECK (valor >= 0),
+    CHECK (data_fim IS NULL OR data_fim >= data_inicio)
+);
+
+CREATE INDEX IF NOT EXISTS idx_tabela_preco_chave ON Tabela_Preco (nome_categoria, tipo_refeicao, data_inicio);
+
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_constraint
+        WHERE conname = 'tabela_preco_sem_sobreposicao' AND conrelid = 'tabela_preco'::regclass
+    ) THEN
+        ALTER TABLE Tabela_Preco ADD CONSTRAINT tabela_preco_sem_sobreposicao
+            EXCLUDE USING gist (
+                nome_categoria WITH =,
+                tipo_refeicao WITH =,
+                daterange(data_inicio, data_fim, '[]') WITH &&
+            );
+    END IF;
+END;
+$$;
+
+INSERT INTO Tabela_Preco (nome_categoria, tipo_refeicao, data_inicio, data_fim, valor)
+SELECT v.nome_categoria, v.tipo_refeicao, DATE '2024-01-01', NULL, v.valor
+FROM (VALUES
+    ('estudante_assistencia', 'cafe', 0.00),
+    ('estudante_assistencia', 'almoco', 0.00),
+    ('estudante_assistencia', 'jantar', 0.00),
+    ('estudante_regular', 'cafe', 2.35),
+    ('estudante_regular', 'almoco', 6.10),
+    ('estudante_regular', 'jantar', 6.10),
+    ('servidor', 'cafe', 5.85),
+    ('servidor', 'almoco', 15.20),
+    ('servidor', 'jantar', 15.20)
+) AS v(nome_categoria, tipo_refeicao, valor)
+WHERE NOT EXISTS (SELECT 1 FROM Tabela_Preco);
+
+COMMENT ON TABLE Tabela_Preco IS 'Preço da refeição por categoria, tipo e período de vigência (Resolução 27/2018 CAD/UnB)';
+
+INSERT INTO Migracao_Aplicada (numero, descricao) VALUES (2, 'Tabela de preços')
+ON CONFLICT (numero) DO NOTHING;
+-- FIM DA MIGRAÇÃO 002
+
+-- ============================================
+-- MIGRAÇÃO 003: QUANTIDADE POR PORÇÃO (purchasing.py)
+-- ============================================
+
+-- Na unidade_de_medida do ingrediente
+ALTER TABLE Refeicao_Ingrediente
+    ADD COLUMN IF NOT EXISTS quantidade_por_porcao NUMERIC(10,4) NOT NULL DEFAULT 0 CHECK (quantidade_por_porcao >= 0);
+
+INSERT INTO Migracao_Aplicada (numero, descricao) VALUES (3, 'Quantidade por porção')
+ON CONFLICT (numero) DO NOTHING;
+-- FIM DA MIGRAÇÃO 003
+
+-- ============================================
+-- MIGRAÇÃO 004: TABELAS DE ARQUIVO (archive.py)
+-- ============================================
+
+-- Pedidos encerrados e seus pagamentos movidos das tabelas ativas
+CREATE TABLE IF NOT EXISTS Pedido_Arquivo (
+    id_pedido INTEGER PRIMARY KEY,
+    data_hora TIMESTAMP,
+    status_do_pedido VARCHAR(20),
+    pedido_usuario INTEGER NOT NULL,
+    ped_cardapio INTEGER NOT NULL,
+    arquivado_em TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE TABLE IF NOT EXISTS Pagamento_Arquivo (
+    id_pagamento INTEGER PRIMARY KEY,
+    data_pagamento TIMESTAMP,
+    valor_pago DECIMAL(8,2) NOT NULL,
+    comprovante BYTEA,
+    forma_de_pagamento VARCHAR(30) NOT NULL,
+    pag_pedido INTEGER NOT NULL,
+    pag_categoria_usuario INTEGER NOT NULL,
+    pag_categoria_nome VARCHAR(50) NOT NULL,
+    arquivado_em TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_pedido_arquivo_data ON Pedido_Arquivo (data_hora);
+CREATE INDEX IF NOT EXISTS idx_pagamento_arquivo_pedido ON Pagamento_Arquivo (pag_pedido);
+
+COMMENT ON TABLE Pedido_Arquivo IS 'Pedidos encerrados arquivados (restauráveis com archive.py)';
+COMMENT ON TABLE Pagamento_Arquivo IS 'Pagamentos dos pedidos arquivados';
+
+INSERT INTO Migracao_Aplicada (numero, descricao) VALUES (4, 'Tabelas de arquivo')
+ON CONFLICT (numero) DO NOTHING;
+-- FIM DA MIGRAÇÃO 004
+
+-- ============================================
+-- MIGRAÇÃO 005: OPERAÇÕES APLICADAS (writebehind.py)
+-- ============================================
+
+-- Chaves de idempotência das operações enviadas pela fila local (modo offline):
+-- reenviar uma operação já aplicada não cria um segundo pedido/pagamento
+CREATE TABLE IF NOT EXISTS Operacao_Aplicada (
+    chave UUID PRIMARY KEY,
+    tipo VARCHAR(20) NOT NULL,
+    id_resultado INTEGER,
+    aplicada_em TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO Migracao_Aplicada (numero, descricao) VALUES (5, 'Operações aplicadas')
+ON CONFLICT (numero) DO NOTHING;
+-- FIM DA MIGRAÇÃO 005
+
+-- ============================================
+-- MIGRAÇÃO 006: PREVISÃO DE DEMANDA (forecast.py)
+-- ============================================
+
+-- Refeições previstas por unidade, data e tipo (regerada periodicamente)
+CREATE TABLE IF NOT EXISTS Previsao_Demanda (
+    id_unidade INTEGER NOT NULL REFERENCES Unidade(id_unidade) ON DELETE CASCADE,
+    data DATE NOT NULL,
+    tipo_refeicao VARCHAR(20) NOT NULL CHECK (tipo_refeicao IN ('cafe', 'almoco', 'jantar')),
+    quantidade_prevista NUMERIC(8,1) NOT NULL,
+    limite_superior INTEGER NOT NULL, -- 90% dos dias devem ficar abaixo deste valor
+    gerada_em TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+    PRIMARY KEY (id_unidade, data, tipo_refeicao)
+);
+
+INSERT INTO Migracao_Aplicada (numero, descricao) VALUES (6, 'Previsão de demanda')
+ON CONFLICT (numero) DO NOTHING;
+-- FIM DA MIGRAÇÃO 006
+
+-- ============================================
+-- MIGRAÇÃO 007: NECESSIDADE DE INGREDIENTES (purchasing.py)
+-- ============================================
+
+-- Ingredientes por pedido de cada cardápio (Cardapio → Refeicao → Ingrediente já multiplicado)
+CREATE TABLE IF NOT EXISTS Necessidade_Cardapio (
+    id_cardapio INTEGER NOT NULL REFERENCES Cardapio(id_cardapio) ON DELETE CASCADE,
+    id_ingrediente INTEGER NOT NULL REFERENCES Ingrediente(id_ingrediente) ON DELETE CASCADE,
+    quantidade_por_pedido NUMERIC(12,4) NOT NULL,
+    PRIMARY KEY (id_cardapio, id_ingrediente)
+);
+
+-- Assinatura (md5) da composição usada no cálculo: só cardápios alterados são recalculados
+CREATE TABLE IF NOT EXISTS Necessidade_Assinatura (
+    id_cardapio INTEGER PRIMARY KEY REFERENCES Cardapio(id_cardapio) ON DELETE CASCADE,
+    assinatura CHAR(32) NOT NULL,
+    calculada_em TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+INSERT INTO Migracao_Aplicada (numero, descricao) VALUES (7, 'Necessidade de ingredientes')
+ON CONFLICT (numero) DO NOTHING;
+-- FIM DA MIGRAÇÃO 007
+
+-- ============================================
+-- MIGRAÇÃO 008: AGREGADO DE AVALIAÇÕES (feedback.py)
+-- ============================================
+
+-- Contagens de Feedback por unidade, cardápio e semana (0 = não atribuída)
+CREATE TABLE IF NOT EXISTS Feedback_Semanal (
+    id_unidade INTEGER NOT NULL,
+    id_cardapio INTEGER NOT NULL,
+    semana DATE NOT NULL, -- segunda-feira da semana
+    total INTEGER NOT NULL DEFAULT 0,
+    soma_notas INTEGER NOT NULL DEFAULT 0,
+    nota_1 INTEGER NOT NULL DEFAULT 0,
+    nota_2 INTEGER NOT NULL DEFAULT 0,
+    nota_3 INTEGER NOT NULL DEFAULT 0,
+    nota_4 INTEGER NOT NULL DEFAULT 0,
+    nota_5 INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (id_unidade, id_cardapio, semana)
+);
+
+-- Marca d'água: todos os id_feedback até ela já foram agregados
+CREATE TABLE IF NOT EXISTS Feedback_Marca (
+    nome VARCHAR(50) PRIMARY KEY,
+    ultimo_id INTEGER NOT NULL
+);
+
+-- IDs acima da marca já agregados (transações confirmadas fora de ordem)
+CREATE TABLE IF NOT EXISTS Feedback_Processado (
+    id_feedback INTEGER PRIMARY KEY,
+    processado_em TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP
+);
+
+CREATE INDEX IF NOT EXISTS idx_feedback_semanal_semana ON Feedback_Semanal (semana);
+CREATE INDEX IF NOT EXISTS idx_pedido_usuario_data ON Pedido (pedido_usuario, data_hora);
+
+INSERT INTO Migracao_Aplicada (numero, descricao) VALUES (8, 'Agregado de avaliações')
+ON CONFLICT (numero) DO NOTHING;
+-- FIM DA MIGRAÇÃO 008
+
+-- ============================================
+-- MIGRAÇÃO 009: CATRACA (turnstile.py)
+-- ============================================
+-- Carga do índice de elegibilidade: pedidos do dia por cardápio vigente
+
+CREATE INDEX IF NOT EXISTS idx_pedido_cardapio_data ON Pedido (ped_cardapio, data_hora);
+
+INSERT INTO Migracao_Aplicada (numero, descricao) VALUES (9, 'Índice da catraca')
+ON CONFLICT (numero) DO NOTHING;
+-- FIM DA MIGRAÇÃO 009
+
+-- ============================================
+-- MIGRAÇÃO 010: BUSCA TEXTUAL (database.search)
+-- ============================================
+-- Vetores tsvector em português (sem acentos) mantidos por trigger, com índices
+-- GIN. Em bancos já existentes, preenche os vetores das linhas atuais.
+
+CREATE EXTENSION IF NOT EXISTS unaccent;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_ts_config
+        WHERE cfgname = 'busca_pt' AND cfgnamespace = current_schema()::regnamespace
+    ) THEN
+        CREATE TEXT SEARCH CONFIGURATION busca_pt (COPY = portuguese);
+        ALTER TEXT SEARCH CONFIGURATION busca_pt
+            ALTER MAPPING FOR hword, hword_part, word WITH unaccent, portuguese_stem;
+    END IF;
+END;
+$$;
+
+ALTER TABLE Usuario ADD COLUMN IF NOT EXISTS busca tsvector;
+ALTER TABLE Refeicao ADD COLUMN IF NOT EXISTS busca tsvector;
+ALTER TABLE Feedback ADD COLUMN IF NOT EXISTS busca tsvector;
+
+CREATE OR REPLACE FUNCTION atualizar_busca()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    CASE lower(TG_TABLE_NAME)
+        WHEN 'usuario' THEN
+            -- E-mail quebrado em partes ("maria.silva@unb.br" → maria silva unb br)
+            NEW.busca := setweight(to_tsvector('busca_pt', coalesce(NEW.nome_usuario, '')), 'A')
+                      || setweight(to_tsvector('simple', regexp_replace(coalesce(NEW.email_usuario, ''), '[@._+-]+', ' ', 'g')), 'B');
+        WHEN 'refeicao' THEN
+            NEW.busca := setweight(to_tsvector('busca_pt', coalesce(NEW.nome_refeicao, '')), 'A')
+                      || setweight(to_tsvector('busca_pt', coalesce(NEW.descricao_refeicao, '')), 'B');
+        WHEN 'feedback' THEN
+            NEW.busca := to_tsvector('busca_pt', coalesce(NEW.comentarios, ''));
+    END CASE;
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_usuario_busca ON Usuario;
+CREATE TRIGGER trg_usuario_busca
+    BEFORE INSERT OR UPDATE OF nome_usuario, email_usuario ON Usuario
+    FOR EACH ROW EXECUTE FUNCTION atualizar_busca();
+
+DROP TRIGGER IF EXISTS trg_refeicao_busca ON Refeicao;
+CREATE TRIGGER trg_refeicao_busca
+    BEFORE INSERT OR UPDATE OF nome_refeicao, descricao_refeicao ON Refeicao
+    FOR EACH ROW EXECUTE FUNCTION atualizar_busca();
+
+DROP TRIGGER IF EXISTS trg_feedback_busca ON Feedback;
+CREATE TRIGGER trg_feedback_busca
+    BEFORE INSERT OR UPDATE OF comentarios ON Feedback
+    FOR EACH ROW EXECUTE FUNCTION atualizar_busca();
+
+-- Linhas existentes (o UPDATE dispara os triggers acima)
+UPDATE Usuario SET nome_usuario = nome_usuario WHERE busca IS NULL;
+UPDATE Refeicao SET nome_refeicao = nome_refeicao WHERE busca IS NULL;
+UPDATE Feedback SET comentarios = comentarios WHERE busca IS NULL;
+
+CREATE INDEX IF NOT EXISTS idx_usuario_busca ON Usuario USING GIN (busca);
+CREATE INDEX IF NOT EXISTS idx_refeicao_busca ON Refeicao USING GIN (busca);
+CREATE INDEX IF NOT EXISTS idx_feedback_busca ON Feedback USING GIN (busca);
+
+INSERT INTO Migracao_Aplicada (numero, descricao) VALUES (10, 'Busca textual')
+ON CONFLICT (numero) DO NOTHING;
+-- FIM DA MIGRAÇÃO 010
+
+-- ============================================
+-- MIGRAÇÃO 011: SINCRONIZAÇÃO INCREMENTAL DE USUÁRIOS (snapshot.py)
+-- ============================================
+-- atualizado_em marca cada inserção/alteração; exclusões deixam uma lápide em
+-- Usuario_Removido. Clientes buscam só o que mudou desde a última sincronização.
+
+ALTER TABLE Usuario ADD COLUMN IF NOT EXISTS atualizado_em TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp();
+
+CREATE TABLE IF NOT EXISTS Usuario_Removido (
+    id_usuario INTEGER PRIMARY KEY,
+    removido_em TIMESTAMPTZ NOT NULL DEFAULT clock_timestamp()
+);
+
+CREATE OR REPLACE FUNCTION marcar_usuario_alterado()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP = 'DELETE' THEN
+        INSERT INTO Usuario_Removido (id_usuario, removido_em)
+        VALUES (OLD.id_usuario, clock_timestamp())
+        ON CONFLICT (id_usuario) DO UPDATE SET removido_em = EXCLUDED.removido_em;
+        RETURN OLD;
+    END IF;
+    NEW.atualizado_em := clock_timestamp();
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_usuario_alterado ON Usuario;
+CREATE TRIGGER trg_usuario_alterado
+    BEFORE UPDATE ON Usuario
+    FOR EACH ROW EXECUTE FUNCTION marcar_usuario_alterado();
+
+DROP TRIGGER IF EXISTS trg_usuario_removido ON Usuario;
+CREATE TRIGGER trg_usuario_removido
+    AFTER DELETE ON Usuario
+    FOR EACH ROW EXECUTE FUNCTION marcar_usuario_alterado();
+
+CREATE INDEX IF NOT EXISTS idx_usuario_atualizado_em ON Usuario (atualizado_em);
+CREATE INDEX IF NOT EXISTS idx_usuario_removido_em ON Usuario_Removido (removido_em);
+
+INSERT INTO Migracao_Aplicada (numero, descricao) VALUES (11, 'Sincronização incremental de usuários')
+ON CONFLICT (numero) DO NOTHING;
+-- FIM DA MIGRAÇÃO 011
+
+-- ============================================
+-- MIGRAÇÃO 012: CARDÁPIO VIGENTE (menus.py)
+-- ============================================
+-- Cada cardápio vale para um intervalo de datas e um tipo de refeição, para uma
+-- unidade (id_unidade) ou para todas (NULL). A restrição de exclusão impede
+-- dois cardápios do mesmo tipo e unidade com vigências sobrepostas. O índice
+-- GiST dela (tipo, unidade, daterange) também atende a busca do cardápio
+-- vigente: WHERE tipo = ... AND vigencia @> data.
+
+CREATE EXTENSION IF NOT EXISTS btree_gist;
+
+ALTER TABLE Cardapio ADD COLUMN IF NOT EXISTS id_unidade INTEGER REFERENCES Unidade(id_unidade);
+ALTER TABLE Cardapio ADD COLUMN IF NOT EXISTS vigencia DATERANGE
+    GENERATED ALWAYS AS (daterange(data_inicio, data_fim, '[]')) STORED;
+
+DO $$
+BEGIN
+    IF NOT EXISTS (
+        SELECT 1 FROM pg_constraint
+        WHERE conname = 'cardapio_sem_sobreposicao' AND conrelid = 'cardapio'::regclass
+    ) THEN
+        ALTER TABLE Cardapio ADD CONSTRAINT cardapio_sem_sobreposicao
+            EXCLUDE USING gist (tipo WITH =, (COALESCE(id_unidade, 0)) WITH =, vigencia WITH &&);
+    END IF;
+END;
+$$;
+
+-- Unidade a que cada cardápio (e seus pedidos) pertence: a própria
+-- (Cardapio.id_unidade) ou, no cardápio geral, a unidade que o aponta em
+-- Unidade.id_cardapio (a de menor id, se houver mais de uma). NULL se nenhuma.
+-- Capacidade, admissão, avaliações, previsão, compras e subsídio atribuem
+-- pedidos a unidades sempre por esta view.
+CREATE OR REPLACE VIEW vw_cardapio_unidade AS
+SELECT c.id_cardapio,
+       c.tipo,
+       COALESCE(c.id_unidade,
+                (SELECT MIN(u.id_unidade) FROM Unidade u WHERE u.id_cardapio = c.id_cardapio)) AS id_unidade,
+       c.id_unidade IS NOT NULL AS propria
+FROM Cardapio c;
+
+INSERT INTO Migracao_Aplicada (numero, descricao) VALUES (12, 'Cardápio vigente')
+ON CONFLICT (numero) DO NOTHING;
+-- FIM DA MIGRAÇÃO 012
+
+-- ============================================
+-- MIGRAÇÃO 013: ADMISSÃO DE PEDIDOS (admission.py)
+-- ============================================
+-- Vagas por (unidade, data, tipo) distribuídas como reservas com validade
+-- ANTES do INSERT em Pedido. Vaga_Refeicao guarda o saldo: cada reserva é um
+-- decremento atômico (UPDATE ... WHERE disponiveis > 0). O saldo começa em
+-- capacidade menos os pedidos não cancelados do dia. Reservas vencidas sem
+-- pedido devolvem a vaga (liberar_reservas_expiradas). Pedido cancelado ou
+-- removido também devolve a vaga, por trigger.
+
+CREATE TABLE IF NOT EXISTS Vaga_Refeicao (
+    id_unidade INTEGER NOT NULL REFERENCES Unidade(id_unidade),
+    data DATE NOT NULL,
+    tipo_refeicao VARCHAR(20) NOT NULL CHECK (tipo_refeicao IN ('cafe', 'almoco', 'jantar')),
+    capacidade INTEGER NOT NULL,
+    disponiveis INTEGER NOT NULL CHECK (disponiveis >= 0),
+    PRIMARY KEY (id_unidade, data, tipo_refeicao)
+);
+
+CREATE TABLE IF NOT EXISTS Reserva_Vaga (
+    id_reserva BIGSERIAL PRIMARY KEY,
+    id_unidade INTEGER NOT NULL,
+    data DATE NOT NULL,
+    tipo_refeicao VARCHAR(20) NOT NULL,
+    expira_em TIMESTAMPTZ NOT NULL,
+    id_pedido INTEGER, -- NULL = reserva ainda não usada
+    FOREIGN KEY (id_unidade, data, tipo_refeicao) REFERENCES Vaga_Refeicao ON DELETE CASCADE
+);
+
+CREATE INDEX IF NOT EXISTS idx_reserva_vaga_expira ON Reserva_Vaga (expira_em) WHERE id_pedido IS NULL;
+CREATE INDEX IF NOT EXISTS idx_reserva_vaga_pedido ON Reserva_Vaga (id_pedido) WHERE id_pedido IS NOT NULL;
+
+-- Devolve as vagas das reservas vencidas e descarta saldos de dias passados
+CREATE OR REPLACE FUNCTION liberar_reservas_expiradas()
+RETURNS INTEGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_liberadas INTEGER;
+BEGIN
+    WITH vencidas AS (
+        DELETE FROM Reserva_Vaga
+        WHERE id_pedido IS NULL AND expira_em < clock_timestamp()
+        RETURNING id_unidade, data, tipo_refeicao
+    ),
+    por_chave AS (
+        SELECT id_unidade, data, tipo_refeicao, COUNT(*)::INTEGER AS n
+        FROM vencidas
+        GROUP BY id_unidade, data, tipo_refeicao
+    ),
+    devolvidas AS (
+        UPDATE Vaga_Refeicao v
+        SET disponiveis = v.disponiveis + p.n
+        FROM por_chave p
+        WHERE v.id_unidade = p.id_unidade AND v.data = p.data AND v.tipo_refeicao = p.tipo_refeicao
+        RETURNING p.n
+    )
+    SELECT COALESCE(SUM(n), 0) INTO v_liberadas FROM devolvidas;
+
+    DELETE FROM Vaga_Refeicao WHERE data < CURRENT_DATE - 7;
+    RETURN v_liberadas;
+END;
+$$;
+
+CREATE OR REPLACE FUNCTION devolver_vaga_pedido()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    IF TG_OP = 'UPDATE' AND NOT (NEW.status_do_pedido = 'cancelado' AND OLD.status_do_pedido <> 'cancelado') THEN
+        RETURN NULL;
+    END IF;
+    WITH devolvida AS (
+        DELETE FROM Reserva_Vaga WHERE id_pedido = OLD.id_pedido
+        RETURNING id_unidade, data, tipo_refeicao
+    )
+    UPDATE Vaga_Refeicao v
+    SET disponiveis = v.disponiveis + 1
+    FROM devolvida d
+    WHERE v.id_unidade = d.id_unidade AND v.data = d.data AND v.tipo_refeicao = d.tipo_refeicao;
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_pedido_devolve_vaga ON Pedido;
+CREATE TRIGGER trg_pedido_devolve_vaga
+    AFTER UPDATE OF status_do_pedido OR DELETE ON Pedido
+    FOR EACH ROW EXECUTE FUNCTION devolver_vaga_pedido();
+
+INSERT INTO Migracao_Aplicada (numero, descricao) VALUES (13, 'Admissão de pedidos')
+ON CONFLICT (numero) DO NOTHING;
+-- FIM DA MIGRAÇÃO 013
+
+-- ============================================
+-- MIGRAÇÃO 014: CONCORRÊNCIA OTIMISTA (database.update_*)
+-- ============================================
+-- Cada UPDATE em Usuario, Pedido e Pagamento incrementa 'versao' (trigger, vale
+-- também para catraca, admissão e scripts). As telas de edição gravam com
+-- WHERE id = ... AND versao = <lida>: se outra operação alterou o registro
+-- nesse meio tempo, nenhuma linha é atualizada e o operador vê o conflito,
+-- sem bloqueio mantido entre a leitura e a gravação. O arquivo guarda a
+-- versão para que a restauração (archive.py) não a reinicie.
+
+ALTER TABLE Usuario ADD COLUMN IF NOT EXISTS versao INTEGER NOT NULL DEFAULT 1;
+ALTER TABLE Pedido ADD COLUMN IF NOT EXISTS versao INTEGER NOT NULL DEFAULT 1;
+ALTER TABLE Pagamento ADD COLUMN IF NOT EXISTS versao INTEGER NOT NULL DEFAULT 1;
+ALTER TABLE Pedido_Arquivo ADD COLUMN IF NOT EXISTS versao INTEGER NOT NULL DEFAULT 1;
+ALTER TABLE Pagamento_Arquivo ADD COLUMN IF NOT EXISTS versao INTEGER NOT NULL DEFAULT 1;
+
+CREATE OR REPLACE FUNCTION incrementar_versao()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+BEGIN
+    NEW.versao := OLD.versao + 1;
+    RETURN NEW;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_usuario_versao ON Usuario;
+CREATE TRIGGER trg_usuario_versao
+    BEFORE UPDATE ON Usuario
+    FOR EACH ROW EXECUTE FUNCTION incrementar_versao();
+
+DROP TRIGGER IF EXISTS trg_pedido_versao ON Pedido;
+CREATE TRIGGER trg_pedido_versao
+    BEFORE UPDATE ON Pedido
+    FOR EACH ROW EXECUTE FUNCTION incrementar_versao();
+
+DROP TRIGGER IF EXISTS trg_pagamento_versao ON Pagamento;
+CREATE TRIGGER trg_pagamento_versao
+    BEFORE UPDATE ON Pagamento
+    FOR EACH ROW EXECUTE FUNCTION incrementar_versao();
+
+INSERT INTO Migracao_Aplicada (numero, descricao) VALUES (14, 'Concorrência otimista')
+ON CONFLICT (numero) DO NOTHING;
+-- FIM DA MIGRAÇÃO 014
+
 -- ============================================
 -- COMENTÁRIOS NAS TABELAS
 -- ============================================
@@ -258,13 +793,13 @@ INSERT INTO Cardapio_Refeicao (id_cardapio, id_refeicao) VALUES
 (5, 6), (5, 7), (5, 4), (5, 5);
 
 -- Inserir relacionamentos Refeicao_Ingrediente
-INSERT INTO Refeicao_Ingrediente (id_refeicao, id_ingrediente) VALUES
-(1, 1), (1, 4), (1, 6),
-(2, 2), (2, 5), (2, 4),
-(3, 3), (3, 7),
-(4, 8), (4, 7),
-(6, 5), (6, 8), (6, 4),
-(7, 8), (7, 6), (7, 9);
+INSERT INTO Refeicao_Ingrediente (id_refeicao, id_ingrediente, quantidade_por_porcao) VALUES
+(1, 1, 0.0800), (1, 4, 0.5000), (1, 6, 0.0050),
+(2, 2, 0.0600), (2, 5, 0.0100), (2, 4, 0.5000),
+(3, 3, 0.1500), (3, 7, 0.0010),
+(4, 8, 0.0800), (4, 7, 0.0005),
+(6, 5, 0.0200), (6, 8, 0.0300), (6, 4, 0.3000),
+(7, 8, 0.0100), (7, 6, 0.0020), (7, 9, 0.1000);
 
 -- ============================================
 -- CRIAÇÃO DA VIEW RELATÓRIO PAGAMENTOS
@@ -300,8 +835,12 @@ FROM
     LEFT JOIN Unidade un ON c.id_cardapio = un.id_cardapio;
 
 -- ============================================
--- CRIAÇÃO DA PROCEDURE
+-- MIGRAÇÃO 015: CAPACIDADE DAS UNIDADES
 -- ============================================
+-- Procedure da criação original (contagem pelo intervalo de data_hora, que usa
+-- índices e poda partições) e a versão em grade (capacidade_unidades).
+-- Regra única de ocupação, também usada pela admissão (Vaga_Refeicao): todo
+-- pedido não cancelado da unidade/dia/tipo ocupa uma vaga.
 
 CREATE OR REPLACE PROCEDURE VerificarCapacidadeUnidade(
     p_id_unidade INTEGER,
@@ -353,12 +892,15 @@ BEGIN
     SELECT COUNT(ped.id_pedido)
     INTO v_pedidos_realizados
     FROM Pedido ped
-    JOIN Cardapio card ON ped.ped_cardapio = card.id_cardapio
-    JOIN Unidade un ON card.id_cardapio = un.id_cardapio
-    WHERE un.id_unidade = p_id_unidade
-      AND card.tipo = p_tipo_refeicao
-      AND DATE(ped.data_hora) = p_data
-      AND ped.status_do_pedido IN ('pago', 'entregue');
+    JOIN vw_cardapio_unidade cu ON ped.ped_cardapio = cu.id_cardapio
+    WHERE cu.id_unidade = p_id_unidade
+      AND cu.tipo = p_tipo_refeicao
+      -- Intervalo direto na coluna (em vez de DATE(data_hora)) usa índices e poda partições
+      AND ped.data_hora >= p_data
+      AND ped.data_hora < p_data + 1
+      -- Todo pedido não cancelado ocupa vaga (pendente inclusive: é o estado em
+      -- que a admissão grava o pedido; mesma regra de database._SQL_OCUPADAS)
+      AND ped.status_do_pedido <> 'cancelado';
     
     v_pedidos_realizados := COALESCE(v_pedidos_realizados, 0);
     p_vagas_restantes := v_capacidade_maxima - v_pedidos_realizados;
@@ -401,6 +943,163 @@ EXCEPTION
 END;
 $$;
 
+-- Capacidade em grade (função set-returning): mesma regra de
+-- VerificarCapacidadeUnidade, mas para qualquer combinação de unidades × datas
+-- × tipos em uma única consulta agrupada, sem NOTICE/WARNING.
+-- NULL em p_unidades ou p_tipos significa "todos".
+-- Exemplo: SELECT * FROM capacidade_unidades(NULL, CURRENT_DATE, CURRENT_DATE + 6, NULL);
+
+CREATE OR REPLACE FUNCTION capacidade_unidades(
+    p_unidades INTEGER[] DEFAULT NULL,
+    p_inicio DATE DEFAULT CURRENT_DATE,
+    p_fim DATE DEFAULT CURRENT_DATE,
+    p_tipos VARCHAR(20)[] DEFAULT NULL
+)
+RETURNS TABLE (
+    id_unidade INTEGER,
+    nome_unidade VARCHAR(100),
+    data DATE,
+    tipo_refeicao VARCHAR(20),
+    capacidade INTEGER,
+    pedidos INTEGER,
+    vagas_restantes INTEGER,
+    pode_atender BOOLEAN,
+    previsao NUMERIC(8,1)
+)
+LANGUAGE sql
+STABLE
+AS $$
+    WITH unidades AS (
+        SELECT u.id_unidade, u.nome_unidade, u.capacidade
+        FROM Unidade u
+        WHERE p_unidades IS NULL OR u.id_unidade = ANY(p_unidades)
+    ),
+    grade AS (
+        SELECT un.id_unidade, un.nome_unidade, un.capacidade, d::date AS dia, t.tipo
+        FROM unidades un
+        CROSS JOIN generate_series(p_inicio, p_fim, INTERVAL '1 day') AS d
+        CROSS JOIN unnest(COALESCE(p_tipos, ARRAY['cafe', 'almoco', 'jantar']::VARCHAR(20)[])) AS t(tipo)
+    ),
+    ocupacao AS (
+        -- Uma varredura do intervalo inteiro, agrupada por unidade/dia/tipo
+        SELECT cu.id_unidade, ped.data_hora::date AS dia, cu.tipo, COUNT(*)::INTEGER AS total
+        FROM unidades un
+        JOIN vw_cardapio_unidade cu ON cu.id_unidade = un.id_unidade
+        JOIN Pedido ped ON ped.ped_cardapio = cu.id_cardapio
+        WHERE ped.data_hora >= p_inicio
+          AND ped.data_hora < p_fim + 1
+          AND ped.status_do_pedido <> 'cancelado'
+        GROUP BY cu.id_unidade, ped.data_hora::date, cu.tipo
+    )
+    SELECT
+        g.id_unidade,
+        g.nome_unidade,
+        g.dia,
+        g.tipo,
+        g.capacidade,
+        COALESCE(o.total, 0),
+        GREATEST(g.capacidade - COALESCE(o.total, 0), 0),
+        g.capacidade > COALESCE(o.total, 0),
+        pd.quantidade_prevista
+    FROM grade g
+    LEFT JOIN ocupacao o
+        ON o.id_unidade = g.id_unidade AND o.dia = g.dia AND o.tipo = g.tipo
+    LEFT JOIN Previsao_Demanda pd
+        ON pd.id_unidade = g.id_unidade AND pd.data = g.dia AND pd.tipo_refeicao = g.tipo
+    ORDER BY g.id_unidade, g.dia, array_position(ARRAY['cafe', 'almoco', 'jantar']::VARCHAR(20)[], g.tipo);
+$$;
+
+INSERT INTO Migracao_Aplicada (numero, descricao) VALUES (15, 'Capacidade das unidades')
+ON CONFLICT (numero) DO NOTHING;
+-- FIM DA MIGRAÇÃO 015
+
+-- ============================================
+-- MIGRAÇÃO 016: CANAL DE ALTERAÇÕES (LISTEN/NOTIFY)
+-- ============================================
+-- Publica eventos compactos no canal 'ru_alteracoes' para que os clientes
+-- atualizem seus caches incrementalmente, sem reconsultar tabelas inteiras.
+-- Formato: {"tabela": "...", "op": "I|U|D", "id": ..., ...}
+
+CREATE OR REPLACE FUNCTION notificar_alteracao()
+RETURNS TRIGGER
+LANGUAGE plpgsql
+AS $$
+DECLARE
+    v_linha RECORD;
+    v_payload JSONB;
+BEGIN
+    IF TG_LEVEL = 'ROW' THEN
+        IF TG_OP = 'DELETE' THEN
+            v_linha := OLD;
+        ELSE
+            v_linha := NEW;
+        END IF;
+    END IF;
+
+    v_payload := jsonb_build_object('tabela', lower(TG_TABLE_NAME), 'op', left(TG_OP, 1));
+
+    CASE lower(TG_TABLE_NAME)
+        WHEN 'usuario' THEN
+            v_payload := v_payload || jsonb_build_object('id', v_linha.id_usuario);
+        WHEN 'pedido' THEN
+            v_payload := v_payload || jsonb_build_object('id', v_linha.id_pedido);
+        WHEN 'pagamento' THEN
+            -- Pedidos afetados (antigo e novo) para atualizar a lista de pendentes
+            v_payload := v_payload || jsonb_build_object(
+                'id', v_linha.id_pagamento,
+                'pedidos', CASE
+                    WHEN TG_OP = 'UPDATE' AND OLD.pag_pedido <> NEW.pag_pedido
+                        THEN jsonb_build_array(OLD.pag_pedido, NEW.pag_pedido)
+                    ELSE jsonb_build_array(v_linha.pag_pedido)
+                END
+            );
+        WHEN 'categoria_usuario' THEN
+            v_payload := v_payload || jsonb_build_object('id', v_linha.id_usuario);
+        WHEN 'tabela_preco' THEN
+            NULL; -- Trigger por comando: o cliente recarrega a tabela inteira (pequena)
+        WHEN 'cardapio' THEN
+            NULL; -- Trigger por comando: o cliente descarta os cardápios vigentes em memória
+    END CASE;
+
+    PERFORM pg_notify('ru_alteracoes', v_payload::text);
+    RETURN NULL;
+END;
+$$;
+
+DROP TRIGGER IF EXISTS trg_usuario_notificar ON Usuario;
+CREATE TRIGGER trg_usuario_notificar
+    AFTER INSERT OR UPDATE OR DELETE ON Usuario
+    FOR EACH ROW EXECUTE FUNCTION notificar_alteracao();
+
+DROP TRIGGER IF EXISTS trg_pedido_notificar ON Pedido;
+CREATE TRIGGER trg_pedido_notificar
+    AFTER INSERT OR UPDATE OR DELETE ON Pedido
+    FOR EACH ROW EXECUTE FUNCTION notificar_alteracao();
+
+DROP TRIGGER IF EXISTS trg_pagamento_notificar ON Pagamento;
+CREATE TRIGGER trg_pagamento_notificar
+    AFTER INSERT OR UPDATE OR DELETE ON Pagamento
+    FOR EACH ROW EXECUTE FUNCTION notificar_alteracao();
+
+DROP TRIGGER IF EXISTS trg_categoria_usuario_notificar ON Categoria_Usuario;
+CREATE TRIGGER trg_categoria_usuario_notificar
+    AFTER INSERT OR UPDATE OR DELETE ON Categoria_Usuario
+    FOR EACH ROW EXECUTE FUNCTION notificar_alteracao();
+
+DROP TRIGGER IF EXISTS trg_tabela_preco_notificar ON Tabela_Preco;
+CREATE TRIGGER trg_tabela_preco_notificar
+    AFTER INSERT OR UPDATE OR DELETE ON Tabela_Preco
+    FOR EACH STATEMENT EXECUTE FUNCTION notificar_alteracao();
+
+DROP TRIGGER IF EXISTS trg_cardapio_notificar ON Cardapio;
+CREATE TRIGGER trg_cardapio_notificar
+    AFTER INSERT OR UPDATE OR DELETE ON Cardapio
+    FOR EACH STATEMENT EXECUTE FUNCTION notificar_alteracao();
+
+INSERT INTO Migracao_Aplicada (numero, descricao) VALUES (16, 'Canal de alterações')
+ON CONFLICT (numero) DO NOTHING;
+-- FIM DA MIGRAÇÃO 016
+
 -- ============================================
 -- VERIFICAÇÃO DE INTEGRIDADE
 -- ============================================
@@ -426,3 +1125,6 @@ SELECT * FROM vw_relatorio_pagamentos LIMIT 5;
 
 -- Testar a procedure 
 CALL VerificarCapacidadeUnidade(1, '2024-07-15', 'almoco', NULL, NULL, NULL);
+
+-- Testar a função de capacidade em grade
+SELECT * FROM capacidade_unidades(NULL, '2024-01-15', '2024-01-21', NULL);
@@ -0,0 +1,135 @@
+# CÓPIA LOCAL DO CADASTRO DE USUÁRIOS - SINCRONIZAÇÃO INCREMENTAL
+#
+# Mantém em memória (e, opcionalmente, em disco entre execuções) a lista de
+# usuários usada nos formulários. Cada sincronização busca só as linhas com
+# atualizado_em posterior à última marca e as lápides de exclusão
+# (database.get_users_delta), em vez da tabela inteira.
+#
+# MARCA E MARGEM:
+# - A marca é o now() do servidor na consulta anterior, sempre lida no primário
+#   (database.somente_primario): réplicas atrasadas não avançam a marca
+# - A próxima consulta pede alterações desde (marca - margem): uma transação
+#   que alterou a linha antes da marca, mas só confirmou depois, ainda é vista.
+#   Linhas repetidas na margem apenas sobrescrevem a cópia local
+# - Cópia mais antiga que a retenção das lápides (ou sem marca): carga completa
+#
+# ARQUIVO (opcional, SNAPSHOT_USUARIOS no .env):
+#   JSON com marca e linhas, gravado de forma atômica. Contém CPF e e-mail:
+#   manter fora do controle de versão e com permissão restrita.
+
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta, timezone
+import database
+
+MARGEM_PADRAO = timedelta(seconds=60)
+RETENCAO_REMOCOES = timedelta(days=30)
+
+class SnapshotUsuarios:
+    """
+    CÓPIA LOCAL DE USUARIO (id_usuario → linha de get_all_users)
+    """
+
+    def __init__(self, arquivo=None, margem=MARGEM_PADRAO, intervalo_gravacao=30.0):
+        self.arquivo = arquivo
+        self.margem = margem
+        self.intervalo_gravacao = intervalo_gravacao
+        self._lock = threading.RLock()
+        self._linhas = {}
+        self._marca = None
+        self._gravado_em = 0.0
+        self._alterado = False
+        if arquivo:
+            self._ler_arquivo()
+
+    # ---------- ARQUIVO ----------
+
+    def _ler_arquivo(self):
+        try:
+            with open(self.arquivo, encoding='utf-8') as entrada:
+                dados = json.load(entrada)
+            self._linhas = {linha[0]: tuple(linha) for linha in dados['linhas']}
+            self._marca = datetime.fromisoformat(dados['marca'])
+        except FileNotFoundError:
+            pass
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"[AVISO] Cópia local de usuários ignorada ({self.arquivo}): {e}")
+            self._linhas, self._marca = {}, None
+
+    def salvar(self):
+        """Grava a cópia em disco (se houver arquivo configurado e alterações)"""
+        with self._lock:
+            if not self.arquivo or not self._alterado or self._marca is None:
+                return
+            dados = {'marca': self._marca.isoformat(), 'linhas': list(self._linhas.values())}
+            temporario = self.arquivo + '.tmp'
+            with open(temporario, 'w', encoding='utf-8') as saida:
+                json.dump(dados, saida, ensure_ascii=False)
+            os.replace(temporario, self.arquivo)
+            self._alterado = False
+            self._gravado_em = time.monotonic()
+
+    # ---------- SINCRONIZAÇÃO ----------
+
+    def sincronizar(self, conn):
+        """
+        Aplica as alterações do servidor desde a última marca
+
+        Returns:
+            int: Linhas alteradas/removidas (carga completa conta todas)
+        """
+        with self._lock:
+            desde = None
+            if self._marca is not None and datetime.now(timezone.utc) - self._marca < RETENCAO_REMOCOES:
+                desde = self._marca - self.margem
+
+            # No primário: o now() de uma réplica atrasada viraria marca e as
+            # alterações ainda não replicadas ficariam para trás da margem
+            with database.somente_primario():
+                linhas, removidos, marca = database.get_users_delta(conn, desde)
+            if desde is None:
+                self._linhas = {}
+            for id_usuario in removidos:
+                self._linhas.pop(id_usuario, None)
+            # Depois das lápides: uma linha presente em Usuario está viva
+            for linha in linhas:
+                self._linhas[linha[0]] = linha
+            self._marca = marca
+
+            alteracoes = len(linhas) + len(removidos)
+            self._alterado = self._alterado or alteracoes > 0
+            if time.monotonic() - self._gravado_em > self.intervalo_gravacao:
+                self.salvar()
+            return alteracoes
+
+    def aplicar(self, id_usuario, linha):
+        """Atualiza uma linha recebida por outro meio (ex.: evento do ouvinte); None remove"""
+        with self._lock:
+            if linha:
+                self._linhas[id_usuario] = linha
+            else:
+                self._linhas.pop(id_usuario, None)
+            self._alterado = True
+
+    # ---------- CONSULTA ----------
+
+    def listar(self):
+        """Linhas ordenadas por ID (mesmo formato de database.get_all_users)"""
+        with self._lock:
+            return [self._linhas[k] for k in sorted(self._linhas)]
+
+    def carregada(self):
+        return self._marca is not None
+
+
+def criar_snapshot(config=None):
+    """SnapshotUsuarios com o arquivo de SNAPSHOT_USUARIOS no .env (vazio = só em memória)"""
+    config = config if config is not None else database.get_db_config()
+    arquivo = config.get('SNAPSHOT_USUARIOS') or None
+    try:
+        margem = timedelta(seconds=float(config.get('SNAPSHOT_MARGEM', MARGEM_PADRAO.total_seconds())))
+    except ValueError:
+        margem = MARGEM_PADRAO
+    return SnapshotUsuarios(arquivo, margem)
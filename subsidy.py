@@ -0,0 +1,405 @@
+# SIMULADOR DE SUBSÍDIO - CENÁRIOS SOBRE OS PAGAMENTOS DO PERÍODO
+#
+# Responde "e se o subsídio parcial fosse 50%?" ou "e se o preço integral
+# subisse 10%?" com os pagamentos reais de um período: quanto a universidade
+# gastaria em subsídio e quanto o RU arrecadaria, por categoria e por unidade.
+#
+# CARGA (uma vez): pagamentos de pedidos não cancelados, ativos e arquivados,
+# agregados no servidor por (categoria, regime de subsídio de Categoria_Usuario,
+# unidade, tipo de refeição, dia) e lidos em blocos por cursor nomeado para
+# arrays NumPy. O preço integral de cada linha vem de Tabela_Preco vigente no
+# dia (pricing.TabelaPrecos.precos_em_lote). As linhas são então reduzidas a
+# grupos com o mesmo preço integral: os cenários não dependem mais do dia.
+#
+# CENÁRIO: fração subsidiada por regime ('total', 'parcial', 'sem_subsidio') e
+# fator de reajuste do preço integral por tipo de refeição. As frações atuais
+# vêm de Tabela_Preco (vigente no fim do período) e do regime de cada categoria
+# em CATEGORIAS_CONFIG: 1 - preço da categoria / preço integral. Todos os cenários
+# são avaliados juntos em matrizes cenários × grupos:
+#   cobrado  = arredonda(integral × reajuste × (1 - fração), centavos)
+#   receita  = refeições × cobrado
+#   subsídio = refeições × (integral × reajuste - cobrado)
+# A demanda é a do período (sem elasticidade de preço).
+#
+# USO:
+#   python subsidy.py --inicio 2024-01-01 --fim 2024-06-30 --parcial 0.4:0.8:0.05 --reajuste 1:1.2:0.05
+#   python subsidy.py --inicio 2024-01-01 --fim 2024-06-30 --cenarios cenarios.json --detalhar 3
+#   python subsidy.py ... --saida cenarios.csv     # por cenário × categoria/unidade
+#
+# cenarios.json: [{"nome": "parcial 50%", "subsidio": {"parcial": 0.5}, "reajuste": {"almoco": 1.1}}]
+# (regimes e tipos omitidos ficam com os valores atuais; "reajuste": 1.1 vale para todos os tipos)
+
+import argparse
+import csv
+import itertools
+import json
+import time
+from collections import namedtuple
+from datetime import date, timedelta
+import numpy as np
+import psycopg2
+import database
+import pricing
+
+REGIMES = ('total', 'parcial', 'sem_subsidio')
+TIPOS = ('cafe', 'almoco', 'jantar')
+
+Cenario = namedtuple('Cenario', 'nome subsidio reajuste')
+
+# ==================== CARGA ====================
+
+SQL_PAGAMENTOS = """
+WITH pagamentos AS (
+    SELECT pag.pag_categoria_usuario, pag.pag_categoria_nome, pag.valor_pago, ped.data_hora, ped.ped_cardapio
+    FROM Pagamento pag
+    JOIN Pedido ped ON ped.id_pedido = pag.pag_pedido
+    WHERE ped.data_hora >= %(inicio)s AND ped.data_hora < %(fim)s
+      AND ped.status_do_pedido <> 'cancelado'
+    UNION ALL
+    SELECT pag.pag_categoria_usuario, pag.pag_categoria_nome, pag.valor_pago, ped.data_hora, ped.ped_cardapio
+    FROM Pagamento_Arquivo pag
+    JOIN Pedido_Arquivo ped ON ped.id_pedido = pag.pag_pedido
+    WHERE ped.data_hora >= %(inicio)s AND ped.data_hora < %(fim)s
+      AND ped.status_do_pedido <> 'cancelado'
+)
+SELECT pg.pag_categoria_nome, COALESCE(cu.subsidio, 'sem_subsidio'),
+       COALESCE(card.id_unidade, 0),
+       card.tipo, pg.data_hora::date, COUNT(*), SUM(pg.valor_pago)
+FROM pagamentos pg
+JOIN vw_cardapio_unidade card ON card.id_cardapio = pg.ped_cardapio
+LEFT JOIN Categoria_Usuario cu
+       ON cu.id_usuario = pg.pag_categoria_usuario AND cu.nome_categoria = pg.pag_categoria_nome
+GROUP BY 1, 2, 3, 4, 5;
+"""
+
+class BasePagamentos:
+    """
+    PAGAMENTOS DO PERÍODO EM ARRAYS, AGRUPADOS POR PREÇO INTEGRAL
+
+    Um elemento por grupo (categoria, regime, unidade, tipo, preço integral):
+    categoria, regime, unidade, tipo (códigos), integral, refeicoes, pago.
+    """
+
+    def __init__(self, categorias, unidades, categoria, regime, unidade, tipo, integral, refeicoes, pago, sem_preco):
+        self.categorias = categorias        # código → nome
+        self.unidades = unidades            # código → id_unidade (0 = não atribuída)
+        self.categoria, self.regime, self.unidade, self.tipo = categoria, regime, unidade, tipo
+        self.integral, self.refeicoes, self.pago = integral, refeicoes, pago
+        self.sem_preco = sem_preco          # refeições sem faixa de preço integral (fora da simulação)
+
+    def __len__(self):
+        return len(self.refeicoes)
+
+def _categoria_integral():
+    return next(nome for nome, regra in database.CATEGORIAS_CONFIG.items()
+                if regra['subsidio'] == 'sem_subsidio')
+
+def subsidio_atual(tabela, data=None):
+    """
+    Frações subsidiadas vigentes por regime, derivadas da tabela de preços
+
+    Para cada regime, 1 - (soma dos preços das suas categorias) / (soma dos preços
+    integrais), nos tipos de refeição com as duas faixas vigentes na data.
+
+    Args:
+        tabela: pricing.TabelaPrecos já carregada
+        data: Data de referência (padrão: hoje)
+
+    Raises:
+        ValueError: Regime sem preço vigente na data
+    """
+    data = data or date.today()
+    integral_nome = _categoria_integral()
+    fracoes = {}
+    for regime in REGIMES:
+        cobrado = integral = 0.0
+        for nome, regra in database.CATEGORIAS_CONFIG.items():
+            if regra['subsidio'] != regime:
+                continue
+            for tipo in TIPOS:
+                preco = tabela.preco(nome, tipo, data)
+                preco_integral = tabela.preco(integral_nome, tipo, data)
+                if preco is not None and preco_integral:
+                    cobrado += preco
+                    integral += preco_integral
+        if not integral:
+            raise ValueError(f"sem preços vigentes em {data} para o regime {regime!r}")
+        fracoes[regime] = round(1.0 - cobrado / integral, 4)
+    return fracoes
+
+def carregar(conn, inicio, fim, tabela=None, bloco=10000):
+    """
+    Lê os pagamentos de [inicio, fim] (inclusivo) e monta a BasePagamentos
+
+    Args:
+        tabela: pricing.TabelaPrecos já carregada (None = carrega aqui)
+    """
+    if tabela is None:
+        tabela = pricing.TabelaPrecos()
+        tabela.carregar(conn)
+    integral_nome = _categoria_integral()
+
+    nomes, regimes, unidades, tipos, dias, quantidades, pagos = [], [], [], [], [], [], []
+    with conn.cursor(name='simulacao_subsidio') as cur:
+        cur.itersize = bloco
+        cur.execute(SQL_PAGAMENTOS, {'inicio': inicio, 'fim': fim + timedelta(days=1)})
+        while True:
+            linhas = cur.fetchmany(bloco)
+            if not linhas:
+                break
+            n, r, u, t, d, q, p = zip(*linhas)
+            nomes.extend(n)
+            regimes.append(np.array([REGIMES.index(x) for x in r], dtype=np.int64))
+            unidades.append(np.array(u, dtype=np.int64))
+            tipos.extend(t)
+            dias.extend(d)
+            quantidades.append(np.array(q, dtype=np.float64))
+            pagos.append(np.array(p, dtype=np.float64))
+    conn.rollback()
+
+    if not nomes:
+        vazio = np.empty(0, dtype=np.int64)
+        return BasePagamentos([], [], vazio, vazio, vazio, vazio, np.empty(0), np.empty(0), np.empty(0), 0)
+
+    integral = tabela.precos_em_lote([integral_nome] * len(tipos), tipos, dias)
+    categorias, categoria = np.unique(np.asarray(nomes, dtype=str), return_inverse=True)
+    tipo = np.array([TIPOS.index(x) for x in tipos], dtype=np.int64)
+    regime, unidade_id = np.concatenate(regimes), np.concatenate(unidades)
+    quantidade, pago = np.concatenate(quantidades), np.concatenate(pagos)
+    lista_unidades, unidade = np.unique(unidade_id, return_inverse=True)
+
+    com_preco = ~np.isnan(integral)
+    sem_preco = int(quantidade[~com_preco].sum())
+
+    # Redução aos grupos de mesmo preço integral (centavos inteiros na chave)
+    centavos = np.round(np.nan_to_num(integral) * 100).astype(np.int64)
+    chave = np.stack([categoria, regime, unidade, tipo, centavos], axis=1)[com_preco]
+    grupos, inverso = np.unique(chave, axis=0, return_inverse=True)
+    inverso = inverso.ravel()
+    refeicoes = np.bincount(inverso, weights=quantidade[com_preco], minlength=len(grupos))
+    pagos_grupo = np.bincount(inverso, weights=pago[com_preco], minlength=len(grupos))
+    return BasePagamentos(
+        [str(c) for c in categorias], [int(u) for u in lista_unidades],
+        grupos[:, 0], grupos[:, 1], grupos[:, 2], grupos[:, 3], grupos[:, 4] / 100.0,
+        refeicoes, pagos_grupo, sem_preco,
+    )
+
+# ==================== CENÁRIOS ====================
+
+def cenario(atual, nome=None, subsidio=None, reajuste=None):
+    """
+    Cenário com os valores atuais onde não informado (reajuste: fator único ou por tipo)
+
+    atual: frações vigentes por regime (subsidio_atual)
+    """
+    fracoes = dict(atual)
+    for regime, fracao in (subsidio or {}).items():
+        if regime not in REGIMES:
+            raise ValueError(f"regime desconhecido: {regime!r} (use {', '.join(REGIMES)})")
+        if not 0.0 <= float(fracao) <= 1.0:
+            raise ValueError(f"fração de subsídio fora de [0, 1] para {regime}: {fracao}")
+        fracoes[regime] = float(fracao)
+    if not isinstance(reajuste, dict):
+        reajuste = {tipo: 1.0 if reajuste is None else reajuste for tipo in TIPOS}
+    fatores = {tipo: 1.0 for tipo in TIPOS}
+    for tipo, fator in reajuste.items():
+        if tipo not in TIPOS or float(fator) < 0:
+            raise ValueError(f"reajuste inválido: {tipo}={fator}")
+        fatores[tipo] = float(fator)
+    if nome is None:
+        nome = ' '.join(f"{r}={fracoes[r]:.0%}" for r in REGIMES)
+        if any(f != 1.0 for f in fatores.values()):
+            unicos = set(fatores.values())
+            nome += (f" reajuste={unicos.pop() - 1:+.0%}" if len(unicos) == 1
+                     else ' ' + ' '.join(f"{t}={f - 1:+.0%}" for t, f in fatores.items()))
+    return Cenario(nome, fracoes, fatores)
+
+def grade(atual, total=None, parcial=None, sem_subsidio=None, reajuste=None):
+    """Produto cartesiano das listas de valores (None = só o valor atual)"""
+    eixos = (
+        total or [atual['total']],
+        parcial or [atual['parcial']],
+        sem_subsidio or [atual['sem_subsidio']],
+        reajuste or [1.0],
+    )
+    return [cenario(atual, subsidio=dict(zip(REGIMES, (t, p, s))), reajuste=r)
+            for t, p, s, r in itertools.product(*eixos)]
+
+def ler_cenarios(arquivo, atual):
+    with open(arquivo, encoding='utf-8') as entrada:
+        return [cenario(atual, c.get('nome'), c.get('subsidio'), c.get('reajuste')) for c in json.load(entrada)]
+
+# ==================== AVALIAÇÃO VETORIZADA ====================
+
+Resultado = namedtuple('Resultado', 'cenarios receita subsidio receita_categoria subsidio_categoria '
+                                    'receita_unidade subsidio_unidade')
+
+def _somar_por(valores, codigos, quantidade):
+    """Soma as colunas (grupos) de 'valores' por código: cenários × códigos"""
+    indicadora = np.zeros((len(codigos), quantidade))
+    indicadora[np.arange(len(codigos)), codigos] = 1.0
+    return valores @ indicadora
+
+def avaliar(base, cenarios):
+    """
+    AVALIA TODOS OS CENÁRIOS DE UMA VEZ
+
+    Returns:
+        Resultado: totais (cenários,) e quebras (cenários × categorias/unidades)
+    """
+    fracao = np.array([[c.subsidio[r] for r in REGIMES] for c in cenarios])     # cenários × regimes
+    fator = np.array([[c.reajuste[t] for t in TIPOS] for c in cenarios])        # cenários × tipos
+
+    cheio = base.integral[None, :] * fator[:, base.tipo]                        # cenários × grupos
+    cobrado = np.round(cheio * (1.0 - fracao[:, base.regime]), 2)
+    receita = cobrado * base.refeicoes
+    subsidio = (cheio - cobrado) * base.refeicoes
+
+    return Resultado(
+        cenarios, receita.sum(axis=1), subsidio.sum(axis=1),
+        _somar_por(receita, base.categoria, len(base.categorias)),
+        _somar_por(subsidio, base.categoria, len(base.categorias)),
+        _somar_por(receita, base.unidade, len(base.unidades)),
+        _somar_por(subsidio, base.unidade, len(base.unidades)),
+    )
+
+def historico(base):
+    """Receita e subsídio efetivos do período (valores pagos)"""
+    receita = float(base.pago.sum())
+    return receita, float((base.integral * base.refeicoes).sum()) - receita
+
+# ==================== RELATÓRIO ====================
+
+def _faixa(texto):
+    """'0.4:0.8:0.05' (início:fim:passo, inclusivo) ou '0.5,0.6' → lista de floats"""
+    try:
+        if ':' in texto:
+            inicio, fim, passo = (float(x) for x in texto.split(':'))
+            if passo <= 0:
+                raise ValueError
+            return [round(v, 6) for v in np.arange(inicio, fim + passo / 2, passo)]
+        return [float(x) for x in texto.split(',')]
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"valores inválidos: {texto!r} (use início:fim:passo ou a,b,c)")
+
+def mostrar(resultado, base, nomes_unidades, ordem, limite, detalhar):
+    receita_hist, subsidio_hist = historico(base)
+    print(f"\nHistórico do período: {int(base.refeicoes.sum())} refeições, receita R$ {receita_hist:,.2f}, "
+          f"subsídio R$ {subsidio_hist:,.2f}")
+    print(f"\n{'Cenário':<58} {'Receita (R$)':>14} {'Subsídio (R$)':>14} {'Δ subsídio':>12}")
+    print('-' * 101)
+    for i in ordem[:limite]:
+        print(f"{resultado.cenarios[i].nome[:58]:<58} {resultado.receita[i]:>14,.2f} "
+              f"{resultado.subsidio[i]:>14,.2f} {resultado.subsidio[i] - subsidio_hist:>+12,.2f}")
+    if len(ordem) > limite:
+        print(f"... {len(ordem) - limite} cenários omitidos (--mostrar, --saida)")
+
+    for i in ordem[:detalhar]:
+        print(f"\n{resultado.cenarios[i].nome}")
+        print(f"  {'Categoria / Unidade':<30} {'Receita (R$)':>14} {'Subsídio (R$)':>14}")
+        for j, nome in enumerate(base.categorias):
+            print(f"  {nome[:30]:<30} {resultado.receita_categoria[i, j]:>14,.2f} "
+                  f"{resultado.subsidio_categoria[i, j]:>14,.2f}")
+        for j, id_unidade in enumerate(base.unidades):
+            nome = nomes_unidades.get(id_unidade, 'Não atribuída')
+            print(f"  {nome[:30]:<30} {resultado.receita_unidade[i, j]:>14,.2f} "
+                  f"{resultado.subsidio_unidade[i, j]:>14,.2f}")
+
+def gravar_csv(arquivo, resultado, base, nomes_unidades):
+    with open(arquivo, 'w', encoding='utf-8', newline='') as saida:
+        escritor = csv.writer(saida)
+        escritor.writerow(['cenario', *(f'subsidio_{r}' for r in REGIMES), *(f'reajuste_{t}' for t in TIPOS),
+                           'dimensao', 'chave', 'receita', 'subsidio'])
+        for i, c in enumerate(resultado.cenarios):
+            prefixo = [c.nome, *(c.subsidio[r] for r in REGIMES), *(c.reajuste[t] for t in TIPOS)]
+            escritor.writerow([*prefixo, 'total', '', f"{resultado.receita[i]:.2f}", f"{resultado.subsidio[i]:.2f}"])
+            for j, nome in enumerate(base.categorias):
+                escritor.writerow([*prefixo, 'categoria', nome, f"{resultado.receita_categoria[i, j]:.2f}",
+                                   f"{resultado.subsidio_categoria[i, j]:.2f}"])
+            for j, id_unidade in enumerate(base.unidades):
+                escritor.writerow([*prefixo, 'unidade', nomes_unidades.get(id_unidade, 'Não atribuída'),
+                                   f"{resultado.receita_unidade[i, j]:.2f}", f"{resultado.subsidio_unidade[i, j]:.2f}"])
+
+# ==================== CLI ====================
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulação de cenários de subsídio sobre os pagamentos do período")
+    parser.add_argument('--inicio', type=date.fromisoformat, required=True)
+    parser.add_argument('--fim', type=date.fromisoformat, required=True, help="Inclusivo")
+    parser.add_argument('--total', type=_faixa, help="Frações do regime 'total' (ex.: 0.9,1)")
+    parser.add_argument('--parcial', type=_faixa, help="Frações do regime 'parcial' (ex.: 0.4:0.8:0.05)")
+    parser.add_argument('--sem-subsidio', type=_faixa, help="Frações do regime 'sem_subsidio'")
+    parser.add_argument('--reajuste', type=_faixa, help="Fatores do preço integral (ex.: 1:1.2:0.05)")
+    parser.add_argument('--cenarios', help="Arquivo JSON com cenários (somados à grade)")
+    parser.add_argument('--ordenar', choices=('subsidio', 'receita'), default='subsidio')
+    parser.add_argument('--mostrar', type=int, default=20, help="Cenários listados")
+    parser.add_argument('--detalhar', type=int, default=0,
+                        help="Quebra por categoria e unidade dos N primeiros cenários")
+    parser.add_argument('--saida', help="CSV com todos os cenários por categoria e unidade")
+    args = parser.parse_args()
+
+    if args.fim < args.inicio:
+        print("[ERRO] --fim anterior a --inicio.")
+        return 1
+
+    try:
+        conn = database.open_connection()
+    except psycopg2.Error as e:
+        print(f"[ERRO] Erro ao conectar ao PostgreSQL: {e}")
+        return 1
+    try:
+        inicio = time.perf_counter()
+        tabela = pricing.TabelaPrecos()
+        tabela.carregar(conn)
+        base = carregar(conn, args.inicio, args.fim, tabela)
+        nomes_unidades = {u[0]: u[1] for u in database.get_unidades(conn)}
+        carga = time.perf_counter() - inicio
+    except psycopg2.Error as e:
+        print(f"[ERRO] {e}")
+        return 1
+    finally:
+        conn.close()
+
+    try:
+        atual = subsidio_atual(tabela, args.fim)
+    except ValueError as e:
+        print(f"[ERRO] {e}")
+        return 1
+    print(f"[INFO] Subsídio atual (Tabela_Preco em {args.fim}): "
+          + ', '.join(f"{r}={atual[r]:.1%}" for r in REGIMES))
+    try:
+        cenarios = [cenario(atual, nome='atual')]
+        if any(v is not None for v in (args.total, args.parcial, args.sem_subsidio, args.reajuste)):
+            cenarios += grade(atual, args.total, args.parcial, args.sem_subsidio, args.reajuste)
+        if args.cenarios:
+            cenarios += ler_cenarios(args.cenarios, atual)
+    except (OSError, ValueError, TypeError, AttributeError) as e:
+        print(f"[ERRO] Cenários inválidos: {e}")
+        return 1
+
+    if not len(base):
+        print("[AVISO] Nenhum pagamento com preço integral no período.")
+        return 1
+    if base.sem_preco:
+        print(f"[AVISO] {base.sem_preco} refeições sem faixa de preço integral em Tabela_Preco ficaram fora da simulação.")
+
+    inicio = time.perf_counter()
+    resultado = avaliar(base, cenarios)
+    duracao = time.perf_counter() - inicio
+    print(f"[INFO] {len(base)} grupos carregados em {carga:.1f}s; "
+          f"{len(cenarios)} cenários avaliados em {duracao * 1000:.0f} ms")
+
+    chave = resultado.subsidio if args.ordenar == 'subsidio' else -resultado.receita
+    ordem = [0] + [int(i) + 1 for i in np.argsort(chave[1:], kind='stable')]
+    mostrar(resultado, base, nomes_unidades, ordem, max(1, args.mostrar), args.detalhar)
+    if args.saida:
+        try:
+            gravar_csv(args.saida, resultado, base, nomes_unidades)
+        except OSError as e:
+            print(f"[ERRO] Não foi possível gravar {args.saida}: {e}")
+            return 1
+        print(f"\n[SUCESSO] {len(cenarios)} cenários gravados em {args.saida}")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
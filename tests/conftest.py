@@ -0,0 +1,63 @@
+# TESTES DE INTEGRAÇÃO - SISTEMA RU UNB
+#
+# Rodam contra um PostgreSQL real (com as extensões unaccent e btree_gist).
+# Defina RU_TESTE_DSN, por exemplo:
+#   RU_TESTE_DSN="dbname=ru_teste user=postgres host=localhost" python -m pytest -q
+# Sem a variável, os testes que usam o banco são ignorados. Cada um recebe um schema próprio,
+# carregado do schema.sql e removido ao final; as tabelas reais não são tocadas.
+
+import os
+import sys
+import uuid
+import psycopg2
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database
+
+DSN = os.environ.get('RU_TESTE_DSN')
+
+@pytest.fixture
+def schema():
+    """Schema novo com o schema.sql completo (estrutura e dados de exemplo)"""
+    if not DSN:
+        pytest.skip("RU_TESTE_DSN não definido")
+    nome = f"teste_{uuid.uuid4().hex[:12]}"
+    with open(database.SCHEMA_SQL, encoding='utf-8') as arquivo:
+        ddl = arquivo.read()
+    admin = psycopg2.connect(DSN)
+    admin.autocommit = True
+    with admin.cursor() as cur:
+        cur.execute(f"CREATE SCHEMA {nome};")
+        cur.execute(f"SET search_path TO {nome}, public;")
+        cur.execute(ddl)
+    # Leituras sempre na conexão do teste
+    database.desativar_replicas()
+    try:
+        yield nome
+    finally:
+        with admin.cursor() as cur:
+            cur.execute(f"DROP SCHEMA {nome} CASCADE;")
+        admin.close()
+
+@pytest.fixture
+def conectar(schema):
+    """Fábrica de conexões (ConexaoComOrcamento) com search_path no schema do teste"""
+    abertas = []
+
+    def _conectar(autocommit=False):
+        conn = psycopg2.connect(DSN, options=f"-c search_path={schema},public",
+                                connection_factory=database.ConexaoComOrcamento)
+        conn.autocommit = autocommit
+        abertas.append(conn)
+        return conn
+
+    yield _conectar
+    for conn in abertas:
+        if not conn.closed:
+            conn.close()
+
+@pytest.fixture
+def conn(conectar):
+    return conectar()
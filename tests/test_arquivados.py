@@ -0,0 +1,40 @@
+# Pedidos arquivados (archive.py) continuam contando na demanda: histórico da
+# previsão e necessidade de ingredientes.
+
+from datetime import date, datetime, time
+
+import archive
+import forecast
+import purchasing
+
+DIA = date(2000, 1, 3)
+
+def _pedidos_entregues(conn, quantidade):
+    """Cardápio próprio da unidade 2 em DIA com pedidos entregues; retorna o id do cardápio"""
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO Cardapio (data_inicio, data_fim, tipo, observacao, id_unidade)
+            VALUES (%s, %s, 'almoco', 'Histórico', 2) RETURNING id_cardapio;
+        """, (DIA, DIA))
+        id_cardapio = cur.fetchone()[0]
+        cur.execute("""
+            INSERT INTO Pedido (data_hora, status_do_pedido, pedido_usuario, ped_cardapio)
+            SELECT %s, 'entregue', (SELECT MIN(id_usuario) FROM Usuario), %s FROM generate_series(1, %s);
+        """, (datetime.combine(DIA, time(12, 0)), id_cardapio, quantidade))
+    conn.commit()
+    return id_cardapio
+
+def test_historico_da_previsao_inclui_arquivo(conn):
+    _pedidos_entregues(conn, 4)
+    archive.arquivar(conn, date(2000, 1, 10), pausa=0)
+
+    series, matriz = forecast.carregar_historico(conn, DIA, date(2000, 1, 10))
+    assert matriz[series.index((2, 'almoco')), 0] == 4
+
+def test_demanda_de_compras_inclui_arquivo(conn):
+    id_cardapio = _pedidos_entregues(conn, 3)
+    archive.arquivar(conn, date(2000, 1, 10), pausa=0)
+
+    with conn.cursor() as cur:
+        cur.execute(purchasing.SQL_DEMANDA['pedidos'], {'inicio': DIA, 'fim': DIA})
+        assert dict(cur.fetchall()).get(id_cardapio) == 3
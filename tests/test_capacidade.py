@@ -0,0 +1,85 @@
+# Capacidade contada pela unidade do cardápio (vw_cardapio_unidade): pedidos em
+# um cardápio próprio da unidade (Cardapio.id_unidade) ocupam vagas dela, mesmo
+# que Unidade.id_cardapio aponte para outro cardápio.
+
+from datetime import date, datetime, time
+
+import database
+import subsidy
+
+UNIDADE = 2
+TIPO = 'almoco'
+
+def _cardapio_proprio_com_pedidos(conn, pedidos, status='pago'):
+    hoje = date.today()
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO Cardapio (data_inicio, data_fim, tipo, observacao, id_unidade)
+            VALUES (%s, %s, %s, 'Cardápio próprio', %s)
+            RETURNING id_cardapio;
+        """, (hoje, hoje, TIPO, UNIDADE))
+        id_cardapio = cur.fetchone()[0]
+        cur.execute("""
+            INSERT INTO Pedido (data_hora, status_do_pedido, pedido_usuario, ped_cardapio)
+            SELECT %s, %s, 1, %s FROM generate_series(1, %s);
+        """, (datetime.combine(hoje, time(12, 0)), status, id_cardapio, pedidos))
+        cur.execute("SELECT capacidade FROM Unidade WHERE id_unidade = %s;", (UNIDADE,))
+        capacidade = cur.fetchone()[0]
+    conn.commit()
+    return id_cardapio, capacidade
+
+def test_unidade_do_cardapio_proprio(conn):
+    id_cardapio, _ = _cardapio_proprio_com_pedidos(conn, 1)
+    assert database.get_unidade_do_cardapio(conn, id_cardapio) == (UNIDADE, TIPO, True)
+
+def test_capacidade_conta_cardapio_proprio(conn):
+    _, capacidade = _cardapio_proprio_com_pedidos(conn, 3)
+    hoje = date.today()
+    with conn.cursor() as cur:
+        cur.execute("SELECT pedidos, vagas_restantes FROM capacidade_unidades(%s, %s, %s, %s);",
+                    ([UNIDADE], hoje, hoje, [TIPO]))
+        assert cur.fetchone() == (3, capacidade - 3)
+        cur.execute("CALL VerificarCapacidadeUnidade(%s, %s, %s, NULL, NULL, NULL);", (UNIDADE, hoje, TIPO))
+        assert cur.fetchone()[1] == capacidade - 3
+
+def test_reserva_desconta_cardapio_proprio(conn):
+    _, capacidade = _cardapio_proprio_com_pedidos(conn, 3)
+    hoje = date.today()
+    assert database.reservar_vaga(conn, UNIDADE, hoje, TIPO) is not None
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT disponiveis FROM Vaga_Refeicao
+            WHERE id_unidade = %s AND data = %s AND tipo_refeicao = %s;
+        """, (UNIDADE, hoje, TIPO))
+        assert cur.fetchone()[0] == capacidade - 3 - 1
+
+def test_pendente_ocupa_vaga_na_grade_e_na_admissao(conn):
+    _, capacidade = _cardapio_proprio_com_pedidos(conn, 2, status='pendente')
+    hoje = date.today()
+    database.reservar_vaga(conn, UNIDADE, hoje, TIPO)
+    with conn.cursor() as cur:
+        cur.execute("""
+            SELECT disponiveis + 1 FROM Vaga_Refeicao
+            WHERE id_unidade = %s AND data = %s AND tipo_refeicao = %s;
+        """, (UNIDADE, hoje, TIPO))
+        admissao = cur.fetchone()[0]
+        cur.execute("SELECT vagas_restantes FROM capacidade_unidades(%s, %s, %s, %s);",
+                    ([UNIDADE], hoje, hoje, [TIPO]))
+        grade = cur.fetchone()[0]
+        cur.execute("CALL VerificarCapacidadeUnidade(%s, %s, %s, NULL, NULL, NULL);", (UNIDADE, hoje, TIPO))
+        procedure = cur.fetchone()[1]
+    assert admissao == grade == procedure == capacidade - 2
+
+def test_subsidio_atribui_pagamento_a_unidade_do_cardapio(conn):
+    _cardapio_proprio_com_pedidos(conn, 1)
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO Pagamento (valor_pago, forma_de_pagamento, pag_pedido, pag_categoria_usuario, pag_categoria_nome)
+            SELECT 6.10, 'pix', MAX(id_pedido), 1, cu.nome_categoria
+            FROM Pedido, Categoria_Usuario cu WHERE cu.id_usuario = 1
+            GROUP BY cu.nome_categoria LIMIT 1;
+        """)
+    conn.commit()
+    hoje = date.today()
+    base = subsidy.carregar(conn, hoje, hoje)
+    assert UNIDADE in base.unidades
@@ -0,0 +1,81 @@
+# Índice da catraca: deltas concorrendo com a recarga e filtro pela unidade.
+# Os testes de deltas não usam o banco (leituras simuladas); o de unidade usa.
+
+from datetime import date
+
+import turnstile
+
+ONTEM, HOJE = date(2024, 3, 4), date(2024, 3, 5)
+
+class IndiceSimulado(turnstile.IndiceCatraca):
+    """Índice com leituras em memória; recarrega para HOJE no meio da primeira leitura de delta"""
+
+    def __init__(self, linhas):
+        super().__init__(1, 'almoco')
+        self.linhas = linhas        # data -> [(matricula, id_usuario, nome, id_pedido, status)]
+        self.leituras = []
+        self.recarregar_durante_delta = False
+
+    def _ler(self, conn, data, tipo, filtro='', params=None):
+        self.leituras.append(data)
+        linhas = self.linhas.get(data, [])
+        if params and 'pedidos' in params:
+            linhas = [l for l in linhas if l[3] in params['pedidos']]
+            if self.recarregar_durante_delta:
+                self.recarregar_durante_delta = False
+                self.carregar(conn, HOJE, 'almoco')
+        return linhas
+
+def test_delta_lido_antes_da_recarga_e_relido():
+    indice = IndiceSimulado({
+        ONTEM: [('111', 1, 'Ana', 10, 'pago'), ('333', 3, 'Caio', 11, 'pago')],
+        HOJE: [('222', 2, 'Bia', 20, 'pago')],
+    })
+    indice.carregar(None, ONTEM, 'almoco')
+    indice.recarregar_durante_delta = True
+
+    indice.ao_notificar({'tabela': 'pedido', 'id': 11}, None)
+
+    # Carga, delta (ONTEM, descartado), recarga e releitura do delta no índice novo
+    assert indice.leituras == [ONTEM, ONTEM, HOJE, HOJE]
+    assert indice.consultar('333')[0] == turnstile.SEM_PEDIDO
+    assert indice.consultar('222')[0] == turnstile.LIBERADO
+    assert indice.total() == 1
+
+def test_delta_sem_recarga_aplica():
+    indice = IndiceSimulado({ONTEM: [('111', 1, 'Ana', 10, 'pago')]})
+    indice.carregar(None, ONTEM, 'almoco')
+    indice.linhas[ONTEM].append(('333', 3, 'Caio', 11, 'pago'))
+
+    indice.ao_notificar({'tabela': 'pedido', 'id': 11}, None)
+
+    assert indice.consultar('333') == (turnstile.LIBERADO, 11, 'Caio')
+
+def test_carga_so_com_pedidos_da_unidade(conn):
+    # Dois cardápios próprios vigentes hoje, um em cada unidade, com um pedido pago cada
+    hoje = date.today()
+    with conn.cursor() as cur:
+        cur.execute("SELECT id_usuario, nome_categoria FROM Categoria_Usuario ORDER BY id_usuario LIMIT 2;")
+        usuarios = cur.fetchall()
+        for unidade, (id_usuario, categoria) in zip((1, 2), usuarios):
+            cur.execute("""
+                INSERT INTO Cardapio (data_inicio, data_fim, tipo, observacao, id_unidade)
+                VALUES (%s, %s, 'jantar', 'Catraca', %s) RETURNING id_cardapio;
+            """, (hoje, hoje, unidade))
+            cur.execute("""
+                INSERT INTO Pedido (data_hora, status_do_pedido, pedido_usuario, ped_cardapio)
+                VALUES (now(), 'pago', %s, %s) RETURNING id_pedido;
+            """, (id_usuario, cur.fetchone()[0]))
+            cur.execute("""
+                INSERT INTO Pagamento (valor_pago, forma_de_pagamento, pag_pedido, pag_categoria_usuario, pag_categoria_nome)
+                VALUES (0, 'pix', %s, %s, %s);
+            """, (cur.fetchone()[0], id_usuario, categoria))
+        cur.execute("SELECT matricula_usuario FROM Usuario WHERE id_usuario = ANY(%s) ORDER BY id_usuario;",
+                    ([u[0] for u in usuarios],))
+        matricula_1, matricula_2 = [linha[0] for linha in cur.fetchall()]
+    conn.commit()
+
+    indice = turnstile.IndiceCatraca(2, 'jantar')
+    indice.carregar(conn, hoje)
+    assert indice.consultar(matricula_2)[0] == turnstile.LIBERADO
+    assert indice.consultar(matricula_1)[0] == turnstile.SEM_PEDIDO
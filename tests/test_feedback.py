@@ -0,0 +1,48 @@
+# Agregado de avaliações com transações confirmadas fora da ordem dos IDs.
+
+import feedback
+
+def _inserir(conn, nota):
+    with conn.cursor() as cur:
+        cur.execute("""
+            INSERT INTO Feedback (nota, feed_usuario)
+            VALUES (%s, (SELECT MIN(id_usuario) FROM Usuario))
+            RETURNING id_feedback;
+        """, (nota,))
+        return cur.fetchone()[0]
+
+def _total_agregado(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT COALESCE(SUM(total), 0), COALESCE(SUM(nota_5), 0) FROM Feedback_Semanal;")
+        return tuple(cur.fetchone())
+
+def test_transacoes_intercaladas_nao_perdem_avaliacoes(conectar):
+    conn, t1, t2 = conectar(), conectar(), conectar()
+    feedback.reconstruir(conn)
+    base_total, base_5 = _total_agregado(conn)
+
+    id_t1 = _inserir(t1, 5)    # id menor, ainda não confirmado
+    id_t2 = _inserir(t2, 1)
+    t2.commit()
+    assert id_t1 < id_t2
+
+    assert feedback.atualizar(conn) == 1
+    t1.commit()
+    assert feedback.atualizar(conn) == 1
+    assert feedback.atualizar(conn) == 0
+    assert _total_agregado(conn) == (base_total + 2, base_5 + 1)
+
+def test_marca_avanca_apos_janela(conectar):
+    conn = conectar()
+    feedback.reconstruir(conn)
+    ultimo = _inserir(conn, 3)
+    conn.commit()
+
+    assert feedback.atualizar(conn) == 1
+    # Janela zero: tudo o que já foi processado fica abaixo da marca
+    assert feedback.atualizar(conn, janela='0 seconds') == 0
+    with conn.cursor() as cur:
+        cur.execute("SELECT ultimo_id FROM Feedback_Marca WHERE nome = %s;", (feedback.MARCA,))
+        assert cur.fetchone()[0] == ultimo
+        cur.execute("SELECT COUNT(*) FROM Feedback_Processado;")
+        assert cur.fetchone()[0] == 0
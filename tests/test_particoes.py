@@ -0,0 +1,33 @@
+# Migração para tabelas particionadas: índices preservados e poda por 'desde'.
+
+from datetime import date, timedelta
+
+import database
+import partitions
+
+def _indices(conn, tabela):
+    with conn.cursor() as cur:
+        cur.execute("SELECT indexname FROM pg_indexes WHERE schemaname = current_schema() AND tablename = %s;",
+                    (tabela,))
+        return {linha[0] for linha in cur.fetchall()}
+
+def test_migracao_preserva_indices(conn):
+    antes = _indices(conn, 'pedido')
+    assert {'idx_pedido_usuario_data', 'idx_pedido_cardapio_data'} <= antes
+
+    partitions.migrar(conn, pausa=0)
+
+    depois = _indices(conn, 'pedido')
+    assert {'idx_pedido_usuario_data', 'idx_pedido_cardapio_data'} <= depois
+    assert {'idx_pedido_usuario_data_legado', 'idx_pedido_cardapio_data_legado'} <= _indices(conn, 'pedido_legado')
+    with conn.cursor() as cur:
+        cur.execute("SELECT relkind FROM pg_class WHERE oid = 'idx_pedido_cardapio_data'::regclass;")
+        assert cur.fetchone()[0] == 'I'   # índice particionado, herdado por cada partição
+
+def test_listagens_com_desde(conn):
+    partitions.migrar(conn, pausa=0)
+    amanha = date.today() + timedelta(days=1)
+    assert database.get_all_pedidos(conn, amanha) == []
+    assert database.get_pedidos_page(conn, None, 10, amanha) == []
+    assert database.get_pagamentos_page(conn, None, 10, amanha) == []
+    assert len(database.get_pedidos_page(conn, None, 10, date(2000, 1, 1))) == len(database.get_pedidos_page(conn, None, 10))
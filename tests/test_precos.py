@@ -0,0 +1,37 @@
+# Vigências de Tabela_Preco não se sobrepõem para a mesma categoria e refeição.
+
+from datetime import date
+
+import psycopg2
+import pytest
+
+import pricing
+
+def _inserir(cur, categoria, inicio, fim, valor):
+    cur.execute("""
+        INSERT INTO Tabela_Preco (nome_categoria, tipo_refeicao, data_inicio, data_fim, valor)
+        VALUES (%s, 'almoco', %s, %s, %s);
+    """, (categoria, inicio, fim, valor))
+
+def test_faixa_sobreposta_e_rejeitada(conn):
+    # A carga inicial tem 'servidor'/'almoco' vigente desde 2024-01-01, sem fim
+    with conn.cursor() as cur:
+        with pytest.raises(psycopg2.errors.ExclusionViolation):
+            _inserir(cur, 'servidor', date(2025, 1, 1), None, 20.00)
+    conn.rollback()
+
+def test_reajuste_fechando_a_faixa_atual(conn):
+    with conn.cursor() as cur:
+        cur.execute("""
+            UPDATE Tabela_Preco SET data_fim = '2024-12-31'
+            WHERE nome_categoria = 'servidor' AND tipo_refeicao = 'almoco' AND data_fim IS NULL;
+        """)
+        _inserir(cur, 'servidor', date(2025, 1, 1), None, 20.00)
+        # Outra categoria no mesmo período não conflita
+        _inserir(cur, 'visitante', date(2024, 6, 1), None, 25.00)
+    conn.commit()
+
+    tabela = pricing.TabelaPrecos()
+    tabela.carregar(conn)
+    assert tabela.preco('servidor', 'almoco', date(2024, 12, 31)) == 15.20
+    assert tabela.preco('servidor', 'almoco', date(2025, 1, 1)) == 20.00
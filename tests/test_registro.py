@@ -0,0 +1,65 @@
+# Registro no caixa: só a perda de conexão desvia para a fila local; cancelamento
+# e tempo esgotado não gravam nada. Não usa o banco.
+
+import psycopg2
+import pytest
+
+import database
+import main
+
+class FilaSimulada:
+    def __init__(self):
+        self.pedidos, self.pagamentos, self.notificacoes = [], [], 0
+
+    def registrar_pedido(self, dados):
+        self.pedidos.append(dados)
+        return -len(self.pedidos)
+
+    def registrar_pagamento(self, dados):
+        self.pagamentos.append(dados)
+        return -len(self.pagamentos)
+
+    def notificar(self):
+        self.notificacoes += 1
+
+class ConexaoSimulada:
+    closed = False
+    revertida = False
+
+    def rollback(self):
+        self.revertida = True
+
+class AdmissaoQueFalha:
+    def __init__(self, erro):
+        self.erro = erro
+
+    def admitir(self, conn, pedido_data, unidade=None):
+        raise self.erro
+
+@pytest.fixture(autouse=True)
+def sem_write_behind(monkeypatch):
+    monkeypatch.setattr(database, 'get_db_config', lambda *a, **k: {})
+
+@pytest.mark.parametrize('erro', [
+    database.TempoEsgotado('cancelado'),
+    database.TempoEsgotado('statement_timeout', 'add_pedido', 3000),
+    database.TempoEsgotado('lock_timeout', 'add_pedido', 1000),
+])
+def test_pedido_cancelado_nao_vai_para_a_fila(erro):
+    fila, conn = FilaSimulada(), ConexaoSimulada()
+    main.registrar_pedido(conn, (fila, fila), {'pedido_usuario': 1}, AdmissaoQueFalha(erro))
+    assert fila.pedidos == [] and conn.revertida
+
+def test_pedido_sem_conexao_vai_para_a_fila():
+    fila = FilaSimulada()
+    erro = psycopg2.OperationalError("server closed the connection unexpectedly")
+    main.registrar_pedido(ConexaoSimulada(), (fila, fila), {'pedido_usuario': 1}, AdmissaoQueFalha(erro))
+    assert len(fila.pedidos) == 1 and fila.notificacoes == 1
+
+def test_pagamento_cancelado_nao_vai_para_a_fila(monkeypatch):
+    def cancelar(conn, dados):
+        raise database.TempoEsgotado('cancelado', 'add_pagamento')
+    monkeypatch.setattr(database, 'add_pagamento', cancelar)
+    fila = FilaSimulada()
+    main.registrar_pagamento(ConexaoSimulada(), (fila, fila), {'pag_pedido': 7})
+    assert fila.pagamentos == []
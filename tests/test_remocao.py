@@ -0,0 +1,11 @@
+# delete_* informam se o ID existia: a API responde 404 (e o TUI avisa)
+# em vez de confirmar a remoção de um registro inexistente.
+
+import database
+
+def test_delete_informa_id_inexistente(conn):
+    id_pedido = database.add_pedido(conn, {'pedido_usuario': 1, 'ped_cardapio': 1, 'status_do_pedido': 'pendente'})
+    assert database.delete_pedido(conn, id_pedido) is True
+    assert database.delete_pedido(conn, id_pedido) is False
+    assert database.delete_pagamento(conn, -1) is False
+    assert database.delete_user(conn, -1) is False
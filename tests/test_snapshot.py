@@ -0,0 +1,20 @@
+# A sincronização lê o delta no primário: o now() de uma réplica atrasada
+# não pode virar a marca da próxima consulta.
+
+from datetime import datetime, timezone
+
+import database
+import snapshot
+
+def test_sincronizar_le_no_primario(monkeypatch):
+    lidos_no_primario = []
+
+    def delta(conn, desde):
+        lidos_no_primario.append(getattr(database._leitura_local, 'primario', False))
+        return [(1, '2024001', '000.000.000-00', 'Fulano', 'f@ru', None, 'ativo')], [], datetime.now(timezone.utc)
+
+    monkeypatch.setattr(database, 'get_users_delta', delta)
+    copia = snapshot.SnapshotUsuarios()
+    assert copia.sincronizar(None) == 1
+    assert lidos_no_primario == [True]
+    assert not getattr(database._leitura_local, 'primario', False)
@@ -0,0 +1,39 @@
+# Frações de subsídio atuais derivadas de Tabela_Preco e CATEGORIAS_CONFIG.
+
+from datetime import date
+
+import pricing
+import subsidy
+
+def _tabela(conn):
+    tabela = pricing.TabelaPrecos()
+    tabela.carregar(conn)
+    return tabela
+
+def test_subsidio_atual_da_carga_inicial(conn):
+    atual = subsidy.subsidio_atual(_tabela(conn), date(2024, 6, 1))
+    # estudante_regular: (2,35 + 6,10 + 6,10) / (5,85 + 15,20 + 15,20)
+    assert atual == {'total': 1.0, 'parcial': round(1 - 14.55 / 36.25, 4), 'sem_subsidio': 0.0}
+
+    cenario = subsidy.cenario(atual, nome='atual')
+    assert cenario.subsidio == atual
+
+def test_subsidio_atual_acompanha_reajuste(conn):
+    with conn.cursor() as cur:
+        cur.execute("""
+            UPDATE Tabela_Preco SET data_fim = '2024-12-31'
+            WHERE nome_categoria = 'estudante_regular' AND data_fim IS NULL;
+        """)
+        cur.execute("""
+            INSERT INTO Tabela_Preco (nome_categoria, tipo_refeicao, data_inicio, valor)
+            SELECT 'estudante_regular', tipo, '2025-01-01', valor
+            FROM (VALUES ('cafe', 2.90), ('almoco', 7.60), ('jantar', 7.60)) AS v(tipo, valor);
+        """)
+    conn.commit()
+    tabela = _tabela(conn)
+
+    assert subsidy.subsidio_atual(tabela, date(2024, 12, 31))['parcial'] == round(1 - 14.55 / 36.25, 4)
+    assert subsidy.subsidio_atual(tabela, date(2025, 1, 1))['parcial'] == round(1 - 18.10 / 36.25, 4)
+    # Grade sem --parcial usa a fração vigente
+    assert subsidy.grade(subsidy.subsidio_atual(tabela, date(2025, 1, 1)), reajuste=[1.1])[0].subsidio['parcial'] \
+        == round(1 - 18.10 / 36.25, 4)
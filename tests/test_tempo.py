@@ -0,0 +1,61 @@
+# Tradução de cancelamentos em TempoEsgotado: só quando o limite é nosso (orçamento,
+# prazo) ou o usuário cancelou; o lock_timeout traduzido continua LockNotAvailable.
+
+import threading
+
+import psycopg2
+import pytest
+
+import archive
+import database
+
+def _pedido_encerrado_com_pagamento(conn):
+    with conn.cursor() as cur:
+        cur.execute("SELECT id_usuario, nome_categoria FROM Categoria_Usuario ORDER BY id_usuario LIMIT 1;")
+        id_usuario, categoria = cur.fetchone()
+        cur.execute("""
+            INSERT INTO Pedido (data_hora, status_do_pedido, pedido_usuario, ped_cardapio)
+            VALUES ('2000-01-01 12:00', 'entregue', %s, (SELECT MIN(id_cardapio) FROM Cardapio))
+            RETURNING id_pedido;
+        """, (id_usuario,))
+        id_pedido = cur.fetchone()[0]
+        cur.execute("""
+            INSERT INTO Pagamento (valor_pago, forma_de_pagamento, pag_pedido, pag_categoria_usuario, pag_categoria_nome)
+            VALUES (5.20, 'pix', %s, %s, %s);
+        """, (id_pedido, id_usuario, categoria))
+    conn.commit()
+    return id_pedido
+
+def test_arquivamento_com_prazo_tenta_de_novo_apos_bloqueio(conectar):
+    conn, outra = conectar(), conectar()
+    id_pedido = _pedido_encerrado_com_pagamento(conn)
+    with outra.cursor() as cur:
+        cur.execute("SELECT 1 FROM Pagamento WHERE pag_pedido = %s FOR UPDATE;", (id_pedido,))
+    threading.Timer(0.3, outra.rollback).start()
+
+    with database.prazo(30):
+        totais = archive.arquivar(conn, '2000-01-02', pausa=0.2, lock_timeout='100ms')
+
+    assert totais == {'pedidos': 1, 'pagamentos': 1}
+
+def test_lock_timeout_do_orcamento_e_lock_not_available(conectar):
+    conn, outra = conectar(), conectar()
+    id_pedido = _pedido_encerrado_com_pagamento(conn)
+    with outra.cursor() as cur:
+        cur.execute("SELECT 1 FROM Pedido WHERE id_pedido = %s FOR UPDATE;", (id_pedido,))
+
+    with pytest.raises(psycopg2.errors.LockNotAvailable) as erro:
+        database.delete_pedido(conn, id_pedido)
+
+    assert isinstance(erro.value, database.TempoEsgotado)
+    assert erro.value.motivo == 'lock_timeout'
+    outra.rollback()
+
+def test_cancelamento_externo_sem_limite_nao_e_traduzido(conectar):
+    conn = conectar()
+    threading.Timer(0.2, conn.cancel).start()
+    with pytest.raises(psycopg2.errors.QueryCanceled) as erro:
+        with conn.cursor() as cur:
+            cur.execute("SELECT pg_sleep(5);")
+    assert not isinstance(erro.value, database.TempoEsgotado)
+    conn.rollback()
@@ -15,7 +15,8 @@
 
 import questionary
 import os
-from datetime import datetime
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
 
 def clear_screen():
     """Limpa a tela do terminal"""
@@ -45,15 +46,37 @@ def print_section_header(title):
     print("╚═══════════════════════════════════════════════════════════════╝")
     print()
 
-def main_menu():
-    """Menu principal do sistema"""
+def main_menu(fila_local=None):
+    """Menu principal do sistema (fila_local: resumo da fila offline, se houver pendências)"""
     print_main_ascii_art()
+    choices = [
+        "Gerenciar Usuários",
+        "Gerenciar Pedidos", 
+        "Gerenciar Pagamentos",
+        "Relatórios",
+        "Buscar",
+    ]
+    if fila_local and (fila_local['pendente'] or fila_local['conflito']):
+        choices.append(f"Fila Offline ({fila_local['pendente']} pendentes, {fila_local['conflito']} conflitos)")
+    choices.append("Sair")
+    choice = questionary.select(
+        "Selecione uma opção:",
+        choices=choices
+    ).ask()
+    
+    return choice if choice else "Sair"
+
+def offline_menu(fila_local):
+    """Menu do modo offline: só registros que podem esperar na fila local"""
+    print_section_header("MODO OFFLINE - FILA LOCAL")
+    print(f"[AVISO] Sem conexão com o banco. {fila_local['pendente']} operações aguardando envio, "
+          f"{fila_local['conflito']} conflitos.\n")
     choice = questionary.select(
         "Selecione uma opção:",
         choices=[
-            "Gerenciar Usuários",
-            "Gerenciar Pedidos", 
-            "Gerenciar Pagamentos",
+            "Cadastrar Pedido",
+            "Cadastrar Pagamento",
+            "Ver Fila Offline",
             "Sair"
         ]
     ).ask()
@@ -110,6 +133,20 @@ def pagamento_management_menu():
     
     return choice if choice else "Voltar ao Menu Principal"
 
+def relatorios_menu():
+    """Menu de relatórios"""
+    print_section_header("RELATÓRIOS")
+    choice = questionary.select(
+        "Selecione um relatório:",
+        choices=[
+            "Capacidade da Semana",
+            "Avaliações (Feedback)",
+            "Voltar ao Menu Principal"
+        ]
+    ).ask()
+    
+    return choice if choice else "Voltar ao Menu Principal"
+
 # ==================== FORMULÁRIOS DE ENTRADA ====================
 
 def get_user_data(existing_user=None):
@@ -192,8 +229,13 @@ def get_user_data(existing_user=None):
         'status_usuario': status_usuario
     }
 
-def get_pedido_data(existing_pedido=None, usuarios_disponiveis=None):
-    """Coleta dados do pedido usando estrutura real do Supabase"""
+def get_pedido_data(existing_pedido=None, usuarios_disponiveis=None, cardapio_vigente=None, tipo_padrao='almoco'):
+    """
+    Coleta dados do pedido usando estrutura real do Supabase
+
+    cardapio_vigente: função tipo → linha do cardápio em vigor (menus.CardapiosVigentes),
+    usada para sugerir o cardápio em pedidos novos
+    """
     print("\nDados do Pedido:")
     print("[DICA] Todos os campos marcados com * são obrigatórios")
     
@@ -240,12 +282,30 @@ def get_pedido_data(existing_pedido=None, usuarios_disponiveis=None):
             return None
         pedido_usuario = int(pedido_usuario)
     
-    # Buscar cardápios disponíveis seria ideal aqui, mas para simplificar vamos pedir o ID
-    print("\n[DICA] ID do Cardápio: Digite um número (ex: 1=almoço, 2=jantar, 3=café)")
-    print("[DICA] Use valores de 1 a 7 conforme os cardápios disponíveis no sistema")
+    cardapio_padrao = str(existing_pedido[5]) if existing_pedido and len(existing_pedido) > 5 else "1"
+    if cardapio_vigente and not existing_pedido:
+        # Pedido novo: sugere o cardápio em vigor hoje para a refeição escolhida
+        tipo = questionary.select(
+            "Refeição *:",
+            choices=["cafe", "almoco", "jantar"],
+            default=tipo_padrao
+        ).ask()
+        if not tipo:
+            return None
+        vigente = cardapio_vigente(tipo)
+        if vigente:
+            print(f"\n[INFO] Cardápio vigente: ID {vigente[0]} - {vigente[5] or vigente[1]} "
+                  f"({vigente[3].strftime('%d/%m')} a {vigente[4].strftime('%d/%m')})")
+            cardapio_padrao = str(vigente[0])
+        else:
+            print(f"\n[AVISO] Nenhum cardápio de {tipo} em vigor hoje: informe o ID manualmente.")
+            cardapio_padrao = ""
+    else:
+        print("\n[DICA] ID do Cardápio: Digite um número (ex: 1=almoço, 2=jantar, 3=café)")
+        print("[DICA] Use valores de 1 a 7 conforme os cardápios disponíveis no sistema")
     ped_cardapio = questionary.text(
         "ID do Cardápio *:",
-        default=str(existing_pedido[5]) if existing_pedido and len(existing_pedido) > 5 else "1",
+        default=cardapio_padrao,
         validate=lambda x: x.isdigit() and int(x) > 0 if x else False
     ).ask()
     if not ped_cardapio:
@@ -264,7 +324,7 @@ def get_pedido_data(existing_pedido=None, usuarios_disponiveis=None):
         'status_do_pedido': status_do_pedido
     }
 
-def get_pagamento_data(existing_pagamento=None, pedidos_disponiveis=None):
+def get_pagamento_data(existing_pagamento=None, pedidos_disponiveis=None, calcular_valor=None):
     """
     FORMULÁRIO MAIS COMPLEXO - CADASTRO/EDIÇÃO DE PAGAMENTO
     
@@ -275,7 +335,7 @@ def get_pagamento_data(existing_pagamento=None, pedidos_disponiveis=None):
     - Validação de valores decimais (aceita vírgula e ponto)
     - Prevenção de pagamentos duplicados
     - Integração com categorias de usuário
-    - Cálculos automáticos por tipo de categoria
+    - Cálculos automáticos por tipo de categoria (calcular_valor(id_pedido, categoria))
     
     REGRAS DE NEGÓCIO IMPLEMENTADAS:
     - Estudante assistência: R$ 0,00 (gratuito)
@@ -354,11 +414,29 @@ def get_pagamento_data(existing_pagamento=None, pedidos_disponiveis=None):
         pag_pedido = int(pag_pedido)
         pag_categoria_usuario = pag_pedido
     
+    print("\n[DICA] Categoria: Selecione o tipo de usuário para definir preços")
+    print("[INFO] estudante_assistencia=R$0.00, estudante_regular=desconto 60%, servidor=preço integral")
+    pag_categoria_nome = questionary.select(
+        "Categoria do usuário *:",
+        choices=["estudante_assistencia", "estudante_regular", "servidor"],
+        default=existing_pagamento[6] if existing_pagamento else "estudante_regular"
+    ).ask()
+    if not pag_categoria_nome:
+        return None
+    
+    # Valor sugerido pela tabela de preços (categoria, tipo de refeição e data do pedido)
+    valor_sugerido = calcular_valor(pag_pedido, pag_categoria_nome) if calcular_valor else None
+    if valor_sugerido is not None:
+        print(f"\n[INFO] Valor pela tabela de preços: R$ {valor_sugerido:.2f} (Enter para confirmar)")
+        valor_padrao = f"{valor_sugerido:.2f}"
+    else:
+        valor_padrao = str(existing_pagamento[3]) if existing_pagamento else "0.00"
+    
     print("\n[DICA] Valor: Digite o valor em reais com ponto decimal (ex: 15.50, 0.00)")
     print("[DICA] Para estudantes com assistência, use 0.00 (gratuito)")
     valor_pago = questionary.text(
         "Valor pago (0.00) *:",
-        default=str(existing_pagamento[3]) if existing_pagamento else "0.00",
+        default=valor_padrao,
         validate=lambda x: is_valid_decimal(x) if x else False
     ).ask()
     if not valor_pago:
@@ -371,14 +449,6 @@ def get_pagamento_data(existing_pagamento=None, pedidos_disponiveis=None):
         default=existing_pagamento[4] if existing_pagamento else "vale"
     ).ask()
     
-    print("\n[DICA] Categoria: Selecione o tipo de usuário para definir preços")
-    print("[INFO] estudante_assistencia=R$0.00, estudante_regular=desconto 60%, servidor=preço integral")
-    pag_categoria_nome = questionary.select(
-        "Categoria do usuário *:",
-        choices=["estudante_assistencia", "estudante_regular", "servidor"],
-        default=existing_pagamento[6] if existing_pagamento else "estudante_regular"
-    ).ask()
-    
     return {
         'pag_pedido': pag_pedido,
         'valor_pago': float(valor_pago.replace(',', '.')),
@@ -413,6 +483,42 @@ def is_valid_decimal(value):
     except ValueError:
         return False
 
+def get_busca():
+    """Solicita o texto e as áreas da busca; retorna (termo, entidades) ou None se cancelado"""
+    print_section_header("BUSCA")
+    print("[DICA] Palavras parciais funcionam: 'mar sil' encontra 'Maria Silva'.")
+    termo = questionary.text("Buscar (ou Enter para cancelar):").ask()
+    if not termo or not termo.strip():
+        return None
+
+    areas = {
+        "Usuários (nome e e-mail)": 'usuario',
+        "Refeições (nome e descrição)": 'refeicao',
+        "Comentários de avaliações": 'feedback',
+    }
+    escolhidas = questionary.checkbox(
+        "Onde buscar:",
+        choices=[questionary.Choice(nome, checked=True) for nome in areas]
+    ).ask()
+    if escolhidas is None:
+        return None
+    return termo.strip(), [areas[nome] for nome in escolhidas] or list(areas.values())
+
+def _data_valida(valor):
+    try:
+        date.fromisoformat(valor)
+        return True
+    except ValueError:
+        return "Use o formato AAAA-MM-DD"
+
+def get_listagem_desde():
+    """Data inicial da listagem (lê só as partições a partir dela); None lista tudo"""
+    desde = questionary.text(
+        "Listar a partir de (AAAA-MM-DD, ou Enter para todos):",
+        validate=lambda x: _data_valida(x) if x else True
+    ).ask()
+    return date.fromisoformat(desde) if desde else None
+
 def get_user_id(action_type):
     """Solicita ID do usuário com dicas de validação"""
     print("\n[DICA] Para encontrar o ID do usuário, use 'Listar Usuários' no menu principal.")
@@ -541,6 +647,100 @@ def display_pagamentos(pagamentos):
         print(f"{pagamento[0]:<4} {pagamento[2]:<20} {valor_formatado:<12} {pagamento[4]:<12} {categoria:<15}")
 
 
+def display_capacidade_grade(linhas):
+    """
+    Exibe a ocupação em grade: uma linha por unidade e data, uma coluna por tipo
+    de refeição no formato pedidos/capacidade (e previsão, quando houver).
+    """
+    print("\nCAPACIDADE DAS UNIDADES")
+    print("=" * 95)
+    
+    if not linhas:
+        print("[VAZIO] Nenhuma unidade encontrada.")
+        return
+    
+    tipos = ['cafe', 'almoco', 'jantar']
+    grade = {}
+    for id_unidade, nome, data, tipo, capacidade, pedidos, _, pode_atender, previsao in linhas:
+        celula = f"{pedidos}/{capacidade}"
+        if previsao is not None:
+            celula += f" (~{previsao:.0f})"
+        if not pode_atender:
+            celula += " !"
+        grade.setdefault((id_unidade, nome, data), {})[tipo] = celula
+    
+    print(f"{'Unidade':<25} {'Data':<12} {'Café':<18} {'Almoço':<18} {'Jantar':<18}")
+    print("-" * 95)
+    for (_, nome, data), celulas in grade.items():
+        colunas = ''.join(f"{celulas.get(t, '-'):<18} " for t in tipos)
+        print(f"{nome[:24]:<25} {data.strftime('%d/%m/%Y'):<12} {colunas}")
+    print("\n[INFO] pedidos/capacidade (~previsão); ! = sem vagas")
+
+def display_avaliacoes(resumo, semanas):
+    """Exibe média e distribuição das notas por unidade/cardápio"""
+    print(f"\nAVALIAÇÕES - ÚLTIMAS {semanas} SEMANAS")
+    print("=" * 95)
+    
+    if not resumo:
+        print("[VAZIO] Nenhuma avaliação no período.")
+        return
+    
+    print(f"{'Unidade':<25} {'Cardápio':<14} {'Aval.':>6} {'Média':>6}   {'Distribuição (1★ a 5★)'}")
+    print("-" * 95)
+    for _, nome, id_cardapio, tipo, total, media, *notas in resumo:
+        cardapio = f"#{id_cardapio} {tipo}" if tipo else "-"
+        distribuicao = ' '.join(f"{n * 100 // total:>3}%" for n in notas) if total else ''
+        media_texto = f"{media:.2f}" if media is not None else "-"
+        print(f"{nome[:24]:<25} {cardapio:<14} {total:>6} {media_texto:>6}   {distribuicao}")
+
+def display_busca(termo, resultados, pagina):
+    """Exibe uma página de resultados da busca textual"""
+    print(f"\nRESULTADOS PARA '{termo}' - PÁGINA {pagina}")
+    print("=" * 95)
+    
+    if not resultados:
+        print("[VAZIO] Nenhum resultado encontrado.")
+        return
+    
+    rotulos = {'usuario': 'Usuário', 'refeicao': 'Refeição', 'feedback': 'Avaliação'}
+    print(f"{'Tipo':<10} {'ID':<6} {'Título':<30} {'Trecho'}")
+    print("-" * 95)
+    for entidade, id_registro, titulo, trecho, _ in resultados:
+        trecho = ' '.join((trecho or '').split())
+        print(f"{rotulos[entidade]:<10} {id_registro:<6} {(titulo or '')[:29]:<30} {trecho[:60]}")
+
+def display_purge_result(contagens):
+    """Exibe o resumo de uma exclusão em cascata de usuário"""
+    print("\n[SUCESSO] Usuário removido com todo o histórico:")
+    print("-" * 50)
+    print(f"Pagamentos: {contagens.get('pagamentos', 0)}")
+    print(f"Pedidos: {contagens.get('pedidos', 0)}")
+    print(f"Feedbacks: {contagens.get('feedbacks', 0)}")
+    print(f"Categorias: {contagens.get('categorias', 0)}")
+    if 'pedidos_arquivados' in contagens:
+        print(f"Pedidos arquivados: {contagens['pedidos_arquivados']}")
+        print(f"Pagamentos arquivados: {contagens['pagamentos_arquivados']}")
+    print()
+
+def display_fila_local(resumo, conflitos, conectado):
+    """Exibe a situação da fila offline e as operações recusadas pelo banco"""
+    print("\nFILA OFFLINE")
+    print("=" * 90)
+    print(f"Envio: {'conectado' if conectado else 'aguardando conexão'}")
+    print(f"Pendentes: {resumo['pendente']}  Aplicadas: {resumo['aplicada']}  Conflitos: {resumo['conflito']}")
+    
+    if not conflitos:
+        return
+    
+    print(f"\n{'Seq':<6} {'Tipo':<10} {'Dados':<40} {'Erro'}")
+    print("-" * 90)
+    for seq, tipo, dados, erro in conflitos:
+        if tipo == 'pedido':
+            resumo_dados = f"usuário {dados['pedido_usuario']}, cardápio {dados['ped_cardapio']}"
+        else:
+            resumo_dados = f"pedido {dados['pag_pedido']}, R$ {dados['valor_pago']:.2f}"
+        print(f"{seq:<6} {tipo:<10} {resumo_dados:<40} {erro}")
+
 def show_current_user_data(user):
     """Exibe dados atuais do usuário usando estrutura real do Supabase"""
     print(f"\nDADOS ATUAIS DO USUÁRIO (ID: {user[0]})")
@@ -576,6 +776,72 @@ def show_current_pagamento_data(pagamento):
     print(f"Categoria: {pagamento[6] if len(pagamento) > 6 else 'N/A'}")
     print()
 
+# Campos editáveis: (chave do formulário, rótulo, posição na linha de get_*_by_id)
+CAMPOS_EDITAVEIS = {
+    'usuario': (('matricula_usuario', 'Matrícula', 1), ('CPF_usuario', 'CPF', 2), ('nome_usuario', 'Nome', 3),
+                ('email_usuario', 'Email', 4), ('telefone_usuario', 'Telefone', 5), ('status_usuario', 'Status', 6)),
+    'pedido': (('pedido_usuario', 'Usuário (ID)', 1), ('ped_cardapio', 'Cardápio (ID)', 5),
+               ('status_do_pedido', 'Status', 4)),
+    'pagamento': (('pag_pedido', 'Pedido', 1), ('valor_pago', 'Valor Pago', 3),
+                  ('forma_de_pagamento', 'Forma', 4), ('pag_categoria_nome', 'Categoria', 6)),
+}
+
+def _mesmo_valor(a, b):
+    """Compara valores do banco e do formulário (Decimal × float, int × texto, None × '')"""
+    if a in (None, '') or b in (None, ''):
+        return a in (None, '') and b in (None, '')
+    if isinstance(a, (int, float, Decimal)) or isinstance(b, (int, float, Decimal)):
+        try:
+            return Decimal(str(a)) == Decimal(str(b))
+        except InvalidOperation:
+            pass
+    return str(a) == str(b)
+
+def show_conflito_versao(tabela, lido, atual, proposto):
+    """
+    CONFLITO DE EDIÇÃO (CONCORRÊNCIA OTIMISTA)
+
+    Mostra, campo a campo, o valor lido ao abrir a edição, o valor gravado por
+    outra operação nesse meio tempo e o valor digitado pelo operador.
+    Marcas: * alterado pela outra operação; ! alterado pelos dois, com valores diferentes.
+    """
+    print(f"\n[AVISO] Este registro foi alterado por outra operação enquanto você editava "
+          f"(versão {lido[-1]} → {atual[-1]}).")
+    print(f"\n   {'Campo':<16} {'Quando abriu':<24} {'Agora no banco':<24} {'Sua edição':<24}")
+    print("-" * 94)
+    for chave, rotulo, i in CAMPOS_EDITAVEIS[tabela]:
+        outro = not _mesmo_valor(lido[i], atual[i])
+        seu = not _mesmo_valor(lido[i], proposto.get(chave))
+        marca = '!' if outro and seu and not _mesmo_valor(atual[i], proposto.get(chave)) else '*' if outro else ' '
+        print(f" {marca} {rotulo:<16} {str(lido[i] if lido[i] is not None else '-')[:24]:<24} "
+              f"{str(atual[i] if atual[i] is not None else '-')[:24]:<24} "
+              f"{str(proposto.get(chave) if proposto.get(chave) is not None else '-')[:24]:<24}")
+    print()
+
+def escolher_resolucao_conflito():
+    """Retorna 'mesclar', 'editar' ou None (descartar a edição)"""
+    escolha = questionary.select(
+        "Como continuar?",
+        choices=[
+            "Gravar só os campos que alterei sobre a versão atual",
+            "Editar novamente a partir da versão atual",
+            "Descartar minha edição",
+        ]
+    ).ask()
+    if escolha and escolha.startswith("Gravar"):
+        return 'mesclar'
+    if escolha and escolha.startswith("Editar"):
+        return 'editar'
+    return None
+
+def mesclar_edicao(tabela, lido, atual, proposto):
+    """Campos que o operador não mudou assumem o valor atual do banco; os demais ficam com a edição"""
+    mesclado = dict(proposto)
+    for chave, _, i in CAMPOS_EDITAVEIS[tabela]:
+        if _mesmo_valor(lido[i], proposto.get(chave)):
+            mesclado[chave] = atual[i]
+    return mesclado
+
 def get_status_text(status):
     """Retorna texto indicador correspondente ao status usando os status reais do Supabase"""
     status_map = {
@@ -0,0 +1,403 @@
+# CATRACA - ELEGIBILIDADE POR MATRÍCULA
+#
+# Responde, na entrada do restaurante, se a matrícula tem um pedido pago para a
+# refeição atual nesta unidade. A resposta vem de um índice em memória (dict por matrícula),
+# sem ida ao banco por pessoa.
+#
+# CARGA E ATUALIZAÇÃO:
+# - O índice é carregado de Usuario ⨝ Pedido ⨝ Pagamento para os cardápios
+#   vigentes do tipo de refeição atual que pertencem à unidade da catraca
+#   (vw_cardapio_unidade, como capacidade e admissão) - pedidos do dia
+# - Com o ouvinte de alterações (notifications.py), cada evento de pedido,
+#   pagamento ou usuário relê só as linhas afetadas; um pagamento feito no
+#   caixa libera a catraca em instantes
+# - Na troca de refeição (café → almoço → jantar) ou de dia, o índice é recarregado
+#
+# GRAVAÇÃO DAS ENTREGAS:
+# - A passagem marca o pedido como entregue em memória na hora (evita entrada dupla)
+# - Uma thread grava os pedidos entregues em lotes: um único UPDATE por lote
+#
+# USO:
+#   python turnstile.py                  # lê matrículas da entrada padrão (leitor de código de barras)
+#   python turnstile.py --unidade 2      # unidade da catraca (padrão: UNIDADE_PADRAO no .env)
+#   python turnstile.py --tipo almoco    # força o tipo de refeição
+
+import argparse
+import sys
+import threading
+import time
+from datetime import date, datetime, time as hora
+import psycopg2
+import database
+import notifications
+
+# Janelas de atendimento de cada refeição (fora delas a catraca não libera)
+JANELAS_REFEICAO = {
+    'cafe': (hora(6, 0), hora(10, 0)),
+    'almoco': (hora(10, 30), hora(15, 0)),
+    'jantar': (hora(17, 0), hora(20, 30)),
+}
+
+# Pedidos pagos do dia nos cardápios da unidade vigentes do tipo de refeição
+SQL_ELEGIVEIS = """
+SELECT u.matricula_usuario, u.id_usuario, u.nome_usuario, p.id_pedido, p.status_do_pedido
+FROM vw_cardapio_unidade cu
+JOIN Cardapio c ON c.id_cardapio = cu.id_cardapio
+JOIN Pedido p ON p.ped_cardapio = c.id_cardapio
+JOIN Pagamento pg ON pg.pag_pedido = p.id_pedido
+JOIN Usuario u ON u.id_usuario = p.pedido_usuario
+WHERE cu.id_unidade = %(unidade)s
+  AND cu.tipo = %(tipo)s
+  AND %(data)s BETWEEN c.data_inicio AND c.data_fim
+  AND p.data_hora >= %(data)s AND p.data_hora < %(data)s::date + 1
+  AND p.status_do_pedido <> 'cancelado'
+"""
+
+LIBERADO = 'liberado'
+JA_ENTREGUE = 'ja_entregue'
+SEM_PEDIDO = 'sem_pedido'
+FORA_DE_HORARIO = 'fora_de_horario'
+
+def refeicao_atual(agora=None):
+    """Tipo de refeição servido no horário, ou None fora das janelas"""
+    agora = (agora or datetime.now()).time()
+    for tipo, (inicio, fim) in JANELAS_REFEICAO.items():
+        if inicio <= agora <= fim:
+            return tipo
+    return None
+
+class IndiceCatraca:
+    """
+    ÍNDICE DE ELEGIBILIDADE POR MATRÍCULA
+
+    matrícula → {'id_usuario', 'nome', 'pagos': {id_pedido}, 'entregues': {id_pedido}}
+
+    A consulta (consultar/registrar_passagem) só lê memória. Cargas e deltas
+    montam as linhas fora do lock e trocam/aplicam sob o lock.
+    """
+
+    def __init__(self, unidade, tipo=None):
+        self.unidade = unidade
+        self.tipo_fixo = tipo
+        self.data = None
+        self.tipo = None
+        self._geracao = 0                # muda a cada carga (deltas lidos antes são descartados)
+        self._lock = threading.Lock()
+        self._por_matricula = {}
+        self._matricula_do_pedido = {}   # id_pedido -> matrícula (para deltas)
+        self._matricula_do_usuario = {}  # id_usuario -> matrícula (troca de matrícula)
+        self._a_gravar = set()           # entregues na catraca ainda não gravados
+        self._sem_gravar = threading.Condition(self._lock)
+
+    # ---------- CARGA ----------
+
+    def carregar(self, conn, data=None, tipo=None):
+        """Recarrega o índice para a data/refeição (padrão: agora)"""
+        data = data or date.today()
+        tipo = tipo or self.tipo_fixo or refeicao_atual()
+        linhas = self._ler(conn, data, tipo) if tipo else []
+
+        with self._lock:
+            self.data, self.tipo = data, tipo
+            self._geracao += 1
+            self._por_matricula = {}
+            self._matricula_do_pedido = {}
+            self._matricula_do_usuario = {}
+            for linha in linhas:
+                self._incluir(linha)
+        return len(linhas)
+
+    def atualizar_refeicao(self, conn, agora=None):
+        """Recarrega se o dia ou a refeição mudaram; retorna True se recarregou"""
+        agora = agora or datetime.now()
+        tipo = self.tipo_fixo or refeicao_atual(agora)
+        with self._lock:
+            atual = (self.data, self.tipo)
+        if (agora.date(), tipo) == atual:
+            return False
+        self.carregar(conn, agora.date(), tipo)
+        return True
+
+    def _ler(self, conn, data, tipo, filtro='', params=None):
+        with conn.cursor() as cur:
+            cur.execute(SQL_ELEGIVEIS + filtro + ";",
+                        dict(params or {}, unidade=self.unidade, data=data, tipo=tipo))
+            linhas = cur.fetchall()
+        if not conn.autocommit:
+            conn.rollback()
+        return linhas
+
+    def _incluir(self, linha):
+        matricula, id_usuario, nome, id_pedido, status = linha
+        entrada = self._por_matricula.setdefault(
+            matricula, {'id_usuario': id_usuario, 'nome': nome, 'pagos': set(), 'entregues': set()}
+        )
+        entrada['nome'] = nome
+        if status == 'entregue' or id_pedido in self._a_gravar:
+            entrada['entregues'].add(id_pedido)
+        else:
+            entrada['pagos'].add(id_pedido)
+        self._matricula_do_pedido[id_pedido] = matricula
+        self._matricula_do_usuario[id_usuario] = matricula
+
+    def _remover_pedido(self, id_pedido):
+        matricula = self._matricula_do_pedido.pop(id_pedido, None)
+        entrada = self._por_matricula.get(matricula)
+        if entrada is None:
+            return
+        entrada['pagos'].discard(id_pedido)
+        entrada['entregues'].discard(id_pedido)
+        if not entrada['pagos'] and not entrada['entregues']:
+            del self._por_matricula[matricula]
+            self._matricula_do_usuario.pop(entrada['id_usuario'], None)
+
+    def _remover_usuario(self, id_usuario):
+        entrada = self._por_matricula.get(self._matricula_do_usuario.get(id_usuario))
+        if entrada is not None:
+            for id_pedido in entrada['pagos'] | entrada['entregues']:
+                self._remover_pedido(id_pedido)
+
+    # ---------- DELTAS (OUVINTE DE ALTERAÇÕES) ----------
+
+    def ao_notificar(self, evento, conn):
+        """Callback para OuvinteAlteracoes.assinar: relê apenas as linhas afetadas"""
+        tabela = evento.get('tabela')
+        if tabela == '*':
+            with self._lock:
+                data, tipo = self.data, self.tipo
+            self.carregar(conn, data, tipo)
+            return
+
+        if tabela == 'pedido':
+            pedidos = [evento.get('id')]
+        elif tabela == 'pagamento':
+            pedidos = evento.get('pedidos', [])
+        elif tabela == 'usuario':
+            id_usuario = evento.get('id')
+            self._aplicar_delta(conn, " AND u.id_usuario = %(usuario)s", {'usuario': id_usuario},
+                                lambda: self._remover_usuario(id_usuario))
+            return
+        else:
+            return
+
+        pedidos = [p for p in pedidos if p is not None]
+        if not pedidos:
+            return
+
+        def remover():
+            for id_pedido in pedidos:
+                self._remover_pedido(id_pedido)
+
+        self._aplicar_delta(conn, " AND p.id_pedido = ANY(%(pedidos)s)", {'pedidos': pedidos}, remover)
+
+    def _aplicar_delta(self, conn, filtro, params, remover):
+        """
+        Relê as linhas do filtro e as aplica sob o lock.
+
+        Data, refeição e geração são lidas sob o lock e conferidas de novo antes de
+        aplicar: se uma carga trocou o índice durante a leitura, lê outra vez.
+        """
+        while True:
+            with self._lock:
+                data, tipo, geracao = self.data, self.tipo, self._geracao
+            if tipo is None:
+                return
+            linhas = self._ler(conn, data, tipo, filtro, params)
+            with self._lock:
+                if self._geracao != geracao:
+                    continue
+                remover()
+                for linha in linhas:
+                    self._incluir(linha)
+                return
+
+    # ---------- CONSULTA ----------
+
+    def consultar(self, matricula):
+        """
+        ELEGIBILIDADE DE UMA MATRÍCULA (sem registrar a passagem)
+
+        Returns:
+            tuple: (situacao, id_pedido, nome) com situacao em LIBERADO,
+                   JA_ENTREGUE, SEM_PEDIDO ou FORA_DE_HORARIO
+        """
+        with self._lock:
+            return self._situacao(matricula)
+
+    def registrar_passagem(self, matricula):
+        """
+        Consulta e, se liberado, marca o pedido como entregue em memória e o
+        coloca na fila de gravação. Mesma resposta de consultar().
+        """
+        with self._lock:
+            situacao, id_pedido, nome = self._situacao(matricula)
+            if situacao == LIBERADO:
+                entrada = self._por_matricula[matricula]
+                entrada['pagos'].discard(id_pedido)
+                entrada['entregues'].add(id_pedido)
+                self._a_gravar.add(id_pedido)
+                self._sem_gravar.notify()
+            return situacao, id_pedido, nome
+
+    def _situacao(self, matricula):
+        if self.tipo is None:
+            return FORA_DE_HORARIO, None, None
+        entrada = self._por_matricula.get(matricula)
+        if entrada is None:
+            return SEM_PEDIDO, None, None
+        if entrada['pagos']:
+            return LIBERADO, min(entrada['pagos']), entrada['nome']
+        return JA_ENTREGUE, max(entrada['entregues']), entrada['nome']
+
+    # ---------- GRAVAÇÃO ----------
+
+    def retirar_para_gravar(self, espera):
+        """Aguarda até 'espera' segundos por entregas e retorna as pendentes"""
+        with self._lock:
+            if not self._a_gravar:
+                self._sem_gravar.wait(espera)
+            return sorted(self._a_gravar)
+
+    def confirmar_gravados(self, pedidos):
+        with self._lock:
+            self._a_gravar.difference_update(pedidos)
+
+    def pendentes_de_gravacao(self):
+        with self._lock:
+            return len(self._a_gravar)
+
+    def total(self):
+        with self._lock:
+            return len(self._por_matricula)
+
+
+class GravadorEntregas(threading.Thread):
+    """
+    THREAD DE GRAVAÇÃO DAS ENTREGAS
+
+    Grava em lotes (um UPDATE por lote) os pedidos liberados na catraca.
+    Pedidos só saem da fila depois do commit; se a conexão cair, o lote é
+    reenviado (o UPDATE é idempotente).
+    """
+
+    def __init__(self, indice, lote=200, intervalo=1.0):
+        super().__init__(name='gravador-entregas', daemon=True)
+        self.indice = indice
+        self.lote = lote
+        self.intervalo = intervalo
+        self._parar = threading.Event()
+        self._conn = None
+
+    def parar(self):
+        self._parar.set()
+
+    def run(self):
+        espera = self.intervalo
+        while True:
+            pedidos = self.indice.retirar_para_gravar(self.intervalo)
+            if pedidos and len(pedidos) < self.lote and not self._parar.is_set():
+                # Junta mais passagens no mesmo UPDATE
+                self._parar.wait(self.intervalo)
+                pedidos = self.indice.retirar_para_gravar(0)
+            if not pedidos and self._parar.is_set():
+                break
+            try:
+                for i in range(0, len(pedidos), self.lote):
+                    self._gravar(pedidos[i:i + self.lote])
+                espera = self.intervalo
+            except psycopg2.Error as e:
+                print(f"\n[AVISO] Gravação de entregas adiada: {e}")
+                if self._conn is not None and not self._conn.closed:
+                    self._conn.close()
+                self._conn = None
+                if self._parar.wait(espera):
+                    break
+                espera = min(espera * 2, 60.0)
+        if self._conn is not None and not self._conn.closed:
+            self._conn.close()
+
+    def _gravar(self, pedidos):
+        if self._conn is None or self._conn.closed:
+            self._conn = database.open_connection()
+        with self._conn.cursor() as cur:
+            cur.execute("""
+                UPDATE Pedido SET status_do_pedido = 'entregue'
+                WHERE id_pedido = ANY(%s) AND status_do_pedido NOT IN ('entregue', 'cancelado');
+            """, (pedidos,))
+        self._conn.commit()
+        self.indice.confirmar_gravados(pedidos)
+
+
+def iniciar_catraca(conn, unidade, tipo=None):
+    """Carrega o índice, assina o ouvinte de alterações e inicia a gravação; retorna (indice, ouvinte, gravador)"""
+    database.aplicar_migracoes(conn)
+
+    indice = IndiceCatraca(unidade, tipo)
+    indice.carregar(conn)
+    _, ouvinte = notifications.iniciar_ouvinte()
+    ouvinte.assinar(indice.ao_notificar)
+    gravador = GravadorEntregas(indice)
+    gravador.start()
+    return indice, ouvinte, gravador
+
+def main():
+    parser = argparse.ArgumentParser(description="Catraca: elegibilidade por matrícula")
+    parser.add_argument('--unidade', type=int, help="Unidade da catraca (padrão: UNIDADE_PADRAO no .env)")
+    parser.add_argument('--tipo', choices=sorted(JANELAS_REFEICAO), help="Força o tipo de refeição")
+    args = parser.parse_args()
+
+    unidade = args.unidade
+    if unidade is None:
+        padrao = database.get_db_config().get('UNIDADE_PADRAO')
+        unidade = int(padrao) if padrao and padrao.isdigit() else None
+    if unidade is None:
+        print("[ERRO] Informe a unidade da catraca (--unidade ou UNIDADE_PADRAO no .env).")
+        return 1
+
+    try:
+        conn = database.open_connection()
+        indice, ouvinte, gravador = iniciar_catraca(conn, unidade, args.tipo)
+    except psycopg2.Error as e:
+        print(f"[ERRO] Erro ao conectar ao PostgreSQL: {e}")
+        return 1
+
+    print(f"[SUCESSO] Unidade {unidade}: {indice.total()} matrículas com pedido pago ({indice.tipo or 'fora de horário'}).")
+    mensagens = {
+        LIBERADO: "LIBERADO",
+        JA_ENTREGUE: "NEGADO - refeição já retirada",
+        SEM_PEDIDO: "NEGADO - sem pedido pago",
+        FORA_DE_HORARIO: "NEGADO - fora do horário de refeição",
+    }
+    try:
+        for linha in sys.stdin:
+            texto = linha.strip()
+            if not texto:
+                continue
+            if not texto.isdigit():
+                print(f"[AVISO] Matrícula inválida: {texto}")
+                continue
+            try:
+                if indice.atualizar_refeicao(conn):
+                    print(f"[AVISO] Refeição: {indice.tipo or 'fora de horário'} ({indice.total()} matrículas)")
+            except psycopg2.Error as e:
+                print(f"[AVISO] Recarga do índice falhou (mantendo o anterior): {e}")
+                conn.rollback()
+
+            inicio = time.perf_counter()
+            situacao, _, nome = indice.registrar_passagem(int(texto))
+            microssegundos = (time.perf_counter() - inicio) * 1e6
+            print(f"{texto}: {mensagens[situacao]}{f' - {nome}' if nome else ''} ({microssegundos:.0f} µs)")
+    except KeyboardInterrupt:
+        pass
+    finally:
+        gravador.parar()
+        gravador.join(timeout=10)
+        ouvinte.parar()
+        conn.close()
+        restantes = indice.pendentes_de_gravacao()
+        if restantes:
+            print(f"[AVISO] {restantes} entregas não foram gravadas no banco.")
+    return 0
+
+if __name__ == "__main__":
+    raise SystemExit(main())
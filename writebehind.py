@@ -0,0 +1,280 @@
+# FILA LOCAL DE ESCRITAS - MODO OFFLINE
+#
+# Registra pedidos e pagamentos em um diário SQLite local quando o banco remoto
+# (Supabase) está inacessível ou lento, e os envia depois em segundo plano.
+#
+# FUNCIONAMENTO:
+# - Cada operação recebe uma chave de idempotência (UUID) e um número de
+#   sequência local; o registro é durável (SQLite com synchronous=FULL)
+# - Um pedido registrado na fila ganha um ID local negativo (-seq); um pagamento
+#   pode referenciar esse ID e é resolvido para o ID real no envio
+# - A thread despachante envia as operações em ordem, em lotes (uma transação
+#   por lote, um SAVEPOINT por operação)
+# - No servidor, Operacao_Aplicada guarda as chaves já aplicadas: reenviar um lote
+#   após queda de conexão não duplica pedidos nem pagamentos
+# - Operações rejeitadas pelo banco (pagamento duplicado, usuário inexistente,
+#   CHECK violado...) ficam marcadas como 'conflito' para revisão, sem travar a fila
+
+import json
+import sqlite3
+import threading
+import uuid
+from datetime import datetime
+import psycopg2
+import database
+
+ARQUIVO_PADRAO = 'ru_fila_local.sqlite3'
+
+SQL_DIARIO = """
+CREATE TABLE IF NOT EXISTS operacao (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    chave TEXT NOT NULL UNIQUE,
+    tipo TEXT NOT NULL CHECK (tipo IN ('pedido', 'pagamento')),
+    dados TEXT NOT NULL,
+    criada_em TEXT NOT NULL,
+    estado TEXT NOT NULL DEFAULT 'pendente' CHECK (estado IN ('pendente', 'aplicada', 'conflito')),
+    id_remoto INTEGER,
+    erro TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_operacao_estado ON operacao (estado, seq);
+"""
+
+class ConflitoOperacao(Exception):
+    """Operação que o banco recusou; não adianta reenviar"""
+
+
+class DiarioLocal:
+    """
+    DIÁRIO SQLITE DE OPERAÇÕES PENDENTES
+
+    Acesso serializado por lock: a TUI registra e a thread despachante lê e marca.
+    """
+
+    def __init__(self, caminho=ARQUIVO_PADRAO):
+        self.caminho = caminho
+        self._lock = threading.Lock()
+        self._db = sqlite3.connect(caminho, check_same_thread=False, isolation_level=None)
+        self._db.execute("PRAGMA journal_mode=WAL;")
+        self._db.execute("PRAGMA synchronous=FULL;")
+        self._db.executescript(SQL_DIARIO)
+
+    def fechar(self):
+        with self._lock:
+            self._db.close()
+
+    def _registrar(self, tipo, dados):
+        chave = str(uuid.uuid4())
+        with self._lock:
+            cur = self._db.execute(
+                "INSERT INTO operacao (chave, tipo, dados, criada_em) VALUES (?, ?, ?, ?);",
+                (chave, tipo, json.dumps(dados), datetime.now().isoformat(sep=' '))
+            )
+            return -cur.lastrowid
+
+    def registrar_pedido(self, pedido_data):
+        """Registra um pedido; retorna o ID local (negativo) usado até o envio"""
+        dados = dict(pedido_data)
+        dados.setdefault('data_hora', datetime.now().isoformat(sep=' '))
+        return self._registrar('pedido', dados)
+
+    def registrar_pagamento(self, pagamento_data):
+        """Registra um pagamento (pag_pedido pode ser o ID local de um pedido da fila)"""
+        dados = dict(pagamento_data)
+        dados.setdefault('data_pagamento', datetime.now().isoformat(sep=' '))
+        return self._registrar('pagamento', dados)
+
+    # ---------- CONSULTAS ----------
+
+    def proximas(self, limite):
+        """Próximas operações pendentes, na ordem de registro"""
+        with self._lock:
+            linhas = self._db.execute(
+                "SELECT seq, chave, tipo, dados FROM operacao WHERE estado = 'pendente' ORDER BY seq LIMIT ?;",
+                (limite,)
+            ).fetchall()
+        return [(seq, chave, tipo, json.loads(dados)) for seq, chave, tipo, dados in linhas]
+
+    def situacao(self, seq):
+        """(estado, id_remoto) de uma operação"""
+        with self._lock:
+            return self._db.execute(
+                "SELECT estado, id_remoto FROM operacao WHERE seq = ?;", (seq,)
+            ).fetchone()
+
+    def pedidos_locais(self):
+        """Pedidos ainda na fila, no formato de get_pedidos_pendentes (ID local negativo)"""
+        with self._lock:
+            linhas = self._db.execute(
+                "SELECT seq, dados FROM operacao WHERE tipo = 'pedido' AND estado = 'pendente' ORDER BY seq;"
+            ).fetchall()
+        pedidos = []
+        for seq, dados in linhas:
+            dados = json.loads(dados)
+            pedidos.append((-seq, dados['pedido_usuario'], '(fila local)',
+                            datetime.fromisoformat(dados['data_hora']), dados['status_do_pedido'], None, None))
+        return pedidos
+
+    def resumo(self):
+        """Quantidade de operações por estado"""
+        with self._lock:
+            linhas = self._db.execute("SELECT estado, COUNT(*) FROM operacao GROUP BY estado;").fetchall()
+        return {'pendente': 0, 'aplicada': 0, 'conflito': 0, **dict(linhas)}
+
+    def conflitos(self):
+        """Operações recusadas pelo banco: (seq, tipo, dados, erro)"""
+        with self._lock:
+            linhas = self._db.execute(
+                "SELECT seq, tipo, dados, erro FROM operacao WHERE estado = 'conflito' ORDER BY seq;"
+            ).fetchall()
+        return [(seq, tipo, json.loads(dados), erro) for seq, tipo, dados, erro in linhas]
+
+    # ---------- MARCAÇÃO ----------
+
+    def marcar(self, resultados):
+        """Grava o resultado de um lote já confirmado no servidor: [(seq, estado, id_remoto, erro)]"""
+        with self._lock:
+            self._db.execute("BEGIN;")
+            self._db.executemany(
+                "UPDATE operacao SET estado = ?, id_remoto = ?, erro = ? WHERE seq = ?;",
+                [(estado, id_remoto, erro, seq) for seq, estado, id_remoto, erro in resultados]
+            )
+            self._db.execute("COMMIT;")
+
+    def descartar_conflitos(self):
+        """Remove do diário as operações em conflito já revisadas"""
+        with self._lock:
+            return self._db.execute("DELETE FROM operacao WHERE estado = 'conflito';").rowcount
+
+
+class Despachante(threading.Thread):
+    """
+    THREAD DE ENVIO DA FILA LOCAL
+
+    Mantém conexão própria com o primário e envia as operações pendentes em
+    lotes ordenados. Se a conexão cair no meio de um lote, o lote inteiro é
+    desfeito no servidor e reenviado depois (as chaves evitam duplicidade).
+    """
+
+    def __init__(self, diario, lote=50, intervalo=2.0, ao_conflito=None):
+        super().__init__(name='despachante-fila-local', daemon=True)
+        self.diario = diario
+        self.lote = lote
+        self.intervalo = intervalo
+        self.ao_conflito = ao_conflito
+        self.conectado = False
+        self._parar = threading.Event()
+        self._acordar = threading.Event()
+        self._conn = None
+
+    def parar(self):
+        self._parar.set()
+        self._acordar.set()
+
+    def notificar(self):
+        """Acorda o despachante logo após um novo registro"""
+        self._acordar.set()
+
+    def run(self):
+        espera = self.intervalo
+        while not self._parar.is_set():
+            try:
+                if self._conn is None or self._conn.closed:
+                    self._conn = database.open_connection()
+                    database.aplicar_migracoes(self._conn)
+                self.conectado = True
+                while not self._parar.is_set() and self._enviar_lote():
+                    pass
+                espera = self.intervalo
+            except psycopg2.Error as e:
+                # Sem link (ou erro inesperado do lote): tenta de novo mais tarde, com espera crescente
+                if not isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError)):
+                    print(f"\n[AVISO] Envio da fila local interrompido: {e}")
+                self.conectado = False
+                if self._conn is not None and not self._conn.closed:
+                    self._conn.close()
+                self._conn = None
+                espera = min(espera * 2, 60.0)
+            self._acordar.wait(espera)
+            self._acordar.clear()
+        if self._conn is not None and not self._conn.closed:
+            self._conn.close()
+
+    def _enviar_lote(self):
+        """Envia um lote; retorna True se havia operações (pode haver mais)"""
+        operacoes = self.diario.proximas(self.lote)
+        if not operacoes:
+            return False
+
+        resultados = []
+        ids_no_lote = {}  # seq do pedido local -> id real (pedidos deste mesmo lote)
+        try:
+            with self._conn.cursor() as cur:
+                for seq, chave, tipo, dados in operacoes:
+                    cur.execute("SAVEPOINT operacao;")
+                    try:
+                        id_remoto = self._aplicar(cur, chave, tipo, dados, ids_no_lote)
+                        cur.execute("RELEASE SAVEPOINT operacao;")
+                        resultados.append((seq, 'aplicada', id_remoto, None))
+                        if tipo == 'pedido':
+                            ids_no_lote[seq] = id_remoto
+                    except (ConflitoOperacao, psycopg2.IntegrityError, psycopg2.DataError) as e:
+                        cur.execute("ROLLBACK TO SAVEPOINT operacao;")
+                        resultados.append((seq, 'conflito', None, str(e).strip()))
+                    except psycopg2.Error as e:
+                        if e.pgcode is not None:
+                            raise
+                        # Validações da camada de dados (ex.: pagamento duplicado)
+                        cur.execute("ROLLBACK TO SAVEPOINT operacao;")
+                        resultados.append((seq, 'conflito', None, str(e).strip()))
+            self._conn.commit()
+        except BaseException:
+            if not self._conn.closed:
+                self._conn.rollback()
+            raise
+
+        # Só depois do commit: se cair antes daqui, o reenvio é absorvido pelas chaves
+        self.diario.marcar(resultados)
+        if self.ao_conflito:
+            for seq, estado, _, erro in resultados:
+                if estado == 'conflito':
+                    self.ao_conflito(seq, erro)
+        return True
+
+    def _aplicar(self, cur, chave, tipo, dados, ids_no_lote):
+        cur.execute("""
+            INSERT INTO Operacao_Aplicada (chave, tipo) VALUES (%s, %s)
+            ON CONFLICT (chave) DO NOTHING
+            RETURNING chave;
+        """, (chave, tipo))
+        if cur.fetchone() is None:
+            # Já aplicada em um envio anterior (resposta perdida com a conexão)
+            cur.execute("SELECT id_resultado FROM Operacao_Aplicada WHERE chave = %s;", (chave,))
+            return cur.fetchone()[0]
+
+        if tipo == 'pedido':
+            id_remoto = database.add_pedido(self._conn, dados, commit=False)
+        else:
+            dados = dict(dados)
+            if dados['pag_pedido'] < 0:
+                dados['pag_pedido'] = self._resolver_pedido(-dados['pag_pedido'], ids_no_lote)
+            id_remoto = database.add_pagamento(self._conn, dados, commit=False)
+
+        cur.execute("UPDATE Operacao_Aplicada SET id_resultado = %s WHERE chave = %s;", (id_remoto, chave))
+        return id_remoto
+
+    def _resolver_pedido(self, seq, ids_no_lote):
+        """ID real de um pedido que foi registrado na fila local"""
+        if seq in ids_no_lote:
+            return ids_no_lote[seq]
+        situacao = self.diario.situacao(seq)
+        if situacao and situacao[0] == 'aplicada':
+            return situacao[1]
+        raise ConflitoOperacao(f"Pedido local {-seq} não foi aplicado no banco")
+
+
+def iniciar_despachante(caminho=ARQUIVO_PADRAO, ao_conflito=None):
+    """Abre o diário local e inicia a thread de envio; retorna (diario, despachante)"""
+    diario = DiarioLocal(caminho)
+    despachante = Despachante(diario, ao_conflito=ao_conflito)
+    despachante.start()
+    return diario, despachante